@@ -1,12 +1,8 @@
 import os
 import io
 import json
+import threading
 from flask import Flask, request, jsonify
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Part
-from google.cloud import storage
-
-storage_client = storage.Client()
 # from google.cloud import firestore # Se for usar Firestore
 from dotenv import load_dotenv
 
@@ -22,9 +18,25 @@ LOCATION = os.getenv("GCP_LOCATION", "us-central1") # ou a região onde seu mode
 # Para Flash 2.5 Pro, você pode usar "gemini-1.5-flash-001" ou o mais recente disponível
 MODEL_ID = os.getenv("GEMINI_MODEL_ID", "gemini-1.5-flash-001") 
 
-# Inicializa o cliente do Vertex AI (para interagir com o Gemini)
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-model = GenerativeModel(MODEL_ID)
+# Clientes do Cloud Storage e do Vertex AI (Gemini), criados no primeiro uso:
+# importar o SDK e autenticar no import do módulo atrasava o boot em segundos
+# e falhava sem credenciais
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_clients():
+    """Retorna (storage_client, model), inicializando uma única vez por processo"""
+    if not _clients:
+        with _clients_lock:
+            if not _clients:
+                import vertexai
+                from vertexai.preview.generative_models import GenerativeModel
+                from google.cloud import storage
+
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                model = GenerativeModel(MODEL_ID)
+                _clients.update(storage=storage.Client(), model=model)
+    return _clients['storage'], _clients['model']
 
 # --- Endpoint principal para upload de imagem ---
 @app.route("/upload-invoice", methods=["POST"])
@@ -46,6 +58,7 @@ def upload_invoice():
             if not bucket_name:
                 return jsonify({"error": "GCS_BUCKET_NAME environment variable not set"}), 500
 
+            storage_client, model = get_clients()
             bucket = storage_client.bucket(bucket_name)
             blob = bucket.blob(image_name)
             blob.upload_from_string(image_bytes, content_type=image_file.mimetype)
@@ -82,6 +95,7 @@ def upload_invoice():
             """
 
             # Cria um objeto Part com a imagem do GCS
+            from vertexai.preview.generative_models import Part
             image_part = Part.from_uri(gcs_uri, mime_type=image_file.mimetype)
 
             # Envia o prompt e a imagem para o Gemini
@@ -4,24 +4,34 @@ Vision Estoque Financeiro Applet
 Aplicação Flask segura para análise de documentos fiscais com Google Gemini AI
 """
 import os
-from flask import Flask
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from flask import Flask, Request, current_app, request
 from flask_login import LoginManager
 from flask_talisman import Talisman
 from flask_cors import CORS
 import logging
 from logging.handlers import RotatingFileHandler
 
+class VisionRequest(Request):
+    """Requisição com limite de tamanho próprio para o upload em lote"""
+
+    @property
+    def max_content_length(self):
+        if not current_app:
+            return None
+        if self.endpoint == 'main.upload_invoices':
+            return current_app.config['BATCH_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
 def create_app(config_name=None):
     """Factory function para criar a aplicação Flask"""
     app = Flask(__name__)
+    app.request_class = VisionRequest
     
     # Configurações de segurança
     app.config.from_object('app.config.Config')
     
-    # Configurar logging
-    if not app.debug and not app.testing:
+    # Configurar logging (em arquivo fora dos testes: não escrevem em logs/ do repositório)
+    if not app.debug and not app.testing and config_name != 'testing':
         if not os.path.exists('logs'):
             os.mkdir('logs')
         file_handler = RotatingFileHandler('logs/vision_app.log', maxBytes=10240, backupCount=10)
@@ -36,10 +46,68 @@ def create_app(config_name=None):
     # Inicializar extensões de segurança
     init_security_extensions(app)
     
+    # Inicializar backend de armazenamento de objetos
+    from app.storage_backends import init_storage_backend
+    init_storage_backend(app)
+    
+    # Inicializar backend do modelo generativo
+    from app.model_backends import init_model_backend
+    init_model_backend(app)
+    
+    # Registro dos clientes do processo (aquecidos no boot do worker)
+    from app.clients import init_client_registry
+    init_client_registry(app)
+    
+    # Chaves de API (hash em repouso, recarga sem reinício)
+    from app.keystore import init_api_key_store
+    init_api_key_store(app)
+    
+    # Templates de prompt (sanitizados uma vez)
+    from app.prompts import init_prompt_registry
+    init_prompt_registry(app)
+    
+    # Cascata de modelos por nível (rotas por tipo de documento do registro de prompts)
+    from app.cascade import init_model_cascade
+    init_model_cascade(app)
+    
+    # Medição de tempo por etapa (Server-Timing)
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
+    
+    # Inicializar cache de extrações
+    from app.cache import init_extraction_cache
+    init_extraction_cache(app)
+    
+    # Persistência dos resultados (gravação em lotes em segundo plano)
+    from app.results import init_result_store
+    init_result_store(app)
+    from app.aggregates import init_aggregates
+    init_aggregates(app)
+    
+    # Detecção de documentos quase duplicados (hash perceptual + número/CNPJ)
+    from app.duplicates import init_duplicate_index
+    init_duplicate_index(app)
+    
+    # Inicializar fila de jobs assíncronos
+    from app.jobs import init_jobs
+    init_jobs(app)
+    
+    # Limites de concorrência para GCS e Vertex
+    from app.pipeline import init_stage_limits
+    init_stage_limits(app)
+    
+    # Prazos, novas tentativas, circuit breaker e hedge na chamada ao Gemini
+    from app.resilience import init_model_resilience
+    init_model_resilience(app)
+    
     # Registrar blueprints
     from app.routes import main_bp
     app.register_blueprint(main_bp)
     
+    # Rate limiting compartilhado (Redis), aplicado às views marcadas
+    from app.ratelimit import init_rate_limiting
+    init_rate_limiting(app)
+    
     # Registrar error handlers
     register_error_handlers(app)
     
@@ -48,14 +116,6 @@ def create_app(config_name=None):
 def init_security_extensions(app):
     """Inicializa todas as extensões de segurança"""
     
-    # Rate Limiting
-    limiter = Limiter(
-        key_func=get_remote_address,
-        default_limits=["200 per day", "50 per hour"],
-        storage_uri="memory://"
-    )
-    limiter.init_app(app)
-    
     # CORS configurado de forma segura
     CORS(app, 
          origins=os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(','),
@@ -121,6 +181,8 @@ def register_error_handlers(app):
     
     @app.errorhandler(429)
     def ratelimit_handler(error):
+        from app.metrics import RATE_LIMIT_REJECTIONS
+        RATE_LIMIT_REJECTIONS.labels(request.endpoint or 'unknown').inc()
         app.logger.warning(f'Rate limit exceeded: {error}')
         return {'error': 'Muitas requisições. Tente novamente mais tarde.'}, 429
     
@@ -0,0 +1,169 @@
+"""
+Controle de admissão da etapa de extração (chamadas ao Gemini)
+Limite de concorrência adaptativo (gradiente de latência, com recuo multiplicativo
+em falhas) e fila de espera limitada: com a cota do Vertex saturada, o excedente
+é rejeitado na hora com 503 em vez de ocupar o worker até o timeout
+"""
+import math
+import time
+import random
+import threading
+from app.metrics import ADMISSION_INFLIGHT, ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSIONS
+from app.resilience import ModelUnavailable, is_transient
+
+
+class AdmissionRejected(ModelUnavailable):
+    """Extração recusada: fila cheia ou espera acima do limite"""
+
+
+class GradientLimit:
+    """
+    Limite adaptativo no estilo Gradient: compara a latência de cada chamada com a
+    latência sem carga (a menor observada). Até `tolerance` vezes ela o limite cresce
+    (com folga de sqrt(limite)); acima, encolhe na proporção. Falhas passageiras
+    recuam o limite por `backoff`. A cada ~`probe_interval` amostras o limite cai para
+    sqrt(limite) e a latência sem carga é medida de novo (o backend pode ter mudado).
+    """
+
+    def __init__(self, initial=16, min_limit=1, max_limit=64, tolerance=2.0, smoothing=0.2,
+                 backoff=0.9, probe_interval=1000):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.backoff = backoff
+        self.probe_interval = probe_interval
+        self._countdown = self._next_probe()
+        self._min_rtt = None
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def _next_probe(self):
+        # Jitter para que os workers não meçam todos ao mesmo tempo
+        return self.probe_interval + random.randrange(max(1, self.probe_interval))
+
+    def on_sample(self, rtt, inflight, dropped=False):
+        """Ajusta o limite com a latência (s) de uma chamada concluída"""
+        if dropped:
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+            return
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = self._next_probe()
+            self._min_rtt = None
+            self._limit = max(self.min_limit, math.sqrt(self._limit))
+            return
+        if self._min_rtt is None or rtt < self._min_rtt:
+            self._min_rtt = rtt
+
+        gradient = max(0.5, min(1.0, self.tolerance * self._min_rtt / max(rtt, 1e-6)))
+        new_limit = self._limit * gradient + math.sqrt(self._limit)
+        # Sem demanda (poucas chamadas em andamento) não há sinal para crescer
+        if new_limit > self._limit and inflight < self._limit / 2:
+            return
+        new_limit = self._limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self._limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+
+class AdmissionController:
+    """
+    Vaga na etapa de extração (context manager, como os semáforos de etapa)
+    Até `limit` chamadas em andamento; as demais esperam em fila de até `max_queue`
+    por no máximo `max_wait` segundos
+    """
+
+    def __init__(self, limit=None, max_queue=32, max_wait=10.0):
+        self.limit = limit or GradientLimit()
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'timeout': 0}
+        self._rtt = None
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        ADMISSION_LIMIT.set(self.limit.limit)
+
+    def acquire(self):
+        with self._cond:
+            if self.inflight >= self.limit.limit:
+                if self.queued >= self.max_queue:
+                    self._reject('queue_full')
+                self.queued += 1
+                ADMISSION_QUEUE.inc()
+                deadline = time.monotonic() + self.max_wait
+                try:
+                    while self.inflight >= self.limit.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject('timeout')
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+                    ADMISSION_QUEUE.dec()
+            self.inflight += 1
+            self.admitted += 1
+        ADMISSION_INFLIGHT.inc()
+        ADMISSIONS.labels('admitted').inc()
+
+    def release(self, rtt, dropped=False):
+        with self._cond:
+            self.limit.on_sample(rtt, self.inflight, dropped)
+            self.inflight -= 1
+            if not dropped:
+                self._rtt = rtt if self._rtt is None else self._rtt + 0.1 * (rtt - self._rtt)
+            ADMISSION_LIMIT.set(self.limit.limit)
+            self._cond.notify_all()
+        ADMISSION_INFLIGHT.dec()
+
+    def _reject(self, reason):
+        """Chamado sob o lock; Retry-After estimado pelo tempo para escoar a fila"""
+        self.shed[reason] += 1
+        ADMISSIONS.labels(f'shed_{reason}').inc()
+        waves = (self.queued + 1) / max(1, self.limit.limit)
+        retry_after = max(1, math.ceil(waves * (self._rtt or 1.0)))
+        raise AdmissionRejected(f'Extração recusada pelo controle de admissão ({reason})', retry_after)
+
+    def __enter__(self):
+        self.acquire()
+        # Pilha por thread: a mesma thread pode ocupar vagas de controladores diferentes
+        self._local.started = getattr(self._local, 'started', [])
+        self._local.started.append(time.monotonic())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        started = self._local.started.pop()
+        dropped = exc is not None and (isinstance(exc, ModelUnavailable) or is_transient(exc))
+        self.release(time.monotonic() - started, dropped)
+        return False
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit.limit,
+                'inflight': self.inflight,
+                'queued': self.queued,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+            }
+
+
+def create_admission_controller(config):
+    """Controlador da etapa 'vertex'; VERTEX_MAX_CONCURRENCY é o teto do limite adaptativo"""
+    return AdmissionController(
+        limit=GradientLimit(
+            initial=config['ADMISSION_INITIAL_LIMIT'],
+            min_limit=config['ADMISSION_MIN_LIMIT'],
+            max_limit=config['VERTEX_MAX_CONCURRENCY'],
+            tolerance=config['ADMISSION_TOLERANCE'],
+            smoothing=config['ADMISSION_SMOOTHING'],
+            backoff=config['ADMISSION_BACKOFF'],
+        ),
+        max_queue=config['ADMISSION_MAX_QUEUE'],
+        max_wait=config['ADMISSION_MAX_WAIT'],
+    )
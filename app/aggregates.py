@@ -0,0 +1,385 @@
+"""
+Agregados materializados de estoque e gastos
+Atualizados de forma incremental na mesma transação que grava cada lote de
+resultados; reconstrução completa (backfill) com cálculo colunar em NumPy
+"""
+import time
+import logging
+from app.results import normalize_cnpj, normalize_date, normalize_text, to_number
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    # Entradas (notas fiscais) somadas e última contagem por produto
+    'CREATE TABLE IF NOT EXISTS stock ('
+    ' codigo_produto TEXT PRIMARY KEY,'
+    ' descricao TEXT,'
+    ' unidade TEXT,'
+    ' quantidade_entrada REAL NOT NULL DEFAULT 0,'
+    ' valor_entrada REAL NOT NULL DEFAULT 0,'
+    ' documentos INTEGER NOT NULL DEFAULT 0,'
+    ' quantidade_contada REAL,'
+    ' contado_em TEXT)',
+    # Gasto por fornecedor e mês (cnpj '' = fornecedor não identificado)
+    'CREATE TABLE IF NOT EXISTS spend ('
+    ' cnpj_fornecedor TEXT NOT NULL,'
+    ' mes TEXT NOT NULL,'
+    ' fornecedor TEXT,'
+    ' valor_total REAL NOT NULL DEFAULT 0,'
+    ' documentos INTEGER NOT NULL DEFAULT 0,'
+    ' PRIMARY KEY (cnpj_fornecedor, mes)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS spend_month ('
+    ' mes TEXT PRIMARY KEY,'
+    ' valor_total REAL NOT NULL DEFAULT 0,'
+    ' documentos INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID',
+)
+
+# Tipos que alteram o estoque/gasto (comparação sem diferenciar maiúsculas)
+ENTRY_TYPES = {'nota fiscal'}
+COUNT_TYPES = {'relatório de contagem', 'relatorio de contagem'}
+
+# Contagem mais recente (data, depois ordem de gravação) prevalece
+_NEWER_COUNT = 'excluded.contado_em IS NOT NULL AND (contado_em IS NULL OR excluded.contado_em >= contado_em)'
+
+_STOCK_UPSERT = (
+    'INSERT INTO stock (codigo_produto, descricao, unidade, quantidade_entrada, valor_entrada,'
+    ' documentos, quantidade_contada, contado_em)'
+    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    ' ON CONFLICT (codigo_produto) DO UPDATE SET'
+    ' descricao = COALESCE(excluded.descricao, descricao),'
+    ' unidade = COALESCE(excluded.unidade, unidade),'
+    ' quantidade_entrada = quantidade_entrada + excluded.quantidade_entrada,'
+    ' valor_entrada = valor_entrada + excluded.valor_entrada,'
+    ' documentos = documentos + excluded.documentos,'
+    f' quantidade_contada = CASE WHEN {_NEWER_COUNT} THEN excluded.quantidade_contada ELSE quantidade_contada END,'
+    f' contado_em = CASE WHEN {_NEWER_COUNT} THEN excluded.contado_em ELSE contado_em END'
+)
+
+_SPEND_UPSERT = (
+    'INSERT INTO spend (cnpj_fornecedor, mes, fornecedor, valor_total, documentos)'
+    ' VALUES (?, ?, ?, ?, ?)'
+    ' ON CONFLICT (cnpj_fornecedor, mes) DO UPDATE SET'
+    ' fornecedor = COALESCE(excluded.fornecedor, fornecedor),'
+    ' valor_total = valor_total + excluded.valor_total,'
+    ' documentos = documentos + excluded.documentos'
+)
+
+_MONTH_UPSERT = (
+    'INSERT INTO spend_month (mes, valor_total, documentos) VALUES (?, ?, ?)'
+    ' ON CONFLICT (mes) DO UPDATE SET'
+    ' valor_total = valor_total + excluded.valor_total,'
+    ' documentos = documentos + excluded.documentos'
+)
+
+STOCK_COLUMNS = ('codigo_produto', 'descricao', 'unidade', 'quantidade_entrada', 'valor_entrada',
+                 'documentos', 'quantidade_contada', 'contado_em')
+
+
+def document_kind(tipo_documento):
+    """'entry' (nota fiscal), 'count' (relatório de contagem) ou None"""
+    tipo = (tipo_documento or '').strip().casefold()
+    if tipo in ENTRY_TYPES:
+        return 'entry'
+    if tipo in COUNT_TYPES:
+        return 'count'
+    return None
+
+
+def document_date(data_emissao, created_at):
+    """Data de emissão normalizada ou, na falta dela, a data de gravação (UTC)"""
+    return data_emissao or time.strftime('%Y-%m-%d', time.gmtime(created_at))
+
+
+def item_value(quantidade, valor_unitario, valor_total_item):
+    """Valor do item: total informado ou quantidade x unitário"""
+    if valor_total_item is not None:
+        return valor_total_item
+    if quantidade is not None and valor_unitario is not None:
+        return quantidade * valor_unitario
+    return 0.0
+
+
+class AggregateDelta:
+    """Variações de um lote, somadas por chave antes do upsert"""
+
+    def __init__(self):
+        self.stock = {}
+        self.spend = {}
+        self.months = {}
+
+    def add_document(self, data, created_at):
+        kind = document_kind(data.get('tipo_documento'))
+        if kind is None:
+            return
+        date = document_date(normalize_date(data.get('data_emissao')), created_at)
+        items = [item for item in data.get('itens') or [] if isinstance(item, dict)]
+
+        seen = set()
+        total_items = 0.0
+        for item in items:
+            quantidade = to_number(item.get('quantidade'))
+            value = item_value(quantidade, to_number(item.get('valor_unitario')),
+                               to_number(item.get('valor_total_item')))
+            total_items += value
+            code = normalize_text(item.get('codigo_produto'))
+            if code is None:
+                continue
+            row = self.stock.setdefault(code, [None, None, 0.0, 0.0, 0, None, None])
+            row[0] = normalize_text(item.get('descricao')) or row[0]
+            row[1] = normalize_text(item.get('unidade')) or row[1]
+            if kind == 'entry':
+                row[2] += quantidade or 0.0
+                row[3] += value
+                row[4] += code not in seen
+                seen.add(code)
+            elif row[6] is None or date >= row[6]:
+                row[5] = quantidade
+                row[6] = date
+
+        if kind != 'entry':
+            return
+        total = to_number(data.get('valor_total_documento'))
+        total = total_items if total is None else total
+        month = date[:7]
+        key = (normalize_cnpj(data.get('cnpj_fornecedor')) or '', month)
+        spend = self.spend.setdefault(key, [None, 0.0, 0])
+        spend[0] = normalize_text(data.get('fornecedor')) or spend[0]
+        spend[1] += total
+        spend[2] += 1
+        monthly = self.months.setdefault(month, [0.0, 0])
+        monthly[0] += total
+        monthly[1] += 1
+
+    def apply(self, conn):
+        """Aplica as variações com upserts (na transação corrente)"""
+        conn.executemany(_STOCK_UPSERT, [
+            (code, *row) for code, row in self.stock.items()])
+        conn.executemany(_SPEND_UPSERT, [
+            (cnpj, month, row[0], row[1], row[2]) for (cnpj, month), row in self.spend.items()])
+        conn.executemany(_MONTH_UPSERT, [
+            (month, row[0], row[1]) for month, row in self.months.items()])
+
+
+class Aggregates:
+    """Consultas aos agregados materializados (leitura por chave primária)"""
+
+    def __init__(self, store):
+        self.store = store
+        conn = store._connect()
+        for statement in SCHEMA:
+            conn.execute(statement)
+        store.add_listener(self.apply_batch)
+
+    def apply_batch(self, conn, records):
+        """
+        Ouvinte do ResultStore: atualiza os agregados com os documentos novos
+        Duplicatas confirmadas (duplicate_of) não contam de novo no estoque nem nos gastos
+        """
+        delta = AggregateDelta()
+        for record in records:
+            if record.get('duplicate_of'):
+                continue
+            delta.add_document(record['data'], record['created_at'])
+        delta.apply(conn)
+
+    def stock(self, codigo_produto):
+        row = self.store._connect().execute(
+            f'SELECT {", ".join(STOCK_COLUMNS)} FROM stock WHERE codigo_produto = ?',
+            (codigo_produto,)).fetchone()
+        return stock_entry(row) if row else None
+
+    def stock_page(self, cursor=None, limit=100):
+        """Produtos em ordem de código, paginados pelo último código"""
+        rows = self.store._connect().execute(
+            f'SELECT {", ".join(STOCK_COLUMNS)} FROM stock WHERE codigo_produto > ?'
+            ' ORDER BY codigo_produto LIMIT ?', (cursor or '', limit + 1)).fetchall()
+        products = [stock_entry(row) for row in rows[:limit]]
+        return products, products[-1]['codigo_produto'] if len(rows) > limit else None
+
+    def financial_summary(self, cnpj_fornecedor=None, mes_inicio=None, mes_fim=None):
+        """Gasto por mês (de um fornecedor ou total) no intervalo AAAA-MM informado"""
+        params = [mes_inicio or '', mes_fim or '9999-99']
+        if cnpj_fornecedor:
+            sql = ('SELECT mes, valor_total, documentos, fornecedor FROM spend'
+                   ' WHERE cnpj_fornecedor = ? AND mes BETWEEN ? AND ? ORDER BY mes')
+            params.insert(0, normalize_cnpj(cnpj_fornecedor) or '')
+        else:
+            sql = ('SELECT mes, valor_total, documentos, NULL FROM spend_month'
+                   ' WHERE mes BETWEEN ? AND ? ORDER BY mes')
+        rows = self.store._connect().execute(sql, params).fetchall()
+        summary = {
+            'meses': [{'mes': mes, 'valor_total': round(valor, 2), 'documentos': documentos}
+                      for mes, valor, documentos, _ in rows],
+            'valor_total': round(sum(row[1] for row in rows), 2),
+            'documentos': sum(row[2] for row in rows),
+        }
+        if cnpj_fornecedor:
+            summary['cnpj_fornecedor'] = normalize_cnpj(cnpj_fornecedor)
+            summary['fornecedor'] = rows[-1][3] if rows else None
+        return summary
+
+    def rebuild(self):
+        """Recalcula todos os agregados a partir dos documentos persistidos"""
+        conn = self.store._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stock_rows, spend_rows, month_rows = compute_aggregates(conn)
+            conn.execute('DELETE FROM stock')
+            conn.execute('DELETE FROM spend')
+            conn.execute('DELETE FROM spend_month')
+            conn.executemany('INSERT INTO stock VALUES (?, ?, ?, ?, ?, ?, ?, ?)', stock_rows)
+            conn.executemany('INSERT INTO spend VALUES (?, ?, ?, ?, ?)', spend_rows)
+            conn.executemany('INSERT INTO spend_month VALUES (?, ?, ?)', month_rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info(f'Rebuilt aggregates: {len(stock_rows)} products, {len(spend_rows)} supplier-months')
+        return len(stock_rows), len(spend_rows)
+
+
+def stock_entry(row):
+    return dict(zip(STOCK_COLUMNS, row))
+
+
+def _last_by(groups, order, count):
+    """Índice da última linha (maior `order`) de cada grupo; -1 se o grupo não tiver linhas"""
+    import numpy as np
+    last = np.full(count, -1, dtype=np.int64)
+    sorted_rows = np.lexsort((order, groups))
+    last[groups[sorted_rows]] = sorted_rows  # atribuições repetidas: vale a última
+    return last
+
+
+def compute_aggregates(conn):
+    """
+    Agregados completos com operações colunares (NumPy), para backfill:
+    lê documentos e itens como colunas, agrupa com unique/bincount e devolve
+    as linhas das tabelas stock, spend e spend_month
+    """
+    import numpy as np
+
+    docs = conn.execute(
+        'SELECT id, tipo_documento, COALESCE(data_emissao, date(created_at, \'unixepoch\')),'
+        ' COALESCE(cnpj_fornecedor, \'\'), fornecedor, valor_total_documento FROM documents'
+        ' WHERE duplicate_of IS NULL ORDER BY id').fetchall()
+    if not docs:
+        return [], [], []
+    ids, types, dates, cnpjs, suppliers, declared = (np.array(column, dtype=object) for column in zip(*docs))
+    doc_ids = ids.astype(np.int64)
+    doc_date = dates.astype(str)
+    # Tipo de cada documento classificado uma vez por valor distinto
+    type_values, type_index = np.unique(types.astype(str), return_inverse=True)
+    type_kind = np.array([{'entry': 1, 'count': 2}.get(document_kind(t), 0) for t in type_values], dtype=np.int8)
+    doc_kind = type_kind[type_index]
+
+    items = conn.execute(
+        'SELECT document_id, codigo_produto, descricao, unidade, quantidade, valor_unitario,'
+        ' valor_total_item FROM items WHERE document_id IN'
+        ' (SELECT id FROM documents WHERE duplicate_of IS NULL) ORDER BY document_id, position').fetchall()
+    columns = zip(*items) if items else [()] * 7
+    item_ids, codes, descriptions, units, quantity, unit_value, total_value = (
+        np.array(column, dtype=object) for column in columns)
+    item_doc = np.searchsorted(doc_ids, item_ids.astype(np.int64))
+    quantity, unit_value, total_value = (c.astype(np.float64) for c in (quantity, unit_value, total_value))
+    value = np.where(np.isnan(total_value),
+                     np.nan_to_num(quantity * unit_value, nan=0.0), total_value)
+    kind = doc_kind[item_doc]
+
+    # Estoque por produto: itens com código em notas fiscais e relatórios de contagem
+    stock_rows = []
+    rows = np.flatnonzero((codes != None) & (kind > 0))  # noqa: E711
+    if len(rows):
+        product_codes, product = np.unique(codes[rows].astype(str), return_inverse=True)
+        count = len(product_codes)
+        row_doc, row_kind, row_quantity = item_doc[rows], kind[rows], quantity[rows]
+
+        entries = row_kind == 1
+        quantity_in = np.bincount(product[entries], np.nan_to_num(row_quantity[entries]), count)
+        value_in = np.bincount(product[entries], value[rows][entries], count)
+        # Documentos distintos com entrada do produto
+        pairs = np.unique(product[entries].astype(np.int64) * len(docs) + row_doc[entries])
+        documents = np.bincount(pairs // len(docs), minlength=count)
+        last_description = _last_non_null(product, descriptions[rows], count)
+        last_unit = _last_non_null(product, units[rows], count)
+
+        # Última contagem: maior (data, ordem de gravação) entre as linhas de contagem
+        counts = np.flatnonzero(row_kind == 2)
+        last_count = np.full(count, -1, dtype=np.int64)
+        if len(counts):
+            count_dates = doc_date[row_doc[counts]].astype(str)
+            ordered = counts[np.lexsort((counts, count_dates, product[counts]))]
+            last_count[product[ordered]] = ordered  # atribuições repetidas: vale a última
+
+        for index, code in enumerate(product_codes):
+            counted = last_count[index]
+            counted_quantity = row_quantity[counted] if counted >= 0 else np.nan
+            stock_rows.append((
+                str(code), last_description[index], last_unit[index],
+                float(quantity_in[index]), float(value_in[index]), int(documents[index]),
+                None if np.isnan(counted_quantity) else float(counted_quantity),
+                str(doc_date[row_doc[counted]]) if counted >= 0 else None,
+            ))
+
+    # Gasto por fornecedor/mês (apenas notas fiscais)
+    entry_docs = np.flatnonzero(doc_kind == 1)
+    if not len(entry_docs):
+        return stock_rows, [], []
+    items_total = np.bincount(item_doc, value, len(docs))
+    declared_total = declared.astype(np.float64)
+    doc_total = np.where(np.isnan(declared_total), items_total, declared_total)[entry_docs]
+    months = doc_date[entry_docs].astype('U7')  # AAAA-MM
+    entry_cnpjs = cnpjs[entry_docs].astype(str)
+
+    keys, group = np.unique(np.char.add(np.char.add(entry_cnpjs, '|'), months), return_inverse=True)
+    spend_total = np.bincount(group, doc_total, len(keys))
+    spend_docs = np.bincount(group, minlength=len(keys))
+    last_supplier = _last_non_null(group, suppliers[entry_docs], len(keys))
+    spend_rows = []
+    for index, key in enumerate(keys):
+        cnpj, month = str(key).split('|')
+        spend_rows.append((cnpj, month, last_supplier[index], float(spend_total[index]), int(spend_docs[index])))
+
+    month_keys, month_group = np.unique(months, return_inverse=True)
+    month_total = np.bincount(month_group, doc_total, len(month_keys))
+    month_docs = np.bincount(month_group, minlength=len(month_keys))
+    month_rows = [(str(m), float(t), int(c)) for m, t, c in zip(month_keys, month_total, month_docs)]
+    return stock_rows, spend_rows, month_rows
+
+
+def _last_non_null(groups, values, count):
+    """Último valor não nulo (na ordem das linhas) de cada grupo"""
+    import numpy as np
+    result = [None] * count
+    rows = np.flatnonzero(values != None)  # noqa: E711
+    if len(rows):
+        last = _last_by(groups[rows], rows, count)
+        for index in np.flatnonzero(last >= 0):
+            result[index] = values[rows[last[index]]]
+    return result
+
+
+def init_aggregates(app):
+    """Registra os agregados sobre o armazenamento de resultados (se habilitado)"""
+    store = app.extensions.get('result_store')
+    aggregates = Aggregates(store) if store is not None else None
+    app.extensions['aggregates'] = aggregates
+    return aggregates
+
+
+def main():
+    """Reconstrói os agregados de um banco de resultados (python -m app.aggregates <banco>)"""
+    import argparse
+    from app.results import ResultStore
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db', help='Caminho do banco (RESULTS_DB_PATH)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    products, supplier_months = Aggregates(ResultStore(args.db)).rebuild()
+    print(f'{products} produtos, {supplier_months} fornecedor-meses '
+          f'em {time.perf_counter() - started:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,10 @@
 """
 Módulo de autenticação (opcional)
 """
-import os
+import hmac
 import hashlib
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from flask_login import UserMixin
 
 class User(UserMixin):
@@ -20,17 +20,15 @@ class User(UserMixin):
     def get(user_id):
         """Recupera usuário por ID (implementação básica)"""
         # Em produção, isso viria de um banco de dados
-        users = {
-            '1': User('1', 'admin', hash_password('admin123'))
-        }
-        return users.get(user_id)
+        return _USERS.get(user_id)
     
     @staticmethod
     def authenticate(username, password):
         """Autentica usuário"""
         # Em produção, isso viria de um banco de dados
-        if username == 'admin' and verify_password('admin123', hash_password('admin123')):
-            return User('1', 'admin', hash_password('admin123'))
+        user = _USERS_BY_NAME.get(username)
+        if user and verify_password(password, user.password_hash):
+            return user
         return None
 
 def hash_password(password):
@@ -38,8 +36,38 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def verify_password(password, password_hash):
-    """Verifica senha"""
-    return hash_password(password) == password_hash
+    """Verifica senha (comparação em tempo constante)"""
+    return hmac.compare_digest(hash_password(password), password_hash)
+
+# Usuários montados uma vez (o hash não é recalculado a cada requisição)
+_USERS = {
+    '1': User('1', 'admin', hash_password('admin123'))
+}
+_USERS_BY_NAME = {user.username: user for user in _USERS.values()}
+
+def request_token():
+    """Token do cabeçalho Authorization ("Bearer <token>" ou o token puro)"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None
+    return auth_header.split(' ')[1] if ' ' in auth_header else auth_header
+
+def api_key_name(token):
+    """Nome da chave (loja/filial) do token, ou None se inválido"""
+    return current_app.extensions['api_keys'].verify(token)
+
+def request_api_key():
+    """
+    Nome da chave de API da requisição atual, ou None
+    Verificado uma vez por requisição e guardado em g junto com o token (limite
+    de taxa e auth_required usam o mesmo resultado; um contexto de aplicação
+    reaproveitado entre requisições não devolve a chave de outro token)
+    """
+    token = request_token()
+    cached = g.get('_api_key')
+    if cached is None or cached[0] != token:
+        cached = g._api_key = (token, api_key_name(token) if token else None)
+    return cached[1]
 
 def auth_required(f):
     """
@@ -53,18 +81,15 @@ def auth_required(f):
             return f(*args, **kwargs)
         
         # Verificar token de autenticação básica
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
+        token = request_token()
+        if not token:
             return jsonify({'error': 'Token de autenticação necessário'}), 401
         
         try:
-            # Implementação básica - em produção, use JWT ou similar
-            token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
-            
-            # Verificar se token é válido (implementação simplificada)
-            expected_token = os.getenv('API_TOKEN', 'default-token')
-            if token != expected_token:
+            key_name = request_api_key()
+            if key_name is None:
                 return jsonify({'error': 'Token inválido'}), 401
+            g.api_key = key_name
                 
         except Exception as e:
             current_app.logger.warning(f'Auth error: {e}')
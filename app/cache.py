@@ -0,0 +1,229 @@
+"""
+Cache de extrações endereçado por conteúdo
+Evita reenviar ao GCS/Gemini documentos já processados (reenvios, retries, fotos duplicadas)
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Tamanho dos blocos lidos ao calcular o hash do upload
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Ao passar do limite em disco, despeja até esta fração dele (evita varrer a cada escrita)
+DISK_EVICT_TARGET = 0.9
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """Calcula o SHA-256 de um stream e retorna ao início"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash, model_id, prompt_version):
+    """Chave do cache: hash do conteúdo + modelo + versão do prompt"""
+    raw = f'{content_hash}:{model_id}:{prompt_version}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Cache em dois níveis para resultados de extração:
+    - LRU em memória, limitado em número de entradas
+    - Disco (opcional), com TTL e despejo por tamanho total; o índice do disco
+      (tamanho por chave, do mais antigo ao mais recente) fica em memória e o
+      diretório só é varrido no início e quando o total passa do limite
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None, disk_ttl=7 * 24 * 3600,
+                 disk_max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_ttl = disk_ttl
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._disk_index = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with self._disk_lock:
+                self._disk_rescan()
+
+    def get(self, key):
+        """Retorna o valor armazenado ou None"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return value
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._memory_set(key, value)
+        return value
+
+    def set(self, key, value):
+        """Armazena o valor nos dois níveis"""
+        with self._lock:
+            self._memory_set(key, value)
+        self._disk_set(key, value)
+
+    def clear(self):
+        """Remove todas as entradas (memória e disco)"""
+        with self._lock:
+            self._memory.clear()
+        with self._disk_lock:
+            for _, path, _, _ in self._disk_entries():
+                _silent_unlink(path)
+            self._disk_index.clear()
+            self._disk_bytes = 0
+
+    def stats(self):
+        """Contadores de acerto/falha do cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+    def _memory_set(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.disk_ttl:
+                _silent_unlink(path)
+                self._disk_forget(key)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._disk_lock:
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+        return value
+
+    def _disk_set(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+                size = f.tell()
+            # Escrita atômica para leitores em outros workers
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            _silent_unlink(tmp_path)
+            return
+        with self._disk_lock:
+            self._disk_bytes += size - self._disk_index.pop(key, 0)
+            self._disk_index[key] = size
+            if self._disk_bytes > self.disk_max_bytes:
+                self._disk_evict()
+
+    def _disk_forget(self, key):
+        with self._disk_lock:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+
+    def _disk_entries(self):
+        """(mtime, caminho, chave, tamanho) dos arquivos do diretório"""
+        if not self.disk_dir:
+            return []
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, entry.path, entry.name[:-len('.json')], st.st_size))
+        return entries
+
+    def _disk_rescan(self):
+        """
+        Reconstrói o índice a partir do diretório (chamado sob _disk_lock), removendo
+        as entradas expiradas; inclui o que outros workers gravaram
+        """
+        now = time.time()
+        self._disk_index.clear()
+        self._disk_bytes = 0
+        for mtime, path, key, size in sorted(self._disk_entries()):
+            if now - mtime > self.disk_ttl:
+                _silent_unlink(path)
+                continue
+            self._disk_index[key] = size
+            self._disk_bytes += size
+
+    def _disk_evict(self):
+        """
+        Total acima do limite (chamado sob _disk_lock): varre o diretório e remove as
+        entradas mais antigas até DISK_EVICT_TARGET do limite
+        """
+        self._disk_rescan()
+        target = self.disk_max_bytes * DISK_EVICT_TARGET
+        while self._disk_index and self._disk_bytes > target:
+            key, size = self._disk_index.popitem(last=False)
+            _silent_unlink(self._disk_path(key))
+            self._disk_bytes -= size
+
+
+def _silent_unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def init_extraction_cache(app):
+    """Cria o cache de extrações conforme a configuração da aplicação"""
+    if not app.config.get('EXTRACTION_CACHE_ENABLED', True):
+        app.extensions['extraction_cache'] = None
+        return None
+
+    cache = ExtractionCache(
+        max_entries=app.config['EXTRACTION_CACHE_MAX_ENTRIES'],
+        disk_dir=app.config.get('EXTRACTION_CACHE_DIR') or None,
+        disk_ttl=app.config['EXTRACTION_CACHE_TTL'],
+        disk_max_bytes=app.config['EXTRACTION_CACHE_MAX_BYTES'],
+    )
+    app.extensions['extraction_cache'] = cache
+    return cache
@@ -0,0 +1,250 @@
+"""
+Cascata de modelos da extração
+Cada documento vai primeiro ao modelo mais barato (e mais rápido) da cascata; a saída
+é validada (JSON, campos obrigatórios, totais dos itens) e só sobe para o modelo
+seguinte quando a validação falha ou quando o tipo de documento detectado exige um
+nível mínimo (MODEL_CASCADE_ROUTES). Taxa de acerto, latência e custo por nível
+ficam em /cascade e em /metrics
+"""
+import threading
+from app.metrics import CASCADE_CALLS, CASCADE_COST, CASCADE_DURATION, CASCADE_ESCALATIONS
+from app.model_backends import create_model_backend
+from app.results import to_number
+
+# Campos que o documento precisa trazer, por tipo detectado
+REQUIRED_FIELDS = {
+    'Nota Fiscal': ('numero_documento', 'data_emissao', 'cnpj_fornecedor', 'valor_total_documento'),
+}
+
+# Tipos conhecidos: todos precisam de ao menos um item
+DOCUMENT_TYPES = ('Nota Fiscal', 'Etiqueta de Produto', 'Relatório de Contagem')
+
+
+def close_enough(value, expected, tolerance):
+    """Diferença dentro da tolerância relativa (com folga mínima de um centavo)"""
+    return abs(value - expected) <= max(0.01, tolerance * abs(expected))
+
+
+def check_extraction(data, item_tolerance=0.01, total_tolerance=0.05):
+    """
+    Motivos para não aceitar a extração (lista vazia = aceita):
+    invalid_json, unknown_type, missing:<campo>, item_total (quantidade x valor
+    unitário diferente do total do item) e document_total (soma dos itens diferente
+    do total do documento)
+    """
+    if data is None:
+        return ['invalid_json']
+
+    reasons = []
+    doc_type = data.get('tipo_documento')
+    if doc_type not in DOCUMENT_TYPES:
+        reasons.append('unknown_type')
+
+    items = data.get('itens')
+    if not isinstance(items, list) or (not items and doc_type in DOCUMENT_TYPES):
+        reasons.append('missing:itens')
+        items = []
+    for field in REQUIRED_FIELDS.get(doc_type, ()):
+        if data.get(field) in (None, ''):
+            reasons.append(f'missing:{field}')
+
+    totals = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        quantity = to_number(item.get('quantidade'))
+        unit_value = to_number(item.get('valor_unitario'))
+        total = to_number(item.get('valor_total_item'))
+        totals.append(total)
+        if None in (quantity, unit_value, total):
+            continue
+        if not close_enough(quantity * unit_value, total, item_tolerance) and 'item_total' not in reasons:
+            reasons.append('item_total')
+
+    # Frete, impostos e descontos entram no total da nota: tolerância maior que a dos itens
+    document_total = to_number(data.get('valor_total_documento'))
+    if document_total is not None and totals and None not in totals:
+        if not close_enough(sum(totals), document_total, total_tolerance):
+            reasons.append('document_total')
+    return reasons
+
+
+class ModelTier:
+    """Nível da cascata: backend do modelo e preço (USD por 1M tokens de entrada e de saída)"""
+
+    __slots__ = ('model_id', 'backend', 'input_price', 'output_price')
+
+    def __init__(self, model_id, backend, input_price=0.0, output_price=0.0):
+        self.model_id = model_id
+        self.backend = backend
+        self.input_price = input_price
+        self.output_price = output_price
+
+    def usage(self, response):
+        """(tokens de entrada, tokens de saída, custo em USD) da resposta"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        candidate_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        cost = (prompt_tokens * self.input_price + candidate_tokens * self.output_price) / 1e6
+        return prompt_tokens, candidate_tokens, cost
+
+
+class TierStats:
+    """Contadores de um nível neste processo"""
+
+    __slots__ = ('calls', 'outcomes', 'seconds', 'prompt_tokens', 'candidate_tokens', 'cost')
+
+    def __init__(self):
+        self.calls = 0
+        self.outcomes = {'accepted': 0, 'escalated': 0, 'exhausted': 0, 'error': 0}
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.candidate_tokens = 0
+        self.cost = 0.0
+
+
+class ModelCascade:
+    """
+    Níveis do mais barato ao mais forte e o nível mínimo por tipo de documento
+    (chave do registro de prompts, ex.: {'nota_fiscal': 1})
+    """
+
+    def __init__(self, tiers, routes=None, item_tolerance=0.01, total_tolerance=0.05):
+        if not tiers:
+            raise ValueError('Cascata de modelos sem níveis')
+        self.tiers = list(tiers)
+        self.routes = dict(routes or {})
+        self.item_tolerance = item_tolerance
+        self.total_tolerance = total_tolerance
+        self._stats = [TierStats() for _ in self.tiers]
+        self._reasons = {}
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self):
+        """Modelos da cascata, na ordem (vai para a chave de cache no lugar de GEMINI_MODEL_ID)"""
+        return '>'.join(tier.model_id for tier in self.tiers)
+
+    def min_tier(self, key):
+        """Nível mínimo do tipo de documento (0 se não houver rota)"""
+        return min(self.routes.get(key, 0), len(self.tiers) - 1)
+
+    def review(self, index, extracted, detected_key=None):
+        """
+        Valida a saída do nível `index`
+        Retorna (próximo nível ou None se a saída fica, motivos)
+        """
+        reasons = check_extraction(extracted, self.item_tolerance, self.total_tolerance)
+        required = self.min_tier(detected_key)
+        if required > index:
+            reasons.append(f'route:{detected_key}')
+        if not reasons or index == len(self.tiers) - 1:
+            return None, reasons
+        return max(index + 1, required), reasons
+
+    def record(self, index, seconds, response=None, reasons=(), escalated=False, error=False):
+        """Contabiliza uma chamada do nível `index` (aqui e nas métricas)"""
+        tier = self.tiers[index]
+        if error:
+            outcome = 'error'
+        elif escalated:
+            outcome = 'escalated'
+        else:
+            outcome = 'exhausted' if reasons else 'accepted'
+        prompt_tokens, candidate_tokens, cost = tier.usage(response)
+
+        CASCADE_CALLS.labels(tier.model_id, outcome).inc()
+        CASCADE_DURATION.labels(tier.model_id).observe(seconds)
+        if cost:
+            CASCADE_COST.labels(tier.model_id).inc(cost)
+        if escalated:
+            for reason in reasons:
+                CASCADE_ESCALATIONS.labels(reason).inc()
+
+        with self._lock:
+            stats = self._stats[index]
+            stats.calls += 1
+            stats.outcomes[outcome] += 1
+            stats.seconds += seconds
+            stats.prompt_tokens += prompt_tokens
+            stats.candidate_tokens += candidate_tokens
+            stats.cost += cost
+            if escalated:
+                for reason in reasons:
+                    self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def warm(self):
+        for tier in self.tiers:
+            tier.backend.warm()
+
+    def stats(self):
+        """Taxa de acerto, latência média, tokens e custo por nível neste processo"""
+        with self._lock:
+            tiers = []
+            for tier, stats in zip(self.tiers, self._stats):
+                tiers.append({
+                    'model': tier.model_id,
+                    'calls': stats.calls,
+                    **stats.outcomes,
+                    'hit_rate': stats.outcomes['accepted'] / stats.calls if stats.calls else None,
+                    'mean_latency_ms': stats.seconds * 1000 / stats.calls if stats.calls else None,
+                    'prompt_tokens': stats.prompt_tokens,
+                    'candidate_tokens': stats.candidate_tokens,
+                    'cost_usd': round(stats.cost, 6),
+                })
+            # Cada documento termina em exatamente um nível: aceito, esgotado ou com erro
+            documents = sum(s.outcomes['accepted'] + s.outcomes['exhausted'] + s.outcomes['error']
+                            for s in self._stats)
+            cost = sum(s.cost for s in self._stats)
+            return {
+                'documents': documents,
+                'cost_usd': round(cost, 6),
+                'cost_usd_per_document': cost / documents if documents else None,
+                'escalation_reasons': dict(self._reasons),
+                'tiers': tiers,
+                'routes': dict(self.routes),
+            }
+
+
+def parse_tiers(spec):
+    """'modelo[:entrada:saída],...' em [(modelo, preço de entrada, preço de saída)]"""
+    tiers = []
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        model_id, *prices = entry.split(':')
+        if len(prices) not in (0, 2):
+            raise ValueError(f'Nível da cascata inválido: {entry}')
+        input_price, output_price = (float(p) for p in prices) if prices else (0.0, 0.0)
+        tiers.append((model_id.strip(), input_price, output_price))
+    return tiers
+
+
+def parse_routes(spec, registry):
+    """'tipo=nível,...' em {chave do prompt: nível}; o tipo aceita chave ou nome ('Nota Fiscal')"""
+    routes = {}
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, level = entry.partition('=')
+        template = registry.get(name) if name.strip() else None
+        if template is None or not level.strip().isdigit():
+            raise ValueError(f'Rota da cascata inválida: {entry}')
+        routes[template.key] = int(level)
+    return routes
+
+
+def create_model_cascade(config, registry):
+    """Cascata de MODEL_CASCADE (None com menos de dois modelos: vale GEMINI_MODEL_ID)"""
+    tiers = parse_tiers(config.get('MODEL_CASCADE'))
+    if len(tiers) < 2:
+        return None
+    return ModelCascade(
+        [ModelTier(model_id, create_model_backend(config, model_id=model_id), input_price, output_price)
+         for model_id, input_price, output_price in tiers],
+        routes=parse_routes(config.get('MODEL_CASCADE_ROUTES'), registry),
+        item_tolerance=config['MODEL_CASCADE_ITEM_TOLERANCE'],
+        total_tolerance=config['MODEL_CASCADE_TOTAL_TOLERANCE'],
+    )
+
+
+def init_model_cascade(app):
+    """Registra a cascata de modelos na aplicação (depois do registro de prompts)"""
+    cascade = create_model_cascade(app.config, app.extensions['prompt_registry'])
+    app.extensions['model_cascade'] = cascade
+    return cascade
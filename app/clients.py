@@ -0,0 +1,128 @@
+"""
+Registro dos clientes pesados do processo (modelo generativo, armazenamento)
+Aquece os clientes ao iniciar o worker, fora do caminho da primeira requisição,
+e tenta de novo com backoff exponencial quando a inicialização falha
+"""
+import os
+import time
+import random
+import logging
+import threading
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# Extensões da aplicação com clientes a aquecer (backends com método warm())
+CLIENT_EXTENSIONS = ('model_backend', 'model_cascade', 'storage_backend')
+
+# Estado dos módulos pré-carregados no aquecimento (imports adiados no boot)
+IMPORTS_STATE = 'imports'
+
+
+class ClientState:
+    """Situação de um cliente: pending, ready ou failed"""
+
+    __slots__ = ('status', 'attempts', 'error', 'seconds')
+
+    def __init__(self):
+        self.status = 'pending'
+        self.attempts = 0
+        self.error = None
+        self.seconds = None
+
+    def as_dict(self):
+        return {'status': self.status, 'attempts': self.attempts,
+                'error': self.error, 'seconds': self.seconds}
+
+
+class ClientRegistry:
+    """
+    Estado de aquecimento dos backends registrados em app.extensions
+    Os backends já são seguros entre threads (criação sob lock); aqui cada um é
+    inicializado uma vez por processo, por um único thread de aquecimento
+    """
+
+    def __init__(self, app, names=CLIENT_EXTENSIONS, retry_initial=1.0, retry_max=60.0, modules=()):
+        self.app = app
+        self.modules = tuple(modules)
+        self.names = ((IMPORTS_STATE,) if self.modules else ()) + tuple(names)
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._states = {name: ClientState() for name in self.names}
+        self._warm_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def ready(self):
+        return all(state.status == 'ready' for state in self._states.values())
+
+    def status(self):
+        return {name: state.as_dict() for name, state in self._states.items()}
+
+    def warm(self):
+        """Inicializa (no thread atual) os clientes ainda não prontos; retorna se todos estão prontos"""
+        with self._warm_lock:
+            for name in self.names:
+                state = self._states[name]
+                if state.status == 'ready':
+                    continue
+                if name == IMPORTS_STATE:
+                    warm = self._import_modules
+                else:
+                    warm = getattr(self.app.extensions.get(name), 'warm', None)
+                state.attempts += 1
+                started = time.perf_counter()
+                try:
+                    if warm is not None:
+                        warm()
+                except Exception as e:
+                    state.status = 'failed'
+                    state.error = f'{type(e).__name__}: {e}'
+                    logger.warning(f'Client warm-up failed for {name} (attempt {state.attempts}): {e}')
+                    continue
+                state.status = 'ready'
+                state.error = None
+                state.seconds = round(time.perf_counter() - started, 3)
+                logger.info(f'Client {name} ready in {state.seconds:.3f}s')
+        return self.ready
+
+    def _import_modules(self):
+        for module in self.modules:
+            importlib.import_module(module)
+
+    def start_warmup(self):
+        """
+        Aquece em segundo plano até todos os clientes ficarem prontos (idempotente)
+        Recriado após fork: threads do processo pai não existem no worker
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self._states = {name: ClientState() for name in self.names}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._warm_loop, name='client-warmup', daemon=True)
+            self._thread.start()
+
+    def _warm_loop(self):
+        delay = self.retry_initial
+        while not self.warm():
+            # Jitter para que os workers de várias instâncias não tentem em sincronia
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.retry_max)
+
+
+def init_client_registry(app):
+    """Registra os clientes do processo; o aquecimento começa no boot do worker ou no primeiro /ready"""
+    registry = ClientRegistry(
+        app,
+        retry_initial=app.config['CLIENT_WARMUP_RETRY_INITIAL'],
+        retry_max=app.config['CLIENT_WARMUP_RETRY_MAX'],
+        modules=[m.strip() for m in app.config['CLIENT_WARMUP_IMPORTS'].split(',') if m.strip()],
+    )
+    app.extensions['client_registry'] = registry
+    return registry
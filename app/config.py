@@ -20,21 +20,165 @@ class Config:
     GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID')
     GCP_LOCATION = os.getenv('GCP_LOCATION', 'us-central1')
     GEMINI_MODEL_ID = os.getenv('GEMINI_MODEL_ID', 'gemini-1.5-flash-001')
+    
+    # Backend de modelo: vertex (produção) ou fake (testes/benchmarks offline)
+    MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'vertex')
+    FAKE_MODEL_LATENCY = os.getenv('FAKE_MODEL_LATENCY', 'fixed:0')  # fixed:<ms>, uniform:<min>:<max>, lognormal:<mediana>:<sigma>
+    FAKE_MODEL_RESPONSES_FILE = os.getenv('FAKE_MODEL_RESPONSES_FILE')
+    FAKE_MODEL_SEED = int(os.getenv('FAKE_MODEL_SEED', 0))
+    FAKE_MODEL_FAILURE_RATE = float(os.getenv('FAKE_MODEL_FAILURE_RATE', 0))
+    FAKE_MODEL_INIT_LATENCY = float(os.getenv('FAKE_MODEL_INIT_LATENCY', 0))  # ms, uma vez por processo
+    FAKE_MODEL_FAILURE_CODE = int(os.getenv('FAKE_MODEL_FAILURE_CODE', 503))  # status HTTP das falhas injetadas
+    # Saída estruturada (response_mime_type/response_schema): JSON garantido pelo modelo
+    MODEL_STRUCTURED_OUTPUT = os.getenv('MODEL_STRUCTURED_OUTPUT', 'true').lower() == 'true'
     GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME')
     
+    # Configurações de armazenamento de objetos
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'gcs')  # gcs, local ou memory
+    STORAGE_LOCAL_PATH = os.getenv('STORAGE_LOCAL_PATH', '/tmp/vision_storage')
+    GCS_CHUNK_SIZE = int(os.getenv('GCS_CHUNK_SIZE', 8 * 1024 * 1024))  # Múltiplo de 256KB
+    GCS_POOL_MAXSIZE = int(os.getenv('GCS_POOL_MAXSIZE', 32))
+    # Abaixo de MAX_CONTENT_LENGTH, senão o upload composto nunca é usado
+    GCS_COMPOSITE_THRESHOLD = int(os.getenv('GCS_COMPOSITE_THRESHOLD', 8 * 1024 * 1024))
+    GCS_COMPOSITE_PARTS = int(os.getenv('GCS_COMPOSITE_PARTS', 8))
+    
+    # Documentos até este tamanho vão inline ao Gemini (sem GCS no caminho crítico)
+    INLINE_MAX_BYTES = int(os.getenv('INLINE_MAX_BYTES', 4 * 1024 * 1024))  # 4MB
+    # Pré-processamento de imagens (redução, EXIF, recompressão)
+    PREPROCESS_ENABLED = os.getenv('PREPROCESS_ENABLED', 'true').lower() == 'true'
+    PREPROCESS_MAX_EDGE = int(os.getenv('PREPROCESS_MAX_EDGE', 2048))  # Lado maior em pixels
+    PREPROCESS_QUALITY = int(os.getenv('PREPROCESS_QUALITY', 85))  # Qualidade JPEG
+    PREPROCESS_GRAYSCALE = os.getenv('PREPROCESS_GRAYSCALE', 'false').lower() == 'true'
+    PREPROCESS_MIN_BYTES = int(os.getenv('PREPROCESS_MIN_BYTES', 256 * 1024))  # Imagens menores passam direto
+    ARCHIVE_ORIGINAL_UPLOADS = os.getenv('ARCHIVE_ORIGINAL_UPLOADS', 'false').lower() == 'true'
+
+    # PDFs com várias páginas: extração paralela por grupo de páginas
+    PDF_SPLIT_ENABLED = os.getenv('PDF_SPLIT_ENABLED', 'true').lower() == 'true'
+    PDF_SPLIT_MIN_PAGES = int(os.getenv('PDF_SPLIT_MIN_PAGES', 2))
+    PDF_PAGES_PER_PART = max(1, int(os.getenv('PDF_PAGES_PER_PART', 1)))
+    PDF_MAX_PAGE_WORKERS = int(os.getenv('PDF_MAX_PAGE_WORKERS', 4))
+    ARCHIVE_INLINE_UPLOADS = os.getenv('ARCHIVE_INLINE_UPLOADS', 'true').lower() == 'true'
+    
+    # Configurações do cache de extrações
+    EXTRACTION_CACHE_ENABLED = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() == 'true'
+    EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', 256))
+    EXTRACTION_CACHE_DIR = os.getenv('EXTRACTION_CACHE_DIR')  # Vazio desabilita o nível em disco
+    EXTRACTION_CACHE_TTL = int(os.getenv('EXTRACTION_CACHE_TTL', 7 * 24 * 3600))  # 7 dias
+    EXTRACTION_CACHE_MAX_BYTES = int(os.getenv('EXTRACTION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    
+    # Configurações de processamento assíncrono
+    UPLOAD_ASYNC_DEFAULT = os.getenv('UPLOAD_ASYNC_DEFAULT', 'false').lower() == 'true'
+    # memory:// só serve a um único worker (o gunicorn não sobe com ele e GUNICORN_WORKERS > 1)
+    JOB_STORE_URL = os.getenv('JOB_STORE_URL', 'sqlite:////tmp/vision_jobs.db')  # memory://, sqlite:///caminho ou redis://
+    JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 4))
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 32))
+    JOB_TTL = int(os.getenv('JOB_TTL', 3600))  # 1 hora
+    
+    # Persistência dos resultados em SQLite (vazio desabilita o GET /documents)
+    RESULTS_DB_PATH = os.getenv('RESULTS_DB_PATH', '')
+    RESULTS_BATCH_SIZE = int(os.getenv('RESULTS_BATCH_SIZE', 200))
+    RESULTS_FLUSH_INTERVAL = float(os.getenv('RESULTS_FLUSH_INTERVAL', 0.5))
+    RESULTS_MAX_PENDING = int(os.getenv('RESULTS_MAX_PENDING', 10000))
+    
+    # Duplicatas confirmadas por (cnpj_fornecedor, numero_documento): off, flag (grava com
+    # duplicate_of) ou skip (não grava); o hash perceptual só aponta candidatas
+    DUPLICATE_DETECTION = os.getenv('DUPLICATE_DETECTION', 'flag').lower()
+    DUPLICATE_MAX_DISTANCE = int(os.getenv('DUPLICATE_MAX_DISTANCE', 4))  # bits de 64
+    DUPLICATE_REFRESH_INTERVAL = float(os.getenv('DUPLICATE_REFRESH_INTERVAL', 30))
+    
+    # Exportação em massa (GET /export): documentos lidos por lote e linhas por row group do Parquet
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_ROW_GROUP_SIZE = int(os.getenv('EXPORT_ROW_GROUP_SIZE', 20000))
+    
+    # Configurações de upload em lote e concorrência por etapa (por processo)
+    BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 50))
+    BATCH_MAX_CONTENT_LENGTH = int(os.getenv('BATCH_MAX_CONTENT_LENGTH', 200 * 1024 * 1024))  # 200MB
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 16))
+    GCS_MAX_CONCURRENCY = int(os.getenv('GCS_MAX_CONCURRENCY', 16))
+    # Chamadas simultâneas ao Gemini por processo: acompanha GUNICORN_THREADS (gunicorn.conf.py)
+    VERTEX_MAX_CONCURRENCY = int(os.getenv('VERTEX_MAX_CONCURRENCY', 32))
+    
+    # Aquecimento dos clientes no boot do worker (/ready só responde 200 depois dele)
+    CLIENT_WARMUP_ENABLED = os.getenv('CLIENT_WARMUP_ENABLED', 'true').lower() == 'true'
+    CLIENT_WARMUP_RETRY_INITIAL = float(os.getenv('CLIENT_WARMUP_RETRY_INITIAL', 1))
+    CLIENT_WARMUP_RETRY_MAX = float(os.getenv('CLIENT_WARMUP_RETRY_MAX', 60))
+    # Resiliência da chamada ao Gemini (segundos): prazo total e por tentativa,
+    # novas tentativas com jitter limitadas por orçamento, circuit breaker e hedge no p95
+    MODEL_RESILIENCE_ENABLED = os.getenv('MODEL_RESILIENCE_ENABLED', 'true').lower() == 'true'
+    MODEL_DEADLINE = float(os.getenv('MODEL_DEADLINE', 90))
+    MODEL_ATTEMPT_TIMEOUT = float(os.getenv('MODEL_ATTEMPT_TIMEOUT', 45))
+    MODEL_MAX_ATTEMPTS = int(os.getenv('MODEL_MAX_ATTEMPTS', 3))
+    MODEL_RETRY_BASE_DELAY = float(os.getenv('MODEL_RETRY_BASE_DELAY', 0.5))
+    MODEL_RETRY_MAX_DELAY = float(os.getenv('MODEL_RETRY_MAX_DELAY', 8))
+    MODEL_RETRY_BUDGET_RATIO = float(os.getenv('MODEL_RETRY_BUDGET_RATIO', 0.1))
+    MODEL_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv('MODEL_RETRY_BUDGET_MIN_PER_SECOND', 1))
+    MODEL_BREAKER_FAILURE_RATE = float(os.getenv('MODEL_BREAKER_FAILURE_RATE', 0.5))
+    MODEL_BREAKER_MIN_CALLS = int(os.getenv('MODEL_BREAKER_MIN_CALLS', 20))
+    MODEL_BREAKER_WINDOW = int(os.getenv('MODEL_BREAKER_WINDOW', 50))
+    MODEL_BREAKER_RESET_TIMEOUT = float(os.getenv('MODEL_BREAKER_RESET_TIMEOUT', 30))
+    MODEL_HEDGE_ENABLED = os.getenv('MODEL_HEDGE_ENABLED', 'false').lower() == 'true'
+    MODEL_HEDGE_QUANTILE = float(os.getenv('MODEL_HEDGE_QUANTILE', 0.95))
+    MODEL_HEDGE_MIN_DELAY = float(os.getenv('MODEL_HEDGE_MIN_DELAY', 0.5))
+    MODEL_HEDGE_MIN_SAMPLES = int(os.getenv('MODEL_HEDGE_MIN_SAMPLES', 20))
+    # Stream: prazo até o primeiro pedaço (com nova tentativa) e entre pedaços
+    MODEL_STREAM_FIRST_CHUNK_TIMEOUT = float(os.getenv('MODEL_STREAM_FIRST_CHUNK_TIMEOUT', 30))
+    MODEL_STREAM_IDLE_TIMEOUT = float(os.getenv('MODEL_STREAM_IDLE_TIMEOUT', 15))
+    
+    # Controle de admissão da extração: limite adaptativo (teto VERTEX_MAX_CONCURRENCY)
+    # e fila limitada; acima dela, 503 imediato com Retry-After
+    ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    ADMISSION_INITIAL_LIMIT = int(os.getenv('ADMISSION_INITIAL_LIMIT', 16))
+    ADMISSION_MIN_LIMIT = int(os.getenv('ADMISSION_MIN_LIMIT', 2))
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 32))
+    ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT', 10))  # segundos na fila
+    ADMISSION_TOLERANCE = float(os.getenv('ADMISSION_TOLERANCE', 2.0))
+    ADMISSION_SMOOTHING = float(os.getenv('ADMISSION_SMOOTHING', 0.2))
+    ADMISSION_BACKOFF = float(os.getenv('ADMISSION_BACKOFF', 0.9))
+    
+    # Cascata de modelos: modelo[:preço_entrada:preço_saída] (USD por 1M tokens), do mais
+    # barato ao mais forte; sobe de nível só quando a validação da saída falha
+    # Vazio ou um único modelo: toda extração usa GEMINI_MODEL_ID
+    MODEL_CASCADE = os.getenv('MODEL_CASCADE', '')
+    MODEL_CASCADE_ROUTES = os.getenv('MODEL_CASCADE_ROUTES', '')  # tipo=nível mínimo, ex.: nota_fiscal=1
+    MODEL_CASCADE_ITEM_TOLERANCE = float(os.getenv('MODEL_CASCADE_ITEM_TOLERANCE', 0.01))
+    MODEL_CASCADE_TOTAL_TOLERANCE = float(os.getenv('MODEL_CASCADE_TOTAL_TOLERANCE', 0.05))
+    
+    # Módulos pesados importados só sob demanda; o aquecimento os carrega em segundo plano
+    CLIENT_WARMUP_IMPORTS = os.getenv('CLIENT_WARMUP_IMPORTS', 'vertexai.preview.generative_models,pypdf')
+    
     # Configurações de segurança
     ENABLE_AUTH = os.getenv('ENABLE_AUTH', 'false').lower() == 'true'
+    # Chaves de API (uma por loja/filial), guardadas como hash; sem fonte usa API_TOKEN
+    API_KEYS_FILE = os.getenv('API_KEYS_FILE', '')
+    API_KEYS_DB = os.getenv('API_KEYS_DB', '')
+    API_KEYS_RELOAD_INTERVAL = float(os.getenv('API_KEYS_RELOAD_INTERVAL', 5))
+    API_KEYS_CACHE_SIZE = int(os.getenv('API_KEYS_CACHE_SIZE', 4096))
     SESSION_COOKIE_SECURE = os.getenv('FLASK_ENV') == 'production'
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(hours=1)
     
     # Configurações de rate limiting
+    RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
     RATELIMIT_STORAGE_URL = os.getenv('REDIS_URL', 'memory://')
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'fixed-window')
+    RATELIMIT_HEADERS_ENABLED = True
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True
+    # Cota compartilhada pelos endpoints de upload, em unidades de custo
+    RATELIMIT_UPLOAD_LIMIT = os.getenv('RATELIMIT_UPLOAD_LIMIT', '60 per minute')
+    # Cota compartilhada pelas consultas (polling de /jobs, /documents, /export, /stock...)
+    RATELIMIT_READ_LIMIT = os.getenv('RATELIMIT_READ_LIMIT', '300 per minute')
+    # Bytes por unidade de custo (PDFs custam no mínimo uma unidade por página)
+    RATELIMIT_COST_UNIT_BYTES = int(os.getenv('RATELIMIT_COST_UNIT_BYTES', 1024 * 1024))
+    # Cotas por chave de API (nome no arquivo de chaves): 'loja_01=600 per minute;loja_02=...'
+    RATELIMIT_TOKEN_LIMITS = os.getenv('RATELIMIT_TOKEN_LIMITS', '')
     
     # Configurações de logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
+    # Cabeçalho Server-Timing com a duração de cada etapa
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+    
     @staticmethod
     def validate_required_config():
         """Valida se as configurações obrigatórias estão definidas"""
@@ -44,6 +188,9 @@ class Config:
         if missing_vars:
             raise ValueError(f"Variáveis de ambiente obrigatórias não definidas: {', '.join(missing_vars)}")
         
+        if Config.GCS_COMPOSITE_THRESHOLD > Config.MAX_CONTENT_LENGTH:
+            raise ValueError('GCS_COMPOSITE_THRESHOLD maior que MAX_FILE_SIZE: o upload composto nunca seria usado')
+        
         return True
 
 class DevelopmentConfig(Config):
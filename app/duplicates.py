@@ -0,0 +1,189 @@
+"""
+Detecção de documentos quase duplicados
+Hash perceptual (dHash de 64 bits) das imagens recebidas, indexado por blocos
+(multi-index hashing) para busca por distância de Hamming, e verificação de (cnpj_fornecedor, numero_documento)
+depois da extração. O dHash não separa notas diferentes no mesmo layout (a miniatura
+9x8 não enxerga números nem linhas de itens): só a verificação confirma a duplicata
+"""
+import io
+import time
+import logging
+import threading
+from PIL import Image, ImageOps
+from app.preprocess import PREPROCESSABLE_MIME_TYPES
+from app.results import normalize_cnpj, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Tamanho da miniatura do dHash: 9x8 -> 64 comparações entre vizinhos
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# Imagens menores que isso não têm detalhe suficiente para um hash confiável
+MIN_IMAGE_EDGE = 32
+
+
+def perceptual_hash(data):
+    """
+    dHash de 64 bits: miniatura em tons de cinza 9x8 e um bit por par de vizinhos
+    na horizontal. Tolera recompressão, redimensionamento e pequenas variações de
+    enquadramento. None se a imagem for pequena demais.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format == 'JPEG':
+            image.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+        if min(image.size) < MIN_IMAGE_EDGE:
+            return None
+        image = ImageOps.exif_transpose(image).convert('L')
+        pixels = image.resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.BILINEAR).tobytes()
+
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for column in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def to_signed(value):
+    """Hash sem sinal -> INTEGER do SQLite (64 bits com sinal)"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class MultiIndexHash:
+    """
+    Índice de hashes de 64 bits para busca por distância de Hamming (multi-index hashing)
+    Os bits são divididos em radius + 1 blocos: pelo princípio da casa dos pombos,
+    hashes a até `radius` bits de distância coincidem exatamente em pelo menos um
+    bloco, então só os candidatos dos baldes desses blocos são comparados
+    """
+
+    def __init__(self, radius, bits=64):
+        self.radius = radius
+        chunks = radius + 1
+        edges = [bits * i // chunks for i in range(chunks + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self.size = 0
+
+    def add(self, value, ref):
+        self.size += 1
+        entry = (value, ref)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(entry)
+
+    def search(self, value):
+        """[(distância, ref)] dos valores a no máximo `radius` bits, do mais próximo ao mais distante"""
+        found = {}
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for candidate, ref in table.get((value >> shift) & mask, ()):
+                if ref not in found:
+                    distance = hamming(value, candidate)
+                    if distance <= self.radius:
+                        found[ref] = distance
+        return sorted((distance, ref) for ref, distance in found.items())
+
+
+class DuplicateIndex:
+    """
+    Índice dos hashes perceptuais vistos por este processo
+    Com um ResultStore, carrega os hashes persistidos e busca periodicamente os
+    gravados por outros workers (documentos com id maior que o último visto)
+    """
+
+    def __init__(self, max_distance=4, store=None, refresh_interval=30.0):
+        self.max_distance = max_distance
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self._index = MultiIndexHash(max_distance)
+        self._seen = set()
+        self._last_id = 0
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Inclui no índice os hashes persistidos desde a última leitura"""
+        if self.store is None:
+            return
+        rows = self.store._connect().execute(
+            'SELECT id, sha256, phash FROM documents WHERE id > ? AND phash IS NOT NULL'
+            ' AND duplicate_of IS NULL ORDER BY id', (self._last_id,)).fetchall()
+        with self._lock:
+            for document_id, sha256, phash in rows:
+                self._add(to_unsigned(phash), sha256)
+                self._last_id = max(self._last_id, document_id)
+            self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def check(self, phash, sha256):
+        """
+        Documento mais próximo dentro de max_distance (outro conteúdo, mesma imagem):
+        {'sha256', 'distance'} ou None. O hash é registrado para as próximas consultas.
+        """
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+        with self._lock:
+            matches = [(distance, ref) for distance, ref in self._index.search(phash)
+                       if ref != sha256]
+            self._add(phash, sha256)
+        if not matches:
+            return None
+        distance, ref = matches[0]
+        return {'sha256': ref, 'distance': distance}
+
+    def _add(self, phash, sha256):
+        if sha256 not in self._seen:
+            self._seen.add(sha256)
+            self._index.add(phash, sha256)
+
+    @property
+    def size(self):
+        return self._index.size
+
+
+def find_same_document(store, extracted_data, sha256):
+    """
+    sha256 de outro documento persistido com o mesmo (cnpj_fornecedor, numero_documento),
+    ou None. Usa o índice (numero_documento, id).
+    """
+    numero = normalize_text(extracted_data.get('numero_documento'))
+    cnpj = normalize_cnpj(extracted_data.get('cnpj_fornecedor'))
+    if store is None or numero is None or cnpj is None:
+        return None
+    row = store._connect().execute(
+        'SELECT sha256 FROM documents WHERE numero_documento = ? AND cnpj_fornecedor = ?'
+        ' AND sha256 != ? AND duplicate_of IS NULL ORDER BY id LIMIT 1',
+        (numero, cnpj, sha256)).fetchone()
+    return row[0] if row else None
+
+
+def document_phash(document):
+    """Hash perceptual do upload (None para PDFs, imagens pequenas ou ilegíveis)"""
+    if document.mime_type not in PREPROCESSABLE_MIME_TYPES:
+        return None
+    try:
+        return perceptual_hash(document.data)
+    except Exception as e:
+        logger.warning(f'Could not hash {document.sha256[:12]}: {e}')
+        return None
+
+
+def init_duplicate_index(app):
+    """Cria o índice de duplicatas (DUPLICATE_DETECTION = off, flag ou skip)"""
+    index = None
+    if app.config['DUPLICATE_DETECTION'] != 'off':
+        index = DuplicateIndex(
+            max_distance=app.config['DUPLICATE_MAX_DISTANCE'],
+            store=app.extensions.get('result_store'),
+            refresh_interval=app.config['DUPLICATE_REFRESH_INTERVAL'],
+        )
+    app.extensions['duplicate_index'] = index
+    return index
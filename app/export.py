@@ -0,0 +1,202 @@
+"""
+Exportação em massa dos documentos persistidos (NDJSON, CSV e Parquet)
+Cada formato é um gerador de blocos: o documento é lido do SQLite em lotes e
+escrito à medida que é gerado, com memória constante qualquer que seja o volume
+"""
+import io
+import csv
+import json
+import importlib.util
+from app.metrics import EXPORT_ROWS
+from app.results import ITEM_COLUMNS, SUMMARY_COLUMNS
+
+# Uma linha por item (documentos sem itens ocupam uma linha com os campos do item vazios)
+FLAT_COLUMNS = SUMMARY_COLUMNS + ITEM_COLUMNS
+
+# Tamanho aproximado de cada bloco enviado nos formatos texto
+CHUNK_SIZE = 64 * 1024
+
+# formato -> (mimetype, extensão)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+_EMPTY_ITEM = (None,) * len(ITEM_COLUMNS)
+
+
+def parquet_available():
+    """pyarrow é opcional: sem ele a exportação Parquet fica indisponível"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def iter_ndjson(store, batch_size=1000, **filters):
+    """Um objeto JSON por documento, com os itens aninhados em 'itens'"""
+    buffer, size, count = [], 0, 0
+    for document, items in store.iter_documents(batch_size, **filters):
+        record = dict(zip(SUMMARY_COLUMNS, document))
+        record['itens'] = [dict(zip(ITEM_COLUMNS, item)) for item in items]
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        buffer.append(line)
+        size += len(line)
+        count += 1
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+    EXPORT_ROWS.labels('ndjson').inc(count)
+
+
+def flat_rows(store, batch_size=1000, **filters):
+    """Linhas de FLAT_COLUMNS: documento repetido em cada item"""
+    for document, items in store.iter_documents(batch_size, **filters):
+        if not items:
+            yield document + _EMPTY_ITEM
+        for item in items:
+            yield document + item
+
+
+def iter_csv(store, batch_size=1000, **filters):
+    """CSV com cabeçalho, uma linha por item"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(FLAT_COLUMNS)
+    count = 0
+    for row in flat_rows(store, batch_size, **filters):
+        writer.writerow(row)
+        count += 1
+        if output.tell() >= CHUNK_SIZE:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+    EXPORT_ROWS.labels('csv').inc(count)
+
+
+class _ChunkSink:
+    """Arquivo só de escrita que acumula os bytes até o próximo take()"""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+    types = {
+        'id': pa.int64(),
+        'valor_total_documento': pa.float64(),
+        'created_at': pa.float64(),
+        'quantidade': pa.float64(),
+        'valor_unitario': pa.float64(),
+        'valor_total_item': pa.float64(),
+    }
+    return pa.schema([(column, types.get(column, pa.string())) for column in FLAT_COLUMNS])
+
+
+def iter_parquet(store, batch_size=1000, row_group_size=20000, **filters):
+    """
+    Parquet (zstd) em row groups de `row_group_size` linhas: cada row group é
+    montado em colunas, gravado e enviado; o rodapé sai no último bloco
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    rows, count = [], 0
+
+    def write_group():
+        columns = zip(*rows)
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+
+    for row in flat_rows(store, batch_size, **filters):
+        rows.append(row)
+        if len(rows) >= row_group_size:
+            write_group()
+            count += len(rows)
+            rows = []
+            yield sink.take()
+    if rows:
+        write_group()
+        count += len(rows)
+    writer.close()
+    yield sink.take()
+    EXPORT_ROWS.labels('parquet').inc(count)
+
+
+def export_chunks(store, fmt, batch_size=1000, row_group_size=20000, **filters):
+    """Gerador de blocos (str para ndjson/csv, bytes para parquet) do formato pedido"""
+    if fmt == 'ndjson':
+        return iter_ndjson(store, batch_size, **filters)
+    if fmt == 'csv':
+        return iter_csv(store, batch_size, **filters)
+    if fmt == 'parquet':
+        return iter_parquet(store, batch_size, row_group_size, **filters)
+    raise ValueError(f'Formato não suportado: {fmt}')
+
+
+def main():
+    """Exporta um banco de resultados (python -m app.export <banco> --format csv -o saida.csv)"""
+    import sys
+    import time
+    import argparse
+    from app.results import ResultStore, normalize_date
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('db', help='Caminho do banco (RESULTS_DB_PATH)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('-o', '--output', help='Arquivo de saída (padrão: saída padrão)')
+    parser.add_argument('--cnpj-fornecedor')
+    parser.add_argument('--numero-documento')
+    parser.add_argument('--tipo-documento')
+    parser.add_argument('--codigo-produto')
+    parser.add_argument('--data-inicio', type=normalize_date, help='DD/MM/AAAA ou AAAA-MM-DD')
+    parser.add_argument('--data-fim', type=normalize_date, help='DD/MM/AAAA ou AAAA-MM-DD')
+    parser.add_argument('--incluir-duplicatas', action='store_true',
+                        help='Inclui documentos marcados como duplicata (duplicate_of)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--row-group-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    chunks = export_chunks(
+        ResultStore(args.db), args.format, args.batch_size, args.row_group_size,
+        cnpj_fornecedor=args.cnpj_fornecedor, numero_documento=args.numero_documento,
+        tipo_documento=args.tipo_documento, codigo_produto=args.codigo_produto,
+        data_inicio=args.data_inicio, data_fim=args.data_fim, duplicates=args.incluir_duplicatas,
+    )
+    started = time.perf_counter()
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    size = 0
+    try:
+        for chunk in chunks:
+            data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+            output.write(data)
+            size += len(data)
+    finally:
+        if args.output:
+            output.close()
+    print(f'{size} bytes em {time.perf_counter() - started:.2f}s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
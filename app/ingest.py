@@ -0,0 +1,111 @@
+"""
+Leitura de uploads em passagem única
+Lê o stream da requisição uma vez, calculando hash, tipo MIME e tamanho
+"""
+import hashlib
+from flask import current_app
+from app.security import MAX_FILE_SIZE, validate_filename, validate_content_head
+from app.validation import create_structure_validator
+
+# Tamanho dos blocos lidos do stream da requisição
+INGEST_CHUNK_SIZE = 256 * 1024
+
+# Bytes necessários para identificar o tipo MIME
+SNIFF_SIZE = 1024
+
+
+class UploadedDocument:
+    """Documento validado e mantido em memória, pronto para o pipeline"""
+
+    __slots__ = ('data', 'filename', 'mime_type', 'size', 'sha256', 'phash')
+
+    def __init__(self, data, filename, mime_type, sha256):
+        self.data = data
+        self.filename = filename
+        self.mime_type = mime_type
+        self.size = len(data)
+        self.sha256 = sha256
+        # Hash perceptual (app.duplicates), calculado sob demanda
+        self.phash = None
+
+
+def ingest_upload(file, max_size=MAX_FILE_SIZE, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Valida e lê um upload (FileStorage) em uma única passagem:
+    - Nome e extensão antes de qualquer leitura
+    - Tipo MIME a partir do primeiro 1 KiB
+    - Estrutura do formato (PNG, JPEG, PDF...) verificada bloco a bloco
+    - Tamanho verificado durante a leitura, abortando ao exceder o limite
+    - SHA-256 calculado incrementalmente
+    """
+    try:
+        if not file:
+            return {'valid': False, 'error': 'Arquivo não fornecido'}
+
+        name_result = validate_filename(file.filename)
+        if not name_result['valid']:
+            return name_result
+
+        stream = getattr(file, 'stream', file)
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        mime_type = None
+        structure = None
+
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                return {'valid': False, 'error': f'Arquivo muito grande. Máximo: {max_size // (1024*1024)}MB'}
+
+            digest.update(chunk)
+            chunks.append(chunk)
+
+            if structure is None and size >= SNIFF_SIZE:
+                # Identificar o tipo antes de continuar lendo
+                head = b''.join(chunks)
+                content_result = validate_content_head(head[:SNIFF_SIZE])
+                if not content_result['valid']:
+                    return content_result
+                mime_type = content_result['mime_type']
+                structure = create_structure_validator(mime_type)
+                chunk = head
+            if structure is not None and not structure.feed(chunk):
+                return structure_error(file, structure)
+
+        if size == 0:
+            return {'valid': False, 'error': 'Arquivo vazio'}
+
+        if structure is None:
+            head = b''.join(chunks)
+            content_result = validate_content_head(head)
+            if not content_result['valid']:
+                return content_result
+            mime_type = content_result['mime_type']
+            structure = create_structure_validator(mime_type)
+            structure.feed(head)
+        if structure.finish():
+            return structure_error(file, structure)
+
+        # Uma única cópia para o buffer final; BytesIO/Part compartilham esse objeto
+        data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        document = UploadedDocument(
+            data,
+            file.filename,
+            mime_type or getattr(file, 'mimetype', None) or 'application/octet-stream',
+            digest.hexdigest(),
+        )
+        return {'valid': True, 'filename': name_result['filename'], 'size': size, 'document': document}
+
+    except Exception as e:
+        current_app.logger.error(f'File ingest error: {e}')
+        return {'valid': False, 'error': 'Erro na validação do arquivo'}
+
+
+def structure_error(file, structure):
+    """Resposta para arquivo corrompido ou incompleto"""
+    current_app.logger.warning(f'Structural validation failed for {file.filename}: {structure.error}')
+    return {'valid': False, 'error': f'Arquivo corrompido ou incompleto: {structure.error}'}
@@ -0,0 +1,51 @@
+"""
+Medição de tempo por etapa do processamento
+As durações alimentam o histograma do /metrics e, por requisição, o cabeçalho Server-Timing
+"""
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+from app.metrics import observe_stage
+
+
+@contextmanager
+def stage(name):
+    """Mede a duração de uma etapa do pipeline"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name, seconds):
+    """Registra a duração da etapa no histograma e na requisição atual (se houver)"""
+    observe_stage(name, seconds)
+    if has_request_context():
+        timings = g.setdefault('stage_timings', [])
+        timings.append((name, seconds))
+
+
+def server_timing_header(timings):
+    """Formata as durações no padrão Server-Timing (milissegundos)"""
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings)
+
+
+def init_instrumentation(app):
+    """Adiciona o cabeçalho Server-Timing às respostas, se habilitado"""
+    if not app.config.get('SERVER_TIMING_ENABLED', False):
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        timings = list(g.get('stage_timings', []))
+        started_at = g.get('request_started_at')
+        if started_at is not None:
+            timings.append(('total', time.perf_counter() - started_at))
+        if timings:
+            response.headers['Server-Timing'] = server_timing_header(timings)
+        return response
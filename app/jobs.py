@@ -0,0 +1,257 @@
+"""
+Processamento assíncrono de uploads
+Fila limitada de jobs executados em segundo plano, com estado em store plugável
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Estados finais: um job concluído não volta para queued/running
+FINAL_STATES = (JOB_DONE, JOB_FAILED)
+
+
+class JobQueueFull(Exception):
+    """Fila de jobs sem capacidade para novos uploads"""
+
+
+def apply_update(job, fields):
+    """
+    Aplica os campos ao job; False (sem alteração) se uma atualização atrasada
+    tentar tirar o job de um estado final
+    """
+    if job.get('status') in FINAL_STATES and fields.get('status', job['status']) not in FINAL_STATES:
+        return False
+    job.update(fields)
+    return True
+
+
+class JobStore:
+    """Interface de armazenamento do estado dos jobs"""
+
+    def create(self, job):
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """Store local ao processo (apenas para um único worker)"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._prune()
+            self._jobs[job['id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                apply_update(job, fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['updated_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    """Store em SQLite, compartilhado entre workers do mesmo host"""
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' updated_at REAL NOT NULL,'
+                ' data TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, job):
+        conn = self._connect()
+        conn.execute('DELETE FROM jobs WHERE updated_at < ?', (time.time() - self.ttl,))
+        conn.execute('INSERT OR REPLACE INTO jobs (id, updated_at, data) VALUES (?, ?, ?)',
+                     (job['id'], job['updated_at'], json.dumps(job, ensure_ascii=False)))
+
+    def update(self, job_id, **fields):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            job = json.loads(row[0]) if row is not None else None
+            if job is not None and apply_update(job, fields):
+                conn.execute('UPDATE jobs SET updated_at = ?, data = ? WHERE id = ?',
+                             (job['updated_at'], json.dumps(job, ensure_ascii=False), job_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, job_id):
+        row = self._connect().execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+class RedisJobStore(JobStore):
+    """Store em Redis, compartilhado entre workers e instâncias"""
+
+    def __init__(self, url, ttl=3600, prefix='vision:job:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._watch_error = redis.WatchError
+
+    def create(self, job):
+        self.client.set(self.prefix + job['id'],
+                        json.dumps(job, ensure_ascii=False), ex=self.ttl)
+
+    def update(self, job_id, **fields):
+        """
+        GET-modify-SET atômico (WATCH/MULTI): se outro worker gravar o job entre a
+        leitura e a escrita, a transação falha e a atualização é refeita sobre o novo estado
+        """
+        key = self.prefix + job_id
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    job = json.loads(raw) if raw is not None else None
+                    if job is None or not apply_update(job, fields):
+                        pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job, ensure_ascii=False), ex=self.ttl)
+                    pipe.execute()
+                    return
+                except self._watch_error:
+                    continue
+
+    def get(self, job_id):
+        raw = self.client.get(self.prefix + job_id)
+        return json.loads(raw) if raw is not None else None
+
+
+def create_job_store(url, ttl=3600):
+    """Cria o store a partir de uma URL (memory://, sqlite:///caminho, redis://...)"""
+    if not url or url.startswith('memory://'):
+        return InMemoryJobStore(ttl=ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteJobStore(url[len('sqlite:///'):], ttl=ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobStore(url, ttl=ttl)
+    raise ValueError(f'Store de jobs não suportado: {url}')
+
+
+class JobManager:
+    """Executor limitado que processa uploads fora do ciclo da requisição"""
+
+    def __init__(self, app, store, max_workers=4, max_pending=32):
+        self.app = app
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='upload-job')
+        # Limita jobs aceitos (em execução + aguardando) por processo
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, document, prompt=None, owner=None):
+        """
+        Enfileira um documento já validado (UploadedDocument) e retorna o job criado
+        `owner` é o nome da chave de API que enviou o upload (só ela consulta o job)
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull()
+
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': JOB_QUEUED,
+            'filename': document.filename,
+            'owner': owner,
+            'created_at': now,
+            'updated_at': now,
+        }
+        try:
+            self.store.create(job)
+            self.executor.submit(self._run, job['id'], document, prompt)
+        except Exception:
+            self._slots.release()
+            raise
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _run(self, job_id, document, prompt=None):
+        from app.pipeline import MODEL_UNAVAILABLE_MESSAGE, process_document
+        from app.resilience import ModelUnavailable
+        try:
+            with self.app.app_context():
+                self.store.update(job_id, status=JOB_RUNNING, updated_at=time.time())
+                try:
+                    payload, status = process_document(document, prompt)
+                except ModelUnavailable as e:
+                    self.app.logger.warning(f'Model unavailable for job {job_id}: {e}')
+                    self.store.update(job_id, status=JOB_FAILED, updated_at=time.time(),
+                                      error=MODEL_UNAVAILABLE_MESSAGE, http_status=503)
+                    return
+                except Exception as e:
+                    self.app.logger.error(f'Error processing job {job_id}: {e}', exc_info=True)
+                    self.store.update(job_id, status=JOB_FAILED, updated_at=time.time(),
+                                      error='Erro interno do servidor', http_status=500)
+                    return
+                self.store.update(job_id, status=JOB_DONE, updated_at=time.time(),
+                                  result=payload, http_status=status)
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def init_jobs(app):
+    """Cria o gerenciador de jobs conforme a configuração da aplicação"""
+    store = create_job_store(app.config['JOB_STORE_URL'], ttl=app.config['JOB_TTL'])
+    manager = JobManager(
+        app,
+        store,
+        max_workers=app.config['JOB_MAX_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+    )
+    app.extensions['job_manager'] = manager
+    return manager
@@ -0,0 +1,248 @@
+"""
+Armazenamento de chaves de API (uma por loja/filial)
+Chaves guardadas só como hash, carregadas de arquivo ou SQLite e recarregadas
+sem reiniciar; verificação por digest (sem comparação byte a byte do token)
+e LRU limitado das chaves salgadas já verificadas. Chaves salgadas têm um
+identificador público ('<kid>.<segredo>'): cada token é conferido contra no
+máximo um registro PBKDF2
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import logging
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Iterações do formato salgado (pbkdf2_sha256$<kid>$<iterações>$<sal>$<hash>)
+PBKDF2_ITERATIONS = 100_000
+
+# Separador entre o identificador público e o segredo das chaves salgadas
+KEY_ID_SEPARATOR = '.'
+
+# Chave usada quando nenhuma fonte está configurada (compatível com API_TOKEN)
+DEFAULT_TOKEN = 'default-token'
+
+
+def hash_api_key(key, salted=False, iterations=PBKDF2_ITERATIONS):
+    """
+    Hash de uma chave para armazenamento:
+    - 'sha256:<hex>' (padrão): indexado, verificação O(1) mesmo com milhares de chaves
+    - 'pbkdf2_sha256$<kid>$...' (salted=True): mais lento, conferido só quando o LRU não
+      tem a chave; a chave precisa ter o formato '<kid>.<segredo>'
+    """
+    if not salted:
+        return 'sha256:' + hashlib.sha256(key.encode()).hexdigest()
+    kid = key_id(key)
+    if kid is None:
+        raise ValueError(f"Chave salgada sem identificador ('<kid>{KEY_ID_SEPARATOR}<segredo>')")
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', key.encode(), salt.encode(), iterations)
+    return f'pbkdf2_sha256${kid}${iterations}${salt}${base64.b64encode(digest).decode()}'
+
+
+def key_id(key):
+    """Identificador público da chave ('<kid>.<segredo>') ou None"""
+    kid, separator, secret = key.partition(KEY_ID_SEPARATOR)
+    return kid if separator and kid and secret and '$' not in kid else None
+
+
+def _check_pbkdf2(key, stored):
+    _, _, iterations, salt, expected = stored.split('$')
+    digest = hashlib.pbkdf2_hmac('sha256', key.encode(), salt.encode(), int(iterations))
+    return hmac.compare_digest(base64.b64encode(digest).decode(), expected)
+
+
+class KeySnapshot:
+    """Conjunto imutável de chaves carregado de uma fonte"""
+
+    __slots__ = ('by_digest', 'salted', 'names')
+
+    def __init__(self, entries):
+        self.by_digest = {}
+        self.salted = {}
+        self.names = []
+        for name, stored in entries:
+            self.names.append(name)
+            if stored.startswith('sha256:'):
+                self.by_digest[stored[7:].lower()] = name
+            elif stored.startswith('pbkdf2_sha256$') and stored.count('$') == 4:
+                self.salted[stored.split('$')[1]] = (name, stored)
+            elif stored.startswith('pbkdf2_sha256$'):
+                logger.warning(f'Ignoring API key {name}: salted hash without key id, reissue the key')
+            else:
+                logger.warning(f'Ignoring API key {name}: unknown hash format')
+
+    def verify(self, key, digest):
+        """Nome da chave correspondente ou None"""
+        name = self.by_digest.get(digest)
+        if name is not None:
+            return name
+        entry = self.salted.get(key_id(key))
+        if entry is not None and _check_pbkdf2(key, entry[1]):
+            return entry[0]
+        return None
+
+
+def load_key_file(path):
+    """Linhas '<nome>:<hash>'; linhas vazias e comentários (#) são ignorados"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, _, stored = line.partition(':')
+            if not stored:
+                logger.warning(f'Ignoring malformed line in {path}')
+                continue
+            entries.append((name.strip(), stored.strip()))
+    return entries
+
+
+def load_key_db(path):
+    """Tabela api_keys(name, key_hash, active) de um banco SQLite"""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return connection.execute(
+            'SELECT name, key_hash FROM api_keys WHERE active = 1').fetchall()
+    finally:
+        connection.close()
+
+
+class ApiKeyStore:
+    """
+    Chaves de API verificadas em microssegundos:
+    - o token é reduzido a SHA-256 e procurado no índice do snapshot atual
+      (comparar digests de um hash não vaza o token; não há comparação byte a byte)
+    - chaves salgadas (PBKDF2) são achadas pelo identificador público do token e
+      conferidas uma vez; o resultado, inclusive negativo, fica num LRU limitado por
+      digest, limpo a cada recarga (token sem identificador conhecido não custa PBKDF2)
+    - a fonte é verificada no máximo a cada `reload_interval` segundos (mtime/tamanho)
+    """
+
+    def __init__(self, key_file=None, key_db=None, reload_interval=5.0, cache_size=4096):
+        self.key_file = key_file
+        self.key_db = key_db
+        self.reload_interval = reload_interval
+        self.cache_size = cache_size
+        self.generation = 0
+        self._snapshot = KeySnapshot(())
+        self._signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._verified = OrderedDict()
+        self._verified_lock = threading.Lock()
+        self.reload()
+
+    def verify(self, token):
+        """Nome da chave (loja/filial) do token, ou None se inválido"""
+        if not token:
+            return None
+        if time.monotonic() >= self._next_check:
+            self.maybe_reload()
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        snapshot = self._snapshot
+        name = snapshot.by_digest.get(digest)
+        if name is not None or key_id(token) not in snapshot.salted:
+            return name
+
+        with self._verified_lock:
+            if digest in self._verified:
+                self._verified.move_to_end(digest)
+                return self._verified[digest]
+        name = snapshot.verify(token, digest)
+        with self._verified_lock:
+            if snapshot is self._snapshot:
+                self._verified[digest] = name
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        return name
+
+    def keys(self):
+        return list(self._snapshot.names)
+
+    def maybe_reload(self):
+        """Recarrega se a fonte mudou desde a última leitura"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            if self._source_signature() == self._signature:
+                return False
+        return self.reload()
+
+    def reload(self):
+        """Lê a fonte e troca o snapshot; em erro mantém as chaves atuais"""
+        with self._lock:
+            signature = self._source_signature()
+            try:
+                entries = self._load_entries()
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f'Error loading API keys: {e}')
+                self._signature = signature
+                return False
+            self._snapshot = KeySnapshot(entries)
+            self._signature = signature
+            self._next_check = time.monotonic() + self.reload_interval
+            self.generation += 1
+            with self._verified_lock:
+                self._verified.clear()
+        logger.info(f'Loaded {len(entries)} API keys (generation {self.generation})')
+        return True
+
+    def _load_entries(self):
+        if self.key_db:
+            return load_key_db(self.key_db)
+        if self.key_file:
+            return load_key_file(self.key_file)
+        return [('default', hash_api_key(os.getenv('API_TOKEN', DEFAULT_TOKEN)))]
+
+    def _source_signature(self):
+        if self.key_db:
+            return tuple(_file_signature(self.key_db + suffix) for suffix in ('', '-wal'))
+        if self.key_file:
+            return _file_signature(self.key_file)
+        return hashlib.sha256(os.getenv('API_TOKEN', DEFAULT_TOKEN).encode()).digest()
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def init_api_key_store(app):
+    """Cria o armazenamento de chaves de API a partir da configuração"""
+    store = ApiKeyStore(
+        key_file=app.config.get('API_KEYS_FILE') or None,
+        key_db=app.config.get('API_KEYS_DB') or None,
+        reload_interval=app.config.get('API_KEYS_RELOAD_INTERVAL', 5.0),
+        cache_size=app.config.get('API_KEYS_CACHE_SIZE', 4096),
+    )
+    app.extensions['api_keys'] = store
+    return store
+
+
+def main():
+    """Gera uma nova chave e a linha para o arquivo de chaves (python -m app.keystore <nome>)"""
+    import argparse
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('name', help='Nome da loja/filial')
+    parser.add_argument('--salted', action='store_true', help='Hash PBKDF2 salgado')
+    args = parser.parse_args()
+
+    key = secrets.token_urlsafe(32)
+    if args.salted:
+        key = f'{secrets.token_hex(4)}{KEY_ID_SEPARATOR}{key}'
+    print(f'Chave (entregue ao cliente): {key}')
+    print(f'Linha do arquivo de chaves:  {args.name}:{hash_api_key(key, salted=args.salted)}')
+
+
+if __name__ == '__main__':
+    main()
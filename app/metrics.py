@@ -0,0 +1,204 @@
+"""
+Métricas Prometheus do serviço
+Em produção (gunicorn) usa o modo multiprocesso do prometheus_client: cada worker
+grava seus valores em PROMETHEUS_MULTIPROC_DIR e o /metrics agrega todos eles.
+"""
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+
+# Tamanho dos uploads: de etiquetas (~50KB) a PDFs no limite de 16MB
+SIZE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+
+# Durações de etapas: de validação (ms) a chamadas ao Gemini (dezenas de segundos)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+UPLOAD_SIZE = Histogram(
+    'vision_upload_size_bytes',
+    'Tamanho dos documentos recebidos',
+    ['endpoint'],
+    buckets=SIZE_BUCKETS,
+)
+
+STAGE_DURATION = Histogram(
+    'vision_stage_duration_seconds',
+    'Duração de cada etapa do processamento',
+    ['stage'],
+    buckets=STAGE_BUCKETS,
+)
+
+UPLOADS = Counter(
+    'vision_uploads_total',
+    'Documentos processados por resultado',
+    ['outcome'],
+)
+
+GEMINI_TOKENS = Counter(
+    'vision_gemini_tokens_total',
+    'Tokens consumidos nas chamadas ao Gemini',
+    ['kind'],
+)
+
+JSON_PARSE_FAILURES = Counter(
+    'vision_json_parse_failures_total',
+    'Respostas do Gemini que não puderam ser lidas como JSON',
+)
+
+MODEL_OUTPUT_PARSES = Counter(
+    'vision_model_output_parses_total',
+    'Leituras da saída do modelo: direta, reparada ou falha (taxa de reparo)',
+    ['result'],
+)
+
+PREPROCESS_BYTES = Counter(
+    'vision_preprocess_bytes_total',
+    'Bytes das imagens antes (original) e depois (processed) do pré-processamento',
+    ['kind'],
+)
+
+RATE_LIMIT_REJECTIONS = Counter(
+    'vision_rate_limit_rejections_total',
+    'Requisições rejeitadas pelo rate limiting',
+    ['endpoint'],
+)
+
+CACHE_LOOKUPS = Counter(
+    'vision_extraction_cache_lookups_total',
+    'Consultas ao cache de extrações',
+    ['result'],
+)
+
+RESULT_WRITES = Counter(
+    'vision_result_writes_total',
+    'Resultados persistidos: written, duplicate, dropped (fila cheia) ou failed',
+    ['result'],
+)
+
+DUPLICATES = Counter(
+    'vision_duplicates_total',
+    'Duplicatas por tipo (perceptual, document_number) e ação (flagged, skipped ou unconfirmed)',
+    ['kind', 'action'],
+)
+
+EXPORT_ROWS = Counter(
+    'vision_export_rows_total',
+    'Linhas exportadas por formato (documentos no NDJSON, itens no CSV e no Parquet)',
+    ['format'],
+)
+
+MODEL_CALLS = Counter(
+    'vision_model_calls_total',
+    'Tentativas de chamada ao modelo: success, error, timeout ou rejected (circuito aberto)',
+    ['outcome'],
+)
+
+MODEL_RETRIES = Counter(
+    'vision_model_retries_total',
+    'Novas tentativas ao modelo: attempted, budget_exhausted ou deadline',
+    ['result'],
+)
+
+MODEL_HEDGES = Counter(
+    'vision_model_hedges_total',
+    'Chamadas duplicadas (hedge): sent, won (respondeu primeiro) ou no_capacity (sem vaga no pool)',
+    ['result'],
+)
+
+MODEL_INFLIGHT = Gauge(
+    'vision_model_calls_inflight',
+    'Chamadas ao modelo em execução no pool, inclusive as abandonadas no prazo',
+    multiprocess_mode='livesum',
+)
+
+BREAKER_TRANSITIONS = Counter(
+    'vision_model_breaker_transitions_total',
+    'Mudanças de estado do circuit breaker do modelo',
+    ['state'],
+)
+
+ADMISSIONS = Counter(
+    'vision_admissions_total',
+    'Entradas na etapa de extração: admitted, shed_queue_full ou shed_timeout',
+    ['result'],
+)
+
+# Gauges somados entre os workers vivos (capacidade e fila do serviço inteiro)
+ADMISSION_LIMIT = Gauge(
+    'vision_admission_limit',
+    'Limite adaptativo de chamadas simultâneas ao modelo',
+    multiprocess_mode='livesum',
+)
+
+ADMISSION_INFLIGHT = Gauge(
+    'vision_admission_inflight',
+    'Chamadas ao modelo em andamento',
+    multiprocess_mode='livesum',
+)
+
+ADMISSION_QUEUE = Gauge(
+    'vision_admission_queue_depth',
+    'Requisições esperando vaga para chamar o modelo',
+    multiprocess_mode='livesum',
+)
+
+
+CASCADE_CALLS = Counter(
+    'vision_cascade_calls_total',
+    'Chamadas por modelo da cascata: accepted, escalated, exhausted (último nível reprovado) ou error',
+    ['model', 'outcome'],
+)
+
+CASCADE_ESCALATIONS = Counter(
+    'vision_cascade_escalations_total',
+    'Motivos de escalonamento para o modelo seguinte da cascata',
+    ['reason'],
+)
+
+CASCADE_DURATION = Histogram(
+    'vision_cascade_call_duration_seconds',
+    'Duração das chamadas por modelo da cascata',
+    ['model'],
+    buckets=STAGE_BUCKETS,
+)
+
+CASCADE_COST = Counter(
+    'vision_cascade_cost_usd_total',
+    'Custo estimado (USD) das chamadas por modelo, pelos tokens e preços de MODEL_CASCADE',
+    ['model'],
+)
+
+
+def observe_stage(stage, seconds):
+    STAGE_DURATION.labels(stage).observe(seconds)
+
+
+def observe_token_usage(response):
+    """Soma os tokens informados em usage_metadata (se presentes)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    candidate_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    if prompt_tokens:
+        GEMINI_TOKENS.labels('prompt').inc(prompt_tokens)
+    if candidate_tokens:
+        GEMINI_TOKENS.labels('candidates').inc(candidate_tokens)
+
+
+def render_metrics():
+    """Gera o texto no formato Prometheus, agregando os workers se necessário"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,223 @@
+"""
+Backends de modelo generativo
+Vertex AI (produção) e um backend falso determinístico para testes e benchmarks
+"""
+import json
+import math
+import time
+import random
+import threading
+
+# Resposta padrão do backend falso: nota fiscal com alguns itens
+DEFAULT_FAKE_RESPONSE = {
+    'tipo_documento': 'Nota Fiscal',
+    'numero_documento': '000123456',
+    'data_emissao': '15/03/2024',
+    'fornecedor': 'Distribuidora Exemplo LTDA',
+    'cnpj_fornecedor': '12.345.678/0001-90',
+    'itens': [
+        {
+            'codigo_produto': f'P{i:04d}',
+            'descricao': f'Produto {i}',
+            'quantidade': i,
+            'unidade': 'UN',
+            'valor_unitario': 10.0,
+            'valor_total_item': 10.0 * i,
+        }
+        for i in range(1, 6)
+    ],
+    'valor_total_documento': 150.0,
+    'observacoes_adicionais': None,
+}
+
+
+class FakeModelError(RuntimeError):
+    """Falha injetada no backend falso; `code` imita o status das exceções do google.api_core"""
+
+    def __init__(self, message, code=503):
+        super().__init__(message)
+        self.code = code
+
+
+class ModelBackend:
+    """Interface comum: mesma assinatura de GenerativeModel.generate_content"""
+
+    model_id = None
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        raise NotImplementedError
+
+    def warm(self):
+        """Inicializa clientes e conexões antes da primeira requisição (padrão: nada a fazer)"""
+
+
+class VertexModelBackend(ModelBackend):
+    """GenerativeModel do Vertex AI, inicializado no primeiro uso"""
+
+    def __init__(self, project, location, model_id):
+        self.project = project
+        self.location = location
+        self.model_id = model_id
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import vertexai
+                    from vertexai.preview.generative_models import GenerativeModel
+
+                    vertexai.init(project=self.project, location=self.location)
+                    self._model = GenerativeModel(self.model_id)
+        return self._model
+
+    def warm(self):
+        """vertexai.init, GenerativeModel e o cliente de predição (canal gRPC) fora da requisição"""
+        model = self.model
+        getattr(model, '_prediction_client', None)
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        return self.model.generate_content(contents, generation_config=generation_config, stream=stream)
+
+
+class FakeUsageMetadata:
+    """Contagem de tokens no formato do Vertex"""
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    """Resposta com a mesma interface usada de GenerationResponse"""
+
+    def __init__(self, text, prompt_tokens=0):
+        self.text = text
+        self.usage_metadata = FakeUsageMetadata(prompt_tokens, max(1, len(text) // 4))
+
+
+class FakeModelBackend(ModelBackend):
+    """
+    Backend falso determinístico (com seed), com:
+    - Latência configurável: fixed:<ms>, uniform:<min>:<max> ou lognormal:<mediana>:<sigma>
+    - Distribuição de respostas: lista de {'text': ..., 'weight': ...}
+    - Falhas injetadas: fração de chamadas que levanta FakeModelError (status `failure_code`)
+    - Custo de inicialização (ms) pago uma vez por processo, como o do cliente do Vertex
+    """
+
+    def __init__(self, latency='fixed:0', responses=None, seed=0, failure_rate=0.0,
+                 model_id='fake-model', stream_chunk_size=64, init_latency=0.0, failure_code=503):
+        self.model_id = model_id
+        self.failure_code = failure_code
+        self.init_latency = init_latency
+        self.initialized = init_latency <= 0
+        self._init_lock = threading.Lock()
+        self.latency = parse_latency_spec(latency)
+        self.responses = responses or [{'text': json.dumps(DEFAULT_FAKE_RESPONSE, ensure_ascii=False), 'weight': 1}]
+        self.failure_rate = failure_rate
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self.last_generation_config = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """Sorteia latência, resposta e falha sob lock (sequência reprodutível)"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency(self._random)
+            weights = [r.get('weight', 1) for r in self.responses]
+            response = self._random.choices(self.responses, weights=weights)[0]
+            fail = self._random.random() < self.failure_rate
+        return delay, response, fail
+
+    def warm(self):
+        if not self.initialized:
+            with self._init_lock:
+                if not self.initialized:
+                    time.sleep(self.init_latency / 1000.0)
+                    self.initialized = True
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        self.warm()
+        self.last_generation_config = generation_config
+        delay, response, fail = self._draw()
+        prompt_tokens = sum(len(c) // 4 for c in contents if isinstance(c, str))
+
+        if stream:
+            return self._stream(delay, response, fail, prompt_tokens)
+
+        time.sleep(delay)
+        if fail:
+            raise FakeModelError('Falha injetada no backend falso', self.failure_code)
+        return FakeResponse(response['text'], prompt_tokens)
+
+    def _stream(self, delay, response, fail, prompt_tokens):
+        text = response['text']
+        chunks = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)] or ['']
+        # Distribui a latência entre os pedaços, com o primeiro mais lento (tempo até o 1º token)
+        first_delay = delay * 0.3
+        step_delay = (delay - first_delay) / len(chunks)
+        time.sleep(first_delay)
+        if fail:
+            raise FakeModelError('Falha injetada no backend falso', self.failure_code)
+        for chunk in chunks:
+            time.sleep(step_delay)
+            yield FakeResponse(chunk, prompt_tokens)
+
+
+def parse_latency_spec(spec):
+    """Converte 'fixed:50', 'uniform:100:300' ou 'lognormal:800:0.5' (ms) em sorteador de segundos"""
+    if callable(spec):
+        return spec
+    kind, *params = str(spec).split(':')
+    values = [float(p) for p in params]
+    if kind == 'fixed':
+        return lambda rnd: values[0] / 1000.0
+    if kind == 'uniform':
+        return lambda rnd: rnd.uniform(values[0], values[1]) / 1000.0
+    if kind == 'lognormal':
+        mu = math.log(values[0])
+        return lambda rnd: rnd.lognormvariate(mu, values[1]) / 1000.0
+    raise ValueError(f'Especificação de latência inválida: {spec}')
+
+
+def load_fake_responses(path):
+    """Lê a distribuição de respostas (lista JSON de {'text', 'weight'})"""
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        responses = json.load(f)
+    return [r if isinstance(r, dict) else {'text': r, 'weight': 1} for r in responses]
+
+
+def create_model_backend(config, model_id=None):
+    """
+    Cria o backend indicado em MODEL_BACKEND (vertex ou fake)
+    `model_id` substitui GEMINI_MODEL_ID (níveis da cascata de modelos)
+    """
+    kind = (config.get('MODEL_BACKEND') or 'vertex').lower()
+    model_id = model_id or config['GEMINI_MODEL_ID']
+    if kind == 'vertex':
+        return VertexModelBackend(config['GCP_PROJECT_ID'], config['GCP_LOCATION'], model_id)
+    if kind == 'fake':
+        return FakeModelBackend(
+            latency=config['FAKE_MODEL_LATENCY'],
+            responses=load_fake_responses(config.get('FAKE_MODEL_RESPONSES_FILE')),
+            seed=config['FAKE_MODEL_SEED'],
+            failure_rate=config['FAKE_MODEL_FAILURE_RATE'],
+            model_id=model_id,
+            init_latency=config['FAKE_MODEL_INIT_LATENCY'],
+            failure_code=config['FAKE_MODEL_FAILURE_CODE'],
+        )
+    raise ValueError(f'Backend de modelo não suportado: {kind}')
+
+
+def init_model_backend(app):
+    """Registra o backend de modelo na aplicação"""
+    backend = create_model_backend(app.config)
+    app.extensions['model_backend'] = backend
+    return backend
@@ -0,0 +1,168 @@
+"""
+Leitura tolerante da saída JSON do modelo
+Caminho rápido com json.loads; reparos apenas quando necessário
+"""
+import re
+import json
+
+# Cercas de markdown (```json ... ```)
+_FENCE_RE = re.compile(r'```(?:json|JSON)?\s*(.*?)\s*```', re.DOTALL)
+
+# Vírgula sobrando antes de fechar objeto/array
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+
+# Literais do Python que o modelo às vezes usa no lugar dos do JSON
+_PY_LITERALS_RE = re.compile(r'(?<![\w"])(None|True|False)(?![\w"])')
+_PY_LITERALS = {'None': 'null', 'True': 'true', 'False': 'false'}
+
+# Aspas tipográficas usadas como delimitadores de string (dentro de strings ficam como estão)
+_SMART_OPEN = '“'
+_SMART_CLOSE = '”'
+
+_decoder = json.JSONDecoder()
+
+
+class ModelOutputError(ValueError):
+    """Saída do modelo que não pôde ser convertida em objeto JSON"""
+
+
+def parse_model_json(text):
+    """
+    Converte a saída do modelo em dict
+    Retorna (dados, reparado); levanta ModelOutputError se não for possível
+    """
+    if not text:
+        raise ModelOutputError('Resposta vazia')
+
+    # Caminho rápido: JSON puro (modo de saída estruturada)
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, False
+    except ValueError:
+        pass
+
+    candidate = _extract_object(_strip_fences(text))
+    if candidate is None:
+        raise ModelOutputError('Nenhum objeto JSON encontrado na resposta')
+
+    for repair in _REPAIRS:
+        candidate = repair(candidate)
+        data = _try_object(candidate)
+        if data is not None:
+            return data, True
+
+    raise ModelOutputError('Resposta não é um objeto JSON válido')
+
+
+def _strip_fences(text):
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match else text
+
+
+def _extract_object(text):
+    """Isola o objeto mais externo, descartando prosa antes e depois"""
+    start = text.find('{')
+    if start == -1:
+        return None
+    try:
+        _, end = _decoder.raw_decode(text, start)
+        return text[start:end]
+    except ValueError:
+        # Objeto inválido ou truncado: vai até o último '}' (ou até o fim)
+        end = text.rfind('}')
+        return text[start:end + 1] if end > start else text[start:]
+
+
+def _try_object(text):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _identity(text):
+    return text
+
+
+def _segments(text):
+    """
+    Divide o texto em trechos (trecho, tipo): 'text' fora de strings, 'string' para
+    strings completas e 'open' para a string final não terminada (saída cortada)
+    Strings delimitadas por aspas tipográficas voltam com aspas retas
+    """
+    segments = []
+    start = 0
+    i = 0
+    length = len(text)
+    while i < length:
+        c = text[i]
+        if c != '"' and c != _SMART_OPEN:
+            i += 1
+            continue
+        if i > start:
+            segments.append((text[start:i], 'text'))
+        closing = _SMART_CLOSE if c == _SMART_OPEN else '"'
+        j = i + 1
+        escape = False
+        while j < length:
+            d = text[j]
+            if escape:
+                escape = False
+            elif d == '\\':
+                escape = True
+            elif d == closing or (closing == _SMART_CLOSE and d == '"'):
+                break
+            j += 1
+        if j >= length:
+            segments.append(('"' + text[i + 1:], 'open'))
+            return segments
+        segments.append(('"' + text[i + 1:j] + '"', 'string'))
+        i = start = j + 1
+    if start < length:
+        segments.append((text[start:], 'text'))
+    return segments
+
+
+def _outside_strings(text, fix):
+    """Aplica `fix` apenas aos trechos fora de strings"""
+    return ''.join(fix(segment) if kind == 'text' else segment for segment, kind in _segments(text))
+
+
+def _fix_outside(segment):
+    segment = _PY_LITERALS_RE.sub(lambda m: _PY_LITERALS[m.group(1)], segment)
+    return _TRAILING_COMMA_RE.sub(r'\1', segment)
+
+
+def _fix_literals(text):
+    """Aspas tipográficas como delimitadores, None/True/False e vírgulas sobrando (fora de strings)"""
+    return _outside_strings(text, _fix_outside)
+
+
+def _close_truncated(text):
+    """Fecha strings, arrays e objetos abertos (saída cortada por limite de tokens)"""
+    stack = []
+    in_string = False
+    for segment, kind in _segments(text):
+        in_string = kind == 'open'
+        if kind != 'text':
+            continue
+        for c in segment:
+            if c in '{[':
+                stack.append('}' if c == '{' else ']')
+            elif c in '}]' and stack:
+                stack.pop()
+
+    if not stack and not in_string:
+        return text
+    if in_string:
+        text += '"'
+    # Remove vírgula ou chave sem valor pendentes antes de fechar
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*|:\s*)$', '', text.rstrip())
+    text += ''.join(reversed(stack))
+    return _outside_strings(text, lambda segment: _TRAILING_COMMA_RE.sub(r'\1', segment))
+
+
+# Reparos aplicados em sequência (cada um sobre o resultado do anterior)
+_REPAIRS = (_identity, _fix_literals, _close_truncated)
@@ -0,0 +1,136 @@
+"""
+Divisão de PDFs em páginas e combinação dos resultados por página
+Cada grupo de páginas vira um documento próprio (extraído e cacheado separadamente)
+"""
+import io
+import os
+import hashlib
+from collections import Counter
+from app.ingest import UploadedDocument
+
+# Campos de cabeçalho reconciliados entre páginas (valor mais frequente)
+HEADER_FIELDS = ('tipo_documento', 'numero_documento', 'data_emissao', 'fornecedor', 'cnpj_fornecedor')
+
+# Campos usados para identificar o mesmo item repetido em páginas diferentes
+ITEM_IDENTITY_FIELDS = ('codigo_produto', 'descricao', 'quantidade', 'unidade', 'valor_unitario', 'valor_total_item')
+
+
+def split_pdf(document, pages_per_part=1, min_pages=2):
+    """
+    Divide o PDF em documentos de `pages_per_part` páginas
+    Retorna None se o PDF tiver menos de `min_pages` páginas (ou couber em um grupo).
+    A saída do pypdf é determinística: a mesma página gera os mesmos bytes
+    (e o mesmo hash), então páginas não alteradas de um PDF editado acertam o cache.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(document.data))
+    total = len(reader.pages)
+    if total < max(min_pages, pages_per_part + 1):
+        return None
+    stem = os.path.splitext(document.filename)[0] or 'upload_file'
+    parts = []
+
+    for start in range(0, total, pages_per_part):
+        end = min(start + pages_per_part, total)
+        writer = PdfWriter()
+        for index in range(start, end):
+            writer.add_page(reader.pages[index])
+        output = io.BytesIO()
+        writer.write(output)
+        data = output.getvalue()
+        parts.append(UploadedDocument(
+            data,
+            f'{stem}_p{start + 1}-{end}.pdf',
+            'application/pdf',
+            hashlib.sha256(data).hexdigest(),
+        ))
+    return parts
+
+
+def merge_page_results(page_results):
+    """
+    Combina os extracted_data das páginas (na ordem) em um único documento:
+    - Cabeçalho: valor mais frequente entre as páginas (empate: primeira página)
+    - Valor total: mais frequente (empate: última página); sem valor, soma dos itens
+    - Itens: concatenados, descartando repetições exatas vindas de outra página
+    - Observações: unidas, com aviso de divergências no cabeçalho
+    """
+    pages = [r for r in page_results if isinstance(r, dict)]
+    merged = {}
+    notes = []
+
+    for field in HEADER_FIELDS:
+        value, conflicts = _reconcile([p.get(field) for p in pages])
+        if field == 'tipo_documento' and value == 'Desconhecido':
+            value, _ = _reconcile([p.get(field) for p in pages if p.get(field) != 'Desconhecido'])
+            value = value or 'Desconhecido'
+        merged[field] = value
+        if conflicts:
+            notes.append(f'Divergência em {field} entre páginas: {", ".join(map(str, conflicts))}')
+
+    merged['itens'] = _merge_items(pages)
+
+    total, conflicts = _reconcile([p.get('valor_total_documento') for p in reversed(pages)])
+    if total is None and merged['itens']:
+        values = [i.get('valor_total_item') for i in merged['itens']]
+        if all(isinstance(v, (int, float)) for v in values):
+            total = round(sum(values), 2)
+    if conflicts:
+        notes.append(f'Divergência em valor_total_documento entre páginas: {", ".join(map(str, conflicts))}')
+    merged['valor_total_documento'] = total
+
+    observations = []
+    for page in pages:
+        text = page.get('observacoes_adicionais')
+        if text and text not in observations:
+            observations.append(text)
+    observations.extend(notes)
+    merged['observacoes_adicionais'] = ' | '.join(observations) if observations else None
+    return merged
+
+
+def _reconcile(values):
+    """Valor mais frequente (não nulo) e os demais valores divergentes"""
+    present = [v for v in values if v not in (None, '')]
+    if not present:
+        return None, []
+    counts = Counter(map(_hashable, present))
+    best = max(counts.values())
+    # Empate: prevalece a ordem recebida
+    chosen = next(v for v in present if counts[_hashable(v)] == best)
+    others = []
+    for v in present:
+        if _hashable(v) != _hashable(chosen) and v not in others:
+            others.append(v)
+    return chosen, others
+
+
+def _merge_items(pages):
+    merged = []
+    seen = {}   # identidade do item -> página em que apareceu
+    for page_index, page in enumerate(pages):
+        for item in page.get('itens') or []:
+            if not isinstance(item, dict):
+                continue
+            identity = _item_identity(item)
+            first_page = seen.setdefault(identity, page_index)
+            if first_page != page_index:
+                # Linha repetida no topo/rodapé de outra página
+                continue
+            merged.append(item)
+    return merged
+
+
+def _item_identity(item):
+    return tuple(_hashable(_normalize(item.get(f))) for f in ITEM_IDENTITY_FIELDS)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    return value
+
+
+def _hashable(value):
+    return repr(value) if isinstance(value, (list, dict)) else value
@@ -0,0 +1,675 @@
+"""
+Pipeline de processamento de documentos fiscais (GCS + Gemini)
+Compartilhado pelo endpoint síncrono e pelos jobs em segundo plano
+"""
+import time
+import inspect
+import threading
+from functools import lru_cache
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app.cache import make_cache_key
+from app.duplicates import document_phash, find_same_document, to_signed
+from app.instrumentation import stage, record_stage
+from app.streaming import IncrementalInvoiceParser
+from app.parsing import ModelOutputError, parse_model_json
+from app.preprocess import PreprocessOptions, preprocess_document
+from app.pdf_pages import merge_page_results, split_pdf
+from app.resilience import ModelUnavailable
+from app.admission import create_admission_controller
+from app.metrics import (
+    CACHE_LOOKUPS, DUPLICATES, JSON_PARSE_FAILURES, MODEL_OUTPUT_PARSES, PREPROCESS_BYTES, UPLOADS,
+    observe_token_usage
+)
+
+MODEL_UNAVAILABLE_MESSAGE = 'Serviço de análise temporariamente indisponível. Tente novamente mais tarde.'
+
+# Executor para arquivar no GCS documentos enviados inline ao Gemini
+_archive_executor = None
+_archive_lock = threading.Lock()
+
+def _nullable(kind, **extra):
+    return {'type': kind, 'nullable': True, **extra}
+
+# Esquema da resposta no modo de saída estruturada (subconjunto OpenAPI do Vertex)
+INVOICE_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'tipo_documento': _nullable('STRING', enum=[
+            'Nota Fiscal', 'Etiqueta de Produto', 'Relatório de Contagem', 'Desconhecido'
+        ]),
+        'numero_documento': _nullable('STRING'),
+        'data_emissao': _nullable('STRING'),
+        'fornecedor': _nullable('STRING'),
+        'cnpj_fornecedor': _nullable('STRING'),
+        'itens': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'codigo_produto': _nullable('STRING'),
+                    'descricao': _nullable('STRING'),
+                    'quantidade': _nullable('NUMBER'),
+                    'unidade': _nullable('STRING'),
+                    'valor_unitario': _nullable('NUMBER'),
+                    'valor_total_item': _nullable('NUMBER'),
+                },
+            },
+        },
+        'valor_total_documento': _nullable('NUMBER'),
+        'observacoes_adicionais': _nullable('STRING'),
+    },
+    'required': ['tipo_documento', 'itens'],
+}
+
+@lru_cache(maxsize=1)
+def structured_generation_config():
+    """
+    GenerationConfig com JSON garantido pelo modelo
+    None se a versão instalada do SDK não suportar response_mime_type
+    """
+    from vertexai.preview.generative_models import GenerationConfig
+
+    params = inspect.signature(GenerationConfig.__init__).parameters
+    if 'response_mime_type' not in params:
+        current_app.logger.warning('Structured output not supported by the installed Vertex AI SDK')
+        return None
+    kwargs = {'response_mime_type': 'application/json'}
+    if 'response_schema' in params:
+        kwargs['response_schema'] = INVOICE_RESPONSE_SCHEMA
+    return GenerationConfig(**kwargs)
+
+def extraction_generation_config():
+    """Configuração de geração das extrações (None = modo texto livre)"""
+    if not current_app.config.get('MODEL_STRUCTURED_OUTPUT'):
+        return None
+    return structured_generation_config()
+
+def resolve_prompt(prompt=None):
+    """Template informado ou o padrão do registro"""
+    return prompt or current_app.extensions['prompt_registry'].default
+
+def extraction_version(prompt=None):
+    """Versão do prompt + modo de saída + pré-processamento, usada na chave de cache"""
+    version = resolve_prompt(prompt).id
+    if extraction_generation_config() is not None:
+        version += '+json'
+    if current_app.config.get('PREPROCESS_ENABLED'):
+        version += '+' + PreprocessOptions.from_config(current_app.config).signature
+    return version
+
+def init_stage_limits(app):
+    """
+    Cria os limites de concorrência por etapa (compartilhados no processo)
+    Com ADMISSION_CONTROL_ENABLED a etapa 'vertex' usa o limite adaptativo com fila limitada
+    """
+    if app.config['ADMISSION_CONTROL_ENABLED']:
+        vertex = create_admission_controller(app.config)
+    else:
+        vertex = threading.BoundedSemaphore(app.config['VERTEX_MAX_CONCURRENCY'])
+    app.extensions['stage_limits'] = {
+        'gcs': threading.BoundedSemaphore(app.config['GCS_MAX_CONCURRENCY']),
+        'vertex': vertex,
+    }
+
+def stage_slot(stage):
+    """Context manager que reserva uma vaga na etapa informada"""
+    limits = current_app.extensions.get('stage_limits') or {}
+    return limits.get(stage) or nullcontext()
+
+def call_model(fn):
+    """Chama fn() (a chamada ao modelo) pela camada de resiliência, se habilitada"""
+    caller = current_app.extensions.get('model_resilience')
+    return fn() if caller is None else caller.call(fn)
+
+def stream_model(fn):
+    """
+    Pedaços do stream de fn() pela camada de resiliência, se habilitada: prazo até
+    o primeiro pedaço (com nova tentativa) e entre pedaços, além do circuit breaker
+    """
+    caller = current_app.extensions.get('model_resilience')
+    return fn() if caller is None else caller.stream(fn)
+
+def document_cache_key(document, prompt=None):
+    """Chave de cache do documento (None se o cache estiver desabilitado)"""
+    if current_app.extensions.get('extraction_cache') is None:
+        return None
+    return make_cache_key(
+        document.sha256,
+        extraction_model_id(),
+        extraction_version(prompt)
+    )
+
+def extraction_model_id():
+    """Modelo das extrações: GEMINI_MODEL_ID ou os modelos da cascata, se configurada"""
+    cascade = current_app.extensions.get('model_cascade')
+    return current_app.config['GEMINI_MODEL_ID'] if cascade is None else cascade.signature
+
+def lookup_cached_result(cache_key):
+    """Retorna a resposta do cache para a chave, se existir"""
+    cache = current_app.extensions.get('extraction_cache')
+    if cache is None or cache_key is None:
+        return None
+
+    with stage('cache'):
+        cached = cache.get(cache_key)
+    if cached is None:
+        CACHE_LOOKUPS.labels('miss').inc()
+        return None
+    CACHE_LOOKUPS.labels('hit').inc()
+
+    current_app.logger.info(f'Extraction cache hit: {cache_key[:12]}')
+    return {
+        'message': 'Imagem processada com sucesso e dados extraídos.',
+        'extracted_data': cached['extracted_data'],
+        'notification_summary': cached['notification_summary'],
+        'cached': True
+    }
+
+def blob_name_for(document, prefix='invoices'):
+    """Nome do objeto no bucket, endereçado pelo conteúdo para evitar sobrescritas"""
+    secure_name = secure_filename(document.filename) or 'upload_file'
+    return f"{prefix}/{document.sha256[:16]}_{secure_name}"
+
+def store_document(document, prefix='invoices'):
+    """Envia o documento (já em memória) ao backend de armazenamento e retorna a URI"""
+    backend = current_app.extensions['storage_backend']
+    return backend.put(blob_name_for(document, prefix), document.data, content_type=document.mime_type)
+
+def archive_document(document, prefix='invoices'):
+    """Arquiva, fora do caminho crítico, um documento enviado inline"""
+    global _archive_executor
+
+    if _archive_executor is None:
+        with _archive_lock:
+            if _archive_executor is None:
+                _archive_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='gcs-archive')
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                with stage_slot('gcs'):
+                    store_document(document, prefix)
+            except Exception as e:
+                app.logger.error(f'Error archiving document {document.sha256[:12]}: {e}')
+
+    _archive_executor.submit(run)
+
+def prepare_document(document):
+    """
+    Pré-processa a imagem antes do armazenamento e do Gemini (PREPROCESS_ENABLED)
+    O original é arquivado em originals/ se ARCHIVE_ORIGINAL_UPLOADS estiver ativo
+    """
+    if not current_app.config['PREPROCESS_ENABLED']:
+        return document
+
+    try:
+        with stage('preprocess'):
+            processed = preprocess_document(document, PreprocessOptions.from_config(current_app.config))
+    except Exception as e:
+        current_app.logger.warning(f'Image preprocessing failed, using original: {e}')
+        return document
+
+    if processed is not document:
+        PREPROCESS_BYTES.labels('original').inc(document.size)
+        PREPROCESS_BYTES.labels('processed').inc(processed.size)
+        if current_app.config['ARCHIVE_ORIGINAL_UPLOADS']:
+            archive_document(document, prefix='originals')
+    return processed
+
+def document_part(document):
+    """
+    Monta o Part do documento para o Gemini
+    Abaixo de INLINE_MAX_BYTES os bytes vão inline e o GCS sai do caminho crítico
+    Backends que o Gemini não consegue ler (local, memória) sempre usam inline
+    """
+    # Import adiado: o SDK do Vertex leva ~2 s para carregar e não é preciso no boot
+    from vertexai.preview.generative_models import Part
+
+    backend = current_app.extensions['storage_backend']
+    if document.size <= current_app.config['INLINE_MAX_BYTES'] or not backend.model_readable:
+        if current_app.config['ARCHIVE_INLINE_UPLOADS']:
+            archive_document(document)
+        return Part.from_data(document.data, mime_type=document.mime_type)
+
+    with stage_slot('gcs'), stage('storage'):
+        gcs_uri = store_document(document)
+    return Part.from_uri(gcs_uri, mime_type=document.mime_type)
+
+def extract_document(document_part, prompt=None):
+    """
+    Chama o Gemini sobre o documento com o template (já sanitizado) do tipo
+    Retorna (payload, status_http)
+    """
+    prompt = resolve_prompt(prompt)
+    cascade = current_app.extensions.get('model_cascade')
+    if cascade is not None:
+        return cascade_extract(cascade, document_part, prompt)
+
+    # Chamar Gemini AI
+    model = current_app.extensions['model_backend']
+    contents = [prompt.text, document_part]
+    generation_config = extraction_generation_config()
+    with stage('model'):
+        response = call_model(lambda: model.generate_content(contents, generation_config=generation_config))
+    observe_token_usage(response)
+
+    gemini_output_text = response.text
+
+    extracted_data = parse_output(gemini_output_text)
+    if extracted_data is None:
+        return invalid_output_payload(gemini_output_text), 200
+
+    return extraction_payload(extracted_data), 200
+
+def cascade_extract(cascade, document_part, prompt):
+    """
+    Extração pela cascata: começa no nível mínimo do tipo do prompt e sobe enquanto
+    a saída reprovar na validação ou o tipo detectado exigir um modelo mais forte
+    Retorna (payload, status_http); o payload indica o modelo que respondeu
+    """
+    registry = current_app.extensions['prompt_registry']
+    contents = [prompt.text, document_part]
+    generation_config = extraction_generation_config()
+    index = cascade.min_tier(prompt.key)
+    escalations = []
+
+    while True:
+        tier = cascade.tiers[index]
+        started = time.perf_counter()
+        try:
+            with stage('model'):
+                response = call_model(
+                    lambda backend=tier.backend: backend.generate_content(contents, generation_config=generation_config)
+                )
+        except Exception:
+            cascade.record(index, time.perf_counter() - started, error=True)
+            raise
+        seconds = time.perf_counter() - started
+        observe_token_usage(response)
+
+        gemini_output_text = response.text
+        extracted_data = parse_output(gemini_output_text)
+        doc_type = extracted_data.get('tipo_documento') if extracted_data else None
+        detected = registry.get(doc_type) if isinstance(doc_type, str) and doc_type.strip() else None
+        next_index, reasons = cascade.review(index, extracted_data, detected.key if detected else None)
+        cascade.record(index, seconds, response, reasons, escalated=next_index is not None)
+        if next_index is None:
+            break
+        current_app.logger.info(f'Escalating extraction from {tier.model_id}: {", ".join(reasons)}')
+        escalations.append({'model': tier.model_id, 'reasons': reasons})
+        index = next_index
+
+    if extracted_data is None:
+        payload = invalid_output_payload(gemini_output_text)
+    else:
+        payload = extraction_payload(extracted_data)
+    payload['model'] = {'id': tier.model_id, 'tier': index, 'escalations': escalations}
+    return payload, 200
+
+def parse_output(text):
+    """
+    Lê a saída do modelo como objeto JSON, reparando defeitos comuns
+    (cercas de markdown, vírgulas sobrando, saída truncada) sem nova chamada
+    Retorna None se a saída não puder ser aproveitada
+    """
+    try:
+        with stage('parse'):
+            extracted_data, repaired = parse_model_json(text)
+    except ModelOutputError as e:
+        MODEL_OUTPUT_PARSES.labels('failed').inc()
+        JSON_PARSE_FAILURES.inc()
+        current_app.logger.warning(f'Gemini returned invalid JSON: {e}')
+        return None
+
+    if repaired:
+        MODEL_OUTPUT_PARSES.labels('repaired').inc()
+        current_app.logger.info('Gemini output required JSON repair')
+    else:
+        MODEL_OUTPUT_PARSES.labels('direct').inc()
+    return extracted_data
+
+def extraction_payload(extracted_data):
+    """Resposta de sucesso com o relatório de notificação"""
+    # Gerar relatório de notificação
+    notification_message = generate_notification_message(extracted_data)
+
+    return {
+        'message': 'Imagem processada com sucesso e dados extraídos.',
+        'extracted_data': extracted_data,
+        'notification_summary': notification_message
+    }
+
+def invalid_output_payload(gemini_output_text):
+    """Resposta para saída do Gemini que não é um objeto JSON"""
+    return {
+        'message': 'Imagem processada, mas a saída não foi um JSON válido.',
+        'gemini_raw_output': gemini_output_text[:500],  # Limitar tamanho da resposta
+        'error': 'Formato de resposta inválido'
+    }
+
+def stream_document(document, prompt=None):
+    """
+    Processa o documento chamando o Gemini em modo stream
+    Gera eventos (tipo, dados) à medida que o JSON fica disponível:
+    field, item e, ao final, result (mesmo payload do endpoint síncrono)
+    PDFs divididos e extrações pela cascata de modelos geram os eventos só no final
+    """
+    prompt = resolve_prompt(prompt)
+    cache_key = document_cache_key(document, prompt)
+    cached = lookup_cached_result(cache_key)
+    if cached is not None:
+        UPLOADS.labels('cached').inc()
+        yield from document_events(cached['extracted_data'])
+        yield 'result', with_prompt_version(cached, prompt)
+        return
+
+    duplicate = check_near_duplicate(document)
+
+    parts = split_document(document)
+    if parts is not None or current_app.extensions.get('model_cascade') is not None:
+        # PDF com várias páginas (extração paralela por página) ou cascata de modelos (a
+        # saída só vale depois de validada, e o nível que responde entra no payload):
+        # resultado único ao final, sem stream do modelo
+        try:
+            if parts is not None:
+                payload, _ = extract_pages(parts, prompt)
+            else:
+                part = document_part(prepare_document(document))
+                with stage_slot('vertex'):
+                    payload, _ = extract_document(part, prompt)
+        except Exception:
+            UPLOADS.labels('error').inc()
+            raise
+        finish_document(document, cache_key, with_prompt_version(payload, prompt), duplicate)
+        if 'extracted_data' in payload:
+            yield from document_events(payload['extracted_data'])
+        yield 'result', payload
+        return
+
+    try:
+        part = document_part(prepare_document(document))
+        model = current_app.extensions['model_backend']
+        parser = IncrementalInvoiceParser()
+        response = None
+
+        contents = [prompt.text, part]
+        generation_config = extraction_generation_config()
+        with stage_slot('vertex'):
+            started = time.perf_counter()
+            first_chunk = True
+            responses = stream_model(
+                lambda: model.generate_content(contents, generation_config=generation_config, stream=True)
+            )
+            for response in responses:
+                if first_chunk:
+                    record_stage('model_first_chunk', time.perf_counter() - started)
+                    first_chunk = False
+                yield from parser.feed(chunk_text(response))
+            record_stage('model', time.perf_counter() - started)
+    except Exception:
+        UPLOADS.labels('error').inc()
+        raise
+
+    if response is not None:
+        observe_token_usage(response)
+
+    extracted_data = parse_output(parser.object_text if parser.complete else parser.text)
+    if extracted_data is None:
+        UPLOADS.labels('invalid_output').inc()
+        yield 'result', with_prompt_version(invalid_output_payload(parser.text), prompt)
+        return
+
+    payload = with_prompt_version(extraction_payload(extracted_data), prompt)
+    mark_duplicate(document, payload, duplicate)
+    remember_result(cache_key, payload)
+    persist_result(document, payload)
+    UPLOADS.labels('extracted').inc()
+    current_app.logger.info(f'Successfully streamed document: {secure_filename(document.filename)}')
+    yield 'result', payload
+
+def chunk_text(response):
+    """Texto de um pedaço do stream (pedaços finais podem não ter texto)"""
+    try:
+        return response.text
+    except (ValueError, AttributeError, IndexError):
+        return ''
+
+def document_events(extracted_data):
+    """Eventos field/item de um documento já completo (ex.: vindo do cache)"""
+    for name, value in extracted_data.items():
+        if name == 'itens':
+            for index, item in enumerate(value or []):
+                yield 'item', {'index': index, 'item': item}
+        else:
+            yield 'field', {'name': name, 'value': value}
+
+def remember_result(cache_key, payload):
+    """Armazena no cache um resultado de extração bem-sucedido (não parcial)"""
+    cache = current_app.extensions.get('extraction_cache')
+    if cache is None or cache_key is None or 'extracted_data' not in payload:
+        return
+    if payload.get('pages', {}).get('failed'):
+        return
+    cache.set(cache_key, {
+        'extracted_data': payload['extracted_data'],
+        'notification_summary': payload['notification_summary']
+    })
+
+def persist_result(document, payload):
+    """
+    Enfileira um resultado completo para gravação em segundo plano
+    Duplicatas confirmadas pelo número/CNPJ são gravadas com duplicate_of (flag)
+    ou não são gravadas (skip)
+    """
+    results = current_app.extensions.get('result_store')
+    if results is None or 'extracted_data' not in payload:
+        return
+    if payload.get('pages', {}).get('failed'):
+        return
+    duplicate = payload.get('duplicate') or {}
+    if duplicate.get('kind') == 'document_number' and current_app.config['DUPLICATE_DETECTION'] == 'skip':
+        return
+    results.submit(
+        document, payload,
+        phash=None if document.phash is None else to_signed(document.phash),
+        duplicate_of=duplicate['sha256'] if duplicate.get('kind') == 'document_number' else None,
+    )
+
+def check_near_duplicate(document):
+    """
+    Documento anterior visualmente parecido (hash perceptual a até
+    DUPLICATE_MAX_DISTANCE bits): {'kind', 'sha256', 'distance'} ou None
+    É só uma candidata: notas diferentes no mesmo layout do fornecedor têm o mesmo
+    hash, então a duplicata só vale confirmada pelo (cnpj_fornecedor, numero_documento)
+    """
+    index = current_app.extensions.get('duplicate_index')
+    if index is None:
+        return None
+    with stage('dedup'):
+        if document.phash is None:
+            document.phash = document_phash(document)
+        if document.phash is None:
+            return None
+        match = index.check(document.phash, document.sha256)
+    if match is None:
+        return None
+    current_app.logger.info(f"Perceptual match with {match['sha256'][:12]} (distance {match['distance']}): "
+                            f'{document.sha256[:12]}')
+    return {'kind': 'perceptual', **match}
+
+def mark_duplicate(document, payload, candidate=None):
+    """
+    Marca no payload a duplicata confirmada pelo mesmo (cnpj_fornecedor, numero_documento)
+    de um documento já persistido; a candidata do hash perceptual sozinha não marca nada
+    (só indica, em 'distance', que a imagem também é parecida com a do original)
+    """
+    mode = current_app.config['DUPLICATE_DETECTION']
+    if 'extracted_data' not in payload or mode == 'off':
+        return
+    original = find_same_document(current_app.extensions.get('result_store'),
+                                  payload['extracted_data'], document.sha256)
+    if original is None:
+        if candidate is not None:
+            DUPLICATES.labels('perceptual', 'unconfirmed').inc()
+        return
+    duplicate = {'kind': 'document_number', 'sha256': original}
+    if candidate is not None and candidate['sha256'] == original:
+        duplicate['distance'] = candidate['distance']
+    payload['duplicate'] = duplicate
+    DUPLICATES.labels('document_number', 'skipped' if mode == 'skip' else 'flagged').inc()
+
+def process_document(document, prompt=None):
+    """
+    Processa um documento já validado (UploadedDocument): cache, GCS e Gemini
+    `prompt` é o template do tipo de documento (padrão: detecção automática)
+    Retorna (payload, status_http)
+    """
+    prompt = resolve_prompt(prompt)
+
+    # Consultar cache de extrações antes de tocar GCS/Vertex
+    cache_key = document_cache_key(document, prompt)
+    cached = lookup_cached_result(cache_key)
+    if cached is not None:
+        UPLOADS.labels('cached').inc()
+        return with_prompt_version(cached, prompt), 200
+
+    # Quase duplicata pela imagem: só candidata, confirmada depois da extração
+    duplicate = check_near_duplicate(document)
+
+    try:
+        parts = split_document(document)
+        if parts is not None:
+            payload, status = extract_pages(parts, prompt)
+        else:
+            part = document_part(prepare_document(document))
+            with stage_slot('vertex'):
+                payload, status = extract_document(part, prompt)
+    except Exception:
+        UPLOADS.labels('error').inc()
+        raise
+    finish_document(document, cache_key, with_prompt_version(payload, prompt), duplicate)
+    return payload, status
+
+def with_prompt_version(payload, prompt):
+    """Inclui nos metadados do resultado a versão do prompt usado"""
+    payload['prompt_version'] = prompt.id
+    return payload
+
+def finish_document(document, cache_key, payload, duplicate=None):
+    """Marca duplicatas, cacheia e persiste o resultado e contabiliza o desfecho do documento"""
+    mark_duplicate(document, payload, duplicate)
+    remember_result(cache_key, payload)
+    persist_result(document, payload)
+
+    if 'extracted_data' in payload:
+        UPLOADS.labels('extracted').inc()
+        current_app.logger.info(f'Successfully processed document: {secure_filename(document.filename)}')
+    else:
+        UPLOADS.labels('invalid_output').inc()
+
+def split_document(document):
+    """
+    Divide PDFs com PDF_SPLIT_MIN_PAGES ou mais páginas em grupos de PDF_PAGES_PER_PART
+    Retorna None para imagens, PDFs curtos ou se a divisão estiver desabilitada
+    """
+    config = current_app.config
+    if document.mime_type != 'application/pdf' or not config['PDF_SPLIT_ENABLED']:
+        return None
+    try:
+        with stage('split'):
+            return split_pdf(document, config['PDF_PAGES_PER_PART'], config['PDF_SPLIT_MIN_PAGES'])
+    except Exception as e:
+        current_app.logger.warning(f'Could not split PDF {document.sha256[:12]}, sending whole document: {e}')
+        return None
+
+def extract_pages(parts, prompt=None):
+    """
+    Extrai os grupos de páginas em paralelo, cada um com seu próprio cache
+    Retorna (payload, status_http) com os itens combinados e o cabeçalho reconciliado
+    """
+    app = current_app._get_current_object()
+
+    def run(part):
+        with app.app_context():
+            cache_key = document_cache_key(part, prompt)
+            cached = lookup_cached_result(cache_key)
+            if cached is not None:
+                return cached, True
+            page_part = document_part(part)
+            with stage_slot('vertex'):
+                payload, _ = extract_document(page_part, prompt)
+            remember_result(cache_key, payload)
+            return payload, False
+
+    workers = max(1, min(app.config['PDF_MAX_PAGE_WORKERS'], len(parts)))
+    with stage('pages'), ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-pages') as executor:
+        results = list(executor.map(run, parts))
+
+    failed = [part.filename for part, (payload, _) in zip(parts, results) if 'extracted_data' not in payload]
+    if len(failed) == len(parts):
+        return results[0][0], 200
+
+    merged = merge_page_results([payload.get('extracted_data') for payload, _ in results])
+    payload = extraction_payload(merged)
+    payload['pages'] = {
+        'parts': len(parts),
+        'cached': sum(1 for _, cached in results if cached),
+        'failed': failed,
+    }
+    return payload, 200
+
+def process_batch(documents, max_workers, prompt=None):
+    """
+    Processa vários documentos validados (UploadedDocument) em paralelo
+    Retorna [(payload, status_http)] na mesma ordem da entrada
+    """
+    app = current_app._get_current_object()
+
+    def run(document):
+        with app.app_context():
+            try:
+                return process_document(document, prompt)
+            except ModelUnavailable as e:
+                app.logger.warning(f'Model unavailable for batch item {document.filename}: {e}')
+                return {'error': MODEL_UNAVAILABLE_MESSAGE}, 503
+            except Exception as e:
+                app.logger.error(f'Error processing batch item {document.filename}: {e}', exc_info=True)
+                return {'error': 'Erro interno do servidor'}, 500
+
+    if not documents:
+        return []
+    workers = max(1, min(max_workers, len(documents)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload-batch') as executor:
+        return list(executor.map(run, documents))
+
+def generate_notification_message(extracted_data):
+    """Gera mensagem de notificação formatada"""
+    try:
+        message = f"""
+**Relatório Vision Estoque-Financeiro**
+Tipo de Documento: {extracted_data.get("tipo_documento", "N/A")}
+Número: {extracted_data.get("numero_documento", "N/A")}
+Data: {extracted_data.get("data_emissao", "N/A")}
+Fornecedor: {extracted_data.get("fornecedor", "N/A")}
+Valor Total: R$ {extracted_data.get("valor_total_documento", "0.00")}
+
+**Itens:**
+"""
+        for item in extracted_data.get("itens", []):
+            message += (
+                f"- {item.get('descricao', 'N/A')} ({item.get('codigo_produto', 'N/A')}) "
+                f"Qtd: {item.get('quantidade', 'N/A')} {item.get('unidade', '')} "
+                f"Total: R$ {item.get('valor_total_item', '0.00')}\n"
+            )
+
+        message += f"\nObservações: {extracted_data.get('observacoes_adicionais', 'Nenhuma')}"
+        return message
+
+    except Exception as e:
+        current_app.logger.error(f'Error generating notification: {e}')
+        return "Erro ao gerar relatório de notificação"
@@ -0,0 +1,92 @@
+"""
+Pré-processamento de imagens antes do armazenamento e do Gemini
+Reduz fotos de celular (8-12 MP) a um tamanho suficiente para a extração
+"""
+import io
+import os
+import hashlib
+from PIL import Image, ImageOps
+from app.ingest import UploadedDocument
+
+# Formatos que o pré-processamento sabe regravar (PDF, GIF etc. passam direto)
+PREPROCESSABLE_MIME_TYPES = {'image/jpeg', 'image/png', 'image/tiff', 'image/bmp'}
+
+
+class PreprocessOptions:
+    """Parâmetros do pré-processamento lidos da configuração"""
+
+    __slots__ = ('max_edge', 'quality', 'grayscale', 'min_bytes')
+
+    def __init__(self, max_edge=2048, quality=85, grayscale=False, min_bytes=256 * 1024):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.grayscale = grayscale
+        self.min_bytes = min_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_edge=config['PREPROCESS_MAX_EDGE'],
+            quality=config['PREPROCESS_QUALITY'],
+            grayscale=config['PREPROCESS_GRAYSCALE'],
+            min_bytes=config['PREPROCESS_MIN_BYTES'],
+        )
+
+    @property
+    def signature(self):
+        """Identifica os parâmetros (entra na chave de cache das extrações)"""
+        return f"e{self.max_edge}q{self.quality}{'g' if self.grayscale else 'c'}"
+
+
+def preprocess_document(document, options):
+    """
+    Reduz, normaliza e recomprime a imagem do documento:
+    - Rotação conforme a orientação EXIF, e remoção dos metadados
+    - Lado maior limitado a max_edge (JPEGs são decodificados já reduzidos)
+    - Escala de cinza opcional
+    - Regravação em JPEG com a qualidade configurada
+    Retorna o documento original se o formato não se aplicar, ou se a regravação
+    não reduzir o arquivo e a imagem não tiver EXIF; com EXIF, a versão
+    rotacionada e sem metadados é usada mesmo que fique maior.
+    """
+    if document.mime_type not in PREPROCESSABLE_MIME_TYPES or document.size < options.min_bytes:
+        return document
+
+    with Image.open(io.BytesIO(document.data)) as image:
+        if image.format == 'JPEG':
+            # Decodificação DCT reduzida: evita descomprimir os 12 MP inteiros
+            image.draft('L' if options.grayscale else 'RGB', (options.max_edge, options.max_edge))
+        image.load()
+        has_exif = bool(image.getexif())
+        ImageOps.exif_transpose(image, in_place=True)
+        # BICUBIC: ~1,5x mais rápido que LANCZOS, sem perda perceptível para OCR
+        image.thumbnail((options.max_edge, options.max_edge), Image.BICUBIC)
+        image = _normalize_mode(image, options.grayscale)
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=options.quality, optimize=True)
+
+    data = output.getvalue()
+    if len(data) >= document.size and not has_exif:
+        return document
+
+    stem = os.path.splitext(document.filename)[0] or 'upload_file'
+    return UploadedDocument(data, f'{stem}.jpg', 'image/jpeg', hashlib.sha256(data).hexdigest())
+
+
+def _normalize_mode(image, grayscale):
+    """Converte para L/RGB; transparência vira fundo branco"""
+    if grayscale:
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = _flatten(image)
+        return image.convert('L')
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        return _flatten(image)
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def _flatten(image):
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
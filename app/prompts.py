@@ -0,0 +1,123 @@
+"""
+Registro de prompts de extração
+Um template versionado por tipo de documento, sanitizado uma única vez na inicialização
+"""
+from app.security import sanitize_prompt
+
+# Formato de saída comum a todos os templates (mesmo esquema da saída estruturada)
+_OUTPUT_FORMAT = """
+        {
+          "tipo_documento": "Nota Fiscal" ou "Etiqueta de Produto" ou "Relatório de Contagem" ou "Desconhecido",
+          "numero_documento": "<numero_da_nota_fiscal_ou_referencia>",
+          "data_emissao": "<DD/MM/AAAA>",
+          "fornecedor": "<nome_do_fornecedor>",
+          "cnpj_fornecedor": "<CNPJ>",
+          "itens": [
+            {
+              "codigo_produto": "<codigo>",
+              "descricao": "<descricao_do_item>",
+              "quantidade": <quantidade_numerica>,
+              "unidade": "<unidade_medida>",
+              "valor_unitario": <valor_numerica>,
+              "valor_total_item": <valor_numerica>
+            }
+          ],
+          "valor_total_documento": <valor_numerica>,
+          "observacoes_adicionais": "<texto_livre_de_observacoes_ou_discrepancias>"
+        }"""
+
+# Templates por tipo: (chave, tipo_documento, versão, texto)
+# Incremente a versão ao alterar o texto (invalida o cache das extrações)
+PROMPT_TEMPLATES = (
+    ('auto', None, '1', """
+        Analise esta imagem que pode ser uma nota fiscal, etiqueta de produto ou documento de estoque.
+        Extraia as seguintes informações em formato JSON, se presentes e identificáveis:""" + _OUTPUT_FORMAT + """
+        Se a informação não for encontrada, deixe o campo como `null` ou array vazio para "itens".
+        Se for uma etiqueta, preencha apenas o que for relevante.
+        Certifique-se de que a saída seja um JSON válido.
+        """),
+    ('nota_fiscal', 'Nota Fiscal', '1', """
+        Analise este documento fiscal (nota fiscal eletrônica ou DANFE).
+        Extraia em formato JSON o cabeçalho (número da nota, data de emissão, emitente e CNPJ do emitente)
+        e todos os itens da tabela de produtos, com quantidades e valores numéricos:""" + _OUTPUT_FORMAT + """
+        Use "Nota Fiscal" em tipo_documento. Valores monetários com ponto decimal, sem símbolo de moeda.
+        Se a informação não for encontrada, deixe o campo como `null`.
+        Certifique-se de que a saída seja um JSON válido.
+        """),
+    ('etiqueta_produto', 'Etiqueta de Produto', '1', """
+        Analise esta etiqueta de produto.
+        Extraia em formato JSON o código do produto (SKU ou código de barras), a descrição,
+        a quantidade e a unidade da embalagem, como um único item:""" + _OUTPUT_FORMAT + """
+        Use "Etiqueta de Produto" em tipo_documento. Campos de nota fiscal ausentes ficam como `null`.
+        Certifique-se de que a saída seja um JSON válido.
+        """),
+    ('relatorio_contagem', 'Relatório de Contagem', '1', """
+        Analise este relatório de contagem de estoque.
+        Extraia em formato JSON a referência e a data do relatório e todas as linhas contadas,
+        com código, descrição, quantidade contada e unidade:""" + _OUTPUT_FORMAT + """
+        Use "Relatório de Contagem" em tipo_documento. Valores ausentes ficam como `null`.
+        Registre divergências anotadas no relatório em observacoes_adicionais.
+        Certifique-se de que a saída seja um JSON válido.
+        """),
+)
+
+DEFAULT_PROMPT = 'auto'
+
+
+class PromptTemplate:
+    """Template já sanitizado, pronto para ser enviado ao modelo"""
+
+    __slots__ = ('key', 'doc_type', 'version', 'text')
+
+    def __init__(self, key, doc_type, version, text):
+        self.key = key
+        self.doc_type = doc_type
+        self.version = version
+        self.text = text
+
+    @property
+    def id(self):
+        """Identificador versionado (vai para os metadados e para a chave de cache)"""
+        return f'{self.key}@{self.version}'
+
+
+class PromptRegistry:
+    """Templates indexados pela chave e pelo nome do tipo de documento"""
+
+    def __init__(self, templates=PROMPT_TEMPLATES, default=DEFAULT_PROMPT):
+        self._templates = {}
+        self._aliases = {}
+        for key, doc_type, version, text in templates:
+            template = PromptTemplate(key, doc_type, version, sanitize_template(key, text))
+            self._templates[key] = template
+            self._aliases[key.casefold()] = template
+            if doc_type:
+                self._aliases[doc_type.casefold()] = template
+        self.default = self._templates[default]
+
+    def get(self, name=None):
+        """Template pela chave ou tipo ('Nota Fiscal'); padrão se vazio, None se desconhecido"""
+        if not name:
+            return self.default
+        return self._aliases.get(name.strip().casefold())
+
+    def keys(self):
+        return list(self._templates)
+
+
+def sanitize_template(key, text):
+    """
+    Sanitiza o template uma vez; falha na inicialização se a sanitização
+    remover conteúdo além de espaços e quebras de linha
+    """
+    sanitized = sanitize_prompt(text)
+    if ''.join(sanitized.split()) != ''.join(text.split()):
+        raise ValueError(f'Template de prompt alterado pela sanitização: {key}')
+    return sanitized
+
+
+def init_prompt_registry(app):
+    """Registra os templates de prompt na aplicação"""
+    registry = PromptRegistry()
+    app.extensions['prompt_registry'] = registry
+    return registry
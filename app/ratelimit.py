@@ -0,0 +1,197 @@
+"""
+Rate limiting compartilhado entre workers
+Um único Limiter por aplicação, com armazenamento em Redis (RATELIMIT_STORAGE_URL),
+cota por chave de API e custo proporcional ao tamanho/páginas do upload
+"""
+import re
+import math
+import threading
+from flask import current_app, request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from limits import parse_many
+from limits.storage import MemoryStorage
+from app.auth import request_api_key
+
+# Escopos de limite e a configuração com a cota padrão de cada um
+RATE_LIMIT_SCOPES = {
+    'uploads': 'RATELIMIT_UPLOAD_LIMIT',
+    'reads': 'RATELIMIT_READ_LIMIT',
+}
+
+# Escopos com custo pelo tamanho/páginas do upload e cota própria por chave de API
+# (RATELIMIT_TOKEN_LIMITS); nos demais cada requisição custa 1
+UPLOAD_SCOPES = frozenset({'uploads'})
+
+# Estimativa de páginas sem interpretar o PDF (objetos /Type /Page)
+_PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+# /Count da árvore de páginas (/Type /Pages antes ou depois, no mesmo dicionário)
+_PDF_COUNT_RE = re.compile(
+    rb'/Type\s*/Pages(?![a-zA-Z])[^>]{0,256}?/Count\s+(\d+)|/Count\s+(\d+)[^>]{0,256}?/Type\s*/Pages(?![a-zA-Z])'
+)
+
+# Bytes lidos do início e do fim do PDF para estimar as páginas (antes da autenticação)
+PDF_SCAN_BYTES = 256 * 1024
+
+
+class SharedMemoryStorage(MemoryStorage):
+    """
+    Armazenamento local (local://<nome>) compartilhado por todas as instâncias
+    do processo com o mesmo nome. Substitui o Redis em testes: vários apps
+    (simulando workers) enxergam os mesmos contadores.
+    """
+
+    STORAGE_SCHEME = ['local']
+
+    _namespaces = {}
+    _namespaces_lock = threading.Lock()
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        with self._namespaces_lock:
+            state = self._namespaces.setdefault(
+                uri, (self.storage, self.locks, self.expirations, self.events))
+        self.storage, self.locks, self.expirations, self.events = state
+
+
+def rate_limited(scope):
+    """Marca a view para receber o limite (com custo) do escopo na inicialização"""
+    def decorator(view):
+        view.rate_limit_scope = scope
+        return view
+    return decorator
+
+
+def rate_limit_key():
+    """Chave do limite: nome da chave de API válida (se autenticação ativa) ou IP"""
+    if current_app.config.get('ENABLE_AUTH'):
+        name = request_api_key()
+        if name is not None:
+            return f'key:{name}'
+    return f'ip:{get_remote_address()}'
+
+
+def scope_limit(scope):
+    """Cota do escopo para a chave atual (cota própria da chave de API ou padrão)"""
+    def limit():
+        key = rate_limit_key()
+        quotas = current_app.extensions['rate_limit_quotas'] if scope in UPLOAD_SCOPES else {}
+        if key.startswith('key:') and key[4:] in quotas:
+            return quotas[key[4:]]
+        return current_app.config[RATE_LIMIT_SCOPES[scope]]
+    return limit
+
+
+def upload_cost():
+    """
+    Custo da requisição em unidades: por arquivo, o maior entre
+    ceil(tamanho / RATELIMIT_COST_UNIT_BYTES) e o número estimado de páginas (PDF)
+    Uma foto de etiqueta custa 1; um PDF de 16MB custa 16 (ou mais, se tiver mais páginas)
+    """
+    unit = current_app.config['RATELIMIT_COST_UNIT_BYTES']
+    total = 0
+    for _, file in request.files.items(multi=True):
+        cost = math.ceil(_stream_size(file.stream) / unit)
+        if (file.filename or '').lower().endswith('.pdf'):
+            cost = max(cost, estimate_pdf_pages(file.stream))
+        total += max(1, cost)
+    return max(1, total)
+
+
+def scope_cost(scope):
+    """
+    Custo do upload limitado à menor cota do escopo para a chave atual: o limits
+    recusa sempre um custo acima da cota, mesmo com a janela vazia (um PDF de 200
+    páginas nunca passaria num limite de 60 por minuto); acima disso o upload
+    consome a cota inteira
+    """
+    if scope not in UPLOAD_SCOPES:
+        return 1
+    limit = scope_limit(scope)
+
+    def cost():
+        return min(upload_cost(), min(item.amount for item in parse_many(limit())))
+    return cost
+
+
+def estimate_pdf_pages(stream, scan_bytes=PDF_SCAN_BYTES):
+    """
+    Páginas do PDF lendo no máximo `scan_bytes` do início e do fim (devolve o stream
+    ao início): o /Count da árvore de páginas, se estiver no trecho lido; senão os
+    objetos /Type /Page do trecho, extrapolados para o tamanho do arquivo
+    0 se nada for encontrado (vale o custo por tamanho)
+    """
+    try:
+        size = _stream_size(stream)
+        stream.seek(0)
+        head = stream.read(scan_bytes)
+        tail = b''
+        if size > len(head):
+            stream.seek(max(len(head), size - scan_bytes))
+            tail = stream.read(scan_bytes)
+
+        counts = [int(a or b) for a, b in _PDF_COUNT_RE.findall(head) + _PDF_COUNT_RE.findall(tail)]
+        if counts:
+            return max(counts)
+        pages = len(_PDF_PAGE_RE.findall(head)) + len(_PDF_PAGE_RE.findall(tail))
+        scanned = len(head) + len(tail)
+        if not pages or scanned >= size:
+            return pages
+        return math.ceil(pages * size / scanned)
+    finally:
+        stream.seek(0)
+
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def parse_token_limits(value):
+    """'<nome_da_chave>=100 per minute;<nome>=...' -> {nome: limite}"""
+    quotas = {}
+    for entry in (value or '').split(';'):
+        if '=' in entry:
+            key, limit = entry.split('=', 1)
+            quotas[key.strip()] = limit.strip()
+    return quotas
+
+
+def init_rate_limiting(app):
+    """
+    Cria o Limiter da aplicação sobre o armazenamento configurado e aplica
+    os limites com custo às views marcadas com @rate_limited
+    """
+    app.config.setdefault('RATELIMIT_STORAGE_URI', app.config['RATELIMIT_STORAGE_URL'])
+    app.extensions['rate_limit_quotas'] = parse_token_limits(app.config.get('RATELIMIT_TOKEN_LIMITS'))
+
+    # Os limites padrão só valem para rotas sem escopo (ex.: /login): uploads e
+    # consultas têm cotas próprias por chave
+    limiter = Limiter(
+        key_func=rate_limit_key,
+        default_limits=["200 per day", "50 per hour"],
+    )
+    limiter.init_app(app)
+    # As views decoradas só guardam uma referência fraca ao Limiter, e com
+    # RATELIMIT_ENABLED=false o init_app não o registra em app.extensions
+    app.extensions['rate_limiter'] = limiter
+
+    # Probes e scraping de métricas não consomem a cota de rate limiting
+    @limiter.request_filter
+    def exempt_probes():
+        return request.endpoint in ('main.health_check', 'main.readiness', 'main.metrics', 'main.admission_stats',
+                                    'main.cascade_stats')
+
+    for endpoint, view in list(app.view_functions.items()):
+        scope = getattr(view, 'rate_limit_scope', None)
+        if scope is None:
+            continue
+        app.view_functions[endpoint] = limiter.shared_limit(
+            scope_limit(scope), scope=scope, cost=scope_cost(scope)
+        )(view)
+
+    return limiter
@@ -0,0 +1,438 @@
+"""
+Resiliência da chamada ao modelo generativo
+Prazo por chamada, novas tentativas com jitter limitadas por um orçamento,
+circuit breaker que falha rápido com o backend indisponível e, opcionalmente,
+hedging: uma segunda chamada quando a primeira passa do p95 observado.
+Chamadas em stream têm prazo até o primeiro pedaço e entre pedaços
+"""
+import time
+import queue
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.metrics import BREAKER_TRANSITIONS, MODEL_CALLS, MODEL_HEDGES, MODEL_INFLIGHT, MODEL_RETRIES
+
+# Status HTTP de falhas passageiras (exceções do google.api_core e do backend falso têm `code`)
+TRANSIENT_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class ModelUnavailable(Exception):
+    """Modelo indisponível: circuito aberto, prazo esgotado ou falhas sem nova tentativa possível"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelTimeout(TimeoutError):
+    """Tentativa sem resposta dentro do prazo"""
+
+
+def is_transient(exc):
+    """Falhas que valem nova tentativa: timeout, conexão, 429 e 5xx"""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, 'code', None)
+    return isinstance(code, int) and code in TRANSIENT_CODES
+
+
+class RetryBudget:
+    """
+    Orçamento de novas tentativas (balde de fichas)
+    Cada chamada deposita `ratio` fichas e cada nova tentativa (ou hedge) gasta uma;
+    `min_per_second` garante algumas tentativas com pouco tráfego. Com o backend
+    fora do ar, as novas tentativas ficam limitadas a ~ratio da carga normal.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, window=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(1.0, min_per_second * window)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Abre quando a taxa de falhas das últimas `window` chamadas passa de `failure_rate`
+    (com pelo menos `min_calls`); após `reset_timeout` segundos deixa passar uma
+    chamada de teste (half_open) e fecha se ela tiver sucesso. `allow()` devolve a
+    permissão da chamada; no half_open só o resultado da chamada de teste (a
+    permissão devolvida a ela) muda o estado
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=20, window=50, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probe = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        self._state = state
+        self._probe = None
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state == CLOSED:
+            self._outcomes.clear()
+        BREAKER_TRANSITIONS.labels(state).inc()
+
+    def allow(self):
+        """
+        Permissão para a chamada seguir (False se bloqueada), a ser passada a record()
+        No half_open só uma chamada de teste por vez, com permissão própria
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+            return False
+
+    def retry_after(self):
+        """Segundos até a próxima chamada de teste"""
+        with self._lock:
+            if self._state != OPEN:
+                return 1
+            return max(1, int(self.reset_timeout - (self._clock() - self._opened_at)) + 1)
+
+    def record(self, success, permit=True):
+        """Resultado de uma chamada liberada por allow() (permit é a permissão devolvida)"""
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                # Chamadas liberadas antes da abertura não decidem pela chamada de teste
+                if permit is self._probe:
+                    self._transition(CLOSED if success else OPEN)
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._transition(OPEN)
+
+
+class StreamFeed:
+    """Pedaços de um stream lidos num thread do pool e entregues por fila, com prazo"""
+
+    END = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+
+    def run(self, fn):
+        """Lê o stream de fn() até o fim, um erro ou stop()"""
+        try:
+            chunks = fn()
+            for chunk in chunks:
+                if self._stopped.is_set():
+                    close = getattr(chunks, 'close', None)
+                    if close is not None:
+                        close()
+                    return
+                self._queue.put((chunk, None))
+            self._queue.put((self.END, None))
+        except Exception as e:
+            self._queue.put((None, e))
+
+    def get(self, timeout):
+        """Próximo pedaço (END no fim do stream); ModelTimeout se nada chegar no prazo"""
+        try:
+            chunk, error = self._queue.get(timeout=max(0, timeout))
+        except queue.Empty:
+            raise ModelTimeout(f'Stream do modelo sem resposta em {timeout:.1f}s') from None
+        if error is not None:
+            raise error
+        return chunk
+
+    def stop(self):
+        self._stopped.set()
+
+
+class LatencyTracker:
+    """Quantil das latências recentes (s) com sucesso, base do atraso do hedge"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        """None até haver `min_samples` amostras"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """
+    Executa as chamadas ao modelo em um pool próprio para poder abandoná-las no prazo
+    (uma chamada travada não segura o worker até o timeout do gunicorn)
+    `max_workers` limita as chamadas em execução, inclusive hedges e chamadas
+    abandonadas: a vaga só volta quando a chamada ao modelo termina de fato
+    """
+
+    def __init__(self, deadline=60.0, attempt_timeout=30.0, max_attempts=3, base_delay=0.5,
+                 max_delay=8.0, budget=None, breaker=None, tracker=None, hedge=False,
+                 hedge_quantile=0.95, hedge_min_delay=0.5, max_workers=64, first_chunk_timeout=30.0,
+                 idle_timeout=15.0):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.first_chunk_timeout = first_chunk_timeout
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.tracker = tracker or LatencyTracker()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-call')
+
+    def call(self, fn):
+        """Chama fn() com prazo, novas tentativas, circuit breaker e hedge"""
+        expires = time.monotonic() + self.deadline
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            permit = self.breaker.allow()
+            if not permit:
+                MODEL_CALLS.labels('rejected').inc()
+                raise ModelUnavailable('Circuito aberto para o modelo', self.breaker.retry_after())
+            remaining = expires - time.monotonic()
+            started = time.monotonic()
+            try:
+                result = self._attempt(fn, min(self.attempt_timeout, remaining))
+            except Exception as e:
+                attempt += 1
+                self._retry_or_raise(e, attempt, expires, permit)
+                continue
+            self.breaker.record(True, permit)
+            self.tracker.observe(time.monotonic() - started)
+            MODEL_CALLS.labels('success').inc()
+            return result
+
+    def _retry_or_raise(self, error, attempt, expires, permit):
+        """
+        Contabiliza a tentativa `attempt` que falhou com `error` e espera o backoff
+        da próxima; levanta a exceção final quando não cabe nova tentativa
+        """
+        transient = is_transient(error)
+        # Erros do cliente (ex.: 400) vêm de um backend que está respondendo
+        self.breaker.record(not transient, permit)
+        MODEL_CALLS.labels('timeout' if isinstance(error, ModelTimeout) else 'error').inc()
+        if not transient:
+            raise error
+        if attempt >= self.max_attempts:
+            raise ModelUnavailable(f'Modelo indisponível após {attempt} tentativas: {error}') from error
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if time.monotonic() + delay >= expires:
+            MODEL_RETRIES.labels('deadline').inc()
+            raise ModelUnavailable(f'Prazo da chamada ao modelo esgotado: {error}') from error
+        if not self.budget.withdraw():
+            MODEL_RETRIES.labels('budget_exhausted').inc()
+            raise ModelUnavailable(f'Orçamento de novas tentativas esgotado: {error}') from error
+        MODEL_RETRIES.labels('attempted').inc()
+        time.sleep(delay)
+
+    def stream(self, fn):
+        """
+        Pedaços do stream de fn() com prazos: até o primeiro pedaço (first_chunk_timeout),
+        entre pedaços (idle_timeout) e total (deadline). Antes do primeiro pedaço a
+        chamada pode ser repetida (mesma política de call()); depois dele não há como
+        repetir de forma transparente e a falha vira ModelUnavailable para o cliente
+        """
+        expires = time.monotonic() + self.deadline
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            permit = self.breaker.allow()
+            if not permit:
+                MODEL_CALLS.labels('rejected').inc()
+                raise ModelUnavailable('Circuito aberto para o modelo', self.breaker.retry_after())
+            feed = StreamFeed()
+            timeout = min(self.first_chunk_timeout, expires - time.monotonic())
+            first_by = time.monotonic() + timeout
+            try:
+                if timeout <= 0:
+                    raise ModelTimeout('Prazo da chamada ao modelo esgotado')
+                if self._submit(lambda: feed.run(fn), timeout) is None:
+                    raise ModelTimeout(f'Sem vaga para chamar o modelo em {timeout:.1f}s '
+                                       f'({self.max_workers} chamadas em andamento)')
+                chunk = feed.get(first_by - time.monotonic())
+            except Exception as e:
+                feed.stop()
+                attempt += 1
+                self._retry_or_raise(e, attempt, expires, permit)
+                continue
+            break
+
+        # Cliente que desconecta no meio do stream (GeneratorExit) não conta como falha
+        success, outcome = True, 'success'
+        try:
+            while chunk is not StreamFeed.END:
+                yield chunk
+                chunk = feed.get(min(self.idle_timeout, expires - time.monotonic()))
+        except ModelTimeout as e:
+            success, outcome = False, 'timeout'
+            raise ModelUnavailable(f'Stream do modelo interrompido: {e}') from e
+        except Exception as e:
+            success, outcome = not is_transient(e), 'error'
+            raise
+        finally:
+            feed.stop()
+            self.breaker.record(success, permit)
+            MODEL_CALLS.labels(outcome).inc()
+
+    def _attempt(self, fn, timeout):
+        """Uma tentativa: primeira chamada e, se demorar além do p95, uma cópia (hedge)"""
+        if timeout <= 0:
+            raise ModelTimeout('Prazo da chamada ao modelo esgotado')
+        expires = time.monotonic() + timeout
+        first = self._submit(fn, timeout)
+        if first is None:
+            raise ModelTimeout(f'Sem vaga para chamar o modelo em {timeout:.1f}s '
+                               f'({self.max_workers} chamadas em andamento)')
+        pending = {first}
+        hedge = None
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done and self.budget.withdraw():
+                hedge = self._submit(fn)
+                if hedge is None:
+                    MODEL_HEDGES.labels('no_capacity').inc()
+                else:
+                    MODEL_HEDGES.labels('sent').inc()
+                    pending.add(hedge)
+
+        # Vale a primeira resposta com sucesso; erro só se todas as chamadas falharem
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, expires - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise ModelTimeout(f'Modelo sem resposta em {timeout:.1f}s')
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        MODEL_HEDGES.labels('won').inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _submit(self, fn, timeout=0):
+        """
+        Envia fn() ao pool se conseguir vaga em até `timeout` segundos (0: sem esperar)
+        Retorna o future ou None; a vaga é devolvida quando fn() termina, mesmo que a
+        tentativa já tenha sido abandonada
+        """
+        acquired = self._slots.acquire(timeout=timeout) if timeout > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            return None
+        try:
+            future = self._executor.submit(fn)
+        except BaseException:
+            self._slots.release()
+            raise
+        MODEL_INFLIGHT.inc()
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        MODEL_INFLIGHT.dec()
+        self._slots.release()
+
+    def _hedge_delay(self):
+        if not self.hedge:
+            return None
+        quantile = self.tracker.quantile(self.hedge_quantile)
+        if quantile is None:
+            return None
+        return max(self.hedge_min_delay, quantile)
+
+def init_model_resilience(app):
+    """Registra a camada de resiliência do modelo (None se desabilitada)"""
+    config = app.config
+    if not config['MODEL_RESILIENCE_ENABLED']:
+        app.extensions['model_resilience'] = None
+        return None
+    caller = ResilientCaller(
+        deadline=config['MODEL_DEADLINE'],
+        attempt_timeout=config['MODEL_ATTEMPT_TIMEOUT'],
+        max_attempts=config['MODEL_MAX_ATTEMPTS'],
+        base_delay=config['MODEL_RETRY_BASE_DELAY'],
+        max_delay=config['MODEL_RETRY_MAX_DELAY'],
+        budget=RetryBudget(config['MODEL_RETRY_BUDGET_RATIO'], config['MODEL_RETRY_BUDGET_MIN_PER_SECOND']),
+        breaker=CircuitBreaker(
+            failure_rate=config['MODEL_BREAKER_FAILURE_RATE'],
+            min_calls=config['MODEL_BREAKER_MIN_CALLS'],
+            window=config['MODEL_BREAKER_WINDOW'],
+            reset_timeout=config['MODEL_BREAKER_RESET_TIMEOUT'],
+        ),
+        tracker=LatencyTracker(min_samples=config['MODEL_HEDGE_MIN_SAMPLES']),
+        hedge=config['MODEL_HEDGE_ENABLED'],
+        hedge_quantile=config['MODEL_HEDGE_QUANTILE'],
+        hedge_min_delay=config['MODEL_HEDGE_MIN_DELAY'],
+        first_chunk_timeout=config['MODEL_STREAM_FIRST_CHUNK_TIMEOUT'],
+        idle_timeout=config['MODEL_STREAM_IDLE_TIMEOUT'],
+        # Hedges e chamadas abandonadas no prazo contam no mesmo teto da etapa 'vertex'
+        max_workers=config['VERTEX_MAX_CONCURRENCY'],
+    )
+    app.extensions['model_resilience'] = caller
+    return caller
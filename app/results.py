@@ -0,0 +1,392 @@
+"""
+Persistência local dos resultados de extração (SQLite)
+Documentos e itens normalizados, com índices para as consultas do GET /documents;
+a gravação é feita em lotes por um thread em segundo plano, fora da requisição
+"""
+import os
+import re
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from app.metrics import RESULT_WRITES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS documents ('
+    ' id INTEGER PRIMARY KEY,'
+    ' sha256 TEXT NOT NULL UNIQUE,'
+    ' filename TEXT,'
+    ' tipo_documento TEXT,'
+    ' numero_documento TEXT,'
+    ' data_emissao TEXT,'
+    ' fornecedor TEXT,'
+    ' cnpj_fornecedor TEXT,'
+    ' valor_total_documento REAL,'
+    ' prompt_version TEXT,'
+    ' created_at REAL NOT NULL,'
+    ' data TEXT NOT NULL,'
+    ' phash INTEGER,'
+    ' duplicate_of TEXT)',
+    'CREATE TABLE IF NOT EXISTS items ('
+    ' document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,'
+    ' position INTEGER NOT NULL,'
+    ' codigo_produto TEXT,'
+    ' descricao TEXT,'
+    ' quantidade REAL,'
+    ' unidade TEXT,'
+    ' valor_unitario REAL,'
+    ' valor_total_item REAL,'
+    ' PRIMARY KEY (document_id, position)) WITHOUT ROWID',
+    # Índices (coluna, id): filtro por igualdade + paginação por id sem ordenação extra
+    'CREATE INDEX IF NOT EXISTS documents_cnpj ON documents (cnpj_fornecedor, id)',
+    'CREATE INDEX IF NOT EXISTS documents_numero ON documents (numero_documento, id)',
+    'CREATE INDEX IF NOT EXISTS documents_data ON documents (data_emissao, id)',
+    'CREATE INDEX IF NOT EXISTS documents_tipo ON documents (tipo_documento, id)',
+    'CREATE INDEX IF NOT EXISTS items_produto ON items (codigo_produto, document_id)',
+)
+
+# Colunas acrescentadas depois da primeira versão (bancos existentes recebem ALTER TABLE)
+ADDED_COLUMNS = (
+    ('phash', 'INTEGER'),
+    ('duplicate_of', 'TEXT'),
+)
+
+# Colunas devolvidas na listagem (o JSON completo fica em GET /documents/<id>)
+SUMMARY_COLUMNS = ('id', 'sha256', 'filename', 'tipo_documento', 'numero_documento',
+                   'data_emissao', 'fornecedor', 'cnpj_fornecedor', 'valor_total_documento',
+                   'prompt_version', 'created_at', 'duplicate_of')
+
+ITEM_COLUMNS = ('codigo_produto', 'descricao', 'quantidade', 'unidade',
+                'valor_unitario', 'valor_total_item')
+
+_DATE_BR = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$')
+_DATE_ISO = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+
+
+def normalize_cnpj(value):
+    """Somente dígitos ('12.345.678/0001-90' -> '12345678000190'); None se vazio"""
+    digits = re.sub(r'\D', '', str(value or ''))
+    return digits or None
+
+
+def normalize_date(value):
+    """DD/MM/AAAA ou AAAA-MM-DD -> AAAA-MM-DD (ordenável); None se não reconhecida"""
+    text = str(value or '').strip()
+    match = _DATE_BR.match(text)
+    if match:
+        day, month, year = match.groups()
+        return f'{year}-{int(month):02d}-{int(day):02d}'
+    match = _DATE_ISO.match(text)
+    return '-'.join(match.groups()) if match else None
+
+
+def to_number(value):
+    """Número de campo do modelo (1234.5, '1.234,50', 'R$ 10'); None se inválido"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value or '').replace('R$', '').strip()
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def normalize_text(value):
+    """Texto sem espaços nas pontas; None se vazio"""
+    return None if value is None else str(value).strip() or None
+
+
+def document_row(record):
+    """Linha da tabela documents a partir do registro enfileirado"""
+    data = record['data']
+    return (
+        record['sha256'],
+        record.get('filename'),
+        normalize_text(data.get('tipo_documento')),
+        normalize_text(data.get('numero_documento')),
+        normalize_date(data.get('data_emissao')),
+        normalize_text(data.get('fornecedor')),
+        normalize_cnpj(data.get('cnpj_fornecedor')),
+        to_number(data.get('valor_total_documento')),
+        record.get('prompt_version'),
+        record['created_at'],
+        json.dumps(data, ensure_ascii=False),
+        record.get('phash'),
+        record.get('duplicate_of'),
+    )
+
+
+def item_rows(document_id, items):
+    """Linhas da tabela items (itens que não são objetos são ignorados)"""
+    rows = []
+    for position, item in enumerate(items or []):
+        if not isinstance(item, dict):
+            continue
+        rows.append((
+            document_id, position,
+            normalize_text(item.get('codigo_produto')),
+            normalize_text(item.get('descricao')),
+            to_number(item.get('quantidade')),
+            normalize_text(item.get('unidade')),
+            to_number(item.get('valor_unitario')),
+            to_number(item.get('valor_total_item')),
+        ))
+    return rows
+
+
+def document_filters(cnpj_fornecedor=None, numero_documento=None, tipo_documento=None,
+                     data_inicio=None, data_fim=None, codigo_produto=None, duplicates=True):
+    """Cláusulas WHERE (e parâmetros) dos filtros de documentos; datas já em AAAA-MM-DD"""
+    clauses, params = [], []
+    for column, value in (('cnpj_fornecedor', normalize_cnpj(cnpj_fornecedor)),
+                          ('numero_documento', normalize_text(numero_documento)),
+                          ('tipo_documento', normalize_text(tipo_documento))):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if data_inicio:
+        clauses.append('data_emissao >= ?')
+        params.append(data_inicio)
+    if data_fim:
+        clauses.append('data_emissao <= ?')
+        params.append(data_fim)
+    if codigo_produto:
+        clauses.append('id IN (SELECT document_id FROM items WHERE codigo_produto = ?)')
+        params.append(codigo_produto)
+    if not duplicates:
+        clauses.append('duplicate_of IS NULL')
+    return clauses, params
+
+
+class ResultStore:
+    """
+    Resultados de extração em SQLite (WAL: leituras não bloqueiam a gravação)
+    submit() só enfileira; um thread grava em lotes de até `batch_size` registros
+    ou a cada `flush_interval` segundos. Documentos repetidos (mesmo sha256) são ignorados.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=0.5, max_pending=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+        self._listeners = []
+
+        conn = self._connect()
+        for statement in SCHEMA:
+            conn.execute(statement)
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(documents)')}
+        for column, kind in ADDED_COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE documents ADD COLUMN {column} {kind}')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Gravação
+
+    def add_listener(self, listener):
+        """
+        listener(conn, records) chamado dentro da transação de cada lote com os
+        registros novos (já com 'id'); uma falha desfaz o lote inteiro
+        """
+        self._listeners.append(listener)
+
+    def submit(self, document, payload, phash=None, duplicate_of=None):
+        """
+        Enfileira o resultado; nunca bloqueia (descarta se a fila estiver cheia)
+        `phash` é o hash perceptual (64 bits com sinal) e `duplicate_of` o sha256 do
+        documento original quando este for uma duplicata confirmada
+        """
+        record = {
+            'sha256': document.sha256,
+            'filename': document.filename,
+            'prompt_version': payload.get('prompt_version'),
+            'created_at': time.time(),
+            'data': payload['extracted_data'],
+            'phash': phash,
+            'duplicate_of': duplicate_of,
+        }
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            RESULT_WRITES.labels('dropped').inc()
+            logger.warning(f'Result queue full, dropping {document.sha256[:12]}')
+
+    def flush(self):
+        """Aguarda a gravação de tudo o que já foi enfileirado"""
+        self._queue.join()
+
+    def _ensure_writer(self):
+        # Criado sob demanda e recriado após fork (threads não sobrevivem ao fork)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._write_loop,
+                                                name='result-writer', daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                RESULT_WRITES.labels('failed').inc(len(batch))
+                logger.error(f'Error writing {len(batch)} results: {e}', exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def write_batch(self, records):
+        """Grava os registros numa única transação; retorna os registros novos"""
+        conn = self._connect()
+        written = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in records:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO documents (sha256, filename, tipo_documento,'
+                    ' numero_documento, data_emissao, fornecedor, cnpj_fornecedor,'
+                    ' valor_total_documento, prompt_version, created_at, data, phash, duplicate_of)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    document_row(record))
+                if not cursor.rowcount:
+                    continue
+                record['id'] = cursor.lastrowid
+                conn.executemany(
+                    'INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    item_rows(cursor.lastrowid, record['data'].get('itens')))
+                written.append(record)
+            for listener in self._listeners:
+                listener(conn, written)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        RESULT_WRITES.labels('written').inc(len(written))
+        RESULT_WRITES.labels('duplicate').inc(len(records) - len(written))
+        return written
+
+    # Consulta
+
+    def query(self, cnpj_fornecedor=None, numero_documento=None, tipo_documento=None,
+              data_inicio=None, data_fim=None, codigo_produto=None, cursor=None, limit=50):
+        """
+        Página de documentos, do mais recente ao mais antigo (paginação por id)
+        Retorna (documentos, próximo_cursor); o cursor é o id do último documento
+        """
+        clauses, params = document_filters(cnpj_fornecedor, numero_documento, tipo_documento,
+                                           data_inicio, data_fim, codigo_produto)
+        if cursor is not None:
+            clauses.append('id < ?')
+            params.append(cursor)
+
+        sql = f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM documents'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+
+        documents = [dict(zip(SUMMARY_COLUMNS, row)) for row in rows[:limit]]
+        next_cursor = documents[-1]['id'] if len(rows) > limit else None
+        return documents, next_cursor
+
+    def iter_documents(self, batch_size=1000, **filters):
+        """
+        Todos os documentos que atendem aos filtros, em ordem de id, com os itens
+        Gera (documento, [itens]) como tuplas nas ordens de SUMMARY_COLUMNS e ITEM_COLUMNS;
+        lê lotes de `batch_size` por id (transações de leitura curtas, memória limitada)
+        """
+        clauses, params = document_filters(**filters)
+        sql = f'SELECT {", ".join(SUMMARY_COLUMNS)} FROM documents WHERE ' + ' AND '.join(clauses + ['id > ?'])
+        sql += ' ORDER BY id LIMIT ?'
+        item_columns = ', '.join(ITEM_COLUMNS)
+        conn = self._connect()
+        last_id = 0
+        while True:
+            rows = conn.execute(sql, params + [last_id, batch_size]).fetchall()
+            if not rows:
+                return
+            ids = [row[0] for row in rows]
+            items = {}
+            for item in conn.execute(
+                    f'SELECT document_id, {item_columns} FROM items WHERE document_id IN'
+                    f' ({", ".join("?" * len(ids))}) ORDER BY document_id, position', ids):
+                items.setdefault(item[0], []).append(item[1:])
+            for row in rows:
+                yield row, items.get(row[0], ())
+            if len(rows) < batch_size:
+                return
+            last_id = ids[-1]
+
+    def get(self, document_id):
+        """Documento completo (JSON extraído + itens normalizados) ou None"""
+        return self._get('id', document_id)
+
+    def get_by_sha256(self, sha256):
+        """Documento completo pelo sha256 do conteúdo ou None"""
+        return self._get('sha256', sha256)
+
+    def _get(self, column, value):
+        conn = self._connect()
+        row = conn.execute(f'SELECT {", ".join(SUMMARY_COLUMNS)}, data FROM documents WHERE {column} = ?',
+                           (value,)).fetchone()
+        if row is None:
+            return None
+        document = dict(zip(SUMMARY_COLUMNS, row[:-1]))
+        document['extracted_data'] = json.loads(row[-1])
+        document['itens'] = [
+            dict(zip(ITEM_COLUMNS, item)) for item in conn.execute(
+                f'SELECT {", ".join(ITEM_COLUMNS)} FROM items WHERE document_id = ? ORDER BY position',
+                (document['id'],))
+        ]
+        return document
+
+
+def init_result_store(app):
+    """Cria o armazenamento de resultados (desabilitado se RESULTS_DB_PATH estiver vazio)"""
+    path = app.config.get('RESULTS_DB_PATH')
+    store = None
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        store = ResultStore(
+            path,
+            batch_size=app.config['RESULTS_BATCH_SIZE'],
+            flush_interval=app.config['RESULTS_FLUSH_INTERVAL'],
+            max_pending=app.config['RESULTS_MAX_PENDING'],
+        )
+    app.extensions['result_store'] = store
+    return store
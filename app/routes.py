@@ -2,43 +2,45 @@
 """
 Rotas principais da aplicação
 """
-import os
-import io
+import re
 import json
-import tempfile
-from flask import Blueprint, request, jsonify, current_app
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from werkzeug.utils import secure_filename
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Part
-from google.cloud import storage
-from app.security import validate_file, sanitize_prompt
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context, g
+from app.ingest import ingest_upload
+from app.instrumentation import stage
+from app.metrics import UPLOAD_SIZE, render_metrics
 from app.auth import auth_required
+from app.ratelimit import rate_limited
+from app.jobs import JobQueueFull
+from app.results import normalize_date
+from app.export import FORMATS, export_chunks, parquet_available
+from app.pipeline import MODEL_UNAVAILABLE_MESSAGE, process_document, process_batch, stream_document
+from app.resilience import ModelUnavailable
 
 # Criar blueprint
 main_bp = Blueprint('main', __name__)
 
-# Rate limiter específico para upload
-limiter = Limiter(key_func=get_remote_address)
+def wants_async():
+    """Verifica se o cliente pediu processamento assíncrono"""
+    flag = request.args.get('async', request.form.get('async'))
+    if flag is not None:
+        return flag.lower() in ('1', 'true', 'yes')
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    return current_app.config.get('UPLOAD_ASYNC_DEFAULT', False)
 
-# Inicializar clientes (será feito no primeiro uso)
-storage_client = None
-model = None
-
-def init_gcp_clients():
-    """Inicializa os clientes do GCP de forma lazy"""
-    global storage_client, model
-    
-    if storage_client is None:
-        storage_client = storage.Client()
-    
-    if model is None:
-        vertexai.init(
-            project=current_app.config['GCP_PROJECT_ID'], 
-            location=current_app.config['GCP_LOCATION']
-        )
-        model = GenerativeModel(current_app.config['GEMINI_MODEL_ID'])
+def requested_prompt():
+    """
+    Template do tipo de documento informado em `tipo_documento` (form ou query)
+    Retorna (template, None) ou (None, resposta de erro)
+    """
+    registry = current_app.extensions['prompt_registry']
+    name = request.args.get('tipo_documento', request.form.get('tipo_documento'))
+    prompt = registry.get(name)
+    if prompt is None:
+        return None, (jsonify({
+            'error': f'Tipo de documento não suportado. Permitidos: {", ".join(registry.keys())}'
+        }), 400)
+    return prompt, None
 
 @main_bp.route('/health', methods=['GET'])
 def health_check():
@@ -49,13 +51,57 @@ def health_check():
         'version': '2.0.0'
     }), 200
 
+@main_bp.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Prontidão do worker: 200 só depois de os clientes (modelo, armazenamento)
+    estarem aquecidos; 503 enquanto aquecem ou após falha (com nova tentativa)
+    Com CLIENT_WARMUP_ENABLED=false os clientes são criados na primeira requisição
+    e a prontidão não depende deles
+    """
+    registry = current_app.extensions['client_registry']
+    if not current_app.config['CLIENT_WARMUP_ENABLED']:
+        return jsonify({'status': 'ready', 'clients': registry.status()}), 200
+    if not registry.ready:
+        registry.start_warmup()
+    body = {'status': 'ready' if registry.ready else 'warming', 'clients': registry.status()}
+    return jsonify(body), 200 if registry.ready else 503
+
+@main_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato texto do Prometheus (agregadas entre workers)"""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
+
+@main_bp.route('/admission', methods=['GET'])
+def admission_stats():
+    """
+    Estado do controle de admissão deste worker: limite atual, chamadas em andamento,
+    fila, admitidas e rejeitadas (o total entre workers está em /metrics)
+    """
+    controller = current_app.extensions['stage_limits']['vertex']
+    if not hasattr(controller, 'stats'):
+        return jsonify({'enabled': False})
+    return jsonify(dict(controller.stats(), enabled=True))
+
+@main_bp.route('/cascade', methods=['GET'])
+def cascade_stats():
+    """
+    Cascata de modelos deste worker: por nível, chamadas aceitas, escalonadas e
+    esgotadas, taxa de acerto, latência média, tokens e custo estimado
+    """
+    cascade = current_app.extensions.get('model_cascade')
+    if cascade is None:
+        return jsonify({'enabled': False, 'model': current_app.config['GEMINI_MODEL_ID']})
+    return jsonify(dict(cascade.stats(), enabled=True))
+
 @main_bp.route('/upload-invoice', methods=['POST'])
-@limiter.limit("10 per minute")
+@rate_limited('uploads')
 @auth_required
 def upload_invoice():
     """
     Endpoint principal para upload e análise de documentos fiscais
-    Rate limited para 10 uploads por minuto por IP
+    Rate limited pela cota de uploads (custo proporcional ao tamanho), por token ou IP
     """
     try:
         # Validar se arquivo foi enviado
@@ -68,129 +114,352 @@ def upload_invoice():
             current_app.logger.warning('Upload attempt with empty filename')
             return jsonify({'error': 'Nenhuma imagem selecionada'}), 400
 
-        # Validar arquivo
-        validation_result = validate_file(image_file)
+        # Validar e ler o arquivo em uma única passagem
+        with stage('validate'):
+            validation_result = ingest_upload(image_file)
         if not validation_result['valid']:
             current_app.logger.warning(f'File validation failed: {validation_result["error"]}')
             return jsonify({'error': validation_result['error']}), 400
+        document = validation_result['document']
+        UPLOAD_SIZE.labels('upload-invoice').observe(document.size)
 
-        # Inicializar clientes GCP
-        init_gcp_clients()
-
-        # Processar arquivo de forma segura
-        secure_name = secure_filename(image_file.filename)
-        
-        # Usar arquivo temporário para processamento
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'_{secure_name}') as temp_file:
-            image_file.save(temp_file.name)
-            
-            # Upload para GCS
-            bucket_name = current_app.config['GCS_BUCKET_NAME']
-            bucket = storage_client.bucket(bucket_name)
-            blob_name = f"invoices/{secure_name}"
-            blob = bucket.blob(blob_name)
-            
-            with open(temp_file.name, 'rb') as f:
-                blob.upload_from_file(f, content_type=image_file.mimetype)
-            
-            gcs_uri = f"gs://{bucket_name}/{blob_name}"
-            
-            # Limpar arquivo temporário
-            os.unlink(temp_file.name)
-
-        # Preparar prompt sanitizado
-        base_prompt = """
-        Analise esta imagem que pode ser uma nota fiscal, etiqueta de produto ou documento de estoque.
-        Extraia as seguintes informações em formato JSON, se presentes e identificáveis:
-        {
-          "tipo_documento": "Nota Fiscal" ou "Etiqueta de Produto" ou "Relatório de Contagem" ou "Desconhecido",
-          "numero_documento": "<numero_da_nota_fiscal_ou_referencia>",
-          "data_emissao": "<DD/MM/AAAA>",
-          "fornecedor": "<nome_do_fornecedor>",
-          "cnpj_fornecedor": "<CNPJ>",
-          "itens": [
-            {
-              "codigo_produto": "<codigo>",
-              "descricao": "<descricao_do_item>",
-              "quantidade": <quantidade_numerica>,
-              "unidade": "<unidade_medida>",
-              "valor_unitario": <valor_numerica>,
-              "valor_total_item": <valor_numerica>
-            }
-          ],
-          "valor_total_documento": <valor_numerica>,
-          "observacoes_adicionais": "<texto_livre_de_observacoes_ou_discrepancias>"
-        }
-        Se a informação não for encontrada, deixe o campo como `null` ou array vazio para "itens".
-        Se for uma etiqueta, preencha apenas o que for relevante.
-        Certifique-se de que a saída seja um JSON válido.
-        """
-        
-        sanitized_prompt = sanitize_prompt(base_prompt)
-
-        # Chamar Gemini AI
-        image_part = Part.from_uri(gcs_uri, mime_type=image_file.mimetype)
-        response = model.generate_content([sanitized_prompt, image_part])
-        
-        gemini_output_text = response.text
+        prompt, error = requested_prompt()
+        if error:
+            return error
+
+        if wants_async():
+            return enqueue_upload(document, prompt)
+
+        payload, status = process_document(document, prompt)
+        return jsonify(payload), status
+
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        current_app.logger.error(f'Error processing upload: {str(e)}', exc_info=True)
+        return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@main_bp.route('/upload-invoice/stream', methods=['POST'])
+@rate_limited('uploads')
+@auth_required
+def upload_invoice_stream():
+    """
+    Variante em streaming do upload (Server-Sent Events)
+    Campos do cabeçalho e cada item são enviados assim que o Gemini os completa
+    """
+    if 'image' not in request.files:
+        current_app.logger.warning('Upload attempt without image file')
+        return jsonify({'error': 'Nenhum arquivo de imagem fornecido'}), 400
+
+    image_file = request.files['image']
+    if image_file.filename == '':
+        current_app.logger.warning('Upload attempt with empty filename')
+        return jsonify({'error': 'Nenhuma imagem selecionada'}), 400
+
+    with stage('validate'):
+        validation_result = ingest_upload(image_file)
+    if not validation_result['valid']:
+        current_app.logger.warning(f'File validation failed: {validation_result["error"]}')
+        return jsonify({'error': validation_result['error']}), 400
+    document = validation_result['document']
+    UPLOAD_SIZE.labels('upload-invoice-stream').observe(document.size)
+
+    prompt, error = requested_prompt()
+    if error:
+        return error
+
+    def generate():
+        # Primeiro evento imediato: o cliente sabe que o documento foi aceito
+        yield sse_event('accepted', {'filename': document.filename, 'size': document.size})
         try:
-            # Tentar parsear como JSON
-            extracted_data = json.loads(gemini_output_text)
-            
-            # Validar estrutura básica do JSON retornado
-            if not isinstance(extracted_data, dict):
-                raise ValueError("Resposta não é um objeto JSON válido")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            current_app.logger.warning(f'Gemini returned invalid JSON: {e}')
-            return jsonify({
-                'message': 'Imagem processada, mas a saída não foi um JSON válido.',
-                'gemini_raw_output': gemini_output_text[:500],  # Limitar tamanho da resposta
-                'error': 'Formato de resposta inválido'
-            }), 200
-
-        # Gerar relatório de notificação
-        notification_message = generate_notification_message(extracted_data)
-        
-        current_app.logger.info(f'Successfully processed document: {secure_name}')
-        
+            for event, data in stream_document(document, prompt):
+                yield sse_event(event, data)
+        except ModelUnavailable as e:
+            current_app.logger.warning(f'Model unavailable for streaming upload: {e}')
+            yield sse_event('error', {'error': MODEL_UNAVAILABLE_MESSAGE, 'retry_after': e.retry_after or 1})
+        except Exception as e:
+            current_app.logger.error(f'Error streaming upload: {str(e)}', exc_info=True)
+            yield sse_event('error', {'error': 'Erro interno do servidor'})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def model_unavailable_response(error):
+    """503 com Retry-After quando o modelo está indisponível (circuito aberto, prazo ou tentativas esgotadas)"""
+    current_app.logger.warning(f'Model unavailable: {error}')
+    response = jsonify({'error': MODEL_UNAVAILABLE_MESSAGE})
+    response.headers['Retry-After'] = str(error.retry_after or 1)
+    return response, 503
+
+def sse_event(event, data):
+    """Formata um evento Server-Sent Events"""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+@main_bp.route('/upload-invoices', methods=['POST'])
+@rate_limited('uploads')
+@auth_required
+def upload_invoices():
+    """
+    Upload em lote: vários documentos em uma única requisição multipart
+    Processados em paralelo; resultados por arquivo na ordem de envio
+    """
+    try:
+        files = request.files.getlist('images') or request.files.getlist('image')
+        if not files:
+            current_app.logger.warning('Batch upload attempt without files')
+            return jsonify({'error': 'Nenhum arquivo de imagem fornecido'}), 400
+
+        max_files = current_app.config['BATCH_MAX_FILES']
+        if len(files) > max_files:
+            return jsonify({'error': f'Muitos arquivos no lote. Máximo: {max_files}'}), 400
+
+        prompt, error = requested_prompt()
+        if error:
+            return error
+
+        # Validar todos os arquivos; falhas são reportadas por item
+        results = [None] * len(files)
+        documents = []
+        positions = []
+        for index, file in enumerate(files):
+            if file.filename == '':
+                results[index] = ({'error': 'Nenhuma imagem selecionada'}, 400)
+                continue
+            validation_result = ingest_upload(file)
+            if not validation_result['valid']:
+                current_app.logger.warning(f'Batch file validation failed: {validation_result["error"]}')
+                results[index] = ({'error': validation_result['error']}, 400)
+                continue
+            documents.append(validation_result['document'])
+            UPLOAD_SIZE.labels('upload-invoices').observe(validation_result['size'])
+            positions.append(index)
+
+        processed = process_batch(documents, current_app.config['BATCH_MAX_WORKERS'], prompt)
+        for index, result in zip(positions, processed):
+            results[index] = result
+
+        items = []
+        for index, (file, (payload, status)) in enumerate(zip(files, results)):
+            items.append(dict(payload, index=index, filename=file.filename, status=status))
+
+        succeeded = sum(1 for item in items if 'extracted_data' in item)
         return jsonify({
-            'message': 'Imagem processada com sucesso e dados extraídos.',
-            'extracted_data': extracted_data,
-            'notification_summary': notification_message
+            'message': f'{succeeded} de {len(items)} documentos processados com sucesso.',
+            'results': items,
+            'summary': {
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded
+            }
         }), 200
 
     except Exception as e:
-        current_app.logger.error(f'Error processing upload: {str(e)}', exc_info=True)
+        current_app.logger.error(f'Error processing batch upload: {str(e)}', exc_info=True)
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
-def generate_notification_message(extracted_data):
-    """Gera mensagem de notificação formatada"""
+def enqueue_upload(document, prompt=None):
+    """Enfileira o documento validado e responde 202 com o id do job"""
+    manager = current_app.extensions['job_manager']
     try:
-        message = f"""
-**Relatório Vision Estoque-Financeiro**
-Tipo de Documento: {extracted_data.get("tipo_documento", "N/A")}
-Número: {extracted_data.get("numero_documento", "N/A")}
-Data: {extracted_data.get("data_emissao", "N/A")}
-Fornecedor: {extracted_data.get("fornecedor", "N/A")}
-Valor Total: R$ {extracted_data.get("valor_total_documento", "0.00")}
-
-**Itens:**
-"""
-        for item in extracted_data.get("itens", []):
-            message += (
-                f"- {item.get('descricao', 'N/A')} ({item.get('codigo_produto', 'N/A')}) "
-                f"Qtd: {item.get('quantidade', 'N/A')} {item.get('unidade', '')} "
-                f"Total: R$ {item.get('valor_total_item', '0.00')}\n"
-            )
-        
-        message += f"\nObservações: {extracted_data.get('observacoes_adicionais', 'Nenhuma')}"
-        return message
-        
-    except Exception as e:
-        current_app.logger.error(f'Error generating notification: {e}')
-        return "Erro ao gerar relatório de notificação"
+        job = manager.submit(document, prompt, owner=g.get('api_key'))
+    except JobQueueFull:
+        current_app.logger.warning('Upload job queue is full')
+        return jsonify({'error': 'Fila de processamento cheia. Tente novamente mais tarde.'}), 503
+
+    status_url = url_for('main.get_job', job_id=job['id'])
+    current_app.logger.info(f'Upload queued as job {job["id"]}')
+    response = jsonify({
+        'message': 'Documento recebido e enfileirado para processamento.',
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+@main_bp.route('/jobs/<job_id>', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def get_job(job_id):
+    """
+    Consulta o status e o resultado de um job de upload
+    Jobs de outra chave de API respondem 404, como os inexistentes
+    """
+    job = current_app.extensions['job_manager'].get(job_id)
+    if job is None or job.get('owner') != g.get('api_key'):
+        return jsonify({'error': 'Job não encontrado'}), 404
+
+    body = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'filename': job.get('filename'),
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if 'result' in job:
+        body['result'] = job['result']
+    if 'error' in job:
+        body['error'] = job['error']
+    return jsonify(body), 200
+
+# Tamanho de página do GET /documents
+DOCUMENTS_PAGE_SIZE = 50
+DOCUMENTS_MAX_PAGE_SIZE = 500
+
+@main_bp.route('/documents', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def list_documents():
+    """
+    Lista os resultados persistidos, do mais recente ao mais antigo
+    Filtros: cnpj_fornecedor, numero_documento, tipo_documento, codigo_produto,
+    data_inicio/data_fim (DD/MM/AAAA ou AAAA-MM-DD); paginação por cursor
+    """
+    results = current_app.extensions.get('result_store')
+    if results is None:
+        return jsonify({'error': 'Persistência de resultados desabilitada'}), 503
+
+    args = request.args
+    try:
+        limit = int(args.get('limit', DOCUMENTS_PAGE_SIZE))
+        cursor = int(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Parâmetros limit e cursor devem ser inteiros'}), 400
+    if not 1 <= limit <= DOCUMENTS_MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit deve estar entre 1 e {DOCUMENTS_MAX_PAGE_SIZE}'}), 400
+
+    dates, error = date_filters(args)
+    if error:
+        return error
+
+    documents, next_cursor = results.query(
+        cnpj_fornecedor=args.get('cnpj_fornecedor'),
+        numero_documento=args.get('numero_documento'),
+        tipo_documento=args.get('tipo_documento'),
+        codigo_produto=args.get('codigo_produto'),
+        cursor=cursor,
+        limit=limit,
+        **dates,
+    )
+    return jsonify({'documents': documents, 'next_cursor': next_cursor}), 200
+
+def date_filters(args):
+    """data_inicio/data_fim normalizadas (AAAA-MM-DD); retorna (datas, None) ou (None, resposta de erro)"""
+    dates = {}
+    for name in ('data_inicio', 'data_fim'):
+        if args.get(name):
+            dates[name] = normalize_date(args[name])
+            if dates[name] is None:
+                return None, (jsonify({'error': f'Data inválida em {name}'}), 400)
+    return dates, None
+
+@main_bp.route('/documents/<int:document_id>', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def get_document(document_id):
+    """Resultado persistido completo, com os itens normalizados"""
+    results = current_app.extensions.get('result_store')
+    if results is None:
+        return jsonify({'error': 'Persistência de resultados desabilitada'}), 503
+    document = results.get(document_id)
+    if document is None:
+        return jsonify({'error': 'Documento não encontrado'}), 404
+    return jsonify(document), 200
+
+@main_bp.route('/export', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def export_documents():
+    """
+    Exportação em massa dos resultados persistidos, enviada em streaming
+    format: ndjson (um documento por linha), csv ou parquet (uma linha por item)
+    Mesmos filtros do GET /documents; duplicatas confirmadas só com duplicatas=1
+    """
+    results = current_app.extensions.get('result_store')
+    if results is None:
+        return jsonify({'error': 'Persistência de resultados desabilitada'}), 503
+
+    args = request.args
+    fmt = args.get('format', 'ndjson').lower()
+    if fmt not in FORMATS:
+        return jsonify({'error': f'Formato não suportado. Permitidos: {", ".join(FORMATS)}'}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Exportação Parquet requer o pacote pyarrow'}), 501
+    dates, error = date_filters(args)
+    if error:
+        return error
+
+    chunks = export_chunks(
+        results, fmt,
+        batch_size=current_app.config['EXPORT_BATCH_SIZE'],
+        row_group_size=current_app.config['EXPORT_ROW_GROUP_SIZE'],
+        cnpj_fornecedor=args.get('cnpj_fornecedor'),
+        numero_documento=args.get('numero_documento'),
+        tipo_documento=args.get('tipo_documento'),
+        codigo_produto=args.get('codigo_produto'),
+        duplicates=args.get('duplicatas', '').lower() in ('1', 'true', 'yes'),
+        **dates,
+    )
+    mimetype, extension = FORMATS[fmt]
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=documentos.{extension}'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+STOCK_PAGE_SIZE = 100
+_MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+
+@main_bp.route('/stock', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def get_stock():
+    """
+    Estoque materializado por produto (entradas por nota fiscal e última contagem)
+    Com codigo_produto responde só esse produto; sem ele, lista paginada por código
+    """
+    aggregates = current_app.extensions.get('aggregates')
+    if aggregates is None:
+        return jsonify({'error': 'Persistência de resultados desabilitada'}), 503
+
+    code = request.args.get('codigo_produto')
+    if code:
+        product = aggregates.stock(code.strip())
+        if product is None:
+            return jsonify({'error': 'Produto não encontrado'}), 404
+        return jsonify(product), 200
+
+    try:
+        limit = int(request.args.get('limit', STOCK_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Parâmetro limit deve ser inteiro'}), 400
+    if not 1 <= limit <= DOCUMENTS_MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit deve estar entre 1 e {DOCUMENTS_MAX_PAGE_SIZE}'}), 400
+    products, next_cursor = aggregates.stock_page(request.args.get('cursor'), limit)
+    return jsonify({'products': products, 'next_cursor': next_cursor}), 200
+
+@main_bp.route('/financial-summary', methods=['GET'])
+@rate_limited('reads')
+@auth_required
+def financial_summary():
+    """
+    Gastos por mês das notas fiscais (total ou de um fornecedor via cnpj_fornecedor)
+    Intervalo opcional em mes_inicio/mes_fim (AAAA-MM)
+    """
+    aggregates = current_app.extensions.get('aggregates')
+    if aggregates is None:
+        return jsonify({'error': 'Persistência de resultados desabilitada'}), 503
+
+    months = {}
+    for name in ('mes_inicio', 'mes_fim'):
+        value = request.args.get(name)
+        if value:
+            if not _MONTH_RE.match(value):
+                return jsonify({'error': f'{name} deve estar no formato AAAA-MM'}), 400
+            months[name] = value
+    summary = aggregates.financial_summary(request.args.get('cnpj_fornecedor'), **months)
+    return jsonify(summary), 200
 
 @main_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -4,9 +4,9 @@ Módulo de segurança para validação de arquivos e sanitização
 """
 import os
 import re
-import magic
 from flask import current_app
 from werkzeug.utils import secure_filename
+from app.validation import detect_mime
 
 # Tipos MIME permitidos
 ALLOWED_MIME_TYPES = {
@@ -22,9 +22,66 @@ ALLOWED_MIME_TYPES = {
 # Extensões permitidas
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'tiff', 'bmp'}
 
+# Sequências que podem ser usadas para injeção de prompt
+DANGEROUS_PROMPT_PATTERNS = (
+    r'ignore\s+previous\s+instructions',
+    r'forget\s+everything',
+    r'new\s+instructions',
+    r'system\s*:',
+    r'assistant\s*:',
+    r'user\s*:',
+    r'<\s*script',
+    r'javascript\s*:',
+    r'data\s*:',
+    r'vbscript\s*:',
+)
+
+# Caracteres de controle + padrões perigosos em uma única expressão
+_PROMPT_INJECTION_RE = re.compile(
+    '|'.join((r'[\x00-\x1f\x7f-\x9f]',) + DANGEROUS_PROMPT_PATTERNS),
+    re.IGNORECASE
+)
+
+# Tamanho máximo do prompt após a sanitização
+MAX_PROMPT_LENGTH = 2000
+
 # Tamanho máximo de arquivo (16MB)
 MAX_FILE_SIZE = 16 * 1024 * 1024
 
+def validate_filename(filename):
+    """
+    Valida nome e extensão do arquivo (sem ler o conteúdo)
+    """
+    if not filename:
+        return {'valid': False, 'error': 'Arquivo não fornecido'}
+
+    filename = secure_filename(filename.lower())
+    if not filename or '.' not in filename:
+        return {'valid': False, 'error': 'Nome de arquivo inválido'}
+
+    extension = filename.rsplit('.', 1)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        return {'valid': False, 'error': f'Extensão não permitida. Permitidas: {", ".join(ALLOWED_EXTENSIONS)}'}
+
+    return {'valid': True, 'filename': filename}
+
+def validate_content_head(head):
+    """
+    Verifica o tipo MIME a partir dos primeiros bytes (magic numbers)
+    Assinaturas conhecidas dispensam o libmagic; handle do libmagic por thread
+    Retorna o tipo detectado (None se não for possível determinar)
+    """
+    try:
+        mime_type = detect_mime(head)
+    except Exception as e:
+        current_app.logger.warning(f'Could not determine MIME type: {e}')
+        # Continuar sem verificação MIME se magic falhar
+        return {'valid': True, 'mime_type': None}
+
+    if mime_type not in ALLOWED_MIME_TYPES:
+        return {'valid': False, 'error': f'Tipo de arquivo não permitido: {mime_type}'}
+    return {'valid': True, 'mime_type': mime_type}
+
 def validate_file(file):
     """
     Valida arquivo enviado verificando:
@@ -35,17 +92,14 @@ def validate_file(file):
     """
     try:
         # Verificar se arquivo existe
-        if not file or not file.filename:
+        if not file:
             return {'valid': False, 'error': 'Arquivo não fornecido'}
         
         # Verificar extensão
-        filename = secure_filename(file.filename.lower())
-        if not filename or '.' not in filename:
-            return {'valid': False, 'error': 'Nome de arquivo inválido'}
-        
-        extension = filename.rsplit('.', 1)[1].lower()
-        if extension not in ALLOWED_EXTENSIONS:
-            return {'valid': False, 'error': f'Extensão não permitida. Permitidas: {", ".join(ALLOWED_EXTENSIONS)}'}
+        name_result = validate_filename(file.filename)
+        if not name_result['valid']:
+            return name_result
+        filename = name_result['filename']
         
         # Verificar tamanho do arquivo
         file.seek(0, os.SEEK_END)
@@ -62,13 +116,9 @@ def validate_file(file):
         file_content = file.read(1024)  # Ler apenas os primeiros 1024 bytes
         file.seek(0)  # Reset para o início
         
-        try:
-            mime_type = magic.from_buffer(file_content, mime=True)
-            if mime_type not in ALLOWED_MIME_TYPES:
-                return {'valid': False, 'error': f'Tipo de arquivo não permitido: {mime_type}'}
-        except Exception as e:
-            current_app.logger.warning(f'Could not determine MIME type: {e}')
-            # Continuar sem verificação MIME se magic falhar
+        content_result = validate_content_head(file_content)
+        if not content_result['valid']:
+            return content_result
         
         return {'valid': True, 'filename': filename, 'size': file_size}
         
@@ -79,35 +129,20 @@ def validate_file(file):
 def sanitize_prompt(prompt):
     """
     Sanitiza prompt para prevenir injeção de prompt
-    Remove ou escapa caracteres potencialmente perigosos
+    Remove caracteres de controle e sequências perigosas com uma única
+    expressão pré-compilada (alternação), repetida até o texto estabilizar
     """
     if not prompt:
         return ""
     
-    # Remover caracteres de controle
-    prompt = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', prompt)
-    
-    # Remover sequências que podem ser usadas para injeção
-    dangerous_patterns = [
-        r'ignore\s+previous\s+instructions',
-        r'forget\s+everything',
-        r'new\s+instructions',
-        r'system\s*:',
-        r'assistant\s*:',
-        r'user\s*:',
-        r'<\s*script',
-        r'javascript\s*:',
-        r'data\s*:',
-        r'vbscript\s*:',
-    ]
-    
-    for pattern in dangerous_patterns:
-        prompt = re.sub(pattern, '', prompt, flags=re.IGNORECASE)
+    # Remoções não podem formar um novo padrão (ex.: "sysuser:tem:")
+    count = 1
+    while count:
+        prompt, count = _PROMPT_INJECTION_RE.subn('', prompt)
     
     # Limitar tamanho do prompt
-    max_prompt_length = 2000
-    if len(prompt) > max_prompt_length:
-        prompt = prompt[:max_prompt_length]
+    if len(prompt) > MAX_PROMPT_LENGTH:
+        prompt = prompt[:MAX_PROMPT_LENGTH]
         try:
             from flask import current_app
             current_app.logger.warning('Prompt truncated due to length')
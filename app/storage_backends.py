@@ -0,0 +1,246 @@
+"""
+Backends de armazenamento de objetos
+GCS (produção), sistema de arquivos local e memória (testes/benchmarks offline)
+"""
+import io
+import os
+import uuid
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+# O GCS exige chunk_size múltiplo de 256 KiB
+GCS_CHUNK_ALIGNMENT = 256 * 1024
+
+# Limite de componentes de uma operação compose do GCS
+GCS_MAX_COMPOSE_PARTS = 32
+
+
+class StorageBackend:
+    """Interface comum dos backends de armazenamento"""
+
+    # Indica se o Gemini consegue ler o objeto diretamente pela URI
+    model_readable = False
+
+    def put(self, name, data, content_type=None):
+        """Armazena os bytes e retorna a URI do objeto"""
+        raise NotImplementedError
+
+    def get(self, name):
+        """Retorna os bytes armazenados (None se não existir)"""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def warm(self):
+        """Inicializa clientes e credenciais antes da primeira requisição (padrão: nada a fazer)"""
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """Armazena objetos em um dicionário do processo"""
+
+    def __init__(self, bucket_name='memory'):
+        self.bucket_name = bucket_name
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, name, data, content_type=None):
+        with self._lock:
+            self.objects[name] = (bytes(data), content_type)
+        return f'memory://{self.bucket_name}/{name}'
+
+    def get(self, name):
+        with self._lock:
+            entry = self.objects.get(name)
+        return entry[0] if entry is not None else None
+
+    def delete(self, name):
+        with self._lock:
+            self.objects.pop(name, None)
+
+
+class LocalStorageBackend(StorageBackend):
+    """Armazena objetos em um diretório local"""
+
+    def __init__(self, base_path):
+        self.base_path = os.path.abspath(base_path)
+        os.makedirs(self.base_path, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.base_path, name))
+        if not path.startswith(self.base_path + os.sep):
+            raise ValueError(f'Nome de objeto inválido: {name}')
+        return path
+
+    def put(self, name, data, content_type=None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return f'file://{path}'
+
+    def get(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, name):
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class GCSStorageBackend(StorageBackend):
+    """
+    Google Cloud Storage com:
+    - Sessão HTTP compartilhada com pool de conexões
+    - chunk_size configurável para uploads resumáveis
+    - Upload composto paralelo para objetos grandes (PDFs)
+    """
+
+    model_readable = True
+
+    def __init__(self, bucket_name, project=None, chunk_size=8 * 1024 * 1024,
+                 pool_maxsize=32, composite_threshold=8 * 1024 * 1024, composite_parts=8):
+        self.bucket_name = bucket_name
+        self.project = project
+        self.chunk_size = _align_chunk_size(chunk_size)
+        self.pool_maxsize = pool_maxsize
+        self.composite_threshold = composite_threshold
+        self.composite_parts = max(2, min(composite_parts, GCS_MAX_COMPOSE_PARTS))
+        self._client = None
+        self._bucket = None
+        self._credentials = None
+        self._lock = threading.Lock()
+        self._composite_executor = None
+
+    @property
+    def bucket(self):
+        """Bucket do GCS, criado no primeiro uso com a sessão compartilhada"""
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    self._client = self._create_client()
+                    self._bucket = self._client.bucket(self.bucket_name)
+        return self._bucket
+
+    def _create_client(self):
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        from requests.adapters import HTTPAdapter
+
+        credentials, project = google.auth.default(
+            scopes=['https://www.googleapis.com/auth/devstorage.read_write']
+        )
+        self._credentials = credentials
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=self.pool_maxsize,
+                              pool_maxsize=self.pool_maxsize,
+                              max_retries=3)
+        session.mount('https://', adapter)
+        return storage.Client(project=self.project or project,
+                              credentials=credentials, _http=session)
+
+    def warm(self):
+        """Cliente, sessão e um token de acesso válido (evita a troca de token na primeira requisição)"""
+        from google.auth.transport.requests import Request
+
+        self.bucket
+        if not self._credentials.valid:
+            self._credentials.refresh(Request())
+
+    def put(self, name, data, content_type=None):
+        if len(data) >= self.composite_threshold:
+            self._put_composite(name, data, content_type)
+        else:
+            blob = self.bucket.blob(name, chunk_size=self.chunk_size)
+            blob.upload_from_file(io.BytesIO(data), size=len(data), content_type=content_type)
+        return f'gs://{self.bucket_name}/{name}'
+
+    def _put_composite(self, name, data, content_type):
+        """
+        Envia partes em paralelo e as combina com compose no servidor
+        As partes enviadas são apagadas no final, também quando outra parte ou o
+        compose falha (não ficam objetos *.parts-<uuid>/NN órfãos no bucket)
+        """
+        if self._composite_executor is None:
+            with self._lock:
+                if self._composite_executor is None:
+                    self._composite_executor = ThreadPoolExecutor(
+                        max_workers=self.composite_parts, thread_name_prefix='gcs-compose')
+
+        view = memoryview(data)
+        part_size = -(-len(data) // self.composite_parts)
+        prefix = f'{name}.parts-{uuid.uuid4().hex}'
+        part_names = [f'{prefix}/{i:02d}' for i in range(-(-len(data) // part_size))]
+
+        def upload_part(index):
+            chunk = view[index * part_size:(index + 1) * part_size]
+            blob = self.bucket.blob(part_names[index], chunk_size=self.chunk_size)
+            blob.upload_from_file(io.BytesIO(chunk), size=len(chunk), content_type=content_type)
+            return blob
+
+        futures = [self._composite_executor.submit(upload_part, index) for index in range(len(part_names))]
+        try:
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            parts = [future.result() for future in futures]
+            target = self.bucket.blob(name)
+            target.content_type = content_type
+            target.compose(parts)
+        finally:
+            # Espera as partes já em andamento para não deixar nenhuma para trás
+            wait(futures)
+            for future in futures:
+                if future.cancelled() or future.exception() is not None:
+                    continue
+                try:
+                    future.result().delete()
+                except Exception:
+                    pass
+
+    def get(self, name):
+        blob = self.bucket.blob(name)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+
+def _align_chunk_size(chunk_size):
+    return max(GCS_CHUNK_ALIGNMENT, (chunk_size // GCS_CHUNK_ALIGNMENT) * GCS_CHUNK_ALIGNMENT)
+
+
+def create_storage_backend(config):
+    """Cria o backend indicado em STORAGE_BACKEND (gcs, local ou memory)"""
+    kind = (config.get('STORAGE_BACKEND') or 'gcs').lower()
+    if kind == 'gcs':
+        return GCSStorageBackend(
+            config['GCS_BUCKET_NAME'],
+            project=config.get('GCP_PROJECT_ID'),
+            chunk_size=config['GCS_CHUNK_SIZE'],
+            pool_maxsize=config['GCS_POOL_MAXSIZE'],
+            composite_threshold=config['GCS_COMPOSITE_THRESHOLD'],
+            composite_parts=config['GCS_COMPOSITE_PARTS'],
+        )
+    if kind == 'local':
+        return LocalStorageBackend(config['STORAGE_LOCAL_PATH'])
+    if kind == 'memory':
+        return InMemoryStorageBackend(config.get('GCS_BUCKET_NAME') or 'memory')
+    raise ValueError(f'Backend de armazenamento não suportado: {kind}')
+
+
+def init_storage_backend(app):
+    """Registra o backend de armazenamento na aplicação"""
+    backend = create_storage_backend(app.config)
+    app.extensions['storage_backend'] = backend
+    return backend
@@ -0,0 +1,151 @@
+"""
+Leitura incremental da resposta do Gemini em modo stream
+Emite campos do cabeçalho e cada item de "itens" assim que ficam completos
+"""
+import json
+
+# Campo cujo array é emitido elemento a elemento
+ITEMS_FIELD = 'itens'
+
+
+class IncrementalInvoiceParser:
+    """
+    Analisador incremental do objeto JSON de extração.
+
+    Alimentado com pedaços de texto (feed), retorna eventos:
+    - ('field', {'name': nome, 'value': valor}): campo de primeiro nível completo
+    - ('item', {'index': indice, 'item': item}): elemento completo do array "itens"
+
+    Texto antes do primeiro '{' (como cercas ```json) é ignorado. O texto
+    completo fica disponível em `text` para a leitura final do documento.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._finished = False
+        self._key = None            # Chave de primeiro nível sendo lida
+        self._key_start = None      # Início da string da chave
+        self._expect_key = False
+        self._value_start = None    # Início do valor de primeiro nível
+        self._item_start = None     # Início do item de "itens"
+        self._item_index = 0
+        self._object_start = None
+        self._object_end = None
+
+    def feed(self, chunk):
+        """Processa mais um pedaço de texto e retorna os eventos gerados"""
+        if not chunk or self._finished:
+            self.text += chunk or ''
+            return []
+
+        self.text += chunk
+        events = []
+        text = self.text
+        i = self._pos
+        n = len(text)
+
+        while i < n:
+            c = text[i]
+
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._object_start = i
+                    self._depth = 1
+                    self._expect_key = True
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._key_start = None
+                i += 1
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+            elif c == ':' and self._depth == 1:
+                self._value_start = None
+            elif c in '{[':
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+                if self._depth == 2 and c == '{' and self._key == ITEMS_FIELD:
+                    self._item_start = i
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 2 and c == '}' and self._item_start is not None:
+                    events.extend(self._emit_item(text[self._item_start:i + 1]))
+                    self._item_start = None
+                if self._depth == 0:
+                    events.extend(self._emit_field(text, i))
+                    self._finished = True
+                    self._object_end = i + 1
+                    i += 1
+                    break
+            elif c == ',' and self._depth == 1:
+                events.extend(self._emit_field(text, i))
+                self._expect_key = True
+            elif self._depth == 1 and not c.isspace() and self._value_start is None \
+                    and self._key is not None and not self._expect_key:
+                # Início de número, true, false ou null
+                self._value_start = i
+
+            i += 1
+
+        self._pos = i
+        return events
+
+    def _emit_field(self, text, end):
+        """Emite o campo de primeiro nível que termina antes de `end`"""
+        key, start = self._key, self._value_start
+        self._key = None
+        self._value_start = None
+        if key is None or start is None:
+            return []
+        try:
+            value = json.loads(text[start:end])
+        except ValueError:
+            return []
+        if key == ITEMS_FIELD:
+            # Itens já foram emitidos individualmente
+            return []
+        return [('field', {'name': key, 'value': value})]
+
+    def _emit_item(self, raw):
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return []
+        index = self._item_index
+        self._item_index += 1
+        return [('item', {'index': index, 'item': item})]
+
+    @property
+    def complete(self):
+        """Indica se o objeto de primeiro nível foi fechado"""
+        return self._finished
+
+    @property
+    def object_text(self):
+        """Texto do objeto de primeiro nível (ou o texto bruto, se incompleto)"""
+        if self._finished:
+            return self.text[self._object_start:self._object_end]
+        return self.text
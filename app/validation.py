@@ -0,0 +1,386 @@
+"""
+Identificação de tipo e validação estrutural incremental dos uploads
+Assinaturas conhecidas antes do libmagic; estrutura verificada durante a leitura
+"""
+import struct
+import threading
+import zlib
+import magic
+
+# Assinaturas (prefixo -> tipo MIME), verificadas antes de recorrer ao libmagic
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'%PDF-', 'application/pdf'),
+    (b'BM', 'image/bmp'),
+)
+
+# Bytes finais mantidos para checar trailers (PDF, GIF)
+TAIL_SIZE = 2048
+
+_local = threading.local()
+
+
+def magic_handle():
+    """Handle do libmagic do thread atual (criado uma vez por thread)"""
+    handle = getattr(_local, 'magic', None)
+    if handle is None:
+        handle = _local.magic = magic.Magic(mime=True)
+    return handle
+
+
+def detect_mime(head):
+    """Tipo MIME pelos primeiros bytes: tabela de assinaturas, depois libmagic"""
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            if mime_type == 'image/bmp' and not _plausible_bmp(head):
+                break
+            return mime_type
+    return magic_handle().from_buffer(head)
+
+
+def _plausible_bmp(head):
+    # 'BM' é curto demais: exige cabeçalho DIB com tamanho conhecido
+    if len(head) < 18:
+        return False
+    return struct.unpack_from('<I', head, 14)[0] in (12, 40, 52, 56, 64, 108, 124)
+
+
+class StructureValidator:
+    """
+    Validador incremental: recebe os bytes em feed() à medida que o upload
+    chega e informa em finish() se o arquivo está estruturalmente completo.
+    `error` guarda o motivo da primeira falha.
+    """
+
+    def __init__(self):
+        self.error = None
+        self.size = 0
+
+    def feed(self, chunk):
+        """Processa mais bytes; retorna False assim que o arquivo for inválido"""
+        if self.error is None:
+            self.size += len(chunk)
+            self._feed(memoryview(chunk))
+        return self.error is None
+
+    def finish(self):
+        """Retorna o motivo da falha (ou None se o arquivo for válido)"""
+        if self.error is None:
+            self._finish()
+        return self.error
+
+    def fail(self, reason):
+        if self.error is None:
+            self.error = reason
+
+    def _feed(self, data):
+        pass
+
+    def _finish(self):
+        pass
+
+
+class _FieldReader(StructureValidator):
+    """Base para formatos lidos como sequência de campos de tamanho fixo"""
+
+    def __init__(self, first_field):
+        super().__init__()
+        self._pending = bytearray()
+        self._need = first_field
+        self._skip = 0
+
+    def _feed(self, data):
+        pos, n = 0, len(data)
+        while pos < n and self.error is None:
+            if self._skip:
+                take = min(self._skip, n - pos)
+                self._consume(data[pos:pos + take])
+                self._skip -= take
+                pos += take
+                if not self._skip:
+                    self._skipped()
+                continue
+            if self._need is None:
+                pos = self._free(data, pos)
+                continue
+            take = min(self._need - len(self._pending), n - pos)
+            self._pending += data[pos:pos + take]
+            pos += take
+            if len(self._pending) == self._need:
+                field = bytes(self._pending)
+                self._pending.clear()
+                self._need = None
+                self._field(field)
+
+    def expect(self, size):
+        self._need = size
+
+    def skip(self, size):
+        self._skip = size
+        if not size:
+            self._skipped()
+
+    def _field(self, field):
+        raise NotImplementedError
+
+    def _consume(self, data):
+        pass
+
+    def _skipped(self):
+        pass
+
+    def _free(self, data, pos):
+        """Leitura sem campo pendente (ex.: dados de varredura JPEG ou após o fim)"""
+        return len(data)
+
+
+class PNGStructure(_FieldReader):
+    """Assinatura, chunks com CRC válido, IHDR primeiro e IEND no fim"""
+
+    def __init__(self):
+        super().__init__(8)
+        self._state = 'signature'
+        self._crc = 0
+        self._type = None
+        self._first = True
+
+    def _field(self, field):
+        if self._state == 'signature':
+            if field != SIGNATURES[0][0]:
+                return self.fail('assinatura PNG inválida')
+            self._state = 'header'
+            self.expect(8)
+        elif self._state == 'header':
+            length, kind = struct.unpack('>I4s', field)
+            if length > 0x7fffffff or not kind.isalpha():
+                return self.fail('chunk PNG inválido')
+            if self._first and (kind != b'IHDR' or length != 13):
+                return self.fail('PNG sem IHDR')
+            self._first = False
+            self._type = kind
+            self._crc = zlib.crc32(kind)
+            self._state = 'data'
+            self.skip(length)
+        elif self._state == 'crc':
+            if struct.unpack('>I', field)[0] != self._crc & 0xffffffff:
+                return self.fail(f'CRC inválido no chunk {self._type.decode()}')
+            if self._type == b'IEND':
+                self._state = 'end'
+            else:
+                self._state = 'header'
+                self.expect(8)
+
+    def _consume(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+
+    def _skipped(self):
+        self._state = 'crc'
+        self.expect(4)
+
+    def _finish(self):
+        if self._state != 'end':
+            self.fail('PNG truncado (sem IEND)')
+
+
+# Marcadores JPEG sem campo de tamanho
+_JPEG_STANDALONE = {0x01} | set(range(0xD0, 0xD8))
+
+
+class JPEGStructure(_FieldReader):
+    """SOI, segmentos bem formados até o SOS, dados de varredura e EOI"""
+
+    def __init__(self):
+        super().__init__(2)
+        self._state = 'soi'
+        self._marker = None
+        self._prev_ff = False
+        self._sos = False
+        self._seen_sos = False
+
+    def _field(self, field):
+        if self._state == 'soi':
+            if field != b'\xff\xd8':
+                return self.fail('JPEG sem SOI')
+            self._state = 'marker'
+            self.expect(1)
+        elif self._state == 'marker':
+            byte = field[0]
+            if self._marker is None:
+                if byte != 0xFF:
+                    return self.fail('marcador JPEG esperado')
+                self._marker = 0xFF
+                self.expect(1)
+            elif byte == 0xFF:
+                self.expect(1)  # bytes de preenchimento
+            else:
+                self._marker = None
+                self._segment(byte)
+        elif self._state == 'length':
+            length = struct.unpack('>H', field)[0]
+            if length < 2:
+                return self.fail('segmento JPEG inválido')
+            self.skip(length - 2)
+
+    def _segment(self, code):
+        if code == 0xD9:
+            if not self._seen_sos:
+                return self.fail('JPEG sem dados de imagem')
+            self._state = 'end'
+        elif code == 0xD8 or code == 0x00:
+            self.fail('marcador JPEG inesperado')
+        elif code in _JPEG_STANDALONE:
+            self._state = 'marker'
+            self.expect(1)
+        else:
+            self._seen_sos = self._seen_sos or code == 0xDA
+            self._sos = code == 0xDA
+            self._state = 'length'
+            self.expect(2)
+
+    def _skipped(self):
+        if self._state == 'length' and self._sos:
+            self._state = 'scan'
+            self._prev_ff = False
+        else:
+            self._state = 'marker'
+            self.expect(1)
+
+    def _free(self, data, pos):
+        """Dados de varredura: procura o próximo marcador real (FF seguido de não-zero/RST)"""
+        if self._state != 'scan':
+            return len(data)
+        n = len(data)
+        raw = data.obj if isinstance(data.obj, bytes) and len(data.obj) == n else bytes(data)
+        while pos < n:
+            if self._prev_ff:
+                self._prev_ff = False
+                code = raw[pos]
+                if code == 0x00 or 0xD0 <= code <= 0xD7 or code == 0xFF:
+                    self._prev_ff = code == 0xFF
+                    pos += 1
+                    continue
+                pos += 1
+                self._segment(code)
+                return pos
+            index = raw.find(b'\xff', pos)
+            if index == -1:
+                return n
+            self._prev_ff = True
+            pos = index + 1
+        return n
+
+    def _finish(self):
+        if self._state != 'end':
+            self.fail('JPEG truncado (sem EOI)')
+
+
+class _TailStructure(StructureValidator):
+    """Base para formatos validados pelo cabeçalho e pelos bytes finais"""
+
+    header_size = 0
+
+    def __init__(self):
+        super().__init__()
+        self._head = bytearray()
+        self._tail = b''
+
+    def _feed(self, data):
+        if len(self._head) < self.header_size:
+            self._head += data[:self.header_size - len(self._head)]
+            if len(self._head) == self.header_size:
+                self._check_head(bytes(self._head))
+        self._tail = (self._tail + bytes(data[-TAIL_SIZE:]))[-TAIL_SIZE:]
+
+    def _finish(self):
+        if len(self._head) < self.header_size:
+            return self.fail('arquivo truncado no cabeçalho')
+        self._check_tail(self._tail)
+
+    def _check_head(self, head):
+        pass
+
+    def _check_tail(self, tail):
+        pass
+
+
+class PDFStructure(_TailStructure):
+    """Cabeçalho %PDF-x.y e trailer com startxref e %%EOF"""
+
+    header_size = 8
+
+    def _check_head(self, head):
+        if not head.startswith(b'%PDF-') or not head[5:6].isdigit():
+            self.fail('cabeçalho PDF inválido')
+
+    def _check_tail(self, tail):
+        if b'%%EOF' not in tail or b'startxref' not in tail:
+            self.fail('PDF truncado (sem trailer)')
+
+
+class GIFStructure(_TailStructure):
+    """Cabeçalho GIF87a/89a com dimensões e trailer 0x3B"""
+
+    header_size = 10
+
+    def _check_head(self, head):
+        width, height = struct.unpack_from('<HH', head, 6)
+        if head[:6] not in (b'GIF87a', b'GIF89a') or not width or not height:
+            self.fail('cabeçalho GIF inválido')
+
+    def _check_tail(self, tail):
+        if not tail.rstrip(b'\x00').endswith(b';'):
+            self.fail('GIF truncado (sem trailer)')
+
+
+class BMPStructure(_TailStructure):
+    """Cabeçalho BM com tamanho declarado e início dos pixels dentro do arquivo"""
+
+    header_size = 18
+
+    def _check_head(self, head):
+        self._declared, _, self._offset, dib = struct.unpack_from('<IIII', head, 2)
+        if head[:2] != b'BM' or dib < 12 or self._offset < 14 + dib:
+            self.fail('cabeçalho BMP inválido')
+
+    def _check_tail(self, tail):
+        if self._declared > self.size or self._offset >= self.size:
+            self.fail('BMP truncado')
+
+
+class TIFFStructure(_TailStructure):
+    """Ordem de bytes, número mágico 42 e primeiro IFD dentro do arquivo"""
+
+    header_size = 8
+
+    def _check_head(self, head):
+        order = {b'II': '<', b'MM': '>'}.get(head[:2])
+        if order is None or struct.unpack_from(order + 'H', head, 2)[0] != 42:
+            return self.fail('cabeçalho TIFF inválido')
+        self._ifd = struct.unpack_from(order + 'I', head, 4)[0]
+        if self._ifd < 8:
+            self.fail('IFD TIFF inválido')
+
+    def _check_tail(self, tail):
+        if self._ifd + 2 > self.size:
+            self.fail('TIFF truncado')
+
+
+STRUCTURE_VALIDATORS = {
+    'image/png': PNGStructure,
+    'image/jpeg': JPEGStructure,
+    'image/jpg': JPEGStructure,
+    'image/gif': GIFStructure,
+    'image/bmp': BMPStructure,
+    'image/tiff': TIFFStructure,
+    'application/pdf': PDFStructure,
+}
+
+
+def create_structure_validator(mime_type):
+    """Validador estrutural para o tipo (base que aceita tudo se desconhecido)"""
+    return STRUCTURE_VALIDATORS.get(mime_type, StructureValidator)()
@@ -0,0 +1,132 @@
+"""
+Benchmark do controle de admissão sob saturação da cota do modelo (sem GCP)
+
+Simula o Vertex com cota esgotada: o backend atende no máximo --capacity chamadas
+por vez (as demais esperam do lado dele). Chegadas em malha aberta, acima da
+capacidade, são atendidas por --threads threads (o worker do gunicorn). Compara o
+semáforo fixo (VERTEX_MAX_CONCURRENCY) com o controle de admissão: latência das
+requisições atendidas, quantas cumpriram o SLO, quantas foram rejeitadas (503)
+e o tempo total de thread ocupado por requisições que passaram do SLO.
+
+Uso:
+    python -m benchmarks.bench_admission --rate 120 --capacity 8 --service-ms 100
+    python -m benchmarks.bench_admission --seconds 20 --slo-ms 2000 --output admission.json
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.admission import AdmissionController, AdmissionRejected, GradientLimit  # noqa: E402
+
+
+class SaturatedModel:
+    """
+    Backend com capacidade fixa: acima dela as chamadas fazem fila (FIFO) no próprio
+    backend, como a cota do Vertex; cada chamada dorme até o seu horário de término
+    """
+
+    def __init__(self, capacity, service_seconds):
+        self._free_at = [0.0] * capacity
+        self._lock = threading.Lock()
+        self.service_seconds = service_seconds
+
+    def call(self):
+        with self._lock:
+            now = time.perf_counter()
+            finish = max(now, heapq.heappop(self._free_at)) + self.service_seconds
+            heapq.heappush(self._free_at, finish)
+        time.sleep(finish - now)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(mode, args):
+    model = SaturatedModel(args.capacity, args.service_ms / 1000)
+    if mode == 'semaphore':
+        slot = threading.BoundedSemaphore(args.max_concurrency)
+    else:
+        slot = AdmissionController(
+            GradientLimit(initial=args.max_concurrency // 2, min_limit=2, max_limit=args.max_concurrency),
+            max_queue=args.max_queue, max_wait=args.max_wait,
+        )
+
+    def one(arrival):
+        try:
+            with slot:
+                model.call()
+            status = 200
+        except AdmissionRejected:
+            status = 503
+        return (time.perf_counter() - arrival) * 1000, status
+
+    futures = []
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for index in range(int(args.rate * args.seconds)):
+            target = started + index * interval
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(one, time.perf_counter()))
+        outcomes = [f.result() for f in futures]
+
+    served = sorted(latency for latency, status in outcomes if status == 200)
+    shed = sorted(latency for latency, status in outcomes if status == 503)
+    result = {
+        'mode': mode,
+        'requests': len(outcomes),
+        'served': len(served),
+        'within_slo': sum(1 for latency in served if latency <= args.slo_ms),
+        'shed': len(shed),
+        'served_p50_ms': percentile(served, 0.50),
+        'served_p99_ms': percentile(served, 0.99),
+        'shed_p99_ms': percentile(shed, 0.99),
+        'seconds_over_slo': sum(latency for latency in served if latency > args.slo_ms) / 1000,
+    }
+    if mode == 'admission':
+        result['final_limit'] = slot.stats()['limit']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=120, help='Chegadas por segundo')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--capacity', type=int, default=8, help='Chamadas simultâneas que o backend atende')
+    parser.add_argument('--service-ms', type=float, default=100)
+    parser.add_argument('--threads', type=int, default=64, help='Threads do worker')
+    parser.add_argument('--max-concurrency', type=int, default=32, help='VERTEX_MAX_CONCURRENCY')
+    parser.add_argument('--max-queue', type=int, default=32)
+    parser.add_argument('--max-wait', type=float, default=2.0)
+    parser.add_argument('--slo-ms', type=float, default=2000)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    results = []
+    for mode in ('semaphore', 'admission'):
+        result = run(mode, args)
+        results.append(result)
+        print(f"{mode:>9s} atendidas={result['served']:5d} no SLO={result['within_slo']:5d} "
+              f"rejeitadas={result['shed']:5d} p50={result['served_p50_ms']:8.1f} "
+              f"p99={result['served_p99_ms']:8.1f} ms acima do SLO={result['seconds_over_slo']:7.1f} s"
+              + (f" limite={result['final_limit']}" if 'final_limit' in result else ''))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
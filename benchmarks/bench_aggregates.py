@@ -0,0 +1,86 @@
+"""
+Benchmark dos agregados de estoque e gastos
+
+Mede, sobre N documentos sintéticos:
+- vazão de gravação com atualização incremental dos agregados (documentos/s)
+- consulta materializada (/stock, /financial-summary) versus agregação sobre os documentos
+- reconstrução completa colunar (NumPy) versus reaplicação documento a documento
+
+Uso:
+    python -m benchmarks.bench_aggregates --rows 200000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.aggregates import Aggregates, AggregateDelta  # noqa: E402
+from app.results import ResultStore  # noqa: E402
+from benchmarks.bench_documents import populate, timed  # noqa: E402
+
+
+def replay(store):
+    """Reconstrução ingênua: relê o JSON de cada documento e soma em Python"""
+    import json as _json
+    delta = AggregateDelta()
+    for data, created_at in store._connect().execute('SELECT data, created_at FROM documents ORDER BY id'):
+        delta.add_document(_json.loads(data), created_at)
+    return delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--suppliers', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(os.path.join(directory, 'results.db'))
+        aggregates = Aggregates(store)
+        results = {'rows': args.rows}
+        results['write_docs_per_sec'] = populate(store, args.rows, args.suppliers, args.batch_size)
+        print(f"gravação + agregados:  {results['write_docs_per_sec']:10.0f} documentos/s")
+
+        conn = store._connect()
+        cnpj = f'{args.suppliers // 2:08d}000190'
+        queries = {
+            'stock_materialized': lambda: aggregates.stock('P00042'),
+            'stock_scan': lambda: conn.execute(
+                'SELECT SUM(quantidade), SUM(valor_total_item) FROM items WHERE codigo_produto = ?',
+                ('P00042',)).fetchone(),
+            'summary_materialized': lambda: aggregates.financial_summary(cnpj),
+            'summary_scan': lambda: conn.execute(
+                "SELECT substr(data_emissao, 1, 7), SUM(valor_total_documento) FROM documents"
+                " WHERE cnpj_fornecedor = ? GROUP BY 1", (cnpj,)).fetchall(),
+            'total_materialized': lambda: aggregates.financial_summary(),
+            'total_scan': lambda: conn.execute(
+                "SELECT substr(data_emissao, 1, 7), SUM(valor_total_documento) FROM documents"
+                " GROUP BY 1").fetchall(),
+        }
+        for name, fn in queries.items():
+            results[f'{name}_ms'] = timed(fn, args.repeat)
+            print(f"{name:22s} {results[f'{name}_ms']:10.3f} ms")
+
+        started = time.perf_counter()
+        aggregates.rebuild()
+        results['rebuild_numpy_s'] = time.perf_counter() - started
+        started = time.perf_counter()
+        replay(store)
+        results['rebuild_replay_s'] = time.perf_counter() - started
+        print(f"rebuild NumPy:         {results['rebuild_numpy_s']:10.2f} s")
+        print(f"rebuild documento a documento: {results['rebuild_replay_s']:.2f} s (sem gravar)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Microbenchmark da verificação de chaves de API por requisição
+
+Compara:
+- legacy: os.getenv('API_TOKEN') + comparação de strings a cada requisição (uma chave)
+- store: ApiKeyStore com N chaves sha256 (índice por digest)
+- salted: ApiKeyStore com chaves PBKDF2 ('<kid>.<segredo>'), já no LRU após a primeira verificação
+- salted_unknown: token sem kid cadastrado (descartado sem PBKDF2)
+
+Uso:
+    python -m benchmarks.bench_auth --keys 5000 --iterations 50000
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.keystore import ApiKeyStore, hash_api_key  # noqa: E402
+
+
+def legacy_verify(token):
+    """Implementação anterior, reproduzida para comparação"""
+    return token == os.getenv('API_TOKEN', 'default-token')
+
+
+def make_store(directory, count, salted=False):
+    """Arquivo com `count` chaves; retorna (store, token de uma chave no meio)"""
+    path = os.path.join(directory, f'keys_{count}_{int(salted)}.txt')
+    prefix = 'k{}.' if salted else ''
+    with open(path, 'w') as f:
+        for index in range(count):
+            key = prefix.format(index) + f'key-{index}'
+            f.write(f'loja_{index:05d}:{hash_api_key(key, salted=salted, iterations=1000)}\n')
+    return ApiKeyStore(key_file=path), prefix.format(count // 2) + f'key-{count // 2}'
+
+
+def measure(fn, iterations):
+    """Melhor de 5 rodadas, em microssegundos por chamada"""
+    return min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--salted-keys', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=50000)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    os.environ.setdefault('API_TOKEN', 'default-token')
+    with tempfile.TemporaryDirectory() as directory:
+        store, token = make_store(directory, args.keys)
+        salted_store, salted_token = make_store(directory, args.salted_keys, salted=True)
+        assert store.verify(token) and salted_store.verify(salted_token)
+
+        results = {
+            'keys': args.keys,
+            'legacy_us': measure(lambda: legacy_verify('default-token'), args.iterations),
+            'store_us': measure(lambda: store.verify(token), args.iterations),
+            'store_invalid_us': measure(lambda: store.verify('invalid'), args.iterations),
+            'salted_cached_us': measure(lambda: salted_store.verify(salted_token), args.iterations),
+            'salted_unknown_us': measure(lambda: salted_store.verify('nokid.invalid'), args.iterations),
+        }
+
+    print(f"legacy (1 chave, getenv):         {results['legacy_us']:8.3f} µs")
+    print(f"store ({args.keys} chaves, válida):    {results['store_us']:8.3f} µs")
+    print(f"store ({args.keys} chaves, inválida):  {results['store_invalid_us']:8.3f} µs")
+    print(f"salted ({args.salted_keys} chaves, LRU):       {results['salted_cached_us']:8.3f} µs")
+    print(f"salted ({args.salted_keys} chaves, kid inválido): {results['salted_unknown_us']:8.3f} µs")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
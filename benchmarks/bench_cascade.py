@@ -0,0 +1,191 @@
+"""
+Benchmark da cascata de modelos (modelos simulados, sem GCP)
+
+Mistura de documentos (etiquetas, notas curtas e DANFEs longas) processada só pelo
+modelo forte, só pelo modelo rápido e pela cascata rápido -> forte. Os modelos
+simulados erram com probabilidade por tipo de documento (totais trocados, campos
+faltando e, numa fração, erros que a validação não enxerga); a latência cresce com
+o número de itens. Compara acerto em relação ao gabarito, latência, custo por
+documento e a taxa de acerto de cada nível da cascata.
+
+Uso:
+    python -m benchmarks.bench_cascade --documents 300 --concurrency 32
+    python -m benchmarks.bench_cascade --routes nota_fiscal=1 --output cascade.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import logging
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.cascade import ModelCascade, ModelTier, parse_routes  # noqa: E402
+from app.model_backends import FakeResponse, ModelBackend  # noqa: E402
+from app.pipeline import extract_document  # noqa: E402
+
+# Tokens de uma imagem na entrada do Gemini
+IMAGE_TOKENS = 258
+
+# (tipo, itens, fração da mistura)
+DOCUMENT_MIX = (
+    ('Etiqueta de Produto', 1, 0.5),
+    ('Nota Fiscal', 5, 0.35),
+    ('Nota Fiscal', 40, 0.15),
+)
+
+# Modelos simulados: preço (USD por 1M tokens de entrada e saída), latência
+# (ms fixos + ms por item) e probabilidade de erro por tipo
+MODELS = {
+    'fast': {
+        'model_id': 'gemini-1.5-flash-001', 'prices': (0.075, 0.30), 'latency': (300, 15),
+        'errors': {1: 0.02, 5: 0.10, 40: 0.45},
+    },
+    'strong': {
+        'model_id': 'gemini-1.5-pro-001', 'prices': (1.25, 5.00), 'latency': (1200, 60),
+        'errors': {1: 0.01, 5: 0.02, 40: 0.05},
+    },
+}
+
+# Fração dos erros que a validação não consegue detectar (ex.: descrição trocada)
+SILENT_ERROR_SHARE = 0.2
+
+
+def make_document(index, rnd):
+    """Gabarito do documento (o 'conteúdo' que os modelos simulados leem)"""
+    doc_type, size, _ = rnd.choices(DOCUMENT_MIX, weights=[m[2] for m in DOCUMENT_MIX])[0]
+    items = []
+    for i in range(size):
+        quantity = rnd.randint(1, 50)
+        unit_value = round(rnd.uniform(1, 200), 2)
+        items.append({
+            'codigo_produto': f'P{index:05d}{i:02d}', 'descricao': f'Produto {i}', 'quantidade': quantity,
+            'unidade': 'UN', 'valor_unitario': unit_value, 'valor_total_item': round(quantity * unit_value, 2),
+        })
+    if doc_type == 'Etiqueta de Produto':
+        for item in items:
+            item['valor_unitario'] = item['valor_total_item'] = None
+        return {'tipo_documento': doc_type, 'itens': items}
+    return {
+        'tipo_documento': doc_type, 'numero_documento': f'{index:09d}', 'data_emissao': '15/03/2024',
+        'fornecedor': 'Distribuidora Exemplo LTDA', 'cnpj_fornecedor': '12.345.678/0001-90', 'itens': items,
+        'valor_total_documento': round(sum(item['valor_total_item'] for item in items), 2),
+    }
+
+
+def corrupt(truth, rnd):
+    """Saída errada: detectável (total, campo faltando, JSON cortado) ou silenciosa"""
+    data = copy.deepcopy(truth)
+    item = rnd.choice(data['itens'])
+    if rnd.random() < SILENT_ERROR_SHARE:
+        item['descricao'] += ' (lido errado)'
+        return json.dumps(data, ensure_ascii=False)
+    kind = rnd.choice(('total', 'missing', 'truncated'))
+    if kind == 'total' and item['valor_total_item'] is not None:
+        item['valor_total_item'] = round(item['valor_total_item'] * 10, 2)
+    elif kind == 'truncated':
+        text = json.dumps(data, ensure_ascii=False)
+        return text[:len(text) // 3]
+    elif data['tipo_documento'] == 'Etiqueta de Produto':
+        data['itens'] = []
+    else:
+        data['numero_documento'] = None
+    return json.dumps(data, ensure_ascii=False)
+
+
+class SimulatedModel(ModelBackend):
+    """Modelo que lê o gabarito do documento e erra com a probabilidade do seu perfil"""
+
+    def __init__(self, profile, seed, time_scale):
+        self.model_id = profile['model_id']
+        self.profile = profile
+        self.time_scale = time_scale
+        self._random = random.Random(seed)
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        prompt, truth = contents
+        size = len(truth['itens'])
+        wrong = self._random.random() < self.profile['errors'][size]
+        text = corrupt(truth, self._random) if wrong else json.dumps(truth, ensure_ascii=False)
+        base, per_item = self.profile['latency']
+        time.sleep((base + per_item * size) * self._random.uniform(0.8, 1.2) * self.time_scale / 1000)
+        return FakeResponse(text, prompt_tokens=len(prompt) // 4 + IMAGE_TOKENS)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(mode, documents, args):
+    app = create_app('testing')
+    app.config['MODEL_STRUCTURED_OUTPUT'] = False
+    app.logger.setLevel(logging.ERROR)
+    names = {'strong': ('strong',), 'fast': ('fast',), 'cascade': ('fast', 'strong')}[mode]
+    tiers = [ModelTier(MODELS[name]['model_id'], SimulatedModel(MODELS[name], args.seed + i, args.time_scale),
+                       *MODELS[name]['prices'])
+             for i, name in enumerate(names)]
+    routes = parse_routes(args.routes, app.extensions['prompt_registry']) if mode == 'cascade' else {}
+    cascade = ModelCascade(tiers, routes=routes)
+    app.extensions['model_cascade'] = cascade
+    app.extensions['model_resilience'] = None
+
+    def one(truth):
+        with app.app_context():
+            started = time.perf_counter()
+            payload, _ = extract_document(truth)
+            return (time.perf_counter() - started) * 1000, payload.get('extracted_data') == truth
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(one, documents))
+    latencies = sorted(latency for latency, _ in outcomes)
+    stats = cascade.stats()
+    return {
+        'mode': mode,
+        'accuracy': sum(1 for _, correct in outcomes if correct) / len(outcomes),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': statistics.fmean(latencies),
+        'cost_usd_per_1k_documents': stats['cost_usd_per_document'] * 1000,
+        'tiers': stats['tiers'],
+        'escalation_reasons': stats['escalation_reasons'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--routes', default='', help='MODEL_CASCADE_ROUTES da cascata (ex.: nota_fiscal=1)')
+    parser.add_argument('--time-scale', type=float, default=0.25, help='Fator sobre as latências simuladas')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    documents = [make_document(index, rnd) for index in range(args.documents)]
+
+    results = []
+    for mode in ('strong', 'fast', 'cascade'):
+        result = run(mode, documents, args)
+        results.append(result)
+        hit_rates = ' '.join(f"{tier['model']}={tier['hit_rate'] * 100:.0f}%/{tier['calls']}"
+                             for tier in result['tiers'])
+        print(f"{mode:>8s} acerto={result['accuracy'] * 100:6.2f}% p50={result['p50_ms']:7.1f} "
+              f"p99={result['p99_ms']:7.1f} ms custo/1k docs=US$ {result['cost_usd_per_1k_documents']:.4f} "
+              f"níveis: {hit_rates}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark de partida a frio (sem GCP)
+
+Em processos novos, mede o tempo de `import main` (create_app incluído) até o
+primeiro /health com sucesso, e faz uma passagem com `python -X importtime` para
+detalhar o tempo de import por módulo. Com --gunicorn mede também do início do
+gunicorn até o /health e o /ready. --budget-ms falha (código 1) se a mediana de
+import + /health passar do orçamento, para pegar regressões no tempo de partida
+do contêiner.
+
+Uso:
+    python -m benchmarks.bench_cold_start --trials 5
+    python -m benchmarks.bench_cold_start --gunicorn --budget-ms 1500 --output cold_start.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_e2e import ROOT, free_port, server_env, start_server, stop_server  # noqa: E402
+from benchmarks.bench_warmup import wait_ready  # noqa: E402
+
+# Executado em um interpretador novo a cada tentativa
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+status = main.app.test_client().get('/health').status_code
+finished = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'health_ms': (finished - imported) * 1000, 'status': status}))
+'''
+
+
+def run_probe(env, importtime=False):
+    """Roda o probe; retorna (medidas, stderr, segundos do processo inteiro)"""
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f'probe falhou: {proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr, wall
+
+
+def import_breakdown(stderr, depth, top):
+    """Módulos mais caros (tempo cumulativo, ms) até a profundidade indicada"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        if level <= depth:
+            rows.append({'module': name.strip(), 'depth': level, 'cumulative_ms': int(cumulative) / 1000})
+    rows.sort(key=lambda r: r['cumulative_ms'], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--depth', type=int, default=2, help='Profundidade do detalhamento de imports')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--gunicorn', action='store_true', help='Mede também a partida do gunicorn')
+    parser.add_argument('--budget-ms', type=float, help='Orçamento para a mediana de import + /health')
+    parser.add_argument('--model-latency', default='fixed:0')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    env = server_env(args)
+
+    trials = []
+    for _ in range(args.trials):
+        probe, _, wall = run_probe(env)
+        probe['process_ms'] = wall * 1000
+        trials.append(probe)
+    startup = [t['import_ms'] + t['health_ms'] for t in trials]
+    summary = {
+        'import_ms': statistics.median(t['import_ms'] for t in trials),
+        'first_health_ms': statistics.median(t['health_ms'] for t in trials),
+        'startup_ms': statistics.median(startup),
+        'process_ms': statistics.median(t['process_ms'] for t in trials),
+    }
+    print(f"import main {summary['import_ms']:8.1f} ms | 1º /health {summary['first_health_ms']:6.1f} ms | "
+          f"total {summary['startup_ms']:8.1f} ms | processo {summary['process_ms']:8.1f} ms "
+          f"(mediana de {args.trials})")
+
+    _, stderr, _ = run_probe(env, importtime=True)
+    breakdown = import_breakdown(stderr, args.depth, args.top)
+    for row in breakdown:
+        print(f"{'  ' * row['depth']}{row['module']:<{48 - 2 * row['depth']}s} {row['cumulative_ms']:8.1f} ms")
+
+    gunicorn = None
+    if args.gunicorn:
+        port = free_port()
+        started = time.perf_counter()
+        proc = start_server(port, 1, 8, 'gthread', env)
+        try:
+            healthy = time.perf_counter() - started
+            ready = healthy + wait_ready(port)
+        finally:
+            stop_server(proc)
+        gunicorn = {'health_seconds': healthy, 'ready_seconds': ready}
+        print(f'gunicorn: /health em {healthy:.2f}s, /ready em {ready:.2f}s')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'summary': summary, 'trials': trials, 'imports': breakdown, 'gunicorn': gunicorn},
+                      f, indent=2)
+
+    if args.budget_ms is not None and summary['startup_ms'] > args.budget_ms:
+        print(f"Orçamento de partida estourado: {summary['startup_ms']:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
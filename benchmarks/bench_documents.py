@@ -0,0 +1,128 @@
+"""
+Benchmark da persistência de resultados e do GET /documents em volume
+
+Popula um banco com N documentos sintéticos (gravação em lote do ResultStore) e mede:
+- vazão de gravação (documentos/s) e custo de submit() no caminho da requisição
+- latência das consultas com filtros, primeira página e página profunda
+  (cursor por id versus OFFSET equivalente)
+
+Uso:
+    python -m benchmarks.bench_documents --rows 1000000 --suppliers 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.results import ResultStore  # noqa: E402
+
+
+class _Document:
+    __slots__ = ('sha256', 'filename')
+
+    def __init__(self, index):
+        self.sha256 = f'{index:064x}'
+        self.filename = f'nota_{index}.jpg'
+
+
+def make_record(index, rng, suppliers):
+    supplier = rng.randrange(suppliers)
+    items = [{'codigo_produto': f'P{rng.randrange(5000):05d}', 'descricao': 'Produto',
+              'quantidade': rng.randint(1, 20), 'unidade': 'UN',
+              'valor_unitario': 10.0, 'valor_total_item': 10.0}
+             for _ in range(rng.randint(1, 4))]
+    return {
+        'sha256': f'{index:064x}',
+        'filename': f'nota_{index}.jpg',
+        'prompt_version': 'auto@1',
+        'created_at': time.time(),
+        'data': {
+            'tipo_documento': rng.choice(('Nota Fiscal', 'Nota Fiscal', 'Etiqueta de Produto')),
+            'numero_documento': str(index),
+            'data_emissao': f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.choice((2023, 2024))}',
+            'fornecedor': f'Fornecedor {supplier}',
+            'cnpj_fornecedor': f'{supplier:08d}000190',
+            'itens': items,
+            'valor_total_documento': 10.0 * len(items),
+        },
+    }
+
+
+def populate(store, rows, suppliers, batch_size):
+    rng = random.Random(42)
+    started = time.perf_counter()
+    for start in range(0, rows, batch_size):
+        store.write_batch([make_record(i, rng, suppliers) for i in range(start, min(rows, start + batch_size))])
+    return rows / (time.perf_counter() - started)
+
+
+def timed(fn, repeat):
+    """Mediana em milissegundos"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--suppliers', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', help='Banco existente/reutilizado (padrão: temporário)')
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(args.db or os.path.join(directory, 'results.db'))
+        count = store._connect().execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        results = {'rows': max(count, args.rows)}
+        if count < args.rows:
+            results['write_docs_per_sec'] = populate(store, args.rows, args.suppliers, args.batch_size)
+            print(f"gravação em lote:      {results['write_docs_per_sec']:10.0f} documentos/s")
+
+        # Custo de submit() na requisição (só enfileira)
+        document, payload = _Document(10 ** 12), {'extracted_data': {'itens': []}}
+        started = time.perf_counter()
+        for _ in range(1000):
+            store.submit(document, payload)
+        results['submit_us'] = (time.perf_counter() - started) / 1000 * 1e6
+        store.flush()
+        print(f"submit (requisição):   {results['submit_us']:10.2f} µs")
+
+        deep_page, cursor = 200, None
+        for _ in range(deep_page):
+            _, cursor = store.query(limit=50, cursor=cursor)
+        conn = store._connect()
+        queries = {
+            'first_page': lambda: store.query(limit=50),
+            'cnpj': lambda: store.query(cnpj_fornecedor=f'{args.suppliers // 2:08d}000190'),
+            'numero': lambda: store.query(numero_documento=str(args.rows // 2)),
+            'tipo_page': lambda: store.query(tipo_documento='Etiqueta de Produto', cursor=cursor),
+            'date_range': lambda: store.query(data_inicio='2024-03-01', data_fim='2024-03-07'),
+            'produto': lambda: store.query(codigo_produto='P00042'),
+            'deep_cursor': lambda: store.query(limit=50, cursor=cursor),
+            'deep_offset': lambda: conn.execute(
+                'SELECT id FROM documents ORDER BY id DESC LIMIT 50 OFFSET ?',
+                (deep_page * 50,)).fetchall(),
+        }
+        for name, fn in queries.items():
+            results[f'{name}_ms'] = timed(fn, args.repeat)
+            print(f"{name:22s} {results[f'{name}_ms']:10.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
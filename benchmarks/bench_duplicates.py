@@ -0,0 +1,84 @@
+"""
+Benchmark da detecção de quase duplicatas
+
+Mede:
+- custo do hash perceptual por imagem (PNG e JPEG, com draft do JPEG)
+- consulta por raio no índice por blocos (multi-index hashing) versus varredura
+  linear sobre N hashes
+
+Uso:
+    python -m benchmarks.bench_duplicates --hashes 200000 --radius 4
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from app.duplicates import MultiIndexHash, hamming, perceptual_hash  # noqa: E402
+
+
+def sample_image(size, fmt):
+    """Imagem sintética do tamanho de uma foto de nota fiscal"""
+    rng = random.Random(0)
+    grid = Image.frombytes('L', (48, 64), bytes(rng.randrange(256) for _ in range(48 * 64)))
+    output = io.BytesIO()
+    grid.resize(size).convert('RGB').save(output, format=fmt)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hashes', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    results = {'hashes': args.hashes, 'radius': args.radius}
+    for fmt in ('PNG', 'JPEG'):
+        data = sample_image((1600, 2200), fmt)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            perceptual_hash(data)
+        results[f'hash_{fmt.lower()}_ms'] = (time.perf_counter() - started) / args.repeat * 1000
+        print(f"hash {fmt:4s} 1600x2200:  {results[f'hash_{fmt.lower()}_ms']:10.2f} ms")
+
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(args.hashes)]
+    index = MultiIndexHash(args.radius)
+    started = time.perf_counter()
+    for ref, value in enumerate(values):
+        index.add(value, ref)
+    results['build_s'] = time.perf_counter() - started
+    print(f"construção do índice:   {results['build_s']:10.2f} s")
+
+    # Metade das consultas tem um vizinho próximo no índice
+    queries = [values[rng.randrange(args.hashes)] ^ (1 << rng.randrange(64)) if i % 2 else rng.getrandbits(64)
+               for i in range(args.queries)]
+
+    started = time.perf_counter()
+    index_found = [len(index.search(q)) for q in queries]
+    results['index_query_ms'] = (time.perf_counter() - started) / args.queries * 1000
+
+    started = time.perf_counter()
+    linear_found = [sum(1 for v in values if hamming(q, v) <= args.radius) for q in queries]
+    results['linear_query_ms'] = (time.perf_counter() - started) / args.queries * 1000
+
+    assert index_found == linear_found
+    print(f"consulta no índice:     {results['index_query_ms']:10.3f} ms")
+    print(f"varredura linear:       {results['linear_query_ms']:10.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark ponta a ponta do serviço com backends falsos (sem GCP)
+
+Sobe o gunicorn com MODEL_BACKEND=fake e STORAGE_BACKEND=memory para cada perfil
+de workers/threads e dispara /upload-invoice (ou /upload-invoices) com concorrência
+variável. Reporta vazão, latências p50/p95/p99 e o tempo médio de cada etapa
+(a partir do cabeçalho Server-Timing), e grava os resultados em JSON para
+comparação entre versões.
+
+Uso:
+    python -m benchmarks.bench_e2e --profiles 2x1,2x8 --concurrency 1,8,32 --requests 200
+    python -m benchmarks.bench_e2e --endpoint batch --batch-size 20 --output atual.json
+    python -m benchmarks.bench_e2e --compare base.json atual.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+import http.client
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tests.conftest import make_png  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def multipart_body(files, field):
+    """Monta o corpo multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: image/png\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in filter(None, (e.strip() for e in (header or '').split(','))):
+        name, _, dur = entry.partition(';dur=')
+        try:
+            timings[name] = float(dur)
+        except ValueError:
+            continue
+    return timings
+
+
+def server_env(args, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        # Fora de 'production' para que o Talisman não force HTTPS no loopback
+        'FLASK_ENV': 'benchmark',
+        'GCP_PROJECT_ID': env.get('GCP_PROJECT_ID', 'bench-project'),
+        'GCS_BUCKET_NAME': env.get('GCS_BUCKET_NAME', 'bench-bucket'),
+        'MODEL_BACKEND': 'fake',
+        'STORAGE_BACKEND': 'memory',
+        'FAKE_MODEL_LATENCY': args.model_latency,
+        'FAKE_MODEL_FAILURE_RATE': str(args.failure_rate),
+        'EXTRACTION_CACHE_ENABLED': 'false',
+        'RATELIMIT_ENABLED': 'false',
+        'SERVER_TIMING_ENABLED': 'true',
+        'ENABLE_AUTH': 'false',
+        'PYTHONPATH': ROOT,
+    })
+    env.update(extra_env or {})
+    return env
+
+
+def start_server(port, workers, threads, worker_class, env):
+    cmd = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers), '--threads', str(threads),
+           '--worker-class', worker_class, '--timeout', '120', 'main:app']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'gunicorn terminou: {proc.stderr.read().decode()[-2000:]}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('gunicorn não respondeu ao /health')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def drive(port, endpoint, concurrency, total_requests, batch_size):
+    """Dispara as requisições e coleta latência e Server-Timing"""
+    path = '/upload-invoices' if endpoint == 'batch' else '/upload-invoice'
+    field = 'images' if endpoint == 'batch' else 'image'
+    files_per_request = batch_size if endpoint == 'batch' else 1
+
+    def one(index):
+        files = [(f'nota_{index}_{i}.png', make_png(8, 8, seed=index * 31 + i)) for i in range(files_per_request)]
+        body, content_type = multipart_body(files, field)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        start = time.perf_counter()
+        try:
+            conn.request('POST', path, body=body, headers={'Content-Type': content_type})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            timing = parse_server_timing(response.getheader('Server-Timing'))
+        except OSError:
+            status, timing = 0, {}
+        finally:
+            conn.close()
+        return (time.perf_counter() - start) * 1000, status, timing
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(total_requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(o[0] for o in outcomes)
+    stage_totals = defaultdict(list)
+    for latency, status, timing in outcomes:
+        for name, value in timing.items():
+            stage_totals[name].append(value)
+        if 'total' in timing:
+            stage_totals['queue_and_transport'].append(latency - timing['total'])
+
+    errors = sum(1 for o in outcomes if o[1] != 200)
+    return {
+        'requests': total_requests,
+        'documents': total_requests * files_per_request,
+        'errors': errors,
+        'wall_seconds': wall,
+        'throughput_rps': total_requests / wall,
+        'throughput_docs_per_s': total_requests * files_per_request / wall,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'mean': statistics.fmean(latencies),
+        },
+        'stage_ms_mean': {name: statistics.fmean(values) for name, values in sorted(stage_totals.items())},
+    }
+
+
+def parse_profile(profile):
+    """'2x8' -> 2 workers, 8 threads; sufixo opcional ':gevent' define a classe do worker"""
+    spec, _, worker_class = profile.partition(':')
+    workers, _, threads = spec.partition('x')
+    threads = int(threads or 1)
+    return int(workers), threads, worker_class or ('gthread' if threads > 1 else 'sync')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path, current_path):
+    """Compara dois arquivos de resultado e imprime as variações"""
+    with open(base_path) as f:
+        base = {(r['profile'], r['endpoint'], r['concurrency']): r for r in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    for result in current:
+        key = (result['profile'], result['endpoint'], result['concurrency'])
+        if key not in base:
+            continue
+        old = base[key]
+        print(f"{key[0]:>10s} {key[1]:>7s} c={key[2]:<4d} "
+              f"rps {old['throughput_rps']:8.1f} -> {result['throughput_rps']:8.1f}  "
+              f"p99 {old['latency_ms']['p99']:8.1f} -> {result['latency_ms']['p99']:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='2x1,2x8', help='workers x threads[:classe], separados por vírgula')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--endpoint', choices=['single', 'batch'], default='single')
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--model-latency', default='lognormal:200:0.3')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'ATUAL'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for profile in args.profiles.split(','):
+        workers, threads, worker_class = parse_profile(profile)
+        port = free_port()
+        proc = start_server(port, workers, threads, worker_class, server_env(args))
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                result = drive(port, args.endpoint, concurrency, args.requests, args.batch_size)
+                result.update({'profile': profile, 'endpoint': args.endpoint, 'concurrency': concurrency,
+                               'workers': workers, 'threads': threads, 'worker_class': worker_class})
+                results.append(result)
+                stages = ' '.join(f'{k}={v:.1f}' for k, v in result['stage_ms_mean'].items())
+                print(f"{profile:>10s} c={concurrency:<4d} rps={result['throughput_rps']:8.1f} "
+                      f"p50={result['latency_ms']['p50']:8.1f} p95={result['latency_ms']['p95']:8.1f} "
+                      f"p99={result['latency_ms']['p99']:8.1f} ms errors={result['errors']}  [{stages}]")
+        finally:
+            stop_server(proc)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'model_latency': args.model_latency,
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
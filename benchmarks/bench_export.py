@@ -0,0 +1,74 @@
+"""
+Benchmark da exportação em massa (NDJSON, CSV e Parquet)
+
+Popula um banco com N documentos sintéticos e, para cada formato, mede:
+- vazão (linhas/s: documentos no NDJSON, itens no CSV e no Parquet) e bytes gerados
+- pico de memória alocada durante a exportação (tracemalloc), que deve ficar
+  estável quando N cresce
+
+Uso:
+    python -m benchmarks.bench_export --rows 200000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.export import export_chunks, parquet_available  # noqa: E402
+from app.results import ResultStore  # noqa: E402
+from benchmarks.bench_documents import populate  # noqa: E402
+
+
+def consume(store, fmt, args):
+    """Consome a exportação como o servidor faria; retorna os bytes gerados"""
+    return sum(len(chunk) for chunk in export_chunks(store, fmt, args.batch_size, args.row_group_size))
+
+
+def run(store, fmt, args):
+    """Retorna (bytes, segundos, pico em MiB); o pico é medido numa segunda passada (tracemalloc é lento)"""
+    started = time.perf_counter()
+    size = consume(store, fmt, args)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    consume(store, fmt, args)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--suppliers', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--row-group-size', type=int, default=20000)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    formats = ['ndjson', 'csv'] + (['parquet'] if parquet_available() else [])
+    results = {'rows': args.rows}
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(os.path.join(directory, 'results.db'))
+        populate(store, args.rows, args.suppliers, 1000)
+        conn = store._connect()
+        counts = {'ndjson': args.rows, 'items': conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]}
+        for fmt in formats:
+            rows = counts.get(fmt, counts['items'])
+            size, elapsed, peak = run(store, fmt, args)
+            results[fmt] = {'rows': rows, 'bytes': size, 'seconds': elapsed,
+                            'rows_per_sec': rows / elapsed, 'peak_mib': peak}
+            print(f'{fmt:8s} {rows:9d} linhas  {rows / elapsed:10.0f} linhas/s  '
+                  f'{size / 2 ** 20:8.1f} MiB  pico {peak:6.1f} MiB')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
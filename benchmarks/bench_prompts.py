@@ -0,0 +1,83 @@
+"""
+Microbenchmark da sanitização de prompts por requisição
+
+Compara:
+- legacy: sanitize_prompt antigo (10 re.sub com padrões compilados em tempo de execução)
+  sobre o prompt constante, a cada requisição
+- registry: busca do template já sanitizado no registro (custo por requisição atual)
+- user_text: expressão única pré-compilada sobre um texto curto do usuário
+
+Uso:
+    python -m benchmarks.bench_prompts --iterations 20000
+"""
+import os
+import re
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.prompts import PromptRegistry, PROMPT_TEMPLATES  # noqa: E402
+from app.security import sanitize_prompt  # noqa: E402
+
+LEGACY_PATTERNS = [
+    r'ignore\s+previous\s+instructions',
+    r'forget\s+everything',
+    r'new\s+instructions',
+    r'system\s*:',
+    r'assistant\s*:',
+    r'user\s*:',
+    r'<\s*script',
+    r'javascript\s*:',
+    r'data\s*:',
+    r'vbscript\s*:',
+]
+
+USER_TEXT = 'Nota do fornecedor ACME, conferir quantidades da página 2'
+
+
+def legacy_sanitize(prompt):
+    """Implementação anterior, reproduzida para comparação"""
+    prompt = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', prompt)
+    for pattern in LEGACY_PATTERNS:
+        prompt = re.sub(pattern, '', prompt, flags=re.IGNORECASE)
+    return prompt[:2000].strip()
+
+
+def measure(fn, iterations):
+    """Melhor de 5 rodadas, em microssegundos por chamada"""
+    return min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    base_prompt = PROMPT_TEMPLATES[0][3]
+    registry = PromptRegistry()
+    assert registry.default.text == legacy_sanitize(base_prompt)
+
+    results = {
+        'legacy_us': measure(lambda: legacy_sanitize(base_prompt), args.iterations),
+        'registry_us': measure(lambda: registry.get('Nota Fiscal').text, args.iterations),
+        'user_text_us': measure(lambda: sanitize_prompt(USER_TEXT), args.iterations),
+        'startup_ms': measure(PromptRegistry, max(1, args.iterations // 100)) / 1000,
+    }
+    results['speedup'] = results['legacy_us'] / results['registry_us']
+
+    print(f"legacy (por requisição):   {results['legacy_us']:9.3f} µs")
+    print(f"registro (por requisição): {results['registry_us']:9.3f} µs  ({results['speedup']:.0f}x)")
+    print(f"texto do usuário:          {results['user_text_us']:9.3f} µs")
+    print(f"montagem do registro:      {results['startup_ms']:9.3f} ms (uma vez por processo)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark da camada de resiliência da chamada ao modelo (backend falso, sem GCP)
+
+Com o modelo falso em latência de cauda longa e uma fração de falhas passageiras,
+compara a chamada direta, a chamada com novas tentativas (orçamento + jitter) e
+com novas tentativas + hedge no p95: taxa de sucesso, p50/p99 e quantas chamadas
+chegaram ao backend por requisição (amplificação).
+
+Uso:
+    python -m benchmarks.bench_resilience --requests 400 --concurrency 16
+    python -m benchmarks.bench_resilience --latency lognormal:200:0.8 --failure-rate 0.1 --output resilience.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.model_backends import FakeModelBackend  # noqa: E402
+from app.resilience import CircuitBreaker, ResilientCaller, RetryBudget  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(mode, args):
+    backend = FakeModelBackend(latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+    caller = None
+    if mode != 'direct':
+        caller = ResilientCaller(
+            deadline=args.deadline, attempt_timeout=args.attempt_timeout, max_attempts=3,
+            base_delay=0.05, max_delay=0.5, budget=RetryBudget(ratio=0.2, min_per_second=5),
+            # Fora do teste: o benchmark mede novas tentativas e hedge, não a abertura do circuito
+            breaker=CircuitBreaker(failure_rate=1.01), hedge=mode == 'hedge',
+            hedge_min_delay=0.01, max_workers=args.concurrency * 2,
+        )
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            if caller is None:
+                backend.generate_content(['p'])
+            else:
+                caller.call(lambda: backend.generate_content(['p']))
+            ok = True
+        except Exception:
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(one, range(args.requests)))
+    latencies = sorted(latency for latency, ok in outcomes if ok)
+    return {
+        'mode': mode,
+        'success_rate': sum(1 for _, ok in outcomes if ok) / len(outcomes),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+        'backend_calls_per_request': backend.calls / len(outcomes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', default='lognormal:100:0.8')
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--deadline', type=float, default=5.0)
+    parser.add_argument('--attempt-timeout', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    results = []
+    for mode in ('direct', 'retry', 'hedge'):
+        result = run(mode, args)
+        results.append(result)
+        print(f"{mode:>7s} sucesso={result['success_rate'] * 100:6.2f}% p50={result['p50_ms']:7.1f} "
+              f"p99={result['p99_ms']:7.1f} ms chamadas/req={result['backend_calls_per_request']:.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'latency': args.latency, 'failure_rate': args.failure_rate, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark do caminho de upload: fluxo antigo (validate_file + NamedTemporaryFile)
+versus leitura em passagem única (ingest_upload + envio a partir da memória)
+
+Cada combinação modo/tamanho roda em um subprocesso próprio para medir o pico de RSS.
+
+Uso:
+    python -m benchmarks.bench_upload_pipeline --sizes 50000,1000000,8000000 --iterations 50
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+
+# Cabeçalho JPEG (SOI + APP0 + SOS) para que o conteúdo sintético seja aceito
+JPEG_HEADER = (b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+               b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00')
+JPEG_TRAILER = b'\xff\xd9'
+
+
+class NullBlob:
+    """Blob que consome o stream como o upload resumável do GCS"""
+
+    def upload_from_file(self, f, size=None, content_type=None):
+        while f.read(1024 * 1024):
+            pass
+
+
+def make_payload(size):
+    # Dados de varredura sem marcadores (0xFF) para passar pela validação estrutural
+    body = os.urandom(max(0, size - len(JPEG_HEADER) - len(JPEG_TRAILER))).replace(b'\xff', b'\x00')
+    return JPEG_HEADER + body + JPEG_TRAILER
+
+
+def legacy_upload(file_storage):
+    """Fluxo anterior: validação com seek, cópia para disco e releitura"""
+    from app.security import validate_file
+    from werkzeug.utils import secure_filename
+
+    result = validate_file(file_storage)
+    assert result['valid'], result
+    secure_name = secure_filename(file_storage.filename)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f'_{secure_name}') as temp_file:
+        file_storage.save(temp_file.name)
+        with open(temp_file.name, 'rb') as f:
+            NullBlob().upload_from_file(f, content_type=file_storage.mimetype)
+        os.unlink(temp_file.name)
+
+
+def single_pass_upload(file_storage, inline_max_bytes):
+    """Fluxo atual: uma leitura, hash incremental, envio inline ou a partir da memória"""
+    from app.ingest import ingest_upload
+
+    result = ingest_upload(file_storage)
+    assert result['valid'], result
+    document = result['document']
+    if document.size > inline_max_bytes:
+        NullBlob().upload_from_file(io.BytesIO(document.data), size=document.size,
+                                    content_type=document.mime_type)
+
+
+def run_worker(mode, size, iterations, inline_max_bytes):
+    """Executa um modo/tamanho e imprime o resultado em JSON"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from werkzeug.datastructures import FileStorage
+    from app import create_app
+
+    app = create_app('testing')
+    payload = make_payload(size)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+
+    with app.app_context():
+        tracemalloc.start()
+        for _ in range(iterations):
+            file_storage = FileStorage(io.BytesIO(payload), 'nota.jpg', content_type='image/jpeg')
+            start = time.perf_counter()
+            if mode == 'legacy':
+                legacy_upload(file_storage)
+            else:
+                single_pass_upload(file_storage, inline_max_bytes)
+            latencies.append((time.perf_counter() - start) * 1000)
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies.sort()
+    print(json.dumps({
+        'mode': mode,
+        'size_bytes': size,
+        'iterations': iterations,
+        'latency_ms_p50': statistics.median(latencies),
+        'latency_ms_p95': latencies[int(len(latencies) * 0.95) - 1],
+        'latency_ms_mean': statistics.fmean(latencies),
+        'peak_rss_growth_kb': rss_after - rss_before,
+        'peak_traced_alloc_kb': traced_peak // 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='50000,1000000,8000000')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--inline-max-bytes', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.iterations, args.inline_max_bytes)
+        return
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        for mode in ('legacy', 'single_pass'):
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_upload_pipeline',
+                 '--worker', mode, str(size),
+                 '--iterations', str(args.iterations),
+                 '--inline-max-bytes', str(args.inline_max_bytes)],
+                check=True, capture_output=True, text=True,
+                env=dict(os.environ, ENABLE_AUTH='false'),
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:12s} {size:>10d}B  p50={result['latency_ms_p50']:.3f}ms "
+                  f"p95={result['latency_ms_p95']:.3f}ms  "
+                  f"rss+={result['peak_rss_growth_kb']}KB  alloc_peak={result['peak_traced_alloc_kb']}KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
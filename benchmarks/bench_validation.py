@@ -0,0 +1,130 @@
+"""
+Benchmark de vazão da validação de uploads (arquivos/s) em corpora mistos
+
+Modos:
+- legacy: seek até o fim + magic.from_buffer a cada arquivo (fluxo anterior, sem estrutura)
+- sniff: tabela de assinaturas + handle do libmagic por thread (só identificação)
+- streaming: ingest_upload completo (identificação + validação estrutural incremental)
+
+Uso:
+    python -m benchmarks.bench_validation --corpus mixed --threads 1,4 --duration 3
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import magic  # noqa: E402
+from PIL import Image  # noqa: E402
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+# Composição dos corpora: (formato, largura, altura, peso)
+CORPORA = {
+    'labels': [('PNG', 400, 300, 1), ('JPEG', 640, 480, 1)],
+    'photos': [('JPEG', 3000, 2000, 1)],
+    'scans': [('PDF', 1240, 1754, 1), ('TIFF', 1240, 1754, 1)],
+    'mixed': [('PNG', 400, 300, 3), ('JPEG', 640, 480, 3), ('JPEG', 2000, 1500, 2),
+              ('PDF', 1240, 1754, 1), ('GIF', 400, 300, 1)],
+}
+
+EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'PDF': 'pdf', 'TIFF': 'tiff', 'GIF': 'gif'}
+
+
+def make_corpus(name):
+    """[(nome_arquivo, bytes)] com a composição do corpus"""
+    files = []
+    for index, (fmt, width, height, weight) in enumerate(CORPORA[name]):
+        image = Image.effect_noise((width, height), 30).convert('RGB')
+        output = io.BytesIO()
+        image.save(output, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+        files.extend([(f'doc{index}.{EXTENSIONS[fmt]}', output.getvalue())] * weight)
+    return files
+
+
+def legacy_validate(filename, data):
+    stream = io.BytesIO(data)
+    stream.seek(0, os.SEEK_END)
+    stream.tell()
+    stream.seek(0)
+    return magic.from_buffer(stream.read(1024), mime=True)
+
+
+def sniff_validate(filename, data):
+    from app.validation import detect_mime
+    return detect_mime(data[:1024])
+
+
+def streaming_validate(filename, data):
+    from app.ingest import ingest_upload
+    result = ingest_upload(FileStorage(io.BytesIO(data), filename))
+    assert result['valid'], result
+    return result
+
+
+MODES = {'legacy': legacy_validate, 'sniff': sniff_validate, 'streaming': streaming_validate}
+
+
+def run(app, mode, corpus, threads, duration):
+    """Valida o corpus em laço por `duration` segundos com `threads` threads"""
+    validate = MODES[mode]
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        count = size = 0
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                for filename, data in corpus:
+                    validate(filename, data)
+                    count += 1
+                    size += len(data)
+        return count, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda _: worker(), range(threads)))
+    elapsed = time.perf_counter() - start
+    files = sum(r[0] for r in results)
+    return {
+        'mode': mode,
+        'threads': threads,
+        'files': files,
+        'files_per_sec': files / elapsed,
+        'mb_per_sec': sum(r[1] for r in results) / elapsed / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default='mixed', choices=sorted(CORPORA) + ['all'])
+    parser.add_argument('--modes', default='legacy,sniff,streaming')
+    parser.add_argument('--threads', default='1,4')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    os.environ.setdefault('ENABLE_AUTH', 'false')
+    from app import create_app
+    app = create_app('testing')
+
+    results = []
+    for corpus_name in (sorted(CORPORA) if args.corpus == 'all' else [args.corpus]):
+        corpus = make_corpus(corpus_name)
+        for mode in args.modes.split(','):
+            for threads in (int(t) for t in args.threads.split(',')):
+                result = dict(run(app, mode, corpus, threads, args.duration), corpus=corpus_name)
+                results.append(result)
+                print(f"{corpus_name:8s} {mode:10s} threads={threads:<3d} "
+                      f"{result['files_per_sec']:10.1f} arquivos/s  {result['mb_per_sec']:8.1f} MB/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark do aquecimento de clientes no boot do worker (sem GCP)
+
+Sobe o serviço com o modelo falso e um custo de inicialização por processo
+(FAKE_MODEL_INIT_LATENCY, simulando vertexai.init + canal gRPC) e mede a latência
+da primeira rajada de requisições:
+- sem aquecimento: a rajada chega logo após o /health e paga a inicialização
+- com aquecimento: o balanceador espera o /ready, a rajada encontra o cliente pronto
+
+Uso:
+    python -m benchmarks.bench_warmup --init-latency 3000 --burst 16
+    python -m benchmarks.bench_warmup --workers 2 --threads 32 --output warmup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_e2e import drive, free_port, server_env, start_server, stop_server  # noqa: E402
+
+
+def wait_ready(port, timeout=120):
+    """Segundos até o /ready responder 200"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/ready')
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return time.perf_counter() - start
+        except OSError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError('/ready não respondeu 200 a tempo')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--init-latency', type=float, default=3000, help='Custo de inicialização (ms)')
+    parser.add_argument('--burst', type=int, default=16, help='Requisições simultâneas na primeira rajada')
+    parser.add_argument('--model-latency', default='fixed:300')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    results = []
+    for warmup in (False, True):
+        env = server_env(args, {
+            'FAKE_MODEL_INIT_LATENCY': str(args.init_latency),
+            'CLIENT_WARMUP_ENABLED': 'true' if warmup else 'false',
+        })
+        port = free_port()
+        boot = time.perf_counter()
+        proc = start_server(port, args.workers, args.threads, args.worker_class, env)
+        try:
+            healthy = time.perf_counter() - boot
+            ready = healthy + wait_ready(port) if warmup else healthy
+            result = drive(port, 'single', args.burst, args.burst, 1)
+        finally:
+            stop_server(proc)
+        result.update({'warmup': warmup, 'seconds_to_health': healthy, 'seconds_to_ready': ready})
+        results.append(result)
+        print(f"warmup={'on ' if warmup else 'off'} ready={ready:6.2f}s "
+              f"p50={result['latency_ms']['p50']:8.1f} p99={result['latency_ms']['p99']:8.1f} ms "
+              f"errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'init_latency_ms': args.init_latency, 'burst': args.burst, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
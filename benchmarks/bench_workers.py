@@ -0,0 +1,86 @@
+"""
+Benchmark dos modelos de worker do gunicorn com backends falsos (sem GCP)
+
+Para cada perfil (sync, gthread, gevent) sobe o serviço com o modelo falso
+(latência configurável, simulando o Vertex) e mede, para cada nível de
+concorrência, vazão, latências e memória residente (RSS) do gunicorn e de
+todos os workers ao final da carga.
+
+Uso:
+    python -m benchmarks.bench_workers --concurrency 2,16,64 --requests 256
+    python -m benchmarks.bench_workers --profiles 2x1:sync,2x32:gthread,2x1:gevent --output workers.json
+"""
+import os
+import sys
+import json
+import argparse
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_e2e import (  # noqa: E402
+    drive, free_port, parse_profile, server_env, start_server, stop_server
+)
+
+
+def process_tree_rss(pid):
+    """RSS total (MiB) do processo e de todos os descendentes (Linux, /proc)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default='2x1:sync,2x32:gthread,2x1:gevent',
+                        help='workers x threads:classe, separados por vírgula')
+    parser.add_argument('--concurrency', default='2,16,64')
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--model-latency', default='fixed:300')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Arquivo JSON com os resultados')
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles.split(','):
+        workers, threads, worker_class = parse_profile(profile)
+        if worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print(f'{profile:>16s} ignorado: pacote gevent não instalado')
+            continue
+        # Vagas do Vertex por processo acompanham as requisições simultâneas do perfil
+        slots = threads if worker_class == 'gthread' else 256
+        env = server_env(args, {'VERTEX_MAX_CONCURRENCY': str(slots), 'GCS_MAX_CONCURRENCY': str(slots)})
+        port = free_port()
+        proc = start_server(port, workers, threads, worker_class, env)
+        try:
+            idle_rss = process_tree_rss(proc.pid)
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                result = drive(port, 'single', concurrency, args.requests, 1)
+                result.update({'profile': profile, 'concurrency': concurrency, 'workers': workers,
+                               'threads': threads, 'worker_class': worker_class,
+                               'idle_rss_mib': idle_rss, 'rss_mib': process_tree_rss(proc.pid)})
+                results.append(result)
+                print(f"{profile:>16s} c={concurrency:<4d} rps={result['throughput_rps']:7.1f} "
+                      f"p50={result['latency_ms']['p50']:8.1f} p99={result['latency_ms']['p99']:8.1f} ms "
+                      f"rss={result['rss_mib']:6.1f} MiB errors={result['errors']}")
+        finally:
+            stop_server(proc)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model_latency': args.model_latency, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
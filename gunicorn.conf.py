@@ -0,0 +1,69 @@
+"""
+Configuração do gunicorn
+Carregada automaticamente a partir do diretório de trabalho; opções passadas na
+linha de comando têm precedência.
+
+O serviço é quase todo espera de E/S (GCS, Vertex), então o perfil padrão é
+gthread: poucos processos com muitas threads, cada uma segurando uma chamada ao
+Gemini em andamento, com os clientes e pools de conexão compartilhados no processo.
+GUNICORN_WORKER_CLASS=gevent troca as threads por greenlets (requer o pacote gevent).
+"""
+import os
+import shutil
+
+# Métricas agregadas entre workers (prometheus_client em modo multiprocesso).
+# Precisa estar definido antes de os workers importarem a aplicação.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/vision_metrics')
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8080')}")
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# Requisições simultâneas por processo: threads (gthread) ou greenlets (gevent)
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 256))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+
+def check_job_store(workers):
+    """Jobs em memória ficam no worker que os criou: GET /jobs/<id> em outro worker daria 404"""
+    url = os.getenv('JOB_STORE_URL', 'sqlite:////tmp/vision_jobs.db')
+    if workers > 1 and url.startswith('memory://'):
+        raise RuntimeError(
+            f'JOB_STORE_URL={url} é local ao processo e o gunicorn usa {workers} workers; '
+            'use sqlite:///caminho ou redis://'
+        )
+
+
+def on_starting(server):
+    """Valida o store de jobs e limpa métricas de execuções anteriores"""
+    check_job_store(server.cfg.workers)
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_worker_init(worker):
+    """
+    Boot do worker: integra o gRPC ao gevent (se for o caso) e começa a aquecer
+    os clientes do Vertex e do GCS em segundo plano (/ready responde 200 ao terminar)
+    """
+    if worker.cfg.worker_class_str == 'gevent':
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+        except ImportError:
+            pass
+        else:
+            grpc_gevent.init_gevent()
+
+    app = worker.wsgi
+    registry = getattr(app, 'extensions', {}).get('client_registry')
+    if registry is not None and app.config.get('CLIENT_WARMUP_ENABLED'):
+        registry.start_warmup()
+
+
+def child_exit(server, worker):
+    """Descarta métricas de gauges 'live' de workers encerrados"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
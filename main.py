@@ -4,7 +4,7 @@ Ponto de entrada principal da aplicação
 """
 import os
 from app import create_app
-from app.config import config
+from app.config import config, Config
 
 # Determinar ambiente
 config_name = os.getenv('FLASK_ENV', 'development')
@@ -16,7 +16,7 @@ app = create_app(config_name)
 
 # Validar configurações obrigatórias
 try:
-    app.config['validate_required_config']()
+    Config.validate_required_config()
 except ValueError as e:
     app.logger.error(f'Configuration error: {e}')
     raise
@@ -1,10 +1,11 @@
-
 """
 Configurações globais para testes
 """
 import pytest
 import os
+import struct
 import tempfile
+import zlib
 
 @pytest.fixture(scope='session')
 def temp_dir():
@@ -21,3 +22,33 @@ def setup_test_env():
     os.environ['ENABLE_AUTH'] = 'false'
     yield
     # Cleanup não necessário pois pytest limpa automaticamente
+
+@pytest.fixture
+def app():
+    """Fixture da aplicação para testes"""
+    from app import create_app
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    """Cliente de teste"""
+    return app.test_client()
+
+def make_png(width=1, height=1, seed=0):
+    """Gera um PNG mínimo válido (escala de cinza, 8 bits)"""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    rows = b''.join(b'\x00' + bytes((seed + x + y) % 256 for x in range(width))
+                    for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) +
+            chunk(b'IEND', b''))
+
+@pytest.fixture
+def png_bytes():
+    """Conteúdo de um PNG válido para uploads"""
+    return make_png(4, 4)
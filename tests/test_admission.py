@@ -0,0 +1,123 @@
+"""
+Testes do controle de admissão da extração (limite adaptativo e fila limitada)
+"""
+import io
+import time
+import threading
+import pytest
+from app.admission import AdmissionController, AdmissionRejected, GradientLimit
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+def fixed_limit(value):
+    return GradientLimit(initial=value, min_limit=value, max_limit=value)
+
+
+class TestGradientLimit:
+    """Adaptação do limite à latência observada"""
+
+    def test_grows_with_stable_latency_under_demand(self):
+        limit = GradientLimit(initial=4, max_limit=32)
+        for _ in range(50):
+            limit.on_sample(0.1, inflight=limit.limit)
+        assert limit.limit > 4
+
+    def test_does_not_grow_without_demand(self):
+        limit = GradientLimit(initial=8, max_limit=32)
+        for _ in range(50):
+            limit.on_sample(0.1, inflight=1)
+        assert limit.limit == 8
+
+    def test_shrinks_when_latency_rises(self):
+        limit = GradientLimit(initial=20, max_limit=32)
+        for _ in range(100):
+            limit.on_sample(0.1, inflight=limit.limit)
+        grown = limit.limit
+        for _ in range(20):
+            limit.on_sample(1.0, inflight=limit.limit)
+        assert limit.limit < grown / 2
+
+    def test_probe_remeasures_baseline(self):
+        """Periodicamente o limite cai para sqrt(limite) e a latência sem carga é medida de novo"""
+        limit = GradientLimit(initial=16, max_limit=32, probe_interval=1)
+        limit.on_sample(0.1, inflight=16)
+        assert limit.limit == 4
+
+    def test_backs_off_on_failures(self):
+        limit = GradientLimit(initial=20, min_limit=2, backoff=0.5)
+        limit.on_sample(0.1, inflight=20, dropped=True)
+        assert limit.limit == 10
+        for _ in range(10):
+            limit.on_sample(0.1, inflight=20, dropped=True)
+        assert limit.limit == 2
+
+
+class TestAdmissionController:
+    """Vagas, fila limitada e rejeição imediata"""
+
+    def test_queue_then_shed(self):
+        controller = AdmissionController(fixed_limit(1), max_queue=1, max_wait=5)
+        controller.acquire()
+
+        admitted = threading.Event()
+
+        def waiter():
+            with controller:
+                admitted.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        while controller.stats()['queued'] == 0:
+            time.sleep(0.005)
+
+        started = time.monotonic()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            controller.acquire()
+        assert time.monotonic() - started < 0.1
+        assert excinfo.value.retry_after >= 1
+
+        controller.release(0.05)
+        thread.join(timeout=5)
+        assert admitted.is_set()
+        stats = controller.stats()
+        assert stats['admitted'] == 2
+        assert stats['shed'] == {'queue_full': 1, 'timeout': 0}
+        assert (stats['inflight'], stats['queued']) == (0, 0)
+
+    def test_wait_timeout(self):
+        controller = AdmissionController(fixed_limit(1), max_queue=4, max_wait=0.05)
+        controller.acquire()
+        with pytest.raises(AdmissionRejected):
+            controller.acquire()
+        assert controller.stats()['shed']['timeout'] == 1
+        assert controller.stats()['queued'] == 0
+
+    def test_transient_failure_counts_as_drop(self):
+        controller = AdmissionController(GradientLimit(initial=10, backoff=0.5))
+        with pytest.raises(TimeoutError):
+            with controller:
+                raise TimeoutError()
+        assert controller.stats()['limit'] == 5
+
+
+class TestAdmissionEndpoints:
+    """503 com Retry-After quando saturado e estatísticas em /admission"""
+
+    def test_saturated_upload_is_shed(self, app, client, png_bytes):
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        controller = AdmissionController(fixed_limit(1), max_queue=0)
+        app.extensions['stage_limits']['vertex'] = controller
+        controller.acquire()
+
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+        assert app.extensions['model_backend'].calls == 0
+
+        stats = client.get('/admission').get_json()
+        assert stats['enabled'] is True
+        assert (stats['limit'], stats['inflight'], stats['shed']['queue_full']) == (1, 1, 1)
@@ -0,0 +1,146 @@
+"""
+Testes dos agregados de estoque e gastos
+"""
+import io
+import time
+import random
+import pytest
+from app.aggregates import Aggregates
+from app.model_backends import FakeModelBackend
+from app.results import ResultStore
+from app.storage_backends import InMemoryStorageBackend
+from tests.conftest import make_png
+
+_sequence = iter(range(10 ** 6))
+
+
+def record(tipo='Nota Fiscal', data_emissao='15/03/2024', cnpj='12.345.678/0001-90',
+           itens=(), total=None, fornecedor='ACME'):
+    return {'sha256': f'{next(_sequence):064x}', 'filename': 'doc.png', 'prompt_version': 'auto@1',
+            'created_at': time.time(),
+            'data': {'tipo_documento': tipo, 'data_emissao': data_emissao, 'cnpj_fornecedor': cnpj,
+                     'fornecedor': fornecedor, 'itens': list(itens), 'valor_total_documento': total}}
+
+
+def item(code, quantity, total=None, unit_value=None, description=None):
+    return {'codigo_produto': code, 'quantidade': quantity, 'valor_total_item': total,
+            'valor_unitario': unit_value, 'descricao': description, 'unidade': 'UN'}
+
+
+@pytest.fixture
+def aggregates(tmp_path):
+    return Aggregates(ResultStore(str(tmp_path / 'results.db')))
+
+
+class TestIncrementalAggregates:
+    """Atualização a cada lote gravado"""
+
+    def test_stock_entries_and_counts(self, aggregates):
+        """Notas somam entradas; a contagem mais recente prevalece"""
+        store = aggregates.store
+        store.write_batch([
+            record(itens=[item('A', 2, 20.0, description='Parafuso'), item('A', 1, unit_value=5.0)]),
+            record(tipo='Relatório de Contagem', data_emissao='20/03/2024', itens=[item('A', 7)]),
+        ])
+        store.write_batch([
+            record(itens=[item('A', 4, 40.0)]),
+            record(tipo='Relatório de Contagem', data_emissao='01/03/2024', itens=[item('A', 1)]),
+            record(tipo='Etiqueta de Produto', itens=[item('A', 100)]),
+        ])
+
+        stock = aggregates.stock('A')
+        assert stock['quantidade_entrada'] == 7
+        assert stock['valor_entrada'] == 65.0
+        assert stock['documentos'] == 2
+        assert stock['quantidade_contada'] == 7
+        assert stock['contado_em'] == '2024-03-20'
+        assert stock['descricao'] == 'Parafuso'
+        assert aggregates.stock('B') is None
+
+    def test_spend_by_supplier_and_month(self, aggregates):
+        """Total declarado ou soma dos itens, por fornecedor e mês"""
+        aggregates.store.write_batch([
+            record(total=100.0),
+            record(itens=[item('A', 1, 30.0)], data_emissao='10/04/2024'),
+            record(cnpj='99.999.999/0001-99', total=50.0, data_emissao='31/03/2024'),
+            record(tipo='Relatório de Contagem', total=999.0),
+        ])
+
+        summary = aggregates.financial_summary('12345678000190')
+        assert [(m['mes'], m['valor_total']) for m in summary['meses']] == [('2024-03', 100.0), ('2024-04', 30.0)]
+        assert summary['fornecedor'] == 'ACME'
+        total = aggregates.financial_summary(mes_inicio='2024-03', mes_fim='2024-03')
+        assert total['valor_total'] == 150.0
+        assert total['documentos'] == 2
+
+
+class TestRebuild:
+    """Reconstrução colunar (NumPy) equivalente à atualização incremental"""
+
+    def test_rebuild_matches_incremental(self, aggregates):
+        rng = random.Random(7)
+        types = ['Nota Fiscal', 'Nota Fiscal', 'Relatório de Contagem', 'Etiqueta de Produto', None]
+        for _ in range(8):
+            batch = []
+            for _ in range(rng.randint(1, 15)):
+                itens = [item(rng.choice(['A', 'B', 'C', None]), rng.choice([1, 2.5, None, '3']),
+                              rng.choice([10.0, None]), rng.choice([2.0, None]),
+                              rng.choice(['x', 'y', None]))
+                         for _ in range(rng.randint(0, 4))]
+                batch.append(record(tipo=rng.choice(types),
+                                    data_emissao=rng.choice(['01/03/2024', '15/04/2024', None]),
+                                    cnpj=rng.choice(['1', '2', None]), itens=itens,
+                                    total=rng.choice([None, 100.0]), fornecedor=rng.choice(['F', None])))
+            aggregates.store.write_batch(batch)
+
+        conn = aggregates.store._connect()
+
+        def snapshot():
+            return {table: sorted(conn.execute(f'SELECT * FROM {table}').fetchall(), key=repr)
+                    for table in ('stock', 'spend', 'spend_month')}
+
+        incremental = snapshot()
+        aggregates.rebuild()
+        rebuilt = snapshot()
+        for table in incremental:
+            assert len(rebuilt[table]) == len(incremental[table])
+            for expected, actual in zip(incremental[table], rebuilt[table]):
+                assert [pytest.approx(v) if isinstance(v, float) else v for v in expected] == list(actual)
+
+
+class TestAggregateEndpoints:
+    """Testes de /stock e /financial-summary"""
+
+    @pytest.fixture
+    def aggregates_app(self, app, aggregates):
+        app.extensions['result_store'] = aggregates.store
+        app.extensions['aggregates'] = aggregates
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        return app
+
+    def test_upload_updates_stock_and_spend(self, aggregates_app):
+        client = aggregates_app.test_client()
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(make_png(4, 4)), 'nota.png')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        aggregates_app.extensions['result_store'].flush()
+
+        product = client.get('/stock?codigo_produto=P0003').get_json()
+        assert product['quantidade_entrada'] == 3
+        assert product['valor_entrada'] == 30.0
+        listing = client.get('/stock?limit=2').get_json()
+        assert [p['codigo_produto'] for p in listing['products']] == ['P0001', 'P0002']
+        assert listing['next_cursor'] == 'P0002'
+
+        summary = client.get('/financial-summary?cnpj_fornecedor=12.345.678/0001-90').get_json()
+        assert summary['meses'] == [{'mes': '2024-03', 'valor_total': 150.0, 'documentos': 1}]
+        assert client.get('/stock?codigo_produto=XYZ').status_code == 404
+
+    def test_invalid_month(self, aggregates_app):
+        assert aggregates_app.test_client().get('/financial-summary?mes_inicio=03/2024').status_code == 400
+
+    def test_disabled(self, client):
+        assert client.get('/stock').status_code == 503
+        assert client.get('/financial-summary').status_code == 503
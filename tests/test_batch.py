@@ -0,0 +1,72 @@
+"""
+Testes do upload em lote
+"""
+import io
+import time
+from unittest.mock import patch
+from tests.conftest import make_png
+
+
+class TestBatchUpload:
+    """Testes do endpoint /upload-invoices"""
+
+    def test_results_in_input_order_with_partial_failures(self, client):
+        """Resultados na ordem de envio, com falhas reportadas por item"""
+        def fake_process(document, prompt=None):
+            return {'message': 'ok', 'extracted_data': {'arquivo': document.filename},
+                    'notification_summary': ''}, 200
+
+        with patch('app.pipeline.process_document', side_effect=fake_process):
+            response = client.post('/upload-invoices', data={
+                'images': [
+                    (io.BytesIO(make_png(seed=1)), 'a.png'),
+                    (io.BytesIO(b'not an image'), 'b.exe'),
+                    (io.BytesIO(make_png(seed=2)), 'c.png'),
+                ]
+            }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [item['filename'] for item in data['results']] == ['a.png', 'b.exe', 'c.png']
+        assert data['results'][0]['extracted_data'] == {'arquivo': 'a.png'}
+        assert data['results'][1]['status'] == 400
+        assert data['results'][2]['extracted_data'] == {'arquivo': 'c.png'}
+        assert data['summary'] == {'total': 3, 'succeeded': 2, 'failed': 1}
+
+    def test_batch_runs_concurrently(self, client):
+        """Tempo total próximo ao do documento mais lento"""
+        def slow_process(document, prompt=None):
+            time.sleep(0.2)
+            return {'message': 'ok', 'extracted_data': {}, 'notification_summary': ''}, 200
+
+        files = [(io.BytesIO(make_png(seed=i)), f'{i}.png') for i in range(8)]
+        with patch('app.pipeline.process_document', side_effect=slow_process):
+            start = time.perf_counter()
+            response = client.post('/upload-invoices', data={'images': files},
+                                   content_type='multipart/form-data')
+            elapsed = time.perf_counter() - start
+
+        assert response.status_code == 200
+        assert response.get_json()['summary']['succeeded'] == 8
+        assert elapsed < 0.2 * 4
+
+    def test_item_exception_is_isolated(self, client):
+        """Erro em um item não derruba o lote"""
+        def flaky_process(document, prompt=None):
+            if document.filename == 'bad.png':
+                raise RuntimeError('boom')
+            return {'message': 'ok', 'extracted_data': {}, 'notification_summary': ''}, 200
+
+        with patch('app.pipeline.process_document', side_effect=flaky_process):
+            response = client.post('/upload-invoices', data={'images': [
+                (io.BytesIO(make_png(seed=1)), 'bad.png'),
+                (io.BytesIO(make_png(seed=2)), 'good.png'),
+            ]}, content_type='multipart/form-data')
+
+        results = response.get_json()['results']
+        assert results[0]['status'] == 500
+        assert results[1]['status'] == 200
+
+    def test_batch_without_files(self, client):
+        """Lote vazio retorna 400"""
+        assert client.post('/upload-invoices').status_code == 400
@@ -0,0 +1,124 @@
+"""
+Testes do cache de extrações
+"""
+import io
+import os
+import hashlib
+import time
+from app.cache import ExtractionCache, hash_stream, make_cache_key
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+class TestExtractionCache:
+    """Testes dos níveis de memória e disco"""
+
+    def test_memory_lru_eviction(self):
+        """Entradas menos usadas saem primeiro"""
+        cache = ExtractionCache(max_entries=2)
+        cache.set('a', {'v': 1})
+        cache.set('b', {'v': 2})
+        cache.get('a')
+        cache.set('c', {'v': 3})
+
+        assert cache.get('b') is None
+        assert cache.get('a') == {'v': 1}
+        assert cache.get('c') == {'v': 3}
+
+    def test_hit_miss_counters(self):
+        """Contadores refletem acertos e falhas"""
+        cache = ExtractionCache()
+        cache.get('missing')
+        cache.set('k', {'v': 1})
+        cache.get('k')
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        """Nível em disco é compartilhado entre instâncias (workers)"""
+        ExtractionCache(disk_dir=str(tmp_path)).set('k', {'v': 1})
+
+        cache = ExtractionCache(disk_dir=str(tmp_path))
+        assert cache.get('k') == {'v': 1}
+        assert cache.stats()['disk_hits'] == 1
+
+    def test_disk_ttl_expiry(self, tmp_path):
+        """Entradas expiradas no disco são descartadas"""
+        ExtractionCache(disk_dir=str(tmp_path)).set('k', {'v': 1})
+        path = tmp_path / 'k.json'
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+
+        cache = ExtractionCache(disk_dir=str(tmp_path), disk_ttl=60)
+        assert cache.get('k') is None
+        assert not path.exists()
+
+    def test_disk_size_eviction(self, tmp_path):
+        """Despejo por tamanho remove as entradas mais antigas"""
+        cache = ExtractionCache(disk_dir=str(tmp_path), disk_max_bytes=150)
+        cache.set('old', {'v': 'x' * 80})
+        old = time.time() - 60
+        os.utime(tmp_path / 'old.json', (old, old))
+        cache.set('new', {'v': 'y' * 80})
+
+        assert not (tmp_path / 'old.json').exists()
+        assert (tmp_path / 'new.json').exists()
+
+    def test_disk_writes_do_not_scan_directory(self, tmp_path, monkeypatch):
+        """Abaixo do limite a escrita só atualiza o índice; a varredura fica para o despejo"""
+        cache = ExtractionCache(disk_dir=str(tmp_path), disk_max_bytes=1000)
+        scans = []
+        real_scandir = os.scandir
+        monkeypatch.setattr(os, 'scandir', lambda path: scans.append(path) or real_scandir(path))
+
+        for index in range(5):
+            cache.set(f'k{index}', {'v': 'x' * 80})
+        assert scans == []
+
+        for index in range(5, 12):
+            cache.set(f'k{index}', {'v': 'x' * 80})
+        assert len(scans) == 1
+        assert sum(p.stat().st_size for p in tmp_path.glob('*.json')) <= 900
+        assert (tmp_path / 'k11.json').exists()
+
+    def test_key_depends_on_model_and_prompt(self):
+        """Chave muda com modelo ou versão do prompt"""
+        content_hash = hash_stream(io.BytesIO(b'abc'))
+        key = make_cache_key(content_hash, 'model-a', '1')
+        assert key != make_cache_key(content_hash, 'model-b', '1')
+        assert key != make_cache_key(content_hash, 'model-a', '2')
+
+
+class TestUploadCache:
+    """Testes do cache no endpoint de upload"""
+
+    def test_cache_hit_skips_gcp(self, app, client, png_bytes):
+        """Acerto no cache não inicializa GCS nem Vertex"""
+        from app.pipeline import extraction_version
+        with app.app_context():
+            version = extraction_version()
+        key = make_cache_key(hashlib.sha256(png_bytes).hexdigest(),
+                             app.config['GEMINI_MODEL_ID'], version)
+        app.extensions['extraction_cache'].set(key, {
+            'extracted_data': {'numero_documento': '123'},
+            'notification_summary': 'resumo'
+        })
+
+        model = FakeModelBackend()
+        storage = InMemoryStorageBackend()
+        app.extensions['model_backend'] = model
+        app.extensions['storage_backend'] = storage
+
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['cached'] is True
+        assert data['extracted_data'] == {'numero_documento': '123'}
+        assert model.calls == 0
+        assert storage.objects == {}
@@ -0,0 +1,146 @@
+"""
+Testes da cascata de modelos (validação da saída, escalonamento e rotas por tipo)
+"""
+import io
+import copy
+import json
+import pytest
+from app.cascade import ModelCascade, ModelTier, check_extraction, create_model_cascade, parse_routes, parse_tiers
+from app.model_backends import DEFAULT_FAKE_RESPONSE, FakeModelBackend
+from app.prompts import PromptRegistry
+from app.storage_backends import InMemoryStorageBackend
+
+LABEL = {
+    'tipo_documento': 'Etiqueta de Produto',
+    'itens': [{'codigo_produto': '7891234567890', 'descricao': 'Parafuso 6mm', 'quantidade': 100, 'unidade': 'UN'}],
+}
+
+
+def invoice(**changes):
+    data = copy.deepcopy(DEFAULT_FAKE_RESPONSE)
+    data.update(changes)
+    return data
+
+
+def backend_for(data, **kwargs):
+    return FakeModelBackend(responses=[{'text': json.dumps(data, ensure_ascii=False)}], **kwargs)
+
+
+def two_tiers(fast, strong, routes=None):
+    return ModelCascade([
+        ModelTier('fast-model', fast, input_price=0.1, output_price=0.4),
+        ModelTier('strong-model', strong, input_price=1.0, output_price=4.0),
+    ], routes=routes)
+
+
+class TestCheckExtraction:
+    """Validação da saída do modelo"""
+
+    def test_consistent_documents_pass(self):
+        assert check_extraction(invoice()) == []
+        assert check_extraction(LABEL) == []
+
+    def test_invalid_output(self):
+        assert check_extraction(None) == ['invalid_json']
+
+    def test_missing_fields_and_unknown_type(self):
+        assert check_extraction(invoice(numero_documento=None, cnpj_fornecedor='')) == [
+            'missing:numero_documento', 'missing:cnpj_fornecedor'
+        ]
+        assert check_extraction({'tipo_documento': 'Desconhecido', 'itens': []}) == ['unknown_type']
+        assert check_extraction({'tipo_documento': 'Etiqueta de Produto', 'itens': []}) == ['missing:itens']
+
+    def test_item_totals(self):
+        data = invoice()
+        data['itens'][2]['valor_total_item'] = 300.0
+        assert check_extraction(data) == ['item_total', 'document_total']
+
+    def test_document_total_tolerance(self):
+        """Frete e impostos cabem na tolerância do total do documento"""
+        assert check_extraction(invoice(valor_total_documento=155.0)) == []
+        assert check_extraction(invoice(valor_total_documento='1.500,00')) == ['document_total']
+
+
+class TestModelCascade:
+    """Escalonamento, rotas por tipo e estatísticas por nível"""
+
+    def test_review(self):
+        cascade = two_tiers(None, None, routes={'nota_fiscal': 1})
+        assert cascade.review(0, LABEL, 'etiqueta_produto') == (None, [])
+        assert cascade.review(0, None) == (1, ['invalid_json'])
+        assert cascade.review(0, invoice(), 'nota_fiscal') == (1, ['route:nota_fiscal'])
+        assert cascade.review(1, None) == (None, ['invalid_json'])
+
+    def test_config(self):
+        registry = PromptRegistry()
+        assert parse_tiers('flash:0.075:0.30, pro') == [('flash', 0.075, 0.30), ('pro', 0.0, 0.0)]
+        assert parse_routes('Nota Fiscal=1,etiqueta_produto=0', registry) == {'nota_fiscal': 1, 'etiqueta_produto': 0}
+        with pytest.raises(ValueError):
+            parse_routes('danfe=1', registry)
+
+        config = {'MODEL_BACKEND': 'fake', 'GEMINI_MODEL_ID': 'flash', 'FAKE_MODEL_LATENCY': 'fixed:0',
+                  'FAKE_MODEL_SEED': 0, 'FAKE_MODEL_FAILURE_RATE': 0, 'FAKE_MODEL_INIT_LATENCY': 0,
+                  'FAKE_MODEL_FAILURE_CODE': 503, 'MODEL_CASCADE_ROUTES': '',
+                  'MODEL_CASCADE_ITEM_TOLERANCE': 0.01, 'MODEL_CASCADE_TOTAL_TOLERANCE': 0.05}
+        assert create_model_cascade(dict(config, MODEL_CASCADE='flash'), registry) is None
+        cascade = create_model_cascade(dict(config, MODEL_CASCADE='flash:0.1:0.4,pro:1:4'), registry)
+        assert [tier.backend.model_id for tier in cascade.tiers] == ['flash', 'pro']
+
+
+class TestCascadeExtraction:
+    """Upload pela cascata: o modelo forte só é chamado quando a validação falha"""
+
+    def upload(self, client, png_bytes, **form):
+        return client.post('/upload-invoice', data=dict(form, image=(io.BytesIO(png_bytes), 'doc.png')),
+                           content_type='multipart/form-data')
+
+    def setup_app(self, app, cascade):
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        app.extensions['model_cascade'] = cascade
+
+    def test_label_stays_on_fast_tier(self, app, client, png_bytes):
+        fast, strong = backend_for(LABEL), backend_for(LABEL)
+        self.setup_app(app, two_tiers(fast, strong))
+
+        body = self.upload(client, png_bytes, tipo_documento='etiqueta_produto').get_json()
+        assert body['model'] == {'id': 'fast-model', 'tier': 0, 'escalations': []}
+        assert (fast.calls, strong.calls, app.extensions['model_backend'].calls) == (1, 0, 0)
+
+    def test_inconsistent_output_escalates(self, app, client, png_bytes):
+        wrong = invoice()
+        wrong['itens'][0]['valor_total_item'] = 99.0
+        fast, strong = backend_for(wrong), backend_for(invoice())
+        self.setup_app(app, two_tiers(fast, strong))
+
+        body = self.upload(client, png_bytes).get_json()
+        assert body['extracted_data']['itens'][0]['valor_total_item'] == 10.0
+        assert body['model']['id'] == 'strong-model'
+        assert body['model']['escalations'] == [
+            {'model': 'fast-model', 'reasons': ['item_total', 'document_total']}
+        ]
+        assert (fast.calls, strong.calls) == (1, 1)
+
+        stats = client.get('/cascade').get_json()
+        assert stats['enabled'] is True
+        assert stats['documents'] == 1
+        fast_stats, strong_stats = stats['tiers']
+        assert (fast_stats['calls'], fast_stats['escalated'], fast_stats['hit_rate']) == (1, 1, 0.0)
+        assert (strong_stats['calls'], strong_stats['accepted'], strong_stats['hit_rate']) == (1, 1, 1.0)
+        assert strong_stats['cost_usd'] > fast_stats['cost_usd'] > 0
+        assert stats['escalation_reasons'] == {'item_total': 1, 'document_total': 1}
+
+    def test_route_by_document_type(self, app, client, png_bytes):
+        """Nota fiscal com rota para o nível 1 sobe mesmo com a saída válida do nível 0"""
+        fast, strong = backend_for(invoice()), backend_for(invoice())
+        self.setup_app(app, two_tiers(fast, strong, routes={'nota_fiscal': 1}))
+
+        body = self.upload(client, png_bytes).get_json()
+        assert body['model']['escalations'] == [{'model': 'fast-model', 'reasons': ['route:nota_fiscal']}]
+
+        body = self.upload(client, png_bytes, tipo_documento='nota_fiscal').get_json()
+        assert body['model'] == {'id': 'strong-model', 'tier': 1, 'escalations': []}
+        assert (fast.calls, strong.calls) == (1, 2)
+
+    def test_disabled(self, client):
+        assert client.get('/cascade').get_json()['enabled'] is False
@@ -0,0 +1,131 @@
+"""
+Testes do registro de clientes, dos imports adiados e do endpoint /ready
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+import pytest
+from app.clients import ClientRegistry
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+class FlakyBackend:
+    """Backend cuja inicialização falha nas primeiras `failures` tentativas"""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+
+    def warm(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise ConnectionError('metadata server indisponível')
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timeout'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fake_app(app):
+    app.extensions['model_backend'] = FakeModelBackend()
+    app.extensions['storage_backend'] = InMemoryStorageBackend()
+    return app
+
+
+class TestClientRegistry:
+    """Aquecimento, recuperação e concorrência"""
+
+    def test_recovers_after_failures(self, fake_app):
+        """Falhas na inicialização são repetidas com backoff até o cliente ficar pronto"""
+        fake_app.extensions['model_backend'] = FlakyBackend(failures=2)
+        registry = ClientRegistry(fake_app, retry_initial=0.01, retry_max=0.02)
+
+        assert registry.warm() is False
+        status = registry.status()
+        assert status['model_backend']['status'] == 'failed'
+        assert 'metadata server' in status['model_backend']['error']
+        assert status['storage_backend']['status'] == 'ready'
+
+        registry.start_warmup()
+        wait_until(lambda: registry.ready)
+        assert registry.status()['model_backend']['attempts'] == 3
+
+    def test_concurrent_warmup_initializes_once(self, fake_app):
+        """Vários threads pedindo aquecimento inicializam cada cliente uma única vez"""
+        backend = FlakyBackend(delay=0.05)
+        fake_app.extensions['model_backend'] = backend
+        registry = ClientRegistry(fake_app)
+
+        threads = [threading.Thread(target=registry.warm) for _ in range(8)]
+        threads += [threading.Thread(target=registry.start_warmup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wait_until(lambda: registry.ready)
+        assert backend.calls == 1
+
+    def test_warm_pays_fake_init_cost_outside_request(self, fake_app):
+        """Depois do aquecimento a primeira chamada ao modelo falso não paga a inicialização"""
+        backend = FakeModelBackend(init_latency=200)
+        fake_app.extensions['model_backend'] = backend
+        assert ClientRegistry(fake_app).warm() is True
+
+        started = time.perf_counter()
+        backend.generate_content(['prompt'])
+        assert time.perf_counter() - started < 0.1
+
+
+class TestLazyImports:
+    """SDKs pesados ficam fora do boot e são carregados pelo aquecimento"""
+
+    def test_boot_does_not_import_heavy_sdks(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, MODEL_BACKEND='fake', STORAGE_BACKEND='memory', FLASK_ENV='testing')
+        code = ("import sys, main; print(','.join(m for m in ('vertexai', 'google.cloud.storage', 'pypdf') "
+                "if m in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, env=env,
+                                capture_output=True, text=True, timeout=60, check=True).stdout
+        assert output.strip().splitlines()[-1:] in ([], [''])
+
+    def test_warmup_preloads_modules(self, fake_app):
+        registry = ClientRegistry(fake_app, modules=('pypdf', 'modulo_inexistente'))
+        assert registry.warm() is False
+        status = registry.status()
+        assert status['imports']['status'] == 'failed'
+        assert 'modulo_inexistente' in status['imports']['error']
+        assert 'pypdf' in sys.modules
+
+        registry.modules = ('pypdf',)
+        assert registry.warm() is True
+
+
+class TestReadiness:
+    """Testes do /ready, separado do /health"""
+
+    def test_ready_after_warmup(self, fake_app):
+        fake_app.extensions['model_backend'] = FlakyBackend(delay=0.2)
+        client = fake_app.test_client()
+
+        response = client.get('/ready')
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'warming'
+        assert client.get('/health').status_code == 200
+
+        wait_until(lambda: client.get('/ready').status_code == 200)
+        assert client.get('/ready').get_json()['clients']['model_backend']['status'] == 'ready'
+
+    def test_warmup_disabled(self, fake_app):
+        """Sem aquecimento os clientes são criados sob demanda e a prontidão não espera por eles"""
+        fake_app.config['CLIENT_WARMUP_ENABLED'] = False
+        assert fake_app.test_client().get('/ready').status_code == 200
+        assert fake_app.extensions['client_registry']._thread is None
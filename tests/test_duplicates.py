@@ -0,0 +1,218 @@
+"""
+Testes da detecção de documentos quase duplicados
+"""
+import io
+import json
+import random
+import sqlite3
+import time
+import pytest
+from PIL import Image, ImageDraw
+from app.aggregates import Aggregates
+from app.duplicates import DuplicateIndex, MultiIndexHash, hamming, perceptual_hash, to_signed, to_unsigned
+from app.model_backends import FakeModelBackend, DEFAULT_FAKE_RESPONSE
+from app.results import ResultStore
+from app.storage_backends import InMemoryStorageBackend
+from tests.conftest import make_png
+
+
+def blocks_png(seed=0, size=(96, 64)):
+    """Imagem de blocos com tons aleatórios (documentos distintos para o hash)"""
+    rng = random.Random(seed)
+    grid = Image.frombytes('L', (12, 8), bytes(rng.randrange(256) for _ in range(96)))
+    output = io.BytesIO()
+    grid.resize(size, Image.Resampling.NEAREST).save(output, format='PNG')
+    return output.getvalue()
+
+
+def form_png(numero, items, seed=0):
+    """Nota no formulário fixo de um fornecedor: muda só o número e as linhas de itens"""
+    rng = random.Random(seed)
+    image = Image.new('L', (620, 877), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 600, 100), outline=0, width=3)
+    draw.text((30, 30), 'DISTRIBUIDORA EXEMPLO LTDA  CNPJ 12.345.678/0001-90', fill=0)
+    draw.text((30, 60), f'NF-e {numero}  15/03/2024', fill=0)
+    draw.rectangle((20, 120, 600, 750), outline=0, width=2)
+    for row in range(items):
+        draw.text((30, 130 + row * 15), f'P{rng.randint(1000, 9999)}  Produto {row}  {rng.randint(1, 99)} UN', fill=0)
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def reencode(data, size=None, quality=70):
+    """Mesma imagem salva de novo como JPEG (outro sha256), opcionalmente redimensionada"""
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    if size:
+        image = image.resize(size)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def record(index, phash=None, duplicate_of=None, **fields):
+    return {'sha256': f'{index:064x}', 'filename': f'{index}.png', 'prompt_version': 'auto@1',
+            'created_at': time.time(), 'phash': phash, 'duplicate_of': duplicate_of,
+            'data': dict(DEFAULT_FAKE_RESPONSE, **fields)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / 'results.db'), flush_interval=0.01)
+
+
+class TestPerceptualHash:
+    """dHash de 64 bits"""
+
+    def test_tolerates_reencoding_and_resizing(self):
+        original = blocks_png()
+        phash = perceptual_hash(original)
+        assert hamming(phash, perceptual_hash(reencode(original))) <= 4
+        assert hamming(phash, perceptual_hash(reencode(original, size=(192, 128)))) <= 4
+        assert hamming(phash, perceptual_hash(blocks_png(seed=2))) > 16
+
+    def test_small_images_are_not_hashed(self):
+        assert perceptual_hash(make_png(4, 4)) is None
+
+    def test_signed_round_trip(self):
+        for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+            assert -2 ** 63 <= to_signed(value) < 2 ** 63
+            assert to_unsigned(to_signed(value)) == value
+
+
+class TestMultiIndexHash:
+    """Busca por raio equivalente à varredura linear"""
+
+    def test_matches_linear_scan(self):
+        rng = random.Random(3)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        # Vizinhos próximos de alguns valores para haver resultados dentro do raio
+        values += [v ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for v in values[:100]]
+        index = MultiIndexHash(radius=6)
+        for ref, value in enumerate(values):
+            index.add(value, ref)
+
+        for query in values[:50] + [rng.getrandbits(64) for _ in range(20)]:
+            expected = sorted((hamming(query, v), ref) for ref, v in enumerate(values) if hamming(query, v) <= 6)
+            assert index.search(query) == expected
+
+
+class TestDuplicateIndex:
+    """Índice em memória e carga a partir do banco de resultados"""
+
+    def test_check_registers_and_skips_same_content(self):
+        index = DuplicateIndex(max_distance=4)
+        assert index.check(0b1111, 'a') is None
+        assert index.check(0b1111, 'a') is None
+        assert index.check(0b0111, 'b') == {'sha256': 'a', 'distance': 1}
+        assert index.check(0xFFFF0000, 'c') is None
+        assert index.size == 3
+
+    def test_loads_persisted_hashes(self, store):
+        store.write_batch([record(1, phash=to_signed(2 ** 64 - 1)),
+                           record(2, phash=5, duplicate_of=f'{1:064x}'), record(3)])
+        index = DuplicateIndex(max_distance=2, store=store, refresh_interval=0)
+        assert index.size == 1
+        assert index.check(2 ** 64 - 2, 'new')['sha256'] == f'{1:064x}'
+
+        store.write_batch([record(4, phash=0)])
+        assert index.check(1, 'other')['sha256'] == f'{4:064x}'
+
+    def test_migrates_existing_database(self, tmp_path):
+        """Bancos criados antes das colunas phash/duplicate_of recebem ALTER TABLE"""
+        path = str(tmp_path / 'old.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE documents (id INTEGER PRIMARY KEY, sha256 TEXT NOT NULL UNIQUE,'
+                     ' filename TEXT, tipo_documento TEXT, numero_documento TEXT, data_emissao TEXT,'
+                     ' fornecedor TEXT, cnpj_fornecedor TEXT, valor_total_documento REAL,'
+                     ' prompt_version TEXT, created_at REAL NOT NULL, data TEXT NOT NULL)')
+        conn.close()
+        store = ResultStore(path)
+        store.write_batch([record(1, phash=7)])
+        assert store.get_by_sha256(f'{1:064x}')['duplicate_of'] is None
+
+
+class TestAggregatesSkipDuplicates:
+    """Duplicatas confirmadas não contam de novo no estoque nem nos gastos"""
+
+    def test_incremental_and_rebuild(self, store):
+        aggregates = Aggregates(store)
+        store.write_batch([record(1), record(2, duplicate_of=f'{1:064x}')])
+        assert aggregates.stock('P0003')['quantidade_entrada'] == 3
+        assert aggregates.financial_summary()['documentos'] == 1
+        aggregates.rebuild()
+        assert aggregates.stock('P0003')['quantidade_entrada'] == 3
+        assert aggregates.financial_summary()['documentos'] == 1
+
+
+class TestUploadDuplicates:
+    """Fluxo do /upload-invoice com documentos repetidos"""
+
+    @pytest.fixture
+    def duplicates_app(self, app, store):
+        app.extensions['result_store'] = store
+        app.extensions['aggregates'] = Aggregates(store)
+        app.extensions['duplicate_index'] = DuplicateIndex(store=store)
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        return app
+
+    def upload(self, app, data, filename):
+        response = app.test_client().post('/upload-invoice', data={
+            'image': (io.BytesIO(data), filename)
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        if app.extensions['result_store'] is not None:
+            app.extensions['result_store'].flush()
+        return response.get_json()
+
+    def test_flag_mode_confirms_by_document_number(self, duplicates_app):
+        """Modo flag: o modelo é chamado e a duplicata é gravada com duplicate_of"""
+        original = blocks_png()
+        assert 'duplicate' not in self.upload(duplicates_app, original, 'nota.png')
+        body = self.upload(duplicates_app, reencode(original), 'nota.jpg')
+
+        assert body['duplicate']['kind'] == 'document_number'
+        assert duplicates_app.extensions['model_backend'].calls == 2
+        documents, _ = duplicates_app.extensions['result_store'].query()
+        assert [doc['duplicate_of'] is None for doc in documents] == [False, True]
+        assert duplicates_app.extensions['aggregates'].stock('P0001')['quantidade_entrada'] == 1
+
+    def test_skip_mode_does_not_store_confirmed_duplicate(self, duplicates_app):
+        """Modo skip: o modelo é chamado e a duplicata confirmada não é gravada de novo"""
+        duplicates_app.config['DUPLICATE_DETECTION'] = 'skip'
+        original = blocks_png()
+        self.upload(duplicates_app, original, 'nota.png')
+        body = self.upload(duplicates_app, reencode(original, size=(192, 128)), 'nota.jpg')
+
+        assert body['duplicate']['kind'] == 'document_number'
+        assert body['duplicate']['distance'] <= 4
+        assert duplicates_app.extensions['model_backend'].calls == 2
+        assert len(duplicates_app.extensions['result_store'].query()[0]) == 1
+        assert duplicates_app.extensions['aggregates'].stock('P0001')['quantidade_entrada'] == 1
+
+    @pytest.mark.parametrize('mode', ['flag', 'skip'])
+    def test_same_layout_is_not_a_duplicate(self, duplicates_app, mode):
+        """Notas diferentes no mesmo formulário têm o mesmo dHash, mas não são duplicatas"""
+        duplicates_app.config['DUPLICATE_DETECTION'] = mode
+        first, second = form_png('000123', items=3), form_png('000987', items=6, seed=1)
+        assert hamming(perceptual_hash(first), perceptual_hash(second)) <= 4
+
+        backend = duplicates_app.extensions['model_backend']
+        self.upload(duplicates_app, first, 'a.png')
+        backend.responses = [{'text': json.dumps(dict(DEFAULT_FAKE_RESPONSE, numero_documento='000987')),
+                              'weight': 1}]
+        body = self.upload(duplicates_app, second, 'b.png')
+
+        assert 'duplicate' not in body
+        assert body['extracted_data']['numero_documento'] == '000987'
+        assert backend.calls == 2
+        documents, _ = duplicates_app.extensions['result_store'].query()
+        assert [doc['duplicate_of'] for doc in documents] == [None, None]
+
+    def test_different_documents_are_not_flagged(self, duplicates_app):
+        self.upload(duplicates_app, blocks_png(), 'a.png')
+        duplicates_app.extensions['model_backend'].responses = [{'text': (
+            '{"tipo_documento": "Nota Fiscal", "numero_documento": "999", "itens": []}'), 'weight': 1}]
+        assert 'duplicate' not in self.upload(duplicates_app, blocks_png(seed=2), 'b.png')
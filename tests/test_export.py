@@ -0,0 +1,98 @@
+"""
+Testes da exportação em massa (NDJSON, CSV e Parquet)
+"""
+import io
+import csv
+import json
+import pytest
+from app.export import FLAT_COLUMNS, export_chunks
+from app.results import ResultStore
+from tests.test_results import record
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.write_batch([record(i, data_emissao=f'{i % 28 + 1:02d}/03/2024') for i in range(1, 26)])
+    store.write_batch([record(100, itens=[], cnpj_fornecedor='99.999.999/0001-99')])
+    duplicate = record(101)
+    duplicate['duplicate_of'] = f'{1:064x}'
+    store.write_batch([duplicate])
+    return store
+
+
+def read(chunks):
+    return ''.join(chunks)
+
+
+class TestIterDocuments:
+    """Leitura em lotes por id"""
+
+    def test_batches_cover_everything_in_order(self, store):
+        ids = [document[0] for document, _ in store.iter_documents(batch_size=7)]
+        assert ids == list(range(1, 28))
+        ids = [document[0] for document, _ in store.iter_documents(batch_size=7, duplicates=False)]
+        assert ids == list(range(1, 27))
+
+
+class TestFormats:
+    """Conteúdo de cada formato"""
+
+    def test_ndjson_nests_items(self, store):
+        lines = read(export_chunks(store, 'ndjson', batch_size=4, duplicates=False)).splitlines()
+        assert len(lines) == 26
+        first = json.loads(lines[0])
+        assert first['numero_documento'] == '1'
+        assert [item['codigo_produto'] for item in first['itens']] == ['P0001', 'P0002', 'P0003', 'P0004', 'P0005']
+        assert json.loads(lines[-1])['itens'] == []
+
+    def test_csv_one_row_per_item(self, store):
+        rows = list(csv.reader(io.StringIO(read(export_chunks(store, 'csv', cnpj_fornecedor='12345678000190')))))
+        assert tuple(rows[0]) == FLAT_COLUMNS
+        assert len(rows) == 1 + 26 * 5
+        assert rows[1][FLAT_COLUMNS.index('quantidade')] == '1.0'
+
+    def test_csv_filters(self, store):
+        text = read(export_chunks(store, 'csv', data_inicio='2024-03-10', data_fim='2024-03-11',
+                                  duplicates=False))
+        numbers = {row['numero_documento'] for row in csv.DictReader(io.StringIO(text))}
+        assert numbers == {'9', '10'}
+
+    def test_parquet_row_groups(self, store):
+        pq = pytest.importorskip('pyarrow.parquet')
+        data = b''.join(export_chunks(store, 'parquet', batch_size=5, row_group_size=40))
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        assert parquet.metadata.num_rows == 26 * 5 + 1
+        assert parquet.metadata.num_row_groups == 4
+        table = parquet.read()
+        assert table.column_names == list(FLAT_COLUMNS)
+        assert table.column('valor_total_item').to_pylist()[:3] == [10.0, 20.0, 30.0]
+
+
+class TestExportEndpoint:
+    """Testes do GET /export"""
+
+    @pytest.fixture
+    def export_app(self, app, store):
+        app.extensions['result_store'] = store
+        return app
+
+    def test_streams_ndjson(self, export_app):
+        response = export_app.test_client().get('/export?format=ndjson&numero_documento=3')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.headers['Content-Disposition'] == 'attachment; filename=documentos.ndjson'
+        assert [json.loads(line)['numero_documento'] for line in response.get_data(as_text=True).splitlines()] == ['3']
+
+    def test_duplicates_opt_in(self, export_app):
+        client = export_app.test_client()
+        assert len(client.get('/export?format=ndjson').get_data().splitlines()) == 26
+        assert len(client.get('/export?format=ndjson&duplicatas=1').get_data().splitlines()) == 27
+
+    @pytest.mark.parametrize('query', ['format=xml', 'data_inicio=ontem'])
+    def test_invalid_parameters(self, export_app, query):
+        assert export_app.test_client().get(f'/export?{query}').status_code == 400
+
+    def test_disabled_store(self, client):
+        assert client.get('/export').status_code == 503
+
@@ -0,0 +1,73 @@
+"""
+Testes da configuração do gunicorn (perfis de worker)
+"""
+import os
+import sys
+import runpy
+import pytest
+from types import SimpleNamespace
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics_env(monkeypatch):
+    """O arquivo de configuração define PROMETHEUS_MULTIPROC_DIR; não vazar para os outros testes"""
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR', raising=False)
+
+
+def load_conf():
+    return runpy.run_path(CONF_PATH)
+
+
+class TestWorkerProfile:
+    """Perfil de concorrência lido do ambiente"""
+
+    def test_default_is_threaded(self, monkeypatch):
+        for name in ('GUNICORN_WORKER_CLASS', 'GUNICORN_WORKERS', 'GUNICORN_THREADS', 'GUNICORN_BIND', 'PORT'):
+            monkeypatch.delenv(name, raising=False)
+        conf = load_conf()
+        assert conf['worker_class'] == 'gthread'
+        assert conf['workers'] * conf['threads'] >= 32
+        assert conf['bind'] == '0.0.0.0:8080'
+
+    def test_environment_overrides(self, monkeypatch):
+        monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gevent')
+        monkeypatch.setenv('GUNICORN_WORKERS', '1')
+        monkeypatch.setenv('GUNICORN_WORKER_CONNECTIONS', '500')
+        monkeypatch.setenv('PORT', '9000')
+        conf = load_conf()
+        assert (conf['worker_class'], conf['workers'], conf['worker_connections']) == ('gevent', 1, 500)
+        assert conf['bind'] == '0.0.0.0:9000'
+
+    def test_grpc_hook_only_for_gevent(self, monkeypatch):
+        """Fora do gevent o hook não toca no gRPC"""
+        calls = []
+        monkeypatch.setitem(sys.modules, 'grpc.experimental.gevent',
+                            SimpleNamespace(init_gevent=lambda: calls.append(True)))
+        conf = load_conf()
+        conf['post_worker_init'](SimpleNamespace(cfg=SimpleNamespace(worker_class_str='gthread'),
+                                                 wsgi=SimpleNamespace()))
+        assert calls == []
+
+    def test_worker_boot_starts_warmup(self):
+        """post_worker_init começa a aquecer os clientes da aplicação carregada"""
+        started = []
+        registry = SimpleNamespace(start_warmup=lambda: started.append(True))
+        app = SimpleNamespace(extensions={'client_registry': registry}, config={'CLIENT_WARMUP_ENABLED': True})
+        load_conf()['post_worker_init'](SimpleNamespace(cfg=SimpleNamespace(worker_class_str='gthread'), wsgi=app))
+        assert started == [True]
+
+
+class TestJobStoreCheck:
+    """Store de jobs local ao processo não sobe com vários workers"""
+
+    def test_memory_store_requires_single_worker(self, monkeypatch):
+        check = load_conf()['check_job_store']
+        monkeypatch.setenv('JOB_STORE_URL', 'memory://')
+        check(1)
+        with pytest.raises(RuntimeError, match='JOB_STORE_URL'):
+            check(2)
+
+        monkeypatch.delenv('JOB_STORE_URL')
+        check(4)
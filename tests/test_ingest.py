@@ -0,0 +1,108 @@
+"""
+Testes da leitura de uploads em passagem única
+"""
+import io
+import hashlib
+from unittest.mock import patch, MagicMock
+from werkzeug.datastructures import FileStorage
+from app.ingest import ingest_upload, UploadedDocument
+from vertexai.preview.generative_models import Part
+from app import pipeline
+
+
+class CountingStream(io.BytesIO):
+    """Stream que proíbe seek e conta leituras"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+    def seek(self, *args):
+        raise AssertionError('ingest_upload não deve reposicionar o stream')
+
+
+class TestIngestUpload:
+    """Testes de validação e leitura em uma passagem"""
+
+    def test_single_pass_hash_and_mime(self, app, png_bytes):
+        """Lê cada byte uma vez e calcula hash e MIME"""
+        stream = CountingStream(png_bytes)
+        with app.app_context():
+            result = ingest_upload(FileStorage(stream, 'nota.png'), chunk_size=8)
+
+        assert result['valid']
+        document = result['document']
+        assert stream.bytes_read == len(png_bytes)
+        assert document.data == png_bytes
+        assert document.sha256 == hashlib.sha256(png_bytes).hexdigest()
+        assert document.mime_type == 'image/png'
+
+    def test_rejects_oversized_without_reading_all(self, app, png_bytes):
+        """Aborta assim que o limite é ultrapassado"""
+        data = png_bytes + b'\0' * 4096
+        stream = CountingStream(data)
+        with app.app_context():
+            result = ingest_upload(FileStorage(stream, 'nota.png'), max_size=1024, chunk_size=512)
+
+        assert not result['valid']
+        assert 'grande' in result['error']
+        assert stream.bytes_read < len(data)
+
+    def test_rejects_disallowed_content(self, app):
+        """Conteúdo que não é imagem/PDF é recusado"""
+        with app.app_context():
+            result = ingest_upload(FileStorage(io.BytesIO(b'MZ\x90\x00' * 64), 'nota.png'))
+        assert not result['valid']
+
+    def test_rejects_empty(self, app):
+        """Arquivo vazio é recusado"""
+        with app.app_context():
+            result = ingest_upload(FileStorage(io.BytesIO(b''), 'nota.png'))
+        assert not result['valid']
+        assert 'vazio' in result['error']
+
+
+class TestDocumentPart:
+    """Testes da escolha entre envio inline e via GCS"""
+
+    def test_small_document_goes_inline(self, app):
+        """Abaixo do limite, nada é enviado ao GCS no caminho crítico"""
+        app.config['INLINE_MAX_BYTES'] = 1024
+        app.config['ARCHIVE_INLINE_UPLOADS'] = False
+        document = UploadedDocument(b'x' * 10, 'a.png', 'image/png', 'ab' * 32)
+        with app.app_context(), \
+                patch.object(pipeline, 'store_document') as store, \
+                patch.object(Part, 'from_data') as from_data:
+            pipeline.document_part(document)
+        store.assert_not_called()
+        from_data.assert_called_once_with(document.data, mime_type='image/png')
+
+    def test_large_document_goes_through_gcs(self, app):
+        """Acima do limite, o documento é enviado da memória ao GCS"""
+        app.config['INLINE_MAX_BYTES'] = 4
+        document = UploadedDocument(b'x' * 10, 'a.png', 'image/png', 'ab' * 32)
+        backend = MagicMock(model_readable=True)
+        backend.put.return_value = 'gs://bucket/obj'
+        app.extensions['storage_backend'] = backend
+        with app.app_context(), patch.object(Part, 'from_uri') as from_uri:
+            pipeline.document_part(document)
+
+        name, data = backend.put.call_args.args
+        assert name == 'invoices/abababababababab_a.png'
+        assert data is document.data
+        from_uri.assert_called_once_with('gs://bucket/obj', mime_type='image/png')
+
+    def test_local_backend_always_inline(self, app):
+        """Backends que o Gemini não lê forçam o envio inline"""
+        app.config['INLINE_MAX_BYTES'] = 4
+        app.config['ARCHIVE_INLINE_UPLOADS'] = False
+        document = UploadedDocument(b'x' * 10, 'a.png', 'image/png', 'ab' * 32)
+        with app.app_context(), patch.object(Part, 'from_data') as from_data:
+            app.extensions['storage_backend'].model_readable = False
+            pipeline.document_part(document)
+        from_data.assert_called_once()
@@ -0,0 +1,236 @@
+"""
+Testes do modo assíncrono de upload
+"""
+import io
+import json
+import time
+import threading
+import pytest
+import redis
+from unittest.mock import patch
+from app.ingest import UploadedDocument
+from app.keystore import ApiKeyStore, hash_api_key
+from app.jobs import (
+    InMemoryJobStore,
+    SQLiteJobStore,
+    RedisJobStore,
+    JobManager,
+    JobQueueFull,
+    create_job_store,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_RUNNING,
+)
+
+
+def make_document(data=b'x', filename='a.png'):
+    """Documento validado para enfileirar"""
+    return UploadedDocument(data, filename, 'image/png', 'hash')
+
+
+def wait_for_job(manager, job_id, timeout=5):
+    """Aguarda o job terminar"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in (JOB_DONE, JOB_FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('Job não terminou a tempo')
+
+
+class FakeRedis:
+    """Redis mínimo em memória com WATCH/MULTI: o EXEC falha se a chave observada mudou"""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        # Chamado uma vez antes do próximo EXEC (simula a escrita de outro worker)
+        self.before_exec = None
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.watched = {}
+        self.commands = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        self.watched[key] = self.client.versions.get(key, 0)
+
+    def unwatch(self):
+        self.watched = {}
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        self.commands = []
+
+    def set(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+    def execute(self):
+        hook, self.client.before_exec = self.client.before_exec, None
+        if hook is not None:
+            hook()
+        commands, watched = self.commands, self.watched
+        self.commands, self.watched = None, {}
+        if any(self.client.versions.get(key, 0) != version for key, version in watched.items()):
+            raise redis.WatchError()
+        for args, kwargs in commands:
+            self.client.set(*args, **kwargs)
+
+
+class TestJobStores:
+    """Testes dos stores de estado"""
+
+    @pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+    def test_create_update_get(self, kind, tmp_path):
+        """Ciclo básico de criação e atualização"""
+        if kind == 'memory':
+            store = InMemoryJobStore()
+        else:
+            store = SQLiteJobStore(str(tmp_path / 'jobs.db'))
+
+        store.create({'id': 'j1', 'status': 'queued', 'updated_at': time.time()})
+        store.update('j1', status='done', result={'ok': True})
+
+        job = store.get('j1')
+        assert job['status'] == 'done'
+        assert job['result'] == {'ok': True}
+        assert store.get('missing') is None
+
+    @pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+    def test_late_update_does_not_reopen_finished_job(self, kind, tmp_path):
+        """Atualização 'running' atrasada não sobrescreve um job já concluído"""
+        store = InMemoryJobStore() if kind == 'memory' else SQLiteJobStore(str(tmp_path / 'jobs.db'))
+        store.create({'id': 'j1', 'status': 'queued', 'updated_at': time.time()})
+        store.update('j1', status=JOB_DONE, result={'ok': True})
+        store.update('j1', status=JOB_RUNNING)
+        assert store.get('j1')['status'] == JOB_DONE
+
+    def test_redis_update_is_atomic(self):
+        """Escrita de outro worker entre o GET e o SET refaz a atualização sobre o novo estado"""
+        store = RedisJobStore('redis://localhost:6379/0')
+        store.client = FakeRedis()
+        store.create({'id': 'j1', 'status': 'queued', 'updated_at': time.time()})
+        key = store.prefix + 'j1'
+
+        def finish():
+            job = json.loads(store.client.get(key))
+            store.client.set(key, json.dumps(dict(job, status=JOB_DONE, result={'ok': True})))
+
+        store.client.before_exec = finish
+        store.update('j1', status=JOB_RUNNING)
+        assert store.get('j1')['status'] == JOB_DONE
+
+        store.client.before_exec = lambda: store.client.set(key, json.dumps(dict(store.get('j1'), seen=True)))
+        store.update('j1', notified=True)
+        job = store.get('j1')
+        assert (job['status'], job['result'], job['seen'], job['notified']) == (JOB_DONE, {'ok': True}, True, True)
+
+    def test_sqlite_shared_between_instances(self, tmp_path):
+        """Dois processos (instâncias) enxergam o mesmo job"""
+        path = str(tmp_path / 'jobs.db')
+        SQLiteJobStore(path).create({'id': 'j1', 'status': 'queued', 'updated_at': time.time()})
+        assert SQLiteJobStore(path).get('j1')['status'] == 'queued'
+
+    def test_store_from_url(self, tmp_path):
+        """Seleção do store pela URL"""
+        assert isinstance(create_job_store('memory://'), InMemoryJobStore)
+        assert isinstance(create_job_store(f'sqlite:///{tmp_path}/j.db'), SQLiteJobStore)
+        with pytest.raises(ValueError):
+            create_job_store('ftp://nope')
+
+
+class TestJobManager:
+    """Testes do executor de jobs"""
+
+    def test_queue_full_rejects(self, app):
+        """Fila cheia levanta JobQueueFull"""
+        release = threading.Event()
+
+        def slow(*args):
+            release.wait(5)
+            return {'message': 'ok'}, 200
+
+        manager = JobManager(app, InMemoryJobStore(), max_workers=1, max_pending=1)
+        with patch('app.pipeline.process_document', side_effect=slow):
+            job = manager.submit(make_document())
+            with pytest.raises(JobQueueFull):
+                manager.submit(make_document(b'y', 'b.png'))
+            release.set()
+            assert wait_for_job(manager, job['id'])['status'] == JOB_DONE
+        manager.shutdown()
+
+    def test_failure_is_recorded(self, app):
+        """Exceções no pipeline marcam o job como falho"""
+        manager = JobManager(app, InMemoryJobStore(), max_workers=1, max_pending=2)
+        with patch('app.pipeline.process_document', side_effect=RuntimeError('boom')):
+            job = manager.submit(make_document())
+            job = wait_for_job(manager, job['id'])
+        assert job['status'] == JOB_FAILED
+        assert job['http_status'] == 500
+        manager.shutdown()
+
+
+class TestAsyncEndpoints:
+    """Testes dos endpoints assíncronos"""
+
+    def test_async_upload_returns_202_and_result(self, app, client, png_bytes):
+        """POST assíncrono retorna 202 e o resultado fica disponível em /jobs/<id>"""
+        payload = {'message': 'ok', 'extracted_data': {'numero_documento': '1'}}
+        with patch('app.pipeline.process_document', return_value=(payload, 200)):
+            response = client.post('/upload-invoice?async=true', data={
+                'image': (io.BytesIO(png_bytes), 'nota.png')
+            }, content_type='multipart/form-data')
+
+            assert response.status_code == 202
+            job_id = response.get_json()['job_id']
+            assert response.headers['Location'].endswith(f'/jobs/{job_id}')
+            wait_for_job(app.extensions['job_manager'], job_id)
+
+        response = client.get(f'/jobs/{job_id}')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['status'] == JOB_DONE
+        assert data['result'] == payload
+
+    def test_job_visible_only_to_its_key(self, app, png_bytes, tmp_path):
+        """Outra chave de API não consulta o job (404, como um job inexistente)"""
+        path = tmp_path / 'keys.txt'
+        path.write_text(f'loja_01:{hash_api_key("k1")}\nloja_02:{hash_api_key("k2")}\n')
+        app.config['ENABLE_AUTH'] = True
+        app.extensions['api_keys'] = ApiKeyStore(key_file=str(path))
+        client = app.test_client()
+
+        with patch('app.pipeline.process_document', return_value=({'message': 'ok'}, 200)):
+            response = client.post('/upload-invoice?async=true', data={
+                'image': (io.BytesIO(png_bytes), 'nota.png')
+            }, content_type='multipart/form-data', headers={'Authorization': 'Bearer k1'})
+            job_id = response.get_json()['job_id']
+            assert wait_for_job(app.extensions['job_manager'], job_id)['owner'] == 'loja_01'
+
+        assert client.get(f'/jobs/{job_id}', headers={'Authorization': 'Bearer k1'}).status_code == 200
+        assert client.get(f'/jobs/{job_id}', headers={'Authorization': 'Bearer k2'}).status_code == 404
+
+    def test_unknown_job_returns_404(self, client):
+        """Job inexistente retorna 404"""
+        assert client.get('/jobs/does-not-exist').status_code == 404
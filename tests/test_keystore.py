@@ -0,0 +1,164 @@
+"""
+Testes do armazenamento de chaves de API
+"""
+import io
+import os
+import sqlite3
+import pytest
+from app.auth import User
+from app.keystore import ApiKeyStore, hash_api_key
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+def write_keys(path, lines):
+    path.write_text('\n'.join(lines) + '\n')
+    # Garante mtime diferente mesmo em sistemas de arquivos com baixa resolução
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestApiKeyStore:
+    """Verificação, formatos de hash e recarga"""
+
+    def test_file_keys_hashed_at_rest(self, tmp_path):
+        """Arquivo só com hashes; comentários e linhas vazias ignorados"""
+        path = tmp_path / 'keys.txt'
+        write_keys(path, ['# lojas', '', f'loja_01:{hash_api_key("k1")}', f'loja_02:{hash_api_key("k2")}'])
+        store = ApiKeyStore(key_file=str(path))
+
+        assert 'k1' not in path.read_text()
+        assert store.verify('k1') == 'loja_01'
+        assert store.verify('k2') == 'loja_02'
+        assert store.verify('k3') is None
+        assert store.verify('') is None
+
+    def test_salted_keys_cached_after_first_check(self, tmp_path, monkeypatch):
+        """Chave PBKDF2 é conferida uma vez; depois vem do LRU"""
+        path = tmp_path / 'keys.txt'
+        write_keys(path, [f'filial:{hash_api_key("f1.segredo", salted=True, iterations=1000)}'])
+        store = ApiKeyStore(key_file=str(path), cache_size=2)
+        checks = []
+        original = type(store._snapshot).verify
+        monkeypatch.setattr(type(store._snapshot), 'verify',
+                            lambda self, key, digest: checks.append(key) or original(self, key, digest))
+
+        assert store.verify('f1.segredo') == 'filial'
+        assert store.verify('f1.segredo') == 'filial'
+        assert store.verify('f1.errado') is None
+        assert store.verify('f1.errado') is None
+        assert checks == ['f1.segredo', 'f1.errado']
+
+        store.verify('f1.outro-1')
+        store.verify('f1.outro-2')
+        assert len(store._verified) == 2
+
+    def test_salted_token_checked_against_one_record(self, tmp_path, monkeypatch):
+        """Com várias chaves salgadas, o token custa no máximo um PBKDF2 (nenhum se o kid não existe)"""
+        path = tmp_path / 'keys.txt'
+        write_keys(path, [f'filial_{i}:{hash_api_key(f"f{i}.segredo-{i}", salted=True, iterations=1000)}'
+                          for i in range(5)] + ['antiga:pbkdf2_sha256$1000$sal$hash'])
+        store = ApiKeyStore(key_file=str(path))
+        checks = []
+        monkeypatch.setattr('app.keystore._check_pbkdf2', lambda key, stored: checks.append(stored) or False)
+
+        assert store.verify('f3.segredo-3') is None
+        assert len(checks) == 1 and checks[0].startswith('pbkdf2_sha256$f3$')
+        assert store.verify('aleatorio') is None
+        assert store.verify('zz.aleatorio') is None
+        assert len(checks) == 1
+        assert store.keys() == ['filial_0', 'filial_1', 'filial_2', 'filial_3', 'filial_4', 'antiga']
+
+    def test_salted_key_requires_key_id(self):
+        with pytest.raises(ValueError):
+            hash_api_key('segredo', salted=True, iterations=1000)
+
+    def test_hot_reload_from_file(self, tmp_path):
+        """Alteração do arquivo vale sem reiniciar; chave removida deixa de valer"""
+        path = tmp_path / 'keys.txt'
+        write_keys(path, [f'loja_01:{hash_api_key("k1")}'])
+        store = ApiKeyStore(key_file=str(path), reload_interval=0)
+        assert store.verify('k1') == 'loja_01'
+
+        write_keys(path, [f'loja_02:{hash_api_key("k2")}'])
+        assert store.verify('k2') == 'loja_02'
+        assert store.verify('k1') is None
+        assert store.generation == 2
+
+    def test_reload_interval_limits_checks(self, tmp_path):
+        """Dentro do intervalo a fonte não é consultada"""
+        path = tmp_path / 'keys.txt'
+        write_keys(path, [f'loja_01:{hash_api_key("k1")}'])
+        store = ApiKeyStore(key_file=str(path), reload_interval=3600)
+
+        write_keys(path, [f'loja_02:{hash_api_key("k2")}'])
+        assert store.verify('k2') is None
+        assert store.maybe_reload() is True
+        assert store.maybe_reload() is False
+        assert store.verify('k2') == 'loja_02'
+
+    def test_sqlite_source_and_broken_reload(self, tmp_path):
+        """Chaves ativas do SQLite; fonte ilegível mantém as chaves atuais"""
+        path = str(tmp_path / 'keys.db')
+        with sqlite3.connect(path) as connection:
+            connection.execute('CREATE TABLE api_keys (name TEXT PRIMARY KEY, key_hash TEXT, active INTEGER)')
+            connection.executemany('INSERT INTO api_keys VALUES (?, ?, ?)', [
+                ('loja_01', hash_api_key('k1'), 1),
+                ('loja_02', hash_api_key('k2'), 0),
+            ])
+        store = ApiKeyStore(key_db=path)
+        assert store.verify('k1') == 'loja_01'
+        assert store.verify('k2') is None
+
+        os.remove(path)
+        assert store.reload() is False
+        assert store.verify('k1') == 'loja_01'
+
+
+class TestAuthWithKeyStore:
+    """Autenticação das rotas com várias chaves"""
+
+    @pytest.fixture
+    def auth_app(self, app, tmp_path):
+        path = tmp_path / 'keys.txt'
+        write_keys(path, [f'loja_01:{hash_api_key("k1")}', f'loja_02:{hash_api_key("k2")}'])
+        app.config['ENABLE_AUTH'] = True
+        app.extensions['api_keys'] = ApiKeyStore(key_file=str(path))
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        return app
+
+    @pytest.mark.parametrize('header, status', [
+        ('Bearer k1', 200), ('k2', 200), ('Bearer k3', 401), (None, 401),
+    ])
+    def test_upload_requires_known_key(self, auth_app, png_bytes, header, status):
+        """Qualquer chave cadastrada autentica; as demais recebem 401"""
+        headers = {'Authorization': header} if header else {}
+        response = auth_app.test_client().post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data', headers=headers)
+        assert response.status_code == status
+
+    def test_key_verified_once_per_request(self, auth_app, png_bytes, monkeypatch):
+        """Limite de taxa e auth_required usam a mesma verificação da chave"""
+        store = auth_app.extensions['api_keys']
+        calls = []
+        original = store.verify
+        monkeypatch.setattr(store, 'verify', lambda token: calls.append(token) or original(token))
+
+        response = auth_app.test_client().post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data', headers={'Authorization': 'Bearer k1'})
+        assert response.status_code == 200
+        assert calls == ['k1']
+
+
+class TestUser:
+    """Usuário básico de login"""
+
+    def test_authenticate_checks_password(self):
+        """Senha errada não autentica"""
+        assert User.authenticate('admin', 'admin123').id == '1'
+        assert User.authenticate('admin', 'errada') is None
+        assert User.authenticate('outro', 'admin123') is None
+        assert User.get('1').username == 'admin'
@@ -0,0 +1,49 @@
+"""
+Testes do endpoint /metrics
+"""
+import io
+import os
+import sys
+import subprocess
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestMetricsEndpoint:
+    """Testes das métricas expostas"""
+
+    def test_metrics_after_upload(self, app, client, png_bytes):
+        """Upload alimenta histogramas de etapa, tamanho e tokens"""
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        body = response.get_data(as_text=True)
+        assert 'vision_stage_duration_seconds_bucket{le="0.001",stage="validate"}' in body
+        assert 'vision_stage_duration_seconds_count{stage="model"}' in body
+        assert 'vision_upload_size_bytes_count{endpoint="upload-invoice"}' in body
+        assert 'vision_gemini_tokens_total{kind="candidates"}' in body
+
+    def test_metrics_not_rate_limited(self, client):
+        """Scraping frequente não esgota o limite padrão"""
+        for _ in range(60):
+            assert client.get('/metrics').status_code == 200
+
+    def test_multiprocess_aggregation(self, tmp_path):
+        """Valores de vários processos são somados no /metrics"""
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=ROOT)
+        increment = 'from app.metrics import JSON_PARSE_FAILURES; JSON_PARSE_FAILURES.inc(3)'
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', increment], env=env, check=True)
+
+        render = 'from app.metrics import render_metrics; print(render_metrics()[0].decode())'
+        output = subprocess.run([sys.executable, '-c', render], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        assert 'vision_json_parse_failures_total 6.0' in output
@@ -0,0 +1,64 @@
+"""
+Testes do backend de modelo falso e do fluxo completo de upload
+"""
+import io
+import json
+import time
+import pytest
+from app.model_backends import FakeModelBackend, parse_latency_spec, DEFAULT_FAKE_RESPONSE
+from app.storage_backends import InMemoryStorageBackend
+
+
+class TestFakeModelBackend:
+    """Testes do backend falso"""
+
+    def test_deterministic_with_seed(self):
+        """Mesma seed produz a mesma sequência de respostas"""
+        responses = [{'text': 'a', 'weight': 1}, {'text': 'b', 'weight': 1}]
+        first = FakeModelBackend(responses=responses, seed=42)
+        second = FakeModelBackend(responses=responses, seed=42)
+        texts = [first.generate_content(['p']).text for _ in range(20)]
+        assert texts == [second.generate_content(['p']).text for _ in range(20)]
+        assert set(texts) == {'a', 'b'}
+
+    def test_latency_spec(self):
+        """Latência fixa é respeitada"""
+        backend = FakeModelBackend(latency='fixed:30')
+        start = time.perf_counter()
+        backend.generate_content(['p'])
+        assert time.perf_counter() - start >= 0.03
+
+    def test_invalid_latency_spec(self):
+        """Especificação desconhecida é recusada"""
+        with pytest.raises(ValueError):
+            parse_latency_spec('normal:10')
+
+    def test_injected_failures(self):
+        """failure_rate=1 sempre falha"""
+        with pytest.raises(RuntimeError):
+            FakeModelBackend(failure_rate=1.0).generate_content(['p'])
+
+    def test_stream_reassembles_text(self):
+        """Modo stream entrega o texto completo em pedaços"""
+        backend = FakeModelBackend(stream_chunk_size=10)
+        chunks = [r.text for r in backend.generate_content(['p'], stream=True)]
+        assert len(chunks) > 1
+        assert json.loads(''.join(chunks)) == DEFAULT_FAKE_RESPONSE
+
+
+class TestUploadWithFakeBackends:
+    """Fluxo completo de upload sem GCP"""
+
+    def test_upload_end_to_end(self, app, client, png_bytes):
+        """Upload percorre validação, armazenamento e extração"""
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['extracted_data'] == DEFAULT_FAKE_RESPONSE
+        assert 'Distribuidora Exemplo LTDA' in data['notification_summary']
@@ -0,0 +1,112 @@
+"""
+Testes da leitura tolerante da saída do modelo
+"""
+import io
+import json
+import pytest
+from app.parsing import ModelOutputError, parse_model_json
+from app.model_backends import FakeModelBackend, DEFAULT_FAKE_RESPONSE
+from app.storage_backends import InMemoryStorageBackend
+from app.metrics import MODEL_OUTPUT_PARSES
+
+VALID = json.dumps(DEFAULT_FAKE_RESPONSE, ensure_ascii=False)
+
+
+class TestParseModelJson:
+    """Testes do parser tolerante"""
+
+    def test_clean_json_is_not_repaired(self):
+        """JSON puro usa o caminho rápido"""
+        assert parse_model_json(VALID) == (DEFAULT_FAKE_RESPONSE, False)
+
+    def test_markdown_fence_and_prose(self):
+        """Cercas ```json e texto ao redor são descartados"""
+        text = f'Aqui está o resultado:\n```json\n{VALID}\n```\nQualquer dúvida, avise.'
+        assert parse_model_json(text) == (DEFAULT_FAKE_RESPONSE, True)
+
+    def test_trailing_commas_and_python_literals(self):
+        """Vírgulas sobrando e None/True/False são corrigidos"""
+        text = '{"numero_documento": "1", "observacoes_adicionais": None, "itens": [{"a": 1},],}'
+        data, repaired = parse_model_json(text)
+        assert repaired
+        assert data == {'numero_documento': '1', 'observacoes_adicionais': None, 'itens': [{'a': 1}]}
+
+    def test_literals_inside_strings_preserved(self):
+        """Palavras dentro de strings não são trocadas"""
+        text = '{"descricao": "None of the above", "itens": [],}'
+        data, _ = parse_model_json(text)
+        assert data['descricao'] == 'None of the above'
+
+    @pytest.mark.parametrize('value', ['Cabo True RMS', 'a,]', 'b, }', 'Cabo “flex” 2m', 'None'])
+    def test_repairs_skip_string_contents(self, value):
+        """Literais, vírgulas e aspas tipográficas dentro de strings ficam intactos"""
+        text = '{"descricao": ' + json.dumps(value, ensure_ascii=False) + ', "ok": True, "itens": [1,],}'
+        data, repaired = parse_model_json(text)
+        assert repaired
+        assert data == {'descricao': value, 'ok': True, 'itens': [1]}
+
+    def test_smart_quotes_as_delimiters(self):
+        """Aspas tipográficas no lugar das retas viram delimitadores JSON"""
+        data, _ = parse_model_json('{“descricao”: “Cabo True RMS”, “ok”: False}')
+        assert data == {'descricao': 'Cabo True RMS', 'ok': False}
+
+    def test_truncated_inside_string_keeps_contents(self):
+        """Saída cortada: vírgulas dentro da string aberta não são removidas"""
+        data, _ = parse_model_json('{"itens": [], "observacoes_adicionais": "faltam 2,]')
+        assert data['observacoes_adicionais'] == 'faltam 2,]'
+
+    def test_truncated_output_closed(self):
+        """Saída cortada no meio de um item é fechada"""
+        text = VALID[:VALID.index('Produto 3')]
+        data, repaired = parse_model_json(text)
+        assert repaired
+        assert data['fornecedor'] == 'Distribuidora Exemplo LTDA'
+        assert [item['codigo_produto'] for item in data['itens']][:2] == ['P0001', 'P0002']
+
+    @pytest.mark.parametrize('text', ['', 'sem json aqui', '[1, 2, 3]'])
+    def test_unrecoverable(self, text):
+        """Saída sem objeto JSON levanta ModelOutputError"""
+        with pytest.raises(ModelOutputError):
+            parse_model_json(text)
+
+
+class TestStructuredOutput:
+    """Modo de saída estruturada e reparo no fluxo de upload"""
+
+    def _upload(self, client, png_bytes):
+        return client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+    def test_generation_config_sent(self, app, client, png_bytes):
+        """Com MODEL_STRUCTURED_OUTPUT a chamada pede JSON ao modelo"""
+        backend = FakeModelBackend()
+        app.extensions['model_backend'] = backend
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        app.config['MODEL_STRUCTURED_OUTPUT'] = True
+
+        assert self._upload(client, png_bytes).status_code == 200
+        config = backend.last_generation_config.to_dict()
+        assert config['response_mime_type'] == 'application/json'
+
+    def test_plain_mode(self, app, client, png_bytes):
+        """Sem o modo estruturado nenhuma configuração é enviada"""
+        backend = FakeModelBackend()
+        app.extensions['model_backend'] = backend
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        app.config['MODEL_STRUCTURED_OUTPUT'] = False
+
+        assert self._upload(client, png_bytes).status_code == 200
+        assert backend.last_generation_config is None
+
+    def test_repaired_output_single_call(self, app, client, png_bytes):
+        """Saída com cercas é reparada sem nova chamada ao modelo"""
+        backend = FakeModelBackend(responses=[{'text': f'```json\n{VALID}\n```'}])
+        app.extensions['model_backend'] = backend
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        repaired = MODEL_OUTPUT_PARSES.labels('repaired')._value.get()
+
+        data = self._upload(client, png_bytes).get_json()
+        assert data['extracted_data'] == DEFAULT_FAKE_RESPONSE
+        assert backend.calls == 1
+        assert MODEL_OUTPUT_PARSES.labels('repaired')._value.get() == repaired + 1
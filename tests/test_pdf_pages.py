@@ -0,0 +1,142 @@
+"""
+Testes da divisão de PDFs e da combinação de resultados por página
+"""
+import io
+import json
+import hashlib
+import threading
+from pypdf import PdfWriter
+from app.ingest import UploadedDocument
+from app.pdf_pages import merge_page_results, split_pdf
+from app.model_backends import FakeResponse, ModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+def make_pdf(page_widths):
+    """PDF com uma página em branco por largura (larguras distintas = páginas distintas)"""
+    writer = PdfWriter()
+    for width in page_widths:
+        writer.add_blank_page(width, 800)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def make_document(data, filename='danfe.pdf'):
+    return UploadedDocument(data, filename, 'application/pdf', hashlib.sha256(data).hexdigest())
+
+
+def item(code, total):
+    return {'codigo_produto': code, 'descricao': f'Produto {code}', 'quantidade': 1,
+            'unidade': 'UN', 'valor_unitario': total, 'valor_total_item': total}
+
+
+class PageBackend(ModelBackend):
+    """Backend que responde conforme a página recebida (por hash do PDF inline)"""
+
+    model_id = 'page-model'
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        sha256 = hashlib.sha256(contents[1].inline_data.data).hexdigest()
+        with self._lock:
+            self.calls.append(sha256)
+        return FakeResponse(json.dumps(self.responses[sha256]))
+
+
+class TestSplitPdf:
+    """Testes da divisão em páginas"""
+
+    def test_split_per_page(self):
+        """Um documento por página, com nomes indicando o intervalo"""
+        parts = split_pdf(make_document(make_pdf([500, 510, 520])))
+        assert [p.filename for p in parts] == ['danfe_p1-1.pdf', 'danfe_p2-2.pdf', 'danfe_p3-3.pdf']
+        assert len({p.sha256 for p in parts}) == 3
+
+    def test_page_groups(self):
+        """Grupos de duas páginas"""
+        parts = split_pdf(make_document(make_pdf([500, 510, 520])), pages_per_part=2)
+        assert [p.filename for p in parts] == ['danfe_p1-2.pdf', 'danfe_p3-3.pdf']
+
+    def test_short_pdf_not_split(self):
+        """PDF de uma página não é dividido"""
+        assert split_pdf(make_document(make_pdf([500]))) is None
+
+    def test_unchanged_pages_keep_hash(self):
+        """Editar uma página não altera o hash das demais"""
+        original = split_pdf(make_document(make_pdf([500, 510, 520])))
+        edited = split_pdf(make_document(make_pdf([500, 515, 520])))
+        assert [a.sha256 == b.sha256 for a, b in zip(original, edited)] == [True, False, True]
+
+
+class TestMergePageResults:
+    """Testes da combinação dos resultados"""
+
+    def test_items_merged_and_deduplicated(self):
+        """Itens repetidos em outra página são descartados; na mesma página, mantidos"""
+        merged = merge_page_results([
+            {'itens': [item('A', 10.0), item('B', 5.0), item('B', 5.0)]},
+            {'itens': [item('B', 5.0), item('C', 7.5)]},
+        ])
+        assert [i['codigo_produto'] for i in merged['itens']] == ['A', 'B', 'B', 'C']
+
+    def test_header_reconciliation(self):
+        """Valor mais frequente prevalece e divergências viram observação"""
+        merged = merge_page_results([
+            {'numero_documento': '123', 'tipo_documento': 'Desconhecido', 'itens': []},
+            {'numero_documento': '123', 'tipo_documento': 'Nota Fiscal', 'itens': []},
+            {'numero_documento': '128', 'fornecedor': 'ACME', 'valor_total_documento': 30.0, 'itens': []},
+        ])
+        assert merged['numero_documento'] == '123'
+        assert merged['tipo_documento'] == 'Nota Fiscal'
+        assert merged['fornecedor'] == 'ACME'
+        assert merged['valor_total_documento'] == 30.0
+        assert 'numero_documento' in merged['observacoes_adicionais']
+
+    def test_total_from_items(self):
+        """Sem valor total em nenhuma página, usa a soma dos itens"""
+        merged = merge_page_results([{'itens': [item('A', 10.0)]}, {'itens': [item('B', 2.5)]}])
+        assert merged['valor_total_documento'] == 12.5
+
+
+class TestPdfUpload:
+    """PDF de várias páginas no endpoint de upload"""
+
+    def _setup(self, app, widths):
+        pdf = make_pdf(widths)
+        parts = split_pdf(make_document(pdf))
+        header = {'tipo_documento': 'Nota Fiscal', 'numero_documento': '42'}
+        responses = {p.sha256: dict(header, itens=[item(f'P{i}', 1.0 + i)]) for i, p in enumerate(parts)}
+        backend = PageBackend(responses)
+        app.extensions['model_backend'] = backend
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        return pdf, backend
+
+    def _upload(self, client, pdf):
+        return client.post('/upload-invoice', data={
+            'image': (io.BytesIO(pdf), 'danfe.pdf')
+        }, content_type='multipart/form-data')
+
+    def test_pages_extracted_and_merged(self, app, client):
+        """Uma chamada por página e um único documento combinado"""
+        pdf, backend = self._setup(app, [500, 510, 520])
+
+        data = self._upload(client, pdf).get_json()
+        assert len(backend.calls) == 3
+        assert [i['codigo_produto'] for i in data['extracted_data']['itens']] == ['P0', 'P1', 'P2']
+        assert data['extracted_data']['numero_documento'] == '42'
+        assert data['pages'] == {'parts': 3, 'cached': 0, 'failed': []}
+
+    def test_edited_pdf_reruns_changed_pages(self, app, client):
+        """Reenvio com uma página alterada só chama o modelo para ela"""
+        pdf, backend = self._setup(app, [500, 510, 520])
+        self._upload(client, pdf)
+
+        edited, edited_backend = self._setup(app, [500, 515, 520])
+        data = self._upload(client, edited).get_json()
+        assert len(edited_backend.calls) == 1
+        assert data['pages']['cached'] == 2
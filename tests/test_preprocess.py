@@ -0,0 +1,133 @@
+"""
+Testes do pré-processamento de imagens
+"""
+import io
+import random
+import hashlib
+from PIL import Image
+from app.ingest import UploadedDocument
+from app.preprocess import PreprocessOptions, preprocess_document
+from app.model_backends import FakeModelBackend
+from app.storage_backends import InMemoryStorageBackend
+
+
+def make_photo(width=3000, height=2000, orientation=None, fmt='JPEG', quality=95):
+    """Foto sintética com ruído (não comprime bem, como uma foto real)"""
+    rnd = random.Random(0)
+    image = Image.frombytes('RGB', (width // 8, height // 8),
+                            bytes(rnd.getrandbits(8) for _ in range(width // 8 * height // 8 * 3)))
+    image = image.resize((width, height))
+    output = io.BytesIO()
+    kwargs = {'quality': quality} if fmt == 'JPEG' else {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        kwargs['exif'] = exif
+    image.save(output, format=fmt, **kwargs)
+    return output.getvalue()
+
+
+def make_document(data, filename='foto.jpg', mime_type='image/jpeg'):
+    return UploadedDocument(data, filename, mime_type, hashlib.sha256(data).hexdigest())
+
+
+class TestPreprocessDocument:
+    """Testes da transformação da imagem"""
+
+    def test_downscale_and_recompress(self):
+        """Lado maior limitado e arquivo menor em JPEG"""
+        document = make_document(make_photo())
+        processed = preprocess_document(document, PreprocessOptions(max_edge=1024, min_bytes=0))
+
+        assert processed.size < document.size
+        assert processed.mime_type == 'image/jpeg'
+        assert processed.sha256 == hashlib.sha256(processed.data).hexdigest()
+        with Image.open(io.BytesIO(processed.data)) as image:
+            assert max(image.size) == 1024
+
+    def test_exif_rotation_applied_and_stripped(self):
+        """Orientação EXIF é aplicada aos pixels e os metadados removidos"""
+        document = make_document(make_photo(1200, 800, orientation=6))
+        processed = preprocess_document(document, PreprocessOptions(max_edge=600, min_bytes=0))
+
+        with Image.open(io.BytesIO(processed.data)) as image:
+            assert image.size == (400, 600)
+            assert not image.getexif()
+
+    def test_exif_applied_even_without_size_gain(self):
+        """Sem ganho de tamanho, a orientação EXIF ainda é aplicada e removida"""
+        document = make_document(make_photo(400, 200, orientation=6, quality=10))
+        processed = preprocess_document(document, PreprocessOptions(quality=95, min_bytes=0))
+
+        assert processed.size >= document.size
+        with Image.open(io.BytesIO(processed.data)) as image:
+            assert image.size == (200, 400)
+            assert not image.getexif()
+
+    def test_no_size_gain_without_exif_keeps_original(self):
+        """Sem EXIF e sem ganho de tamanho, o original é mantido"""
+        document = make_document(make_photo(400, 200, quality=10))
+        processed = preprocess_document(document, PreprocessOptions(quality=95, min_bytes=0))
+
+        assert processed is document
+
+    def test_grayscale_png(self):
+        """PNG vira JPEG em escala de cinza com extensão ajustada"""
+        document = make_document(make_photo(1600, 1200, fmt='PNG'), 'scan.png', 'image/png')
+        processed = preprocess_document(document, PreprocessOptions(grayscale=True, min_bytes=0))
+
+        assert processed.filename == 'scan.jpg'
+        with Image.open(io.BytesIO(processed.data)) as image:
+            assert image.mode == 'L'
+
+    def test_skips_small_and_unsupported(self):
+        """Imagens pequenas e PDFs passam sem alteração"""
+        small = make_document(make_photo(300, 200))
+        assert preprocess_document(small, PreprocessOptions()) is small
+
+        pdf = make_document(b'%PDF-1.4\n' + b'0' * 300000, 'nota.pdf', 'application/pdf')
+        assert preprocess_document(pdf, PreprocessOptions(min_bytes=0)) is pdf
+
+
+class TestPreprocessInPipeline:
+    """Pré-processamento no fluxo de upload"""
+
+    def test_model_receives_processed_image(self, app, client):
+        """Gemini e arquivo recebem a imagem reduzida; original arquivado se configurado"""
+        storage = InMemoryStorageBackend()
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = storage
+        app.config.update(PREPROCESS_MAX_EDGE=1024, PREPROCESS_MIN_BYTES=0,
+                          ARCHIVE_ORIGINAL_UPLOADS=True)
+        photo = make_photo()
+
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(photo), 'foto.jpg')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+
+        from app import pipeline
+        pipeline._archive_executor.shutdown(wait=True)
+        pipeline._archive_executor = None
+
+        sizes = {name.split('/')[0]: len(data) for name, (data, _) in storage.objects.items()}
+        assert sizes['originals'] == len(photo)
+        assert sizes['invoices'] < len(photo)
+
+    def test_disabled(self, app, client):
+        """PREPROCESS_ENABLED=false envia o original"""
+        storage = InMemoryStorageBackend()
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = storage
+        app.config.update(PREPROCESS_ENABLED=False, PREPROCESS_MIN_BYTES=0)
+        photo = make_photo(800, 600)
+
+        client.post('/upload-invoice', data={
+            'image': (io.BytesIO(photo), 'foto.jpg')
+        }, content_type='multipart/form-data')
+
+        from app import pipeline
+        pipeline._archive_executor.shutdown(wait=True)
+        pipeline._archive_executor = None
+
+        assert [len(data) for data, _ in storage.objects.values()] == [len(photo)]
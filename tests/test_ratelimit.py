@@ -0,0 +1,184 @@
+"""
+Testes do rate limiting compartilhado e ponderado por custo
+"""
+import gc
+import io
+import uuid
+import pytest
+from app import create_app
+from app.config import Config
+from app.model_backends import FakeModelBackend
+from app.ratelimit import parse_token_limits, estimate_pdf_pages
+from app.storage_backends import InMemoryStorageBackend
+from tests.conftest import make_png
+
+
+@pytest.fixture
+def shared_storage(monkeypatch):
+    """Armazenamento local:// exclusivo do teste, compartilhado pelos apps criados nele"""
+    monkeypatch.setattr(Config, 'RATELIMIT_STORAGE_URL', f'local://{uuid.uuid4().hex}')
+
+
+def make_worker(limit='3 per minute', unit=1024 * 1024):
+    app = create_app('testing')
+    app.config['RATELIMIT_UPLOAD_LIMIT'] = limit
+    app.config['RATELIMIT_COST_UNIT_BYTES'] = unit
+    app.extensions['model_backend'] = FakeModelBackend()
+    app.extensions['storage_backend'] = InMemoryStorageBackend()
+    return app
+
+
+def upload(client, data=None, filename='nota.png', headers=None):
+    return client.post('/upload-invoice', data={
+        'image': (io.BytesIO(data or make_png(4, 4)), filename)
+    }, content_type='multipart/form-data', headers=headers or {})
+
+
+class TestSharedRateLimit:
+    """Uma cota única para todos os workers e endpoints de upload"""
+
+    def test_budget_shared_between_workers(self, shared_storage):
+        """Dois apps (workers) consomem a mesma cota"""
+        first = make_worker().test_client()
+        second = make_worker().test_client()
+
+        assert upload(first).status_code == 200
+        assert upload(second).status_code == 200
+        assert upload(first).status_code == 200
+        response = upload(second)
+        assert response.status_code == 429
+        assert 'Retry-After' in response.headers
+
+    def test_upload_endpoints_share_scope(self, shared_storage):
+        """Upload único e em lote descontam da mesma cota"""
+        client = make_worker(limit='2 per minute').test_client()
+
+        assert upload(client).status_code == 200
+        response = client.post('/upload-invoices', data={
+            'images': [(io.BytesIO(make_png(seed=1)), 'a.png')]
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        assert upload(client).status_code == 429
+
+    def test_probes_are_exempt(self, shared_storage):
+        """Health check e métricas não consomem cota"""
+        client = make_worker(limit='1 per minute').test_client()
+        for _ in range(5):
+            assert client.get('/health').status_code == 200
+        assert upload(client).status_code == 200
+
+    def test_disabled_limiter_keeps_views_working(self, shared_storage, monkeypatch):
+        """Com RATELIMIT_ENABLED=false as views marcadas continuam respondendo"""
+        monkeypatch.setattr(Config, 'RATELIMIT_ENABLED', False)
+        app = make_worker(limit='1 per minute')
+        gc.collect()
+        client = app.test_client()
+        assert upload(client).status_code == 200
+        assert upload(client).status_code == 200
+
+
+class TestUploadCost:
+    """Custo proporcional ao tamanho e às páginas"""
+
+    def test_large_upload_costs_more(self, shared_storage):
+        """Arquivo de 3 unidades esgota uma cota de 4 em duas requisições"""
+        client = make_worker(limit='4 per minute', unit=100).test_client()
+        large = make_png(64, 48, seed=3)
+        assert 200 < len(large) <= 300 and len(make_png(4, 4)) <= 100
+
+        assert upload(client, large).status_code == 200
+        assert upload(client).status_code == 200
+        assert upload(client).status_code == 429
+
+    def test_cost_capped_at_quota(self, shared_storage):
+        """Upload mais caro que a cota inteira passa com a janela vazia e consome a cota toda"""
+        client = make_worker(limit='2 per minute', unit=100).test_client()
+        large = make_png(64, 48, seed=3)
+        assert len(large) > 200
+
+        assert upload(client, large).status_code == 200
+        response = upload(client)
+        assert response.status_code == 429
+        assert 0 < int(response.headers['Retry-After']) <= 60
+
+
+class TestReadScope:
+    """Consultas com cota própria, separada dos uploads e dos limites padrão"""
+
+    def test_job_polling_does_not_hit_default_limits(self, shared_storage):
+        """Polling além dos 50 por hora padrão não bloqueia as demais consultas"""
+        client = make_worker().test_client()
+        for _ in range(60):
+            assert client.get('/jobs/inexistente').status_code == 404
+        assert client.get('/stock').status_code != 429
+
+    def test_read_limit_is_separate_from_uploads(self, shared_storage):
+        app = make_worker(limit='1 per minute')
+        app.config['RATELIMIT_READ_LIMIT'] = '2 per minute'
+        client = app.test_client()
+        assert upload(client).status_code == 200
+        assert upload(client).status_code == 429
+
+        assert client.get('/jobs/inexistente').status_code == 404
+        assert client.get('/stock').status_code != 429
+        assert client.get('/documents').status_code == 429
+
+
+class TestCostHelpers:
+    """Funções auxiliares de custo e cotas"""
+
+    def test_pdf_pages_count(self):
+        """Cada objeto /Type /Page conta uma página; /Pages não"""
+        pdf = b'%PDF-1.4\n<< /Type /Pages /Count 3 >>\n' + b'<< /Type /Page >>\n' * 3
+        stream = io.BytesIO(pdf)
+        assert estimate_pdf_pages(stream) == 3
+        assert stream.tell() == 0
+
+    def test_pdf_scan_is_bounded(self):
+        """Só o início e o fim do PDF são lidos; páginas do trecho lido são extrapoladas"""
+        class CountingStream(io.BytesIO):
+            read_bytes = 0
+
+            def read(self, size=-1):
+                data = super().read(size)
+                self.read_bytes += len(data)
+                return data
+
+        page = b'<< /Type /Page >>' + b' ' * 1007
+        stream = CountingStream(b'%PDF-1.4\n' + page * 1000)
+        assert estimate_pdf_pages(stream, scan_bytes=16 * 1024) in range(990, 1011)
+        assert stream.read_bytes <= 32 * 1024
+        assert stream.tell() == 0
+
+        tree = b'<< /Count 1000 /Kids [] /Type /Pages >>'
+        assert estimate_pdf_pages(io.BytesIO(b'%PDF-1.4\n' + page * 100 + tree), scan_bytes=4096) == 1000
+
+    def test_parse_token_limits(self):
+        """Formato '<id>=<limite>;...' com espaços e entradas vazias"""
+        assert parse_token_limits(' a=10 per minute; ;b = 5/second') == {
+            'a': '10 per minute', 'b': '5/second'}
+
+
+class TestTokenQuotas:
+    """Cotas por chave de API"""
+
+    def test_token_quota_overrides_default(self, shared_storage, monkeypatch):
+        """Chave com cota própria acima da cota padrão"""
+        monkeypatch.setenv('API_TOKEN', 'token-a')
+        app = make_worker(limit='1 per minute')
+        app.config['ENABLE_AUTH'] = True
+        app.extensions['rate_limit_quotas'] = parse_token_limits('default=3 per minute')
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer token-a'}
+
+        for _ in range(3):
+            assert upload(client, headers=headers).status_code == 200
+        assert upload(client, headers=headers).status_code == 429
+
+    def test_invalid_token_falls_back_to_ip(self, shared_storage, monkeypatch):
+        """Token inválido não ganha chave própria e recebe 401"""
+        monkeypatch.setenv('API_TOKEN', 'token-a')
+        app = make_worker()
+        app.config['ENABLE_AUTH'] = True
+        response = upload(app.test_client(), headers={'Authorization': 'Bearer errado'})
+        assert response.status_code == 401
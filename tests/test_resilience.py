@@ -0,0 +1,250 @@
+"""
+Testes da camada de resiliência da chamada ao modelo (falhas injetadas no backend falso)
+"""
+import io
+import json
+import time
+import pytest
+from app.model_backends import FakeModelBackend, FakeModelError
+from app.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyTracker, ModelUnavailable, ResilientCaller, RetryBudget,
+    is_transient
+)
+from app.storage_backends import InMemoryStorageBackend
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FailingCalls:
+    """Chamada que falha nas primeiras `failures` vezes com o status indicado"""
+
+    def __init__(self, failures, code=503):
+        self.failures = failures
+        self.code = code
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise FakeModelError('falha', self.code)
+        return 'ok'
+
+
+def fast_caller(**kwargs):
+    options = dict(base_delay=0.0, max_delay=0.0, max_workers=4)
+    options.update(kwargs)
+    return ResilientCaller(**options)
+
+
+class TestRetryBudget:
+    """Orçamento de novas tentativas"""
+
+    def test_limits_and_refills(self):
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.5, min_per_second=1, window=2, clock=clock)
+        assert budget.withdraw() and budget.withdraw()
+        assert not budget.withdraw()
+
+        budget.deposit()
+        budget.deposit()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+        clock.now += 1
+        assert budget.withdraw()
+
+
+class TestCircuitBreaker:
+    """Abertura, chamada de teste e fechamento"""
+
+    def test_opens_and_recovers(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window=10, reset_timeout=5, clock=clock)
+        for success in (True, False, False, True):
+            breaker.record(success)
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        assert breaker.retry_after() == 6
+
+        clock.now += 5
+        assert breaker.state == HALF_OPEN
+        probe = breaker.allow()
+        assert probe
+        assert not breaker.allow()  # uma chamada de teste por vez
+        breaker.record(False, probe)
+        assert breaker.state == OPEN
+
+        clock.now += 5
+        probe = breaker.allow()
+        breaker.record(True, probe)
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_only_probe_decides_half_open(self):
+        """Resultado de chamada liberada antes da abertura não fecha nem reabre o circuito"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=2, window=10, reset_timeout=5, clock=clock)
+        stale = breaker.allow()
+        breaker.record(False)
+        breaker.record(False)
+        clock.now += 5
+
+        probe = breaker.allow()
+        breaker.record(True, stale)
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record(False, stale)
+        assert breaker.state == HALF_OPEN
+
+        breaker.record(True, probe)
+        assert breaker.state == CLOSED
+
+    def test_transient_classification(self):
+        assert is_transient(FakeModelError('x', 429))
+        assert is_transient(TimeoutError())
+        assert not is_transient(FakeModelError('x', 400))
+        assert not is_transient(ValueError())
+
+
+class TestResilientCaller:
+    """Novas tentativas, prazos, orçamento, circuito e hedge"""
+
+    def test_retries_transient_failures(self):
+        fn = FailingCalls(failures=2)
+        assert fast_caller(max_attempts=3).call(fn) == 'ok'
+        assert fn.calls == 3
+
+    def test_client_errors_are_not_retried(self):
+        fn = FailingCalls(failures=5, code=400)
+        with pytest.raises(FakeModelError):
+            fast_caller().call(fn)
+        assert fn.calls == 1
+
+    def test_gives_up_after_max_attempts(self):
+        fn = FailingCalls(failures=10)
+        with pytest.raises(ModelUnavailable):
+            fast_caller(max_attempts=3).call(fn)
+        assert fn.calls == 3
+
+    def test_retry_budget_bounds_retries(self):
+        fn = FailingCalls(failures=10)
+        caller = fast_caller(max_attempts=10, budget=RetryBudget(ratio=0, min_per_second=0))
+        with pytest.raises(ModelUnavailable, match='Orçamento'):
+            caller.call(fn)
+        assert fn.calls == 2
+
+    def test_deadline_abandons_slow_call(self):
+        """Chamada travada é abandonada no prazo, sem segurar a requisição"""
+        backend = FakeModelBackend(latency='fixed:2000')
+        caller = fast_caller(deadline=0.3, attempt_timeout=0.1, max_attempts=5)
+        started = time.monotonic()
+        with pytest.raises(ModelUnavailable):
+            caller.call(lambda: backend.generate_content(['p']))
+        assert time.monotonic() - started < 1.0
+
+    def test_abandoned_calls_count_against_limit(self):
+        """Chamada abandonada no prazo segura a vaga até terminar: não passa de max_workers"""
+        backend = FakeModelBackend(latency='fixed:500')
+        caller = fast_caller(attempt_timeout=0.05, max_attempts=1, max_workers=1)
+        for _ in range(2):
+            with pytest.raises(ModelUnavailable):
+                caller.call(lambda: backend.generate_content(['p']))
+        assert backend.calls == 1
+
+        time.sleep(0.6)
+        caller.attempt_timeout = 1.0
+        assert caller.call(lambda: backend.generate_content(['p'])).text
+        assert backend.calls == 2
+
+    def test_stream_retries_before_first_chunk(self):
+        """Stream sem primeiro pedaço no prazo é repetido; o texto chega inteiro"""
+        latencies = iter([5.0])
+        backend = FakeModelBackend(latency=lambda rnd: next(latencies, 0.01), stream_chunk_size=16)
+        caller = fast_caller(first_chunk_timeout=0.2, max_attempts=2)
+
+        started = time.monotonic()
+        text = ''.join(chunk.text for chunk in caller.stream(lambda: backend.generate_content(['p'], stream=True)))
+        assert time.monotonic() - started < 1.0
+        assert json.loads(text)
+        assert backend.calls == 2
+
+    def test_stream_stalled_between_chunks(self):
+        """Stream parado depois do primeiro pedaço termina no prazo entre pedaços, sem nova tentativa"""
+        calls = []
+
+        def stalled():
+            calls.append(1)
+            yield 'primeiro'
+            time.sleep(2)
+            yield 'tarde demais'
+
+        caller = fast_caller(idle_timeout=0.1)
+        chunks = []
+        started = time.monotonic()
+        with pytest.raises(ModelUnavailable):
+            for chunk in caller.stream(stalled):
+                chunks.append(chunk)
+        assert time.monotonic() - started < 1.0
+        assert chunks == ['primeiro'] and len(calls) == 1
+
+    def test_open_circuit_fails_fast(self):
+        backend = FakeModelBackend(failure_rate=1.0)
+        caller = fast_caller(max_attempts=1, breaker=CircuitBreaker(min_calls=3, window=3))
+        for _ in range(3):
+            with pytest.raises(ModelUnavailable):
+                caller.call(lambda: backend.generate_content(['p']))
+        calls = backend.calls
+
+        with pytest.raises(ModelUnavailable) as excinfo:
+            caller.call(lambda: backend.generate_content(['p']))
+        assert backend.calls == calls
+        assert excinfo.value.retry_after >= 1
+
+    def test_hedge_cuts_tail_latency(self):
+        """Chamada lenta além do p95 observado é duplicada e a cópia rápida responde"""
+        latencies = iter([1.0])
+        backend = FakeModelBackend(latency=lambda rnd: next(latencies, 0.01))
+        tracker = LatencyTracker(min_samples=5)
+        for _ in range(5):
+            tracker.observe(0.01)
+        caller = fast_caller(hedge=True, hedge_min_delay=0.05, tracker=tracker)
+
+        started = time.monotonic()
+        response = caller.call(lambda: backend.generate_content(['p']))
+        assert time.monotonic() - started < 0.5
+        assert response.text
+        assert backend.calls == 2
+
+    def test_hedge_needs_free_slot(self):
+        """Sem vaga no pool o hedge não é enviado; a primeira chamada segue até responder"""
+        backend = FakeModelBackend(latency='fixed:200')
+        tracker = LatencyTracker(min_samples=5)
+        for _ in range(5):
+            tracker.observe(0.01)
+        caller = fast_caller(hedge=True, hedge_min_delay=0.05, tracker=tracker, max_workers=1)
+
+        assert caller.call(lambda: backend.generate_content(['p'])).text
+        assert backend.calls == 1
+
+
+class TestModelUnavailableResponse:
+    """Indisponibilidade do modelo vira 503 com Retry-After, não 500"""
+
+    def test_upload_returns_503(self, app, client, png_bytes):
+        app.extensions['model_backend'] = FakeModelBackend(failure_rate=1.0)
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        app.extensions['model_resilience'] = fast_caller(max_attempts=2)
+
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 503
+        # O Flask-Limiter mantém o maior entre este valor e o reset da janela de limite
+        assert int(response.headers['Retry-After']) >= 1
+        assert app.extensions['model_backend'].calls == 2
@@ -0,0 +1,148 @@
+"""
+Testes da persistência de resultados e do GET /documents
+"""
+import io
+import time
+import pytest
+from app.model_backends import FakeModelBackend, DEFAULT_FAKE_RESPONSE
+from app.results import ResultStore, normalize_cnpj, normalize_date, to_number
+from app.storage_backends import InMemoryStorageBackend
+from tests.conftest import make_png
+
+
+def record(index, **fields):
+    data = dict(DEFAULT_FAKE_RESPONSE, numero_documento=str(index), **fields)
+    return {'sha256': f'{index:064x}', 'filename': f'nota{index}.png',
+            'prompt_version': 'auto@1', 'created_at': time.time(), 'data': data}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / 'results.db'), flush_interval=0.01)
+
+
+class TestNormalization:
+    """Normalização dos campos indexados"""
+
+    def test_cnpj_and_dates(self):
+        assert normalize_cnpj('12.345.678/0001-90') == '12345678000190'
+        assert normalize_cnpj(None) is None
+        assert normalize_date('5/3/2024') == '2024-03-05'
+        assert normalize_date('2024-03-05T10:00') == '2024-03-05'
+        assert normalize_date('março') is None
+
+    def test_numbers(self):
+        assert to_number(10) == 10.0
+        assert to_number('1.234,50') == 1234.5
+        assert to_number('R$ 10.5') == 10.5
+        assert to_number(True) is None
+        assert to_number('n/d') is None
+
+
+class TestResultStore:
+    """Gravação em lote, filtros e paginação"""
+
+    def test_write_batch_ignores_duplicates(self, store):
+        """Mesmo sha256 não é gravado duas vezes; itens vão para a tabela própria"""
+        written = store.write_batch([record(1), record(2), record(1)])
+        assert [r['data']['numero_documento'] for r in written] == ['1', '2']
+
+        document = store.get(written[0]['id'])
+        assert document['cnpj_fornecedor'] == '12345678000190'
+        assert document['data_emissao'] == '2024-03-15'
+        assert len(document['itens']) == len(DEFAULT_FAKE_RESPONSE['itens'])
+        assert document['itens'][1]['quantidade'] == 2.0
+        assert document['extracted_data']['numero_documento'] == '1'
+
+    def test_keyset_pagination(self, store):
+        """Páginas sem repetição nem lacunas, da mais recente à mais antiga"""
+        store.write_batch([record(i) for i in range(25)])
+        seen, cursor = [], None
+        while True:
+            page, cursor = store.query(limit=10, cursor=cursor)
+            seen.extend(doc['numero_documento'] for doc in page)
+            if cursor is None:
+                break
+        assert seen == [str(i) for i in reversed(range(25))]
+
+    def test_filters(self, store):
+        """Filtros por CNPJ (qualquer formatação), tipo, período e produto"""
+        store.write_batch([
+            record(1, cnpj_fornecedor='11.111.111/0001-11', data_emissao='01/01/2024'),
+            record(2, data_emissao='10/02/2024', tipo_documento='Etiqueta de Produto'),
+            record(3, data_emissao='20/03/2024', itens=[{'codigo_produto': 'X1', 'quantidade': 1}]),
+        ])
+
+        def numbers(**filters):
+            return [doc['numero_documento'] for doc in store.query(**filters)[0]]
+
+        assert numbers(cnpj_fornecedor='11111111000111') == ['1']
+        assert numbers(tipo_documento='Etiqueta de Produto') == ['2']
+        assert numbers(data_inicio='2024-02-01', data_fim='2024-03-31') == ['3', '2']
+        assert numbers(codigo_produto='X1') == ['3']
+        assert numbers(numero_documento='2', cnpj_fornecedor='11111111000111') == []
+
+    def test_background_writer_batches(self, store):
+        """submit() só enfileira; o thread grava e notifica os ouvintes"""
+        batches = []
+        store.add_listener(lambda conn, records: batches.append(records))
+
+        class Document:
+            def __init__(self, index):
+                self.sha256 = f'{index:064x}'
+                self.filename = f'{index}.png'
+
+        for index in range(5):
+            store.submit(Document(index), {'extracted_data': dict(DEFAULT_FAKE_RESPONSE),
+                                           'prompt_version': 'auto@1'})
+        store.flush()
+        assert sum(len(batch) for batch in batches) == 5
+        assert len(store.query()[0]) == 5
+
+    def test_uses_indexes(self, store):
+        """Filtros por igualdade usam os índices (coluna, id), sem ordenação extra"""
+        conn = store._connect()
+        plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM documents WHERE cnpj_fornecedor = ? '
+            'AND id < ? ORDER BY id DESC LIMIT 50', ('1', 100)))
+        assert 'documents_cnpj' in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+class TestDocumentsEndpoint:
+    """Testes do endpoint /documents"""
+
+    @pytest.fixture
+    def results_app(self, app, store):
+        app.extensions['result_store'] = store
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        return app
+
+    def test_upload_is_persisted_and_listed(self, results_app):
+        """Upload processado aparece na listagem e no detalhe"""
+        client = results_app.test_client()
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(make_png(4, 4)), 'nota.png')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        results_app.extensions['result_store'].flush()
+
+        listing = client.get('/documents?cnpj_fornecedor=12.345.678/0001-90&data_inicio=01/03/2024')
+        assert listing.status_code == 200
+        body = listing.get_json()
+        assert body['next_cursor'] is None
+        assert [doc['filename'] for doc in body['documents']] == ['nota.png']
+        assert body['documents'][0]['prompt_version'] == 'auto@1'
+
+        detail = client.get(f"/documents/{body['documents'][0]['id']}").get_json()
+        assert detail['extracted_data'] == DEFAULT_FAKE_RESPONSE
+        assert client.get('/documents/999').status_code == 404
+
+    @pytest.mark.parametrize('query', ['limit=0', 'limit=abc', 'cursor=x', 'data_fim=ontem'])
+    def test_invalid_parameters(self, results_app, query):
+        assert results_app.test_client().get(f'/documents?{query}').status_code == 400
+
+    def test_disabled_store(self, client):
+        """Sem RESULTS_DB_PATH o endpoint informa que a persistência está desabilitada"""
+        assert client.get('/documents').status_code == 503
@@ -0,0 +1,154 @@
+"""
+Testes dos backends de armazenamento
+"""
+import io
+import zlib
+import struct
+import pytest
+from unittest.mock import MagicMock
+from app.config import Config
+from app.model_backends import FakeModelBackend
+from app.storage_backends import (
+    InMemoryStorageBackend,
+    LocalStorageBackend,
+    GCSStorageBackend,
+    create_storage_backend,
+)
+
+
+class TestStorageBackends:
+    """Testes dos backends local e em memória"""
+
+    def test_memory_roundtrip(self):
+        """Objeto gravado pode ser lido e removido"""
+        backend = InMemoryStorageBackend('bucket')
+        uri = backend.put('invoices/a.png', b'data', 'image/png')
+        assert uri == 'memory://bucket/invoices/a.png'
+        assert backend.get('invoices/a.png') == b'data'
+        backend.delete('invoices/a.png')
+        assert backend.get('invoices/a.png') is None
+
+    def test_local_roundtrip(self, tmp_path):
+        """Objeto gravado em disco pode ser lido"""
+        backend = LocalStorageBackend(str(tmp_path))
+        uri = backend.put('invoices/a.png', b'data')
+        assert uri.startswith('file://')
+        assert (tmp_path / 'invoices' / 'a.png').read_bytes() == b'data'
+        assert backend.get('invoices/a.png') == b'data'
+
+    def test_local_rejects_path_traversal(self, tmp_path):
+        """Nomes que escapam do diretório base são recusados"""
+        backend = LocalStorageBackend(str(tmp_path))
+        with pytest.raises(ValueError):
+            backend.put('../escape.png', b'data')
+
+    def test_selected_by_config(self, tmp_path):
+        """STORAGE_BACKEND escolhe a implementação"""
+        assert isinstance(create_storage_backend({'STORAGE_BACKEND': 'memory'}), InMemoryStorageBackend)
+        backend = create_storage_backend({'STORAGE_BACKEND': 'local', 'STORAGE_LOCAL_PATH': str(tmp_path)})
+        assert isinstance(backend, LocalStorageBackend)
+        with pytest.raises(ValueError):
+            create_storage_backend({'STORAGE_BACKEND': 's3'})
+
+
+class TestGCSStorageBackend:
+    """Testes do backend GCS com bucket simulado"""
+
+    def make_backend(self, **kwargs):
+        backend = GCSStorageBackend('bucket', **kwargs)
+        backend._bucket = MagicMock()
+        return backend
+
+    def test_chunk_size_is_aligned(self):
+        """chunk_size é arredondado para múltiplos de 256KB"""
+        assert GCSStorageBackend('b', chunk_size=1000).chunk_size == 256 * 1024
+        assert GCSStorageBackend('b', chunk_size=600 * 1024).chunk_size == 512 * 1024
+
+    def test_small_upload_is_single_request(self):
+        """Objetos pequenos usam um único upload com o chunk configurado"""
+        backend = self.make_backend(composite_threshold=100)
+        uri = backend.put('invoices/a.pdf', b'x' * 10, 'application/pdf')
+
+        assert uri == 'gs://bucket/invoices/a.pdf'
+        backend._bucket.blob.assert_called_once_with('invoices/a.pdf', chunk_size=backend.chunk_size)
+
+    def test_large_upload_is_composed_from_parts(self):
+        """Objetos grandes são enviados em partes paralelas e combinados"""
+        backend = self.make_backend(composite_threshold=10, composite_parts=4)
+        uploaded = {}
+
+        def make_blob(name, chunk_size=None):
+            blob = MagicMock(name=name)
+            blob.upload_from_file.side_effect = lambda f, **kw: uploaded.__setitem__(name, f.read())
+            return blob
+
+        backend._bucket.blob.side_effect = make_blob
+        backend.put('invoices/big.pdf', b'0123456789abcdef', 'application/pdf')
+
+        parts = [uploaded[name] for name in sorted(uploaded)]
+        assert b''.join(parts) == b'0123456789abcdef'
+        assert len(parts) == 4
+
+    def test_failed_part_cleans_up_uploaded_parts(self):
+        """Falha no envio de uma parte apaga as que já foram enviadas e não chama compose"""
+        backend = self.make_backend(composite_threshold=10, composite_parts=4)
+        blobs = {}
+
+        def make_blob(name, chunk_size=None):
+            blob = blobs[name] = MagicMock(name=name)
+            if name.endswith('/02'):
+                blob.upload_from_file.side_effect = ConnectionError('falha no envio')
+            return blob
+
+        backend._bucket.blob.side_effect = make_blob
+        with pytest.raises(ConnectionError):
+            backend.put('invoices/big.pdf', b'0123456789abcdef', 'application/pdf')
+
+        # Partes que ainda não tinham começado são canceladas
+        parts = {name: blob for name, blob in blobs.items() if '.parts-' in name}
+        assert any(name.endswith('/00') for name in parts)
+        for name, blob in parts.items():
+            assert blob.delete.called == (not name.endswith('/02'))
+        assert 'invoices/big.pdf' not in blobs
+
+
+def stored_png(size):
+    """PNG sem compressão (zlib nível 0) com aproximadamente `size` bytes"""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    width = 1024
+    height = size // (width + 1)
+    rows = (b'\x00' + bytes(width)) * height
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows, 0)) +
+            chunk(b'IEND', b''))
+
+
+class TestCompositeUploadThroughApp:
+    """Upload composto alcançado com a configuração padrão"""
+
+    def test_default_threshold_fits_upload_limit(self):
+        assert Config.INLINE_MAX_BYTES < Config.GCS_COMPOSITE_THRESHOLD <= Config.MAX_CONTENT_LENGTH
+        assert Config.validate_required_config()
+
+    def test_large_upload_is_composed(self, app, client):
+        """Documento acima do limiar vai ao GCS em partes paralelas"""
+        app.config['PREPROCESS_ENABLED'] = False
+        backend = create_storage_backend(dict(app.config, STORAGE_BACKEND='gcs'))
+        backend._bucket = MagicMock()
+        app.extensions['storage_backend'] = backend
+        app.extensions['model_backend'] = FakeModelBackend()
+
+        data = stored_png(app.config['GCS_COMPOSITE_THRESHOLD'] + 1024 * 1024)
+        assert len(data) < app.config['MAX_CONTENT_LENGTH']
+        response = client.post('/upload-invoice', data={
+            'image': (io.BytesIO(data), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        names = [call.args[0] for call in backend._bucket.blob.call_args_list]
+        assert sum('.parts-' in name for name in names) == backend.composite_parts
+        backend._bucket.blob.return_value.compose.assert_called_once()
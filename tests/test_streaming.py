@@ -0,0 +1,118 @@
+"""
+Testes da extração em streaming
+"""
+import io
+import json
+import pytest
+from app.cascade import ModelCascade, ModelTier
+from app.streaming import IncrementalInvoiceParser
+from app.model_backends import FakeModelBackend, DEFAULT_FAKE_RESPONSE
+from app.storage_backends import InMemoryStorageBackend
+
+
+def feed_all(text, chunk_size):
+    parser = IncrementalInvoiceParser()
+    events = []
+    for i in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[i:i + chunk_size]))
+    return parser, events
+
+
+class TestIncrementalInvoiceParser:
+    """Testes do analisador incremental"""
+
+    @pytest.mark.parametrize('chunk_size', [1, 5, 64, 10000])
+    def test_emits_fields_and_items_in_order(self, chunk_size):
+        """Eventos independem da fragmentação do texto"""
+        text = json.dumps(DEFAULT_FAKE_RESPONSE, indent=2)
+        parser, events = feed_all(text, chunk_size)
+
+        fields = {data['name']: data['value'] for kind, data in events if kind == 'field'}
+        items = [data['item'] for kind, data in events if kind == 'item']
+        assert parser.complete
+        assert fields['fornecedor'] == DEFAULT_FAKE_RESPONSE['fornecedor']
+        assert fields['observacoes_adicionais'] is None
+        assert 'itens' not in fields
+        assert items == DEFAULT_FAKE_RESPONSE['itens']
+
+    def test_header_emitted_before_items_finish(self):
+        """Campos do cabeçalho saem antes do fim do array de itens"""
+        parser = IncrementalInvoiceParser()
+        events = parser.feed('{"fornecedor": "ACME", "numero_documento": "42", "itens": [{"codigo_produto": "A"}, {"cod')
+        assert ('field', {'name': 'fornecedor', 'value': 'ACME'}) in events
+        assert ('item', {'index': 0, 'item': {'codigo_produto': 'A'}}) in events
+        assert not parser.complete
+
+    def test_strings_with_braces_and_escapes(self):
+        """Chaves, vírgulas e aspas dentro de strings não confundem o analisador"""
+        text = '{"observacoes_adicionais": "a {b}, [c] \\"d\\"", "itens": [{"descricao": "x}, y"}]}'
+        parser, events = feed_all(text, 3)
+        assert ('field', {'name': 'observacoes_adicionais', 'value': 'a {b}, [c] "d"'}) in events
+        assert ('item', {'index': 0, 'item': {'descricao': 'x}, y'}}) in events
+
+    def test_ignores_markdown_fences(self):
+        """Cercas ```json são ignoradas e o objeto é isolado"""
+        parser, events = feed_all('```json\n{"a": 1}\n```', 4)
+        assert events == [('field', {'name': 'a', 'value': 1})]
+        assert parser.object_text == '{"a": 1}'
+
+
+class TestStreamEndpoint:
+    """Testes do endpoint /upload-invoice/stream"""
+
+    def parse_sse(self, body):
+        events = []
+        for block in body.strip().split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.splitlines())
+            events.append((lines['event'], json.loads(lines['data'])))
+        return events
+
+    def test_stream_events(self, app, client, png_bytes):
+        """Evento inicial, campos, itens e resultado final"""
+        app.extensions['model_backend'] = FakeModelBackend(stream_chunk_size=16)
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+
+        response = client.post('/upload-invoice/stream', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        events = self.parse_sse(response.get_data(as_text=True))
+        kinds = [kind for kind, _ in events]
+        assert kinds[0] == 'accepted'
+        assert kinds[-1] == 'result'
+        assert kinds.count('item') == len(DEFAULT_FAKE_RESPONSE['itens'])
+        assert events[-1][1]['extracted_data'] == DEFAULT_FAKE_RESPONSE
+
+    def test_stream_goes_through_cascade(self, app, client, png_bytes):
+        """Com cascata, a saída inválida do modelo rápido sobe de nível antes do resultado"""
+        fast = FakeModelBackend(responses=[{'text': '{"tipo_documento": "Nota Fiscal", "itens": []}'}])
+        strong = FakeModelBackend()
+        app.extensions['model_backend'] = FakeModelBackend()
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+        app.extensions['model_cascade'] = ModelCascade([ModelTier('fast-model', fast), ModelTier('strong-model', strong)])
+
+        response = client.post('/upload-invoice/stream', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        events = self.parse_sse(response.get_data(as_text=True))
+        kind, result = events[-1]
+        assert kind == 'result'
+        assert result['extracted_data'] == DEFAULT_FAKE_RESPONSE
+        assert result['model']['id'] == 'strong-model'
+        assert [k for k, _ in events].count('item') == len(DEFAULT_FAKE_RESPONSE['itens'])
+        assert (fast.calls, strong.calls, app.extensions['model_backend'].calls) == (1, 1, 0)
+
+    def test_stream_model_error(self, app, client, png_bytes):
+        """Falha do modelo vira evento de erro"""
+        app.extensions['model_backend'] = FakeModelBackend(failure_rate=1.0)
+        app.extensions['storage_backend'] = InMemoryStorageBackend()
+
+        response = client.post('/upload-invoice/stream', data={
+            'image': (io.BytesIO(png_bytes), 'nota.png')
+        }, content_type='multipart/form-data')
+
+        events = self.parse_sse(response.get_data(as_text=True))
+        assert events[-1][0] == 'error'
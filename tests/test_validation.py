@@ -0,0 +1,98 @@
+"""
+Testes da identificação de tipo e da validação estrutural incremental
+"""
+import io
+import threading
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app.ingest import ingest_upload
+from app.validation import create_structure_validator, detect_mime, magic_handle
+
+
+def encode(fmt, **kwargs):
+    image = Image.effect_noise((120, 80), 40).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=fmt, **kwargs)
+    return output.getvalue()
+
+
+SAMPLES = {
+    'image/png': encode('PNG'),
+    'image/jpeg': encode('JPEG', progressive=True),
+    'image/gif': encode('GIF'),
+    'image/bmp': encode('BMP'),
+    'image/tiff': encode('TIFF'),
+    'application/pdf': encode('PDF'),
+}
+
+
+def validate(data, mime_type, chunk_size):
+    validator = create_structure_validator(mime_type)
+    for i in range(0, len(data), chunk_size):
+        validator.feed(data[i:i + chunk_size])
+    return validator.finish()
+
+
+class TestDetectMime:
+    """Testes da tabela de assinaturas"""
+
+    @pytest.mark.parametrize('mime_type', sorted(SAMPLES))
+    def test_signatures(self, mime_type):
+        """Formatos conhecidos identificados pela assinatura"""
+        assert detect_mime(SAMPLES[mime_type][:1024]) == mime_type
+
+    def test_falls_back_to_libmagic(self):
+        """Conteúdo sem assinatura conhecida vai ao libmagic"""
+        assert detect_mime(b'BMnot really a bitmap, just text' * 4) == 'text/plain'
+
+    def test_magic_handle_per_thread(self):
+        """Cada thread usa seu próprio handle, reutilizado entre chamadas"""
+        handles = []
+        thread = threading.Thread(target=lambda: handles.append(magic_handle()))
+        thread.start()
+        thread.join()
+        assert magic_handle() is magic_handle()
+        assert handles[0] is not magic_handle()
+
+
+class TestStructureValidation:
+    """Testes dos validadores incrementais"""
+
+    @pytest.mark.parametrize('mime_type', sorted(SAMPLES))
+    @pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+    def test_valid_files_any_chunking(self, mime_type, chunk_size):
+        """Arquivo íntegro é aceito qualquer que seja o tamanho dos blocos"""
+        assert validate(SAMPLES[mime_type], mime_type, chunk_size) is None
+
+    @pytest.mark.parametrize('mime_type', ['image/png', 'image/jpeg', 'image/gif', 'image/bmp', 'application/pdf'])
+    def test_truncated_files(self, mime_type):
+        """Arquivo cortado é recusado"""
+        data = SAMPLES[mime_type]
+        assert validate(data[:len(data) * 2 // 3], mime_type, 4096)
+
+    def test_png_crc_mismatch_stops_early(self):
+        """CRC incorreto é detectado no bloco em que aparece"""
+        data = bytearray(SAMPLES['image/png'])
+        data[60] ^= 0xFF  # Dentro dos dados do IDAT
+        validator = create_structure_validator('image/png')
+        assert not validator.feed(bytes(data))
+        assert 'CRC' in validator.error
+
+
+class TestIngestStructure:
+    """Validação estrutural durante a leitura do upload"""
+
+    def test_truncated_upload_rejected(self, app):
+        """Upload de JPEG incompleto é recusado com mensagem clara"""
+        data = SAMPLES['image/jpeg'][:-200]
+        with app.app_context():
+            result = ingest_upload(FileStorage(io.BytesIO(data), 'foto.jpg'), chunk_size=512)
+        assert not result['valid']
+        assert 'corrompido' in result['error']
+
+    def test_small_file_validated_at_eof(self, app, png_bytes):
+        """Arquivos menores que o bloco de identificação também são verificados"""
+        with app.app_context():
+            assert ingest_upload(FileStorage(io.BytesIO(png_bytes), 'nota.png'))['valid']
+            assert not ingest_upload(FileStorage(io.BytesIO(png_bytes[:-4]), 'nota.png'))['valid']